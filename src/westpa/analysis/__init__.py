@@ -1,5 +1,27 @@
 from westpa.analysis.core import Run
-from westpa.analysis.statistics import time_average
+from westpa.analysis.statistics import (
+    vectorized,
+    ensemble_moments,
+    ensemble_averages,
+    time_average,
+    time_variance,
+    time_histogram,
+    block_error,
+    bootstrap_ci,
+)
 from westpa.analysis.trajectories import Trajectory, BasicMDTrajectory, HDF5MDTrajectory
 
-__all__ = ['Run', 'time_average', 'Trajectory', 'BasicMDTrajectory', 'HDF5MDTrajectory']
+__all__ = [
+    'Run',
+    'vectorized',
+    'ensemble_moments',
+    'ensemble_averages',
+    'time_average',
+    'time_variance',
+    'time_histogram',
+    'block_error',
+    'bootstrap_ci',
+    'Trajectory',
+    'BasicMDTrajectory',
+    'HDF5MDTrajectory',
+]
@@ -0,0 +1,100 @@
+import collections
+import threading
+
+
+class LRUCache:
+    """A memory-bounded cache that discards the least recently used entries.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum total size (in bytes) of the cached values. Values larger
+        than this are never cached.
+
+    """
+
+    def __init__(self, max_bytes):
+        if max_bytes < 0:
+            raise ValueError('max_bytes must be nonnegative')
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self):
+        """int: Total size (in bytes) of the cached values."""
+        return self._nbytes
+
+    def fits(self, nbytes):
+        """Return whether a value of size `nbytes` can be cached."""
+        return nbytes <= self.max_bytes
+
+    def get(self, key, default=None):
+        """Return the value cached for `key`, or `default` if none is cached."""
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, nbytes):
+        """Cache `value` (of size `nbytes`) for `key`, evicting the least
+        recently used entries as necessary. Values that do not fit are not
+        cached.
+
+        """
+        with self._lock:
+            self.discard(key)
+            if not self.fits(nbytes):
+                return
+            while self._entries and self._nbytes + nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+
+    def get_or_load(self, key, load, nbytes=None):
+        """Return the value cached for `key`, calling `load()` to obtain (and
+        cache) it if none is cached.
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key.
+        load : callable
+            Function of no arguments returning the value for `key`.
+        nbytes : callable, optional
+            Function of the value returning its size in bytes. By default,
+            the ``nbytes`` attribute of the value is used.
+
+        """
+        value = self.get(key)
+        if value is None:
+            value = load()
+            self.put(key, value, nbytes(value) if nbytes else value.nbytes)
+        return value
+
+    def discard(self, key):
+        """Remove the entry for `key`, if any."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._nbytes -= entry[1]
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} with {len(self)} entries, {self.nbytes} of {self.max_bytes} bytes>'
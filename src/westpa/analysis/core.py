@@ -3,7 +3,10 @@ import numpy as np
 import pandas as pd
 import sys
 
+from westpa.analysis.cache import LRUCache
+from westpa.core.ancestry import AncestryIndex, get_iter_parent_ids
 from westpa.core.binning.assign import BinMapper
+from westpa.core.data_manager import SegmentTable
 from westpa.core.h5io import WESTPAH5File, tostr
 from westpa.core.segment import Segment
 from westpa.core.states import BasisState, InitialState, TargetState
@@ -17,12 +20,21 @@ class Run:
     ----------
     h5filename : str or file-like object, default 'west.h5'
         Pathname or stream of a main WESTPA HDF5 data file.
+    cache_size : int, default 256 MiB
+        Maximum number of bytes of iteration data (segment indexes, progress
+        coordinates, auxiliary data, and child indexes) to keep in memory.
+        Iteration data are read in bulk and cached on first access, and the
+        least recently used iterations are discarded to stay within this
+        bound. Set to 0 to disable caching.
 
     """
 
     DESCRIPTION = 'WESTPA Run'
+    DEFAULT_CACHE_SIZE = 256 * 2**20
 
-    def __init__(self, h5filename='west.h5'):
+    def __init__(self, h5filename='west.h5', cache_size=DEFAULT_CACHE_SIZE):
+        self.cache = LRUCache(cache_size)
+        self._bin_mappers = {}
         self.h5filename = h5filename
 
     def __enter__(self):
@@ -32,21 +44,29 @@ class Run:
         self.close()
 
     @classmethod
-    def open(cls, h5filename='west.h5'):
+    def open(cls, h5filename='west.h5', cache_size=DEFAULT_CACHE_SIZE):
         """Alternate constructor.
 
         Parameters
         ----------
         h5filename : str or file-like object, default 'west.h5'
             Pathname or stream of a main WESTPA HDF5 data file.
+        cache_size : int, default 256 MiB
+            Maximum number of bytes of iteration data to keep in memory.
 
         """
-        return cls(h5filename)
+        return cls(h5filename, cache_size=cache_size)
 
     def close(self):
         """Close the Run instance by closing the underlying WESTPA HDF5 file."""
+        self.clear_cache()
         self.h5file.close()
 
+    def clear_cache(self):
+        """Discard all cached iteration data and bin mappers."""
+        self.cache.clear()
+        self._bin_mappers.clear()
+
     @property
     def closed(self):
         """bool: Whether the Run instance is closed."""
@@ -64,6 +84,8 @@ class Run:
             e.strerror = f'Failed to open {self.DESCRIPTION}: file {value!r} not found'
             raise e.with_traceback(None)
         self.h5file = h5file
+        self._file_format_version = h5file.attrs.get('west_file_format_version', h5file.attrs.get('wemd_file_format_version', 0))
+        self.clear_cache()
 
     @property
     def summary(self):
@@ -89,6 +111,13 @@ class Run:
                 self._num_iterations = current - 1
         return self._num_iterations
 
+    @property
+    def ancestry(self):
+        """AncestryIndex: Index of the parents of all walkers."""
+        if not hasattr(self, '_ancestry'):
+            self._ancestry = AncestryIndex.from_h5file(self.h5file, self.num_iterations)
+        return self._ancestry
+
     @property
     def iterations(self):
         """Sequence[Iteration]: Sequence of iterations."""
@@ -138,6 +167,15 @@ class Run:
             raise ValueError(f'iteration number must be in {valid_range}')
         return Iteration(number, self)
 
+    def _bin_mapper(self, binhash):
+        """Return the bin mapper with the given hash, unpickling it only once."""
+        try:
+            return self._bin_mappers[binhash]
+        except KeyError:
+            mapper, _, _ = mapper_from_hdf5(self.h5file['bin_topologies'], binhash)
+            self._bin_mappers[binhash] = mapper
+            return mapper
+
     def __len__(self):
         return self.num_iterations
 
@@ -212,7 +250,7 @@ class Iteration:
     @property
     def segment_summaries(self):
         """pd.DataFrame: Segment summary data for the iteration."""
-        df = pd.DataFrame(self.h5group['seg_index'][:], dtype=object)
+        df = pd.DataFrame(self._seg_index(), dtype=object)
 
         # Make 'endpoint_type' and 'status' human-readable.
         names = map(Segment.endpoint_type_names.get, df['endpoint_type'])
@@ -224,13 +262,14 @@ class Iteration:
 
     @property
     def pcoords(self):
-        """3D ndarray: Progress coordinate snaphots of each walker."""
-        return self.h5group['pcoord'][:]
+        """3D ndarray: Progress coordinate snaphots of each walker (read-only)."""
+        table = self._segment_table()
+        return self.h5group['pcoord'][:] if table is None else table.pcoords
 
     @property
     def weights(self):
-        """1D ndarray: Statistical weight of each walker."""
-        return self.h5group['seg_index']['weight']
+        """1D ndarray: Statistical weight of each walker (read-only)."""
+        return self._seg_index()['weight']
 
     @property
     def bin_target_counts(self):
@@ -243,10 +282,9 @@ class Iteration:
     @property
     def bin_mapper(self):
         """BinMapper: Bin mapper used in the iteration."""
-        if self.bin_target_counts is None:
+        if 'bin_target_counts' not in self.h5group:
             return None
-        mapper, _, _ = mapper_from_hdf5(self.run.h5file['bin_topologies'], self.h5group.attrs['binhash'])
-        return mapper
+        return self.run._bin_mapper(self.h5group.attrs['binhash'])
 
     @property
     def num_bins(self):
@@ -279,14 +317,14 @@ class Iteration:
     @property
     def recycled_walkers(self):
         """Iterable[Walker]: Walkers that stopped in the sink."""
-        endpoint_type = self.h5group['seg_index']['endpoint_type']
+        endpoint_type = self._seg_index()['endpoint_type']
         indices = np.flatnonzero(endpoint_type == Segment.SEG_ENDPOINT_RECYCLED)
         return (Walker(index, self) for index in indices)
 
     @property
     def initial_walkers(self):
         """Iterable[Walker]: Walkers whose parents are initial states."""
-        parent_ids = self.h5group['seg_index']['parent_id']
+        parent_ids = self._parent_ids()
         return (walker for walker, parent_id in zip(self, parent_ids) if parent_id < 0)
 
     @property
@@ -431,6 +469,74 @@ class Iteration:
         pcoord = self.h5group['tstates']['pcoord'][index]
         return TargetState(tostr(row['label']), pcoord, state_id=index)
 
+    def _segment_table(self):
+        """Return the segment index and progress coordinates of all walkers as a
+        cached :class:`SegmentTable`, or None if they do not fit in the cache."""
+        cache = self.run.cache
+        key = ('segments', self.number)
+        table = cache.get(key)
+        if table is None:
+            h5group = self.h5group
+            if not cache.fits(_nbytes(h5group['seg_index']) + _nbytes(h5group['pcoord'])):
+                return None
+            table = SegmentTable.from_iter_group(self.number, h5group, self.run._file_format_version)
+            for array in (table.seg_index, table.pcoords, table.parent_ids):
+                array.flags.writeable = False
+            cache.put(key, table, table.nbytes)
+        return table
+
+    def _segment_row(self, index):
+        """Return a :class:`SegmentTable` holding the walker with the given
+        index, and the row of the table holding it."""
+        table = self._segment_table()
+        if table is None:
+            seg_ids = [index]
+            return SegmentTable.from_iter_group(self.number, self.h5group, self.run._file_format_version, seg_ids), 0
+        return table, index
+
+    def _seg_index(self):
+        table = self._segment_table()
+        return self.h5group['seg_index'][:] if table is None else table.seg_index
+
+    def _parent_ids(self):
+        table = self._segment_table()
+        return get_iter_parent_ids(self.h5group) if table is None else table.parent_ids
+
+    def _children_index(self):
+        """Return the children of all walkers in compressed sparse row form, as a
+        pair ``(offsets, indices)`` such that the children of the walker with
+        index ``i`` are the walkers ``indices[offsets[i]:offsets[i+1]]`` of the
+        next iteration."""
+
+        def load():
+            parent_ids = self.next._parent_ids()
+            indices = np.flatnonzero(parent_ids >= 0)
+            parent_ids = parent_ids[indices]
+            indices = indices[np.argsort(parent_ids, kind='stable')]
+            offsets = np.zeros(self.num_walkers + 1, dtype=np.int64)
+            np.cumsum(np.bincount(parent_ids, minlength=self.num_walkers), out=offsets[1:])
+            return offsets, indices
+
+        return self.run.cache.get_or_load(('children', self.number), load, nbytes=lambda value: value[0].nbytes + value[1].nbytes)
+
+    def _auxiliary_columns(self):
+        """Return a dict of the cached auxiliary datasets of the iteration, or
+        None if they do not fit in the cache."""
+        cache = self.run.cache
+        key = ('auxdata', self.number)
+        columns = cache.get(key)
+        if columns is None:
+            group = self.auxiliary_data
+            datasets = {name: group[name] for name in group} if group is not None else {}
+            nbytes = sum(_nbytes(dataset) for dataset in datasets.values())
+            if not cache.fits(nbytes):
+                return None
+            columns = {name: dataset[...] for name, dataset in datasets.items()}
+            for column in columns.values():
+                column.flags.writeable = False
+            cache.put(key, columns, nbytes)
+        return columns
+
     def __iter__(self):
         return iter(self.walkers)
 
@@ -471,12 +577,14 @@ class Walker:
     @property
     def weight(self):
         """float64: Statistical weight of the walker."""
-        return self.iteration.weights[self.index]
+        table, row = self.iteration._segment_row(self.index)
+        return table.weights[row]
 
     @property
     def pcoords(self):
-        """2D ndarray: Progress coordinate snapshots."""
-        return self.iteration.h5group['pcoord'][self.index]
+        """2D ndarray: Progress coordinate snapshots (read-only)."""
+        table, row = self.iteration._segment_row(self.index)
+        return table.pcoords[row]
 
     @property
     def num_snapshots(self):
@@ -486,8 +594,9 @@ class Walker:
     @property
     def segment_summary(self):
         """pd.Series: Segment summary data."""
+        table, row = self.iteration._segment_row(self.index)
         df = pd.DataFrame(
-            self.iteration.h5group['seg_index'][[self.index]],
+            table.seg_index[[row]],
             index=[self.index],
             dtype=object,
         )
@@ -503,7 +612,8 @@ class Walker:
     @property
     def parent(self):
         """Walker or InitialState: The parent of the walker."""
-        parent_id = self.iteration.h5group['seg_index']['parent_id'][self.index]
+        table, row = self.iteration._segment_row(self.index)
+        parent_id = int(table.parent_ids[row])
 
         if parent_id >= 0:
             return Walker(parent_id, self.iteration.prev)
@@ -536,25 +646,29 @@ class Walker:
         next = self.iteration.next
         if next is None:
             return ()
-        indices = np.flatnonzero(next.h5group['seg_index']['parent_id'] == self.index)
-        return (Walker(index, next) for index in indices)
+        offsets, indices = self.iteration._children_index()
+        return (Walker(int(index), next) for index in indices[offsets[self.index] : offsets[self.index + 1]])
 
     @property
     def recycled(self):
         """bool: True if the walker stopped in the sink, False otherwise."""
-        endpoint_type = self.iteration.h5group['seg_index']['endpoint_type'][self.index]
-        return endpoint_type == Segment.SEG_ENDPOINT_RECYCLED
+        table, row = self.iteration._segment_row(self.index)
+        return table.endpoint_types[row] == Segment.SEG_ENDPOINT_RECYCLED
 
     @property
     def initial(self):
         """bool: True if the parent of the walker is an initial state, False otherwise."""
-        return self.iteration.h5group['seg_index']['parent_id'][self.index] < 0
+        table, row = self.iteration._segment_row(self.index)
+        return table.parent_ids[row] < 0
 
     @property
     def auxiliary_data(self):
         """dict: Auxiliary data for the walker."""
-        data = self.iteration.auxiliary_data or {}
-        return {name: data[name][self.index] for name in data}
+        columns = self.iteration._auxiliary_columns()
+        if columns is None:
+            data = self.iteration.auxiliary_data
+            return {name: data[name][self.index] for name in data}
+        return {name: column[self.index] for name, column in columns.items()}
 
     def trace(self, **kwargs):
         """Return the trace (ancestral line) of the walker.
@@ -707,18 +821,23 @@ class Trace:
             if max_length < 1:
                 raise ValueError('max_length must be at least 1')
 
-        walkers = []
+        # Follow the walker's ancestry back to its initial state, or by at most max_length walkers.
+        run = walker.run
+        (first_iter,), (indices,) = run.ancestry.trace(walker.iteration.number, walker.index, max_length=max_length)
+        walkers = [Walker(int(index), Iteration(int(first_iter) + i, run)) for i, index in enumerate(indices)]
+
+        # Stop at the last walker to have stopped in the source, if any.
+        stopped_in_source = False
+        if source:
+            for i in reversed(range(len(walkers))):
+                if walkers[i].pcoords[-1] in source:
+                    walkers = walkers[i + 1 :]
+                    stopped_in_source = True
+                    break
+
         initial_state = None
-        while len(walkers) < max_length:
-            if source and walker.pcoords[-1] in source:
-                break
-            walkers.append(walker)
-            parent = walker.parent
-            if isinstance(parent, InitialState):
-                initial_state = parent
-                break
-            walker = parent
-        walkers.reverse()
+        if walkers and not stopped_in_source and walkers[0].initial:
+            initial_state = walkers[0].parent
 
         self.walkers = walkers
         self.initial_state = initial_state
@@ -744,3 +863,8 @@ class Trace:
         if self.max_length < sys.maxsize:
             s += f', max_length={self.max_length}'
         return s + ')'
+
+
+def _nbytes(dataset):
+    """Return the number of bytes occupied by an HDF5 dataset once read into memory."""
+    return dataset.size * dataset.dtype.itemsize
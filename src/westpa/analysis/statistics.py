@@ -1,16 +1,169 @@
 import numpy as np
 
+from westpa.mclib import batched, mcbs_ci
 
-def time_average(observable, iterations):
+DEFAULT_CHUNK_SIZE = 16
+
+
+def vectorized(observable):
+    """Mark an observable as vectorized.
+
+    A vectorized observable takes an :class:`Iteration` as input and returns
+    an array with one row per walker, typically computed from whole-iteration
+    blocks such as ``iteration.pcoords`` or the datasets in
+    ``iteration.auxiliary_data``. For example::
+
+        @vectorized
+        def final_pcoord(iteration):
+            return iteration.pcoords[:, -1, 0]
+
+    Observables that are not vectorized take a single :class:`Walker` as
+    input, and are evaluated once per walker.
+
+    Parameters
+    ----------
+    observable : Callable[[Iteration], ArrayLike]
+        Function that takes an iteration as input and returns an array
+        of shape ``(iteration.num_walkers, ...)``.
+
+    Returns
+    -------
+    Callable[[Iteration], ArrayLike]
+        `observable`, marked as vectorized.
+
+    """
+    observable.vectorized = True
+    return observable
+
+
+def observable_values(observable, iteration):
+    """Evaluate an observable for every walker in an iteration.
+
+    Parameters
+    ----------
+    observable : Callable[[Walker], ArrayLike] or Callable[[Iteration], ArrayLike]
+        Observable to evaluate, either per walker or (if marked with
+        :func:`vectorized`) per iteration.
+    iteration : Iteration
+        Iteration whose walkers the observable is evaluated for.
+
+    Returns
+    -------
+    ndarray
+        Array of shape ``(iteration.num_walkers, ...)`` of observable values.
+
+    """
+    if not getattr(observable, 'vectorized', False):
+        return np.array([observable(walker) for walker in iteration])
+    values = np.asarray(observable(iteration))
+    if values.shape[:1] != (iteration.num_walkers,):
+        raise ValueError('vectorized observable must return one value per walker')
+    return values
+
+
+def _moments(observable, iteration):
+    values = observable_values(observable, iteration).astype(np.float64)
+    weights = iteration.weights
+    return np.tensordot(weights, values, axes=1), np.tensordot(weights, values * values, axes=1)
+
+
+def _histogram(observable, iteration, edges):
+    values = observable_values(observable, iteration)
+    # Each walker contributes its weight, spread evenly over its values.
+    values = values.reshape(len(values), -1)
+    weights = np.repeat(iteration.weights / values.shape[1], values.shape[1])
+    hist, _ = np.histogram(values.ravel(), bins=edges, weights=weights)
+    return hist
+
+
+def _evaluate_chunk(h5filename, numbers, function, observable, args):
+    from westpa.analysis.core import Run
+
+    with Run(h5filename) as run:
+        return [function(observable, run.iteration(number), *args) for number in numbers]
+
+
+def _map_iterations(function, observable, iterations, args=(), chunk_size=DEFAULT_CHUNK_SIZE, work_manager=None):
+    """Return ``[function(observable, iteration, *args) for iteration in
+    iterations]``, evaluated by `work_manager` in chunks of `chunk_size`
+    iterations if given."""
+    if work_manager is None:
+        return [function(observable, iteration, *args) for iteration in iterations]
+
+    iterations = list(iterations)
+    futures = []
+    for start in range(0, len(iterations), chunk_size):
+        chunk = iterations[start : start + chunk_size]
+        numbers = [iteration.number for iteration in chunk]
+        task_args = (chunk[0].run.h5filename, numbers, function, observable, args)
+        futures.append(work_manager.submit(_evaluate_chunk, args=task_args))
+
+    results = []
+    for future in futures:
+        results.extend(future.get_result(discard=True))
+    return results
+
+
+def ensemble_moments(observable, iterations, chunk_size=DEFAULT_CHUNK_SIZE, work_manager=None):
+    """Compute the weighted ensemble mean and variance of an observable in
+    each iteration.
+
+    Parameters
+    ----------
+    observable : Callable[[Walker], ArrayLike] or Callable[[Iteration], ArrayLike]
+        Observable to evaluate, either per walker or (if marked with
+        :func:`vectorized`) per iteration.
+    iterations : Sequence[Iteration]
+        Sequence of iterations in which to compute the moments.
+    chunk_size : int, default 16
+        Number of iterations evaluated per task when using `work_manager`.
+    work_manager : WorkManager, optional
+        Work manager through which to evaluate the observable in parallel.
+        The observable must then be picklable (e.g., a module-level function).
+
+    Returns
+    -------
+    means, variances : ndarray
+        Arrays of shape ``(len(iterations), ...)`` of the weighted mean and
+        variance of `observable` in each iteration.
+
+    """
+    moments = _map_iterations(_moments, observable, iterations, chunk_size=chunk_size, work_manager=work_manager)
+    means = np.array([first for first, _ in moments])
+    second_moments = np.array([second for _, second in moments])
+    return means, second_moments - means * means
+
+
+def ensemble_averages(observable, iterations, **kwargs):
+    """Compute the weighted ensemble average of an observable in each
+    iteration.
+
+    Keyword arguments are passed to :func:`ensemble_moments`.
+
+    Returns
+    -------
+    ndarray
+        Array of shape ``(len(iterations), ...)`` of the weighted average of
+        `observable` in each iteration.
+
+    """
+    return ensemble_moments(observable, iterations, **kwargs)[0]
+
+
+def time_average(observable, iterations, **kwargs):
     """Compute the time average of an observable.
 
     Parameters
     ----------
-    observable : Callable[[Walker], ArrayLike]
+    observable : Callable[[Walker], ArrayLike] or Callable[[Iteration], ArrayLike]
         Function that takes a walker as input and returns a number or
-        a fixed-size array of numbers.
+        a fixed-size array of numbers, or a :func:`vectorized` function
+        that takes an iteration as input and returns an array of such
+        values for all its walkers.
     iterations : Sequence[Iteration]
         Sequence of iterations over which to compute the average.
+    **kwargs
+        Passed to :func:`ensemble_moments`.
 
     Returns
     -------
@@ -18,10 +171,130 @@ def time_average(observable, iterations):
         The time average of `observable` over `iterations`.
 
     """
-    for iteration in iterations:
-        values = [observable(walker) for walker in iteration]
-        try:
-            value += np.dot(iteration.weights, values)
-        except NameError:
-            value = np.dot(iteration.weights, values)
-    return value / len(iterations)
+    return ensemble_averages(observable, iterations, **kwargs).mean(axis=0)
+
+
+def time_variance(observable, iterations, **kwargs):
+    """Compute the variance of an observable over the time-averaged weighted
+    ensemble.
+
+    Parameters
+    ----------
+    observable : Callable[[Walker], ArrayLike] or Callable[[Iteration], ArrayLike]
+        Observable to evaluate, either per walker or (if marked with
+        :func:`vectorized`) per iteration.
+    iterations : Sequence[Iteration]
+        Sequence of iterations over which to compute the variance.
+    **kwargs
+        Passed to :func:`ensemble_moments`.
+
+    Returns
+    -------
+    ArrayLike
+        The variance of `observable` over `iterations`.
+
+    """
+    means, variances = ensemble_moments(observable, iterations, **kwargs)
+    mean = means.mean(axis=0)
+    return (variances + means * means).mean(axis=0) - mean * mean
+
+
+def time_histogram(observable, iterations, bins, range=None, chunk_size=DEFAULT_CHUNK_SIZE, work_manager=None):
+    """Compute the time-averaged weighted histogram of an observable.
+
+    Parameters
+    ----------
+    observable : Callable[[Walker], ArrayLike] or Callable[[Iteration], ArrayLike]
+        Observable to evaluate, either per walker or (if marked with
+        :func:`vectorized`) per iteration. If it returns several values per
+        walker, the walker's weight is divided evenly among them.
+    iterations : Sequence[Iteration]
+        Sequence of iterations over which to compute the histogram.
+    bins : int or sequence of scalars
+        Number of bins, or bin edges.
+    range : (float, float), optional
+        Lower and upper bounds of the bins. Required if `bins` is an int.
+    chunk_size : int, default 16
+        Number of iterations evaluated per task when using `work_manager`.
+    work_manager : WorkManager, optional
+        Work manager through which to evaluate the observable in parallel.
+
+    Returns
+    -------
+    hist : ndarray
+        Time-averaged probability in each bin.
+    edges : ndarray
+        Bin edges.
+
+    """
+    if np.ndim(bins) == 0 and range is None:
+        raise ValueError('range must be given if bins is an int')
+    edges = np.histogram_bin_edges([], bins=bins, range=range)
+    hists = _map_iterations(_histogram, observable, iterations, args=(edges,), chunk_size=chunk_size, work_manager=work_manager)
+    return np.mean(hists, axis=0), edges
+
+
+def block_error(values, block_size):
+    """Estimate the standard error of the mean of a time series by block
+    averaging.
+
+    Parameters
+    ----------
+    values : ArrayLike
+        Time series (e.g., from :func:`ensemble_averages`), with time along
+        the first axis.
+    block_size : int
+        Number of consecutive values per block. Trailing values that do not
+        fill a block are discarded.
+
+    Returns
+    -------
+    ArrayLike
+        Standard error of the mean of `values`.
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_blocks = len(values) // block_size
+    if n_blocks < 2:
+        raise ValueError('at least two blocks are required')
+    blocks = values[: n_blocks * block_size].reshape(n_blocks, block_size, *values.shape[1:]).mean(axis=1)
+    return blocks.std(axis=0, ddof=1) / np.sqrt(n_blocks)
+
+
+@batched
+def _mean_estimator(values):
+    return values.mean(axis=1)
+
+
+def bootstrap_ci(values, alpha=0.05, n_sets=None, seed=None):
+    """Estimate a confidence interval on the mean of a time series by Monte
+    Carlo bootstrapping (see :func:`westpa.mclib.mcbs_ci`).
+
+    Bootstrapping assumes the values are uncorrelated; for correlated series,
+    apply it to block averages or use :func:`block_error`.
+
+    Parameters
+    ----------
+    values : ArrayLike
+        Time series (e.g., from :func:`ensemble_averages`), with time along
+        the first axis.
+    alpha : float, default 0.05
+        Significance level; the confidence level is ``1 - alpha``.
+    n_sets : int, optional
+        Number of synthetic data sets.
+    seed : int, optional
+        Random seed, for reproducible results.
+
+    Returns
+    -------
+    mean, lb, ub, sterr : ArrayLike
+        Mean of `values`, lower and upper bounds of the confidence interval,
+        and standard error of the mean.
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.reshape(len(values), -1)
+    results = np.array(
+        [mcbs_ci({'values': column}, _mean_estimator, alpha, len(column), n_sets=n_sets, seed=seed) for column in flat.T]
+    )
+    return tuple(result.reshape(values.shape[1:])[()] for result in results.T)
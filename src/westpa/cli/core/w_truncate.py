@@ -54,6 +54,7 @@ def entry_point():
         dm.del_iter_group(i)
 
     dm.del_iter_summary(n_iter)
+    dm.truncate_ancestry_index(n_iter - 1)
     dm.current_iteration = n_iter - 1
 
     westpa.rc.pstatus('simulation data truncated after iteration {}'.format(dm.current_iteration))
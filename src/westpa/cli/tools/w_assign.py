@@ -1,6 +1,8 @@
+import hashlib
 import logging
 import math
 import os
+from pickle import PickleError
 
 import numpy as np
 from numpy import index_exp
@@ -46,6 +48,23 @@ def _assign_label_pop(
     return (assignments, trajlabels, pops, lb, ub, statelabels)
 
 
+def _state_hash(state_map, state_labels):
+    '''Return a hash identifying the macrostate definitions given by ``state_map`` and ``state_labels``.'''
+    hash = hashlib.sha256(np.ascontiguousarray(state_map, dtype=index_dtype).tobytes())
+    for label in state_labels:
+        hash.update(b'\0' + label)
+    return hash.hexdigest()
+
+
+def _iter_offsets(nsegs, npts):
+    '''Return the offset of the data for each iteration in a ragged assignments data set, in which iterations
+    with ``nsegs`` segments and ``npts`` timepoints each are stored one after another, followed by the total
+    length of the data set.'''
+    iter_offsets = np.zeros((len(nsegs) + 1,), np.int64)
+    np.cumsum(np.asarray(nsegs, np.int64) * np.asarray(npts, np.int64), out=iter_offsets[1:])
+    return iter_offsets
+
+
 class WAssign(WESTParallelTool):
     prog = 'w_assign'
     description = '''\
@@ -190,12 +209,39 @@ space (which will cause most mappers to raise an error). More importantly, for
 indexed by state are of size *M+1* and entry *M* refers to trajectories
 initiated in a region not corresponding to a defined macrostate.
 
+With --ragged, ``/assignments``, ``/trajlabels`` and ``/statelabels`` are
+instead one-dimensional, holding the [segment][timepoint] data of each
+iteration one after another, with no padding. These data sets have a
+``layout`` attribute of ``ragged``, and the additional data set
+
+  ``/iter_offsets`` [iteration]
+    *(Integer)* Position of the first entry for each iteration, followed by
+    the total number of entries.
+
+gives where each iteration's data begin. The data for one iteration can be
+read, whichever layout is used, with ``westpa.core.h5io.get_iter_assignments``.
+
 Thus, ``labeled_populations[:,:,:].sum(axis=1)[:,:-1]`` gives overall per-bin
 populations, for all defined bins and
 ``labeled_populations[:,:,:].sum(axis=2)[:,:-1]`` gives overall
 per-trajectory-ensemble populations for all defined states.
 
 
+-----------------------------------------------------------------------------
+Appending to an existing assignment
+-----------------------------------------------------------------------------
+
+With --append, an existing output file is extended with the iterations run
+since it was written, rather than assigning the entire simulation again.
+Trajectory labels carry on from the last timepoint of the last iteration
+already assigned, so the result is the same as assigning every iteration at
+once. The output file records hashes of the bin mapper and macrostate
+definitions (``binhash`` and ``statehash`` attributes), and appending fails
+if these, or whether data are subsampled, differ from those now in effect.
+Files written by versions of this tool which did not record these hashes, or
+whose datasets cannot be resized, must be assigned again without --append.
+
+
 -----------------------------------------------------------------------------
 Parallelization
 -----------------------------------------------------------------------------
@@ -224,6 +270,8 @@ Command-line options
         self.output_filename = None
         self.states = []
         self.subsample = False
+        self.append = False
+        self.ragged = False
 
     def add_args(self, parser):
         self.data_reader.add_args(parser)
@@ -274,6 +322,22 @@ Command-line options
             help='''Load bins/macrostates from a scheme specified in west.cfg.''',
         )
         agroup.add_argument('--scheme-name', dest='scheme', help='''Name of scheme specified in west.cfg.''')
+        agroup.add_argument(
+            '--ragged',
+            dest='ragged',
+            action='store_true',
+            help='''Store assignments and labels for each iteration one after another, rather than padding
+                             every iteration to the largest number of segments and timepoints. This makes files
+                             smaller and faster to read when the number of segments varies between iterations.''',
+        )
+        agroup.add_argument(
+            '--append',
+            dest='append',
+            action='store_true',
+            help='''If OUTPUT already exists, assign only the iterations not yet in it, appending them to
+                             the existing data. The bins, macrostates and subsampling must be the same as those
+                             OUTPUT was assigned with.''',
+        )
 
     def process_args(self, args):
         self.progress.process_args(args)
@@ -293,6 +357,8 @@ Command-line options
                 self.binning.process_args(args)
 
         self.output_filename = args.output
+        self.append = args.append
+        self.ragged = args.ragged
 
         if args.config_from_file:
             if not args.scheme:
@@ -456,28 +522,17 @@ Command-line options
             assert self.dssynth.dsspec._h5file is None
         pi = self.progress.indicator
         pi.operation = 'Initializing'
-        with pi, self.data_reader, WESTPAH5File(self.output_filename, 'w', creating_program=True) as self.output_file:
+        append = self.append and os.path.exists(self.output_filename)
+        if self.append and not append:
+            log.info('{} does not exist; assigning all iterations'.format(self.output_filename))
+        output_mode = 'r+' if append else 'w'
+        with pi, self.data_reader, WESTPAH5File(self.output_filename, output_mode, creating_program=not append) as self.output_file:
             assign = self.binning.mapper.assign
 
-            # We always assign the entire simulation, so that no trajectory appears to start
-            # in a transition region that doesn't get initialized in one.
-            iter_start = 1
-            iter_stop = self.data_reader.current_iteration
-
-            h5io.stamp_iter_range(self.output_file, iter_start, iter_stop)
-
             nbins = self.binning.mapper.nbins
-            self.output_file.attrs['nbins'] = nbins
-
             state_map = np.empty((self.binning.mapper.nbins + 1,), index_dtype)
             state_map[:] = 0  # state_id == nstates => unknown state
 
-            # Recursive mappers produce a generator rather than a list of labels
-            # so consume the entire generator into a list
-            labels = [np.string_(label) for label in self.binning.mapper.labels]
-
-            self.output_file.create_dataset('bin_labels', data=labels, compression=9)
-
             if self.states:
                 nstates = len(self.states)
                 state_map[:] = nstates  # state_id == nstates => unknown state
@@ -488,86 +543,178 @@ Command-line options
                     state_assignments = assign(sdict['coords'])
                     for assignment in state_assignments:
                         state_map[assignment] = istate
-                self.output_file.create_dataset('state_map', data=state_map, compression=9, shuffle=True)
-                self.output_file['state_labels'] = state_labels  # + ['(unknown)']
             else:
                 nstates = 0
-            self.output_file.attrs['nstates'] = nstates
-            # Stamp if this has been subsampled.
-            self.output_file.attrs['subsampled'] = self.subsample
+                state_labels = []
+
+            try:
+                binhash = self.binning.mapper.pickle_and_hash()[1]
+            except PickleError:
+                binhash = None
+            statehash = _state_hash(state_map, state_labels)
+
+            # We always assign the entire simulation, so that no trajectory appears to start
+            # in a transition region that doesn't get initialized in one. When appending, the
+            # iterations already in the output file are kept, and only the rest are assigned.
+            iter_stop = self.data_reader.current_iteration
+            if append:
+                iter_start, first_iter = self.check_append(binhash, statehash)
+                if first_iter >= iter_stop:
+                    log.info('{} is up to date through iteration {}'.format(self.output_filename, first_iter - 1))
+                    return
+            else:
+                iter_start = first_iter = 1
+
+                self.output_file.attrs['nbins'] = nbins
+
+                # Recursive mappers produce a generator rather than a list of labels
+                # so consume the entire generator into a list
+                labels = [np.string_(label) for label in self.binning.mapper.labels]
+
+                self.output_file.create_dataset('bin_labels', data=labels, compression=9)
+
+                if self.states:
+                    self.output_file.create_dataset('state_map', data=state_map, compression=9, shuffle=True)
+                    self.output_file['state_labels'] = state_labels  # + ['(unknown)']
+                self.output_file.attrs['nstates'] = nstates
+                # Stamp if this has been subsampled.
+                self.output_file.attrs['subsampled'] = self.subsample
+                # Stamp hashes of the bins and states, so that we can tell whether iterations may be appended later.
+                if binhash is not None:
+                    self.output_file.attrs['binhash'] = binhash
+                self.output_file.attrs['statehash'] = statehash
+
+            h5io.stamp_iter_range(self.output_file, iter_start, iter_stop)
 
             iter_count = iter_stop - iter_start
-            nsegs = np.empty((iter_count,), seg_id_dtype)
-            npts = np.empty((iter_count,), seg_id_dtype)
+            new_nsegs = np.empty((iter_stop - first_iter,), seg_id_dtype)
+            new_npts = np.empty((iter_stop - first_iter,), seg_id_dtype)
 
             # scan for largest number of segments and largest number of points
-            pi.new_operation('Scanning for segment and point counts', iter_stop - iter_start)
-            for iiter, n_iter in enumerate(range(iter_start, iter_stop)):
+            pi.new_operation('Scanning for segment and point counts', iter_stop - first_iter)
+            for iiter, n_iter in enumerate(range(first_iter, iter_stop)):
                 iter_group = self.data_reader.get_iter_group(n_iter)
-                nsegs[iiter], npts[iiter] = iter_group['pcoord'].shape[0:2]
+                new_nsegs[iiter], new_npts[iiter] = iter_group['pcoord'].shape[0:2]
                 pi.progress += 1
                 del iter_group
 
             pi.new_operation('Preparing output')
 
-            # create datasets
-            self.output_file.create_dataset('nsegs', data=nsegs, shuffle=True, compression=9)
-            self.output_file.create_dataset('npts', data=npts, shuffle=True, compression=9)
-
-            max_nsegs = nsegs.max()
-            max_npts = npts.max()
-
-            assignments_shape = (iter_count, max_nsegs, max_npts)
-            assignments_dtype = np.min_scalar_type(nbins)
-            assignments_ds = self.output_file.create_dataset(
-                'assignments',
-                dtype=assignments_dtype,
-                shape=assignments_shape,
-                compression=4,
-                shuffle=True,
-                chunks=h5io.calc_chunksize(assignments_shape, assignments_dtype),
-                fillvalue=nbins,
-            )
-            if self.states:
-                trajlabel_dtype = np.min_scalar_type(nstates)
-                trajlabels_ds = self.output_file.create_dataset(
-                    'trajlabels',
-                    dtype=trajlabel_dtype,
+            if append:
+                nsegs_ds = self.output_file['nsegs']
+                npts_ds = self.output_file['npts']
+                for ds, new_data in ((nsegs_ds, new_nsegs), (npts_ds, new_npts)):
+                    ds.resize((iter_count,))
+                    ds[first_iter - iter_start :] = new_data
+                nsegs = nsegs_ds[:]
+                npts = npts_ds[:]
+
+                assignments_ds = self.output_file['assignments']
+                ragged = h5io.tostr(assignments_ds.attrs.get('layout', 'dense')) == 'ragged'
+                if ragged != self.ragged:
+                    log.info(
+                        'appending to {} using its existing {} layout'.format(self.output_filename, 'ragged' if ragged else 'dense')
+                    )
+                if ragged:
+                    iter_offsets = _iter_offsets(nsegs, npts)
+                    offsets_ds = self.output_file['iter_offsets']
+                    offsets_ds.resize((iter_count + 1,))
+                    offsets_ds[...] = iter_offsets
+                    assignments_shape = (iter_offsets[-1],)
+                else:
+                    assignments_shape = (iter_count, nsegs.max(), npts.max())
+                assignments_ds.resize(assignments_shape)
+                if self.states:
+                    trajlabels_ds = self.output_file['trajlabels']
+                    statelabels_ds = self.output_file['statelabels']
+                    trajlabels_ds.resize(assignments_shape)
+                    statelabels_ds.resize(assignments_shape)
+                pops_ds = self.output_file['labeled_populations']
+                pops_ds.resize((iter_count, nstates + 1, nbins + 1))
+
+                # mapping of seg_id to last macrostate inhabited, as of the last iteration already assigned
+                if self.states:
+                    last_labels = h5io.get_iter_assignments(self.output_file, 'trajlabels', first_iter - 1)[:, -1]
+                    last_labels = last_labels.astype(index_dtype)
+                else:
+                    last_labels = np.empty((nsegs[first_iter - 1 - iter_start],), index_dtype)
+                    last_labels[:] = nstates
+            else:
+                nsegs = new_nsegs
+                npts = new_npts
+
+                # create datasets, resizable along every axis so that later iterations may be appended
+                self.output_file.create_dataset('nsegs', data=nsegs, shuffle=True, compression=9, maxshape=(None,))
+                self.output_file.create_dataset('npts', data=npts, shuffle=True, compression=9, maxshape=(None,))
+
+                # assignments are stored either as [iteration][segment][timepoint] arrays padded to the
+                # largest number of segments and timepoints, or flattened one iteration after another
+                ragged = self.ragged
+                if ragged:
+                    iter_offsets = _iter_offsets(nsegs, npts)
+                    self.output_file.create_dataset(
+                        'iter_offsets', data=iter_offsets, shuffle=True, compression=9, maxshape=(None,)
+                    )
+                    assignments_shape = (iter_offsets[-1],)
+                else:
+                    assignments_shape = (iter_count, nsegs.max(), npts.max())
+                maxshape = (None,) * len(assignments_shape)
+                assignments_dtype = np.min_scalar_type(nbins)
+                assignments_ds = self.output_file.create_dataset(
+                    'assignments',
+                    dtype=assignments_dtype,
                     shape=assignments_shape,
+                    maxshape=maxshape,
                     compression=4,
                     shuffle=True,
-                    chunks=h5io.calc_chunksize(assignments_shape, trajlabel_dtype),
-                    fillvalue=nstates,
+                    chunks=h5io.calc_chunksize(assignments_shape, assignments_dtype),
+                    fillvalue=nbins,
                 )
-                statelabels_ds = self.output_file.create_dataset(
-                    'statelabels',
-                    dtype=trajlabel_dtype,
-                    shape=assignments_shape,
+                if self.states:
+                    trajlabel_dtype = np.min_scalar_type(nstates)
+                    trajlabels_ds = self.output_file.create_dataset(
+                        'trajlabels',
+                        dtype=trajlabel_dtype,
+                        shape=assignments_shape,
+                        maxshape=maxshape,
+                        compression=4,
+                        shuffle=True,
+                        chunks=h5io.calc_chunksize(assignments_shape, trajlabel_dtype),
+                        fillvalue=nstates,
+                    )
+                    statelabels_ds = self.output_file.create_dataset(
+                        'statelabels',
+                        dtype=trajlabel_dtype,
+                        shape=assignments_shape,
+                        maxshape=maxshape,
+                        compression=4,
+                        shuffle=True,
+                        chunks=h5io.calc_chunksize(assignments_shape, trajlabel_dtype),
+                        fillvalue=nstates,
+                    )
+
+                pops_shape = (iter_count, nstates + 1, nbins + 1)
+                pops_ds = self.output_file.create_dataset(
+                    'labeled_populations',
+                    dtype=weight_dtype,
+                    shape=pops_shape,
+                    maxshape=(None, nstates + 1, nbins + 1),
                     compression=4,
                     shuffle=True,
-                    chunks=h5io.calc_chunksize(assignments_shape, trajlabel_dtype),
-                    fillvalue=nstates,
+                    chunks=h5io.calc_chunksize(pops_shape, weight_dtype),
                 )
+                h5io.label_axes(pops_ds, [np.string_(i) for i in ['iteration', 'state', 'bin']])
+                if ragged:
+                    for dsname in 'assignments', 'trajlabels', 'statelabels':
+                        if dsname in self.output_file:
+                            self.output_file[dsname].attrs['layout'] = 'ragged'
 
-            pops_shape = (iter_count, nstates + 1, nbins + 1)
-            pops_ds = self.output_file.create_dataset(
-                'labeled_populations',
-                dtype=weight_dtype,
-                shape=pops_shape,
-                compression=4,
-                shuffle=True,
-                chunks=h5io.calc_chunksize(pops_shape, weight_dtype),
-            )
-            h5io.label_axes(pops_ds, [np.string_(i) for i in ['iteration', 'state', 'bin']])
-
-            pi.new_operation('Assigning to bins', iter_stop - iter_start)
-            last_labels = None  # mapping of seg_id to last macrostate inhabited
-            for iiter, n_iter in enumerate(range(iter_start, iter_stop)):
-                # get iteration info in this block
+                last_labels = np.empty((nsegs[0],), index_dtype)  # mapping of seg_id to last macrostate inhabited
+                last_labels[:] = nstates  # unknown state
 
-                if iiter == 0:
-                    last_labels = np.empty((nsegs[iiter],), index_dtype)
-                    last_labels[:] = nstates  # unknown state
+            pi.new_operation('Assigning to bins', iter_stop - first_iter)
+            for n_iter in range(first_iter, iter_stop):
+                iiter = n_iter - iter_start
 
                 # Slices this iteration into n_workers groups of segments, submits them to wm, splices results back together
                 assignments, trajlabels, pops, statelabels = self.assign_iteration(n_iter, nstates, nbins, state_map, last_labels)
@@ -575,17 +722,54 @@ Command-line options
                 # Do stuff with this iteration's results
 
                 last_labels = trajlabels[:, -1].copy()
-                assignments_ds[iiter, 0 : nsegs[iiter], 0 : npts[iiter]] = assignments
+                if ragged:
+                    index = np.index_exp[iter_offsets[iiter] : iter_offsets[iiter + 1]]
+                    assignments, trajlabels, statelabels = assignments.ravel(), trajlabels.ravel(), statelabels.ravel()
+                else:
+                    index = np.index_exp[iiter, 0 : nsegs[iiter], 0 : npts[iiter]]
+                assignments_ds[index] = assignments
                 pops_ds[iiter] = pops
                 if self.states:
-                    trajlabels_ds[iiter, 0 : nsegs[iiter], 0 : npts[iiter]] = trajlabels
-                    statelabels_ds[iiter, 0 : nsegs[iiter], 0 : npts[iiter]] = statelabels
+                    trajlabels_ds[index] = trajlabels
+                    statelabels_ds[index] = statelabels
 
                 pi.progress += 1
                 del assignments, trajlabels, pops, statelabels
 
-            for dsname in 'assignments', 'npts', 'nsegs', 'labeled_populations', 'statelabels':
-                h5io.stamp_iter_range(self.output_file[dsname], iter_start, iter_stop)
+            for dsname in 'assignments', 'npts', 'nsegs', 'labeled_populations', 'trajlabels', 'statelabels':
+                if dsname in self.output_file:
+                    h5io.stamp_iter_range(self.output_file[dsname], iter_start, iter_stop)
+
+    def check_append(self, binhash, statehash):
+        '''Check that iterations may be appended to the open output file, which must have been assigned with
+        the same bins, macrostates and subsampling as are now in effect. Returns ``(iter_start, first_iter)``,
+        the first iteration in the file and the first iteration not yet assigned.'''
+
+        attrs = self.output_file.attrs
+        if 'binhash' not in attrs or 'statehash' not in attrs:
+            raise ValueError(
+                'cannot append to {}, which does not record which bins and states it was assigned with; '
+                'assign all iterations by omitting --append'.format(self.output_filename)
+            )
+        if binhash is None or h5io.tostr(attrs['binhash']) != binhash:
+            raise ValueError('cannot append to {}, which was assigned using different bins'.format(self.output_filename))
+        if h5io.tostr(attrs['statehash']) != statehash:
+            raise ValueError('cannot append to {}, which was assigned using different macrostates'.format(self.output_filename))
+        if bool(attrs['subsampled']) != bool(self.subsample):
+            raise ValueError('cannot append to {}, which was assigned with different subsampling'.format(self.output_filename))
+        if self.output_file['assignments'].maxshape[0] is not None:
+            raise ValueError(
+                'cannot append to {}, whose datasets cannot be resized; '
+                'assign all iterations by omitting --append'.format(self.output_filename)
+            )
+
+        iter_start, first_iter = h5io.get_iter_range(self.output_file)
+        log.info(
+            'appending iterations {} through {} to {}'.format(
+                first_iter, self.data_reader.current_iteration - 1, self.output_filename
+            )
+        )
+        return iter_start, first_iter
 
 
 def entry_point():
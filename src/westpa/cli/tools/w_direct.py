@@ -6,11 +6,11 @@ from westpa.core.data_manager import weight_dtype
 from westpa.tools import WESTMasterCommand, WESTParallelTool
 
 from westpa.core import h5io
-from westpa.core.kinetics import sequence_macro_flux_to_rate, WKinetics
+from westpa.core.kinetics import WKinetics
 
 from westpa.tools.kinetics_tool import WESTKineticsBase, AverageCommands
 
-from westpa.mclib import mcbs_ci_correl, _1D_simple_eval_block, _2D_simple_eval_block
+from westpa.mclib import mcbs_ci_correl, batched, block_seed_sequence, _1D_simple_eval_block, _2D_simple_eval_block
 
 
 # From w_stateprobs
@@ -19,9 +19,26 @@ from westpa.core.binning import accumulate_state_populations_from_labeled
 log = logging.getLogger('w_direct')
 
 
+@batched
+def _macro_flux_to_rate(dataset, pops, istate, jstate, pairwise=True, stride=None):
+    '''Batched counterpart of ``sequence_macro_flux_to_rate``, returning the rate from ``istate`` to
+    ``jstate`` over the whole of each of a set of flux/population sequences (first axis).'''
+    pops_i = pops[:, :, istate]
+    if pairwise:
+        pair_pops = pops_i + pops[:, :, jstate]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pops_i = np.where(pair_pops != 0.0, pops_i / pair_pops, pops_i)
+    fluxsum = dataset.sum(axis=1)
+    psum = pops_i.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((psum > 0) & (fluxsum > 0), fluxsum / psum, 0.0)
+
+
 # This block is responsible for submitting a set of calculations to be bootstrapped over for a particular type of calculation.
 # A property which wishes to be calculated should adhere to this format.
-def _rate_eval_block(iblock, start, stop, nstates, data_input, name, mcbs_alpha, mcbs_nsets, mcbs_acalpha, do_correl, mcbs_enable):
+def _rate_eval_block(
+    iblock, start, stop, nstates, data_input, name, mcbs_alpha, mcbs_nsets, mcbs_acalpha, do_correl, mcbs_enable, mcbs_seed=None
+):
     # Our rate estimator is a little more complex, so we've defined a custom evaluation block for it,
     # instead of just using the block evalutors that we've imported.
     results = []
@@ -37,7 +54,7 @@ def _rate_eval_block(iblock, start, stop, nstates, data_input, name, mcbs_alpha,
             dataset = {'dataset': data_input['dataset'][:, istate, jstate], 'pops': data_input['pops']}
             ci_res = mcbs_ci_correl(
                 dataset,
-                estimator=sequence_macro_flux_to_rate,
+                estimator=_macro_flux_to_rate,
                 alpha=mcbs_alpha,
                 n_sets=mcbs_nsets,
                 autocorrel_alpha=mcbs_acalpha,
@@ -45,6 +62,7 @@ def _rate_eval_block(iblock, start, stop, nstates, data_input, name, mcbs_alpha,
                 do_correl=do_correl,
                 mcbs_enable=mcbs_enable,
                 estimator_kwargs=kwargs,
+                seed=block_seed_sequence(mcbs_seed, name, iblock, istate, jstate),
             )
             results.append((name, iblock, istate, jstate, (start, stop) + ci_res))
 
@@ -227,6 +245,9 @@ Each of these datasets is also stamped with a number of attributes:
     (Integer) Number of bootstrap data sets used in generating confidence
     intervals.
 
+  mcbs_seed
+    (Integer) Seed used for bootstrapping, if one was given with --seed.
+
   mcbs_acalpha
     (Floating-point) Alpha value for determining correlation lengths.
 
@@ -391,6 +412,9 @@ Each of these datasets is also stamped with a number of attributes:
     (Integer) Number of bootstrap data sets used in generating confidence
     intervals.
 
+  mcbs_seed
+    (Integer) Seed used for bootstrapping, if one was given with --seed.
+
   mcbs_acalpha
     (Floating-point) Alpha value for determining correlation lengths.
 
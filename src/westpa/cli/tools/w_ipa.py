@@ -588,11 +588,12 @@ class WIPI(WESTParallelTool):
                     key = []
             except Exception:
                 pass
-            for iter in reversed(list(range(1, self.iteration + 1))):
+            (first_iter,), (path,) = self.data_reader.data_manager.get_ancestry_index().trace(self.iteration, seg_id)
+            for iter, seg_id in zip(range(self.iteration, first_iter - 1, -1), path[::-1]):
                 iter_group = self.data_reader.get_iter_group(iter)
                 current['pcoord'].append(iter_group['pcoord'][seg_id, :, :])
-                current['states'].append(self.assign['trajlabels'][iter - 1, seg_id, :])
-                current['bins'].append(self.assign['assignments'][iter - 1, seg_id, :])
+                current['states'].append(h5io.get_iter_assignments(self.assign, 'trajlabels', iter, seg_id))
+                current['bins'].append(h5io.get_iter_assignments(self.assign, 'assignments', iter, seg_id))
                 current['seg_id'].append(seg_id)
                 current['weights'].append(iter_group['seg_index']['weight'][seg_id])
                 current['iteration'].append(iter)
@@ -601,10 +602,6 @@ class WIPI(WESTParallelTool):
                         current['auxdata'][key].append(iter_group['auxdata'][key][seg_id])
                 except Exception:
                     pass
-                seg_id = iter_group['seg_index']['parent_id'][seg_id]
-                if seg_id < 0:
-                    # Necessary for steady state simulations.  This means they started in that iteration.
-                    break
                 pi.progress += 1
         current['seg_id'] = list(reversed(current['seg_id']))
         current['iteration'] = list(reversed(current['iteration']))
@@ -713,8 +710,8 @@ class WIPI(WESTParallelTool):
                     pass
                 future['parents'].append(iter_data['parents'][children])
                 future['seg_id'].append(iter_data['seg_id'][children])
-                future['states'].append(self.assign['trajlabels'][value - 1, children, :])
-                future['bins'].append(self.assign['assignments'][value - 1, children, :])
+                future['states'].append(h5io.get_iter_assignments(self.assign, 'trajlabels', value, children))
+                future['bins'].append(h5io.get_iter_assignments(self.assign, 'assignments', value, children))
         return future
 
     def go(self):
@@ -172,7 +172,7 @@ Command-line arguments
             pi.new_operation('Finding matching segments', extent=iter_count)
             for iiter, n_iter in enumerate(range(iter_start, iter_stop)):
                 assignments = np.require(
-                    assignments_ds[h5io.get_iteration_entry(assignments_ds, n_iter) + np.index_exp[:, timepoint]],
+                    h5io.get_iter_assignments(assignments_file, 'assignments', n_iter)[:, timepoint],
                     dtype=westpa.core.binning.index_dtype,
                 )
                 all_weights = self.data_reader.get_iter_group(n_iter)['seg_index']['weight']
@@ -12,7 +12,7 @@ from westpa.tools import (
     ProgressIndicatorComponent,
 )
 
-from westpa.fasthist import histnd, normhistnd
+from westpa.fasthist import histnd, minmax, normhistnd
 from westpa.core import h5io
 
 
@@ -28,44 +28,38 @@ def isiterable(x):
         return True
 
 
-def _remote_min_max(ndim, dset_dtype, n_iter, dsspec):
-    try:
-        minval = np.finfo(dset_dtype).min
-        maxval = np.finfo(dset_dtype).max
-    except ValueError:
-        minval = np.iinfo(dset_dtype).min
-        maxval = np.iinfo(dset_dtype).max
-
-    data_range = [(maxval, minval) for _i in range(ndim)]
-
+def _remote_min_max(ndim, n_iter, dsspec, wt_dsspec=None):
+    '''Find the range of the data for iteration ``n_iter``. If ``wt_dsspec`` is given, the data and weights
+    are also returned, so that they may be histogrammed later without being read again.'''
     dset = dsspec.get_iter_data(n_iter)
-    for idim in range(ndim):
-        dimdata = dset[:, :, idim]
-        current_min, current_max = data_range[idim]
-        current_min = min(current_min, dimdata.min())
-        current_max = max(current_max, dimdata.max())
-        data_range[idim] = (current_min, current_max)
-        del dimdata
-    del dset
-    return data_range
+    minvals, maxvals = minmax(dset)
+    data_range = [(minvals[idim], maxvals[idim]) for idim in range(ndim)]
 
+    if wt_dsspec is None:
+        del dset
+        return n_iter, data_range, None, None
+    else:
+        return n_iter, data_range, dset, wt_dsspec.get_iter_data(n_iter)
 
-def _remote_bin_iter(iiter, n_iter, dsspec, wt_dsspec, initpoint, binbounds, ignore_out_of_range):
+
+def _bin_iter_data(dset, weights, initpoint, binbounds, ignore_out_of_range):
+    '''Histogram the data ``dset`` [segment][timepoint][dimension] from timepoint ``initpoint`` on, with each
+    segment contributing its weight at each timepoint, and return the normalized histogram.'''
     iter_hist_shape = tuple(len(bounds) - 1 for bounds in binbounds)
     iter_hist = np.zeros(iter_hist_shape, dtype=np.float64)
 
-    dset = dsspec.get_iter_data(n_iter)
-    npts = dset.shape[1]
-    weights = wt_dsspec.get_iter_data(n_iter)
-
-    dset = dset[:, initpoint:, :]
-    for ipt in range(npts - initpoint):
-        histnd(dset[:, ipt, :], binbounds, weights, out=iter_hist, binbound_check=False, ignore_out_of_range=ignore_out_of_range)
-
-    del weights, dset
+    histnd(dset[:, initpoint:, :], binbounds, weights, out=iter_hist, binbound_check=False, ignore_out_of_range=ignore_out_of_range)
 
     # normalize histogram
     normhistnd(iter_hist, binbounds)
+    return iter_hist
+
+
+def _remote_bin_iter(iiter, n_iter, dsspec, wt_dsspec, initpoint, binbounds, ignore_out_of_range):
+    dset = dsspec.get_iter_data(n_iter)
+    weights = wt_dsspec.get_iter_data(n_iter)
+    iter_hist = _bin_iter_data(dset, weights, initpoint, binbounds, ignore_out_of_range)
+    del weights, dset
     return iiter, n_iter, iter_hist
 
 
@@ -127,8 +121,11 @@ kinds of arguments:
 
 The first two forms (integer, list of integers) will trigger a scan of all
 data in each dimension in order to determine the minimum and maximum values,
-which may be very expensive for large datasets. This can be avoided by
-explicitly providing bin boundaries using the list-of-lists form.
+which may be very expensive for large datasets. Data read during this scan
+are kept in memory (up to --max-cache-size megabytes) and histogrammed
+without being read again, so that small datasets are only read once. The
+scan can be avoided altogether by explicitly providing bin boundaries using
+the list-of-lists form.
 
 Note that these bins are *NOT* at all related to the bins used to drive WE
 sampling.
@@ -217,6 +214,8 @@ Command-line options
         self.data_range = None  # data range for each dimension, as the pairs (min,max)
         self.ignore_out_of_range = False
         self.compress_output = False
+        self.max_cache_bytes = 0
+        self.data_cache = {}  # data and weights read while scanning for the data range, by iteration
 
     def add_args(self, parser):
         self.data_reader.add_args(parser)
@@ -258,6 +257,16 @@ Command-line options
                             sure of your bin boundary specification.)''',
         )
 
+        parser.add_argument(
+            '--max-cache-size',
+            dest='max_cache_size',
+            metavar='MB',
+            type=float,
+            default=512,
+            help='''When scanning the data for its range in order to construct bins, keep up to MB megabytes
+                            of data in memory to be histogrammed without being read again. (Default: %(default)s.)''',
+        )
+
         igroup = parser.add_argument_group('input dataset options').add_mutually_exclusive_group(required=False)
 
         igroup.add_argument(
@@ -305,6 +314,7 @@ Command-line options
         self.output_filename = args.output
         self.ignore_out_of_range = bool(args.ignore_out_of_range)
         self.compress_output = args.compress or False
+        self.max_cache_bytes = int(args.max_cache_size * 2**20)
 
     def go(self):
         self.data_reader.open('r')
@@ -382,35 +392,30 @@ Command-line options
         self.progress.indicator.new_operation('Scanning for data range', self.iter_stop - self.iter_start)
         self.scan_data_shape()
 
-        dset_dtype = self.dset_dtype
         ndim = self.ndim
         dsspec = self.dsspec
-
-        try:
-            minval = np.finfo(dset_dtype).min
-            maxval = np.finfo(dset_dtype).max
-        except ValueError:
-            minval = np.iinfo(dset_dtype).min
-            maxval = np.iinfo(dset_dtype).max
-
-        data_range = self.data_range = [(maxval, minval) for _i in range(self.ndim)]
-
-        # futures = []
-        # for n_iter in xrange(self.iter_start, self.iter_stop):
-        # _remote_min_max(ndim, dset_dtype, n_iter, dsspec)
-        #    futures.append(self.work_manager.submit(_remote_min_max, args=(ndim, dset_dtype, n_iter, dsspec)))
-
-        # for future in self.work_manager.as_completed(futures):
-        for future in self.work_manager.submit_as_completed(
-            ((_remote_min_max, (ndim, dset_dtype, n_iter, dsspec), {}) for n_iter in range(self.iter_start, self.iter_stop)),
-            self.max_queue_len,
-        ):
-            bounds = future.get_result(discard=True)
+        data_range = self.data_range = [None] * ndim
+        data_cache = self.data_cache
+        cached_bytes = 0
+
+        def task_gen():
+            for n_iter in range(self.iter_start, self.iter_stop):
+                # ask for the data back only while there is room to keep it
+                wt_dsspec = self.wt_dsspec if cached_bytes < self.max_cache_bytes else None
+                yield (_remote_min_max, (ndim, n_iter, dsspec, wt_dsspec), {})
+
+        for future in self.work_manager.submit_as_completed(task_gen(), self.max_queue_len):
+            n_iter, bounds, dset, weights = future.get_result(discard=True)
             for idim in range(ndim):
-                current_min, current_max = data_range[idim]
-                current_min = min(current_min, bounds[idim][0])
-                current_max = max(current_max, bounds[idim][1])
-                data_range[idim] = (current_min, current_max)
+                if data_range[idim] is None:
+                    data_range[idim] = bounds[idim]
+                else:
+                    current_min, current_max = data_range[idim]
+                    data_range[idim] = (min(current_min, bounds[idim][0]), max(current_max, bounds[idim][1]))
+            if dset is not None and cached_bytes + dset.nbytes + weights.nbytes <= self.max_cache_bytes:
+                data_cache[n_iter] = (dset, weights)
+                cached_bytes += dset.nbytes + weights.nbytes
+            del dset, weights
             self.progress.indicator.progress += 1
 
     def _construct_bins_from_scalar(self, bins):
@@ -480,6 +485,17 @@ Command-line options
         binbounds = [np.require(boundset, self.dset_dtype, 'C') for boundset in self.binbounds]
 
         self.progress.indicator.new_operation('Constructing histograms', self.iter_stop - self.iter_start)
+
+        # Iterations read while scanning for the data range are histogrammed here, rather than read again
+        histograms_done = np.zeros((iter_count,), np.bool_)
+        for n_iter in sorted(self.data_cache):
+            iiter = n_iter - self.iter_start
+            dset, weights = self.data_cache.pop(n_iter)
+            histograms_ds[iiter] = _bin_iter_data(dset, weights, 1 if iiter > 0 else 0, binbounds, self.ignore_out_of_range)
+            histograms_done[iiter] = True
+            self.progress.indicator.progress += 1
+            del dset, weights
+
         task_gen = (
             (
                 _remote_bin_iter,
@@ -487,16 +503,8 @@ Command-line options
                 {},
             )
             for (iiter, n_iter) in enumerate(range(self.iter_start, self.iter_stop))
+            if not histograms_done[iiter]
         )
-        # futures = set()
-        # for iiter, n_iter in enumerate(xrange(self.iter_start, self.iter_stop)):
-        #    initpoint = 1 if iiter > 0 else 0
-        #    futures.add(self.work_manager.submit(_remote_bin_iter,
-        #                                            args=(iiter, n_iter, self.dsspec, self.wt_dsspec, initpoint, binbounds)))
-
-        # for future in self.work_manager.as_completed(futures):
-        # future = self.work_manager.wait_any(futures)
-        # for future in self.work_manager.submit_as_completed(task_gen, self.queue_size):
         log.debug('max queue length: {!r}'.format(self.max_queue_len))
         for future in self.work_manager.submit_as_completed(task_gen, self.max_queue_len):
             iiter, n_iter, iter_hist = future.get_result(discard=True)
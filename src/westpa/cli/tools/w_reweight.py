@@ -9,7 +9,7 @@ from westpa.tools.kinetics_tool import WESTKineticsBase, AverageCommands, genera
 from westpa.core import h5io
 
 
-from westpa.mclib import mcbs_ci_correl
+from westpa.mclib import mcbs_ci_correl, block_seed_sequence
 
 from westpa.core.reweight import reweight_for_c, FluxMatrix
 
@@ -22,7 +22,19 @@ log = logging.getLogger('w_reweight')
 
 
 def _2D_eval_block(
-    iblock, start, stop, nstates, data_input, name, mcbs_alpha, mcbs_nsets, mcbs_acalpha, do_correl, mcbs_enable, estimator_kwargs
+    iblock,
+    start,
+    stop,
+    nstates,
+    data_input,
+    name,
+    mcbs_alpha,
+    mcbs_nsets,
+    mcbs_acalpha,
+    do_correl,
+    mcbs_enable,
+    estimator_kwargs,
+    mcbs_seed=None,
 ):
     # As our reweighting estimator is a weird function, we can't use the general mclib block.
     results = []
@@ -44,6 +56,7 @@ def _2D_eval_block(
                 do_correl=do_correl,
                 mcbs_enable=mcbs_enable,
                 estimator_kwargs=estimator_kwargs,
+                seed=block_seed_sequence(mcbs_seed, name, iblock, istate, jstate),
             )
             results.append((name, iblock, istate, jstate, (start, stop) + ci_res))
 
@@ -51,7 +64,19 @@ def _2D_eval_block(
 
 
 def _1D_eval_block(
-    iblock, start, stop, nstates, data_input, name, mcbs_alpha, mcbs_nsets, mcbs_acalpha, do_correl, mcbs_enable, estimator_kwargs
+    iblock,
+    start,
+    stop,
+    nstates,
+    data_input,
+    name,
+    mcbs_alpha,
+    mcbs_nsets,
+    mcbs_acalpha,
+    do_correl,
+    mcbs_enable,
+    estimator_kwargs,
+    mcbs_seed=None,
 ):
     # As our reweighting estimator is a weird function, we can't use the general mclib block.
     results = []
@@ -73,6 +98,7 @@ def _1D_eval_block(
             do_correl=do_correl,
             mcbs_enable=mcbs_enable,
             estimator_kwargs=estimator_kwargs,
+            seed=block_seed_sequence(mcbs_seed, name, iblock, istate),
         )
         results.append((name, iblock, istate, (start, stop) + ci_res))
 
@@ -374,6 +400,9 @@ Each of these datasets is also stamped with a number of attributes:
     (Integer) Number of bootstrap data sets used in generating confidence
     intervals.
 
+  mcbs_seed
+    (Integer) Seed used for bootstrapping, if one was given with --seed.
+
   mcbs_acalpha
     (Floating-point) Alpha value for determining correlation lengths.
 
@@ -566,6 +595,9 @@ Each of these datasets is also stamped with a number of attributes:
     (Integer) Number of bootstrap data sets used in generating confidence
     intervals.
 
+  mcbs_seed
+    (Integer) Seed used for bootstrapping, if one was given with --seed.
+
   mcbs_acalpha
     (Floating-point) Alpha value for determining correlation lengths.
 
@@ -679,6 +711,7 @@ Command-line options
                     do_correl=self.do_correl,
                     name='Bin Population Evolution',
                     mcbs_enable=self.mcbs_enable,
+                    mcbs_seed=self.mcbs_seed,
                     data_input={},
                     **submit_kwargs
                 )
@@ -84,6 +84,9 @@ Each of these datasets is also stamped with a number of attributes:
     (Integer) Number of bootstrap data sets used in generating confidence
     intervals.
 
+  mcbs_seed
+    (Integer) Seed used for bootstrapping, if one was given with --seed.
+
   mcbs_acalpha
     (Floating-point) Alpha value for determining correlation lengths.
 
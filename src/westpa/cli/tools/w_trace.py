@@ -43,60 +43,30 @@ class Trace:
         '''Construct and return a trajectory trace whose last segment is identified
         by ``seg_id`` in the iteration number ``n_iter``.'''
 
-        data_manager = data_manager or westpa.rc.get_data_manager()
-
-        # These values are used later on
-        endpoint_type = None
-        pcoord_dtype = None
-        pcoord_pt_shape = None
-
-        seginfo = []
-        parent_id = seg_id
-
-        while n_iter > 0 and parent_id >= 0:
-            seg_id = parent_id
-            iter_group = data_manager.get_iter_group(n_iter)
-            pcoord_ds = iter_group['pcoord']
-            seg_index = iter_group['seg_index']
-            n_segs = pcoord_ds.shape[0]
-            pcoord_len = pcoord_ds.shape[1]
-
-            assert seg_id < n_segs
-
-            indexrow = seg_index[seg_id]
-            final_pcoord = pcoord_ds[seg_id, pcoord_len - 1]
-            weight = indexrow['weight']
-            cputime = indexrow['cputime']
-            walltime = indexrow['walltime']
+        return cls.from_data_manager_batch([(n_iter, seg_id)], data_manager)[0]
 
-            try:
-                parent_id = int(indexrow['parent_id'])
-            except IndexError:
-                # old HDF5 version
-                parent_id = int(iter_group['parents'][indexrow['parents_offset']])
-
-            if endpoint_type is None:
-                endpoint_type = indexrow['endpoint_type']
-                pcoord_pt_shape = pcoord_ds.shape[2:]
-                pcoord_dtype = pcoord_ds.dtype
-
-            seginfo.append((n_iter, seg_id, weight, walltime, cputime, final_pcoord))
-
-            del iter_group, pcoord_ds, seg_index
-            n_iter -= 1
+    @classmethod
+    def from_data_manager_batch(cls, endpoints, data_manager=None):
+        '''Construct and return a list of trajectory traces, one for each of the given
+        (n_iter, seg_id) pairs identifying the last segment of a trajectory. Trajectories are
+        followed using the ancestry index of the data manager, and the segment index and
+        progress coordinates of each iteration are read once for all traces passing through it.'''
 
-        # loop terminates with parent_id set to the identifier of the initial state,
-        # seg_id set to the identifier of the first segment in the trajectory, and
-        # n_iter set to one less than the iteration of the first segment
-        first_iter = n_iter + 1
-        first_seg_id = seg_id
-        first_parent_id = parent_id
+        data_manager = data_manager or westpa.rc.get_data_manager()
+        if not len(endpoints):
+            return []
 
-        # Initial segment (for fetching initial state)
-        first_segment = Segment(n_iter=first_iter, seg_id=first_seg_id, parent_id=first_parent_id)
+        ancestry = data_manager.get_ancestry_index()
+        end_iters, end_seg_ids = np.asarray(endpoints, dtype=np.int64).reshape(-1, 2).T
+        first_iters, paths = ancestry.trace(end_iters, end_seg_ids)
 
-        seginfo.reverse()
+        # The iteration and seg_id of every segment of every trace, one trace after another
+        trace_lengths = end_iters - first_iters + 1
+        trace_ends = np.cumsum(trace_lengths)
+        all_seg_ids = np.concatenate(paths)
+        all_iters = np.concatenate([np.arange(first_iter, end_iter + 1) for first_iter, end_iter in zip(first_iters, end_iters)])
 
+        pcoord_ds = data_manager.get_iter_group(end_iters[0])['pcoord']
         summary_dtype = np.dtype(
             [
                 ('n_iter', n_iter_dtype),
@@ -104,26 +74,61 @@ class Trace:
                 ('weight', weight_dtype),
                 ('walltime', utime_dtype),
                 ('cputime', utime_dtype),
-                ('final_pcoord', pcoord_dtype, pcoord_pt_shape),
+                ('final_pcoord', pcoord_ds.dtype, pcoord_ds.shape[2:]),
             ]
         )
+        summaries = np.empty((len(all_seg_ids),), dtype=summary_dtype)
+        summaries['n_iter'] = all_iters
+        summaries['seg_id'] = all_seg_ids
+        endpoint_types = np.empty((len(all_seg_ids),), dtype=np.uint8)
+        del pcoord_ds
+
+        order = np.argsort(all_iters, kind='stable')
+        iter_bounds = np.flatnonzero(np.diff(all_iters[order])) + 1
+        for iter_rows in np.split(order, iter_bounds):
+            n_iter = all_iters[iter_rows[0]]
+            iter_group = data_manager.get_iter_group(n_iter)
+            seg_index = iter_group['seg_index'][...]
+            pcoord_ds = iter_group['pcoord']
 
-        summary = np.array(seginfo, dtype=summary_dtype)
+            # Read final progress coordinates for every distinct segment traced through this iteration at once
+            iter_seg_ids, inverse = np.unique(all_seg_ids[iter_rows], return_inverse=True)
+            summaries['final_pcoord'][iter_rows] = pcoord_ds[iter_seg_ids, pcoord_ds.shape[1] - 1][inverse]
 
-        try:
-            initial_state = data_manager.get_segment_initial_states([first_segment], first_iter)[0]
-        except KeyError:
-            # old HDF5 version
-            assert parent_id < 0
-            istate_pcoord = data_manager.get_iter_group(first_iter)['pcoord'][first_seg_id, 0]
-            istate_id = -(first_parent_id + 1)
-            basis_state = None
-            initial_state = InitialState(istate_id, None, iter_created=0, pcoord=istate_pcoord)
+            index_rows = seg_index[all_seg_ids[iter_rows]]
+            for field in ('weight', 'walltime', 'cputime'):
+                summaries[field][iter_rows] = index_rows[field]
+            endpoint_types[iter_rows] = index_rows['endpoint_type']
 
-        else:
-            basis_state = data_manager.get_basis_states(first_iter)[initial_state.basis_state_id]
+            del iter_group, pcoord_ds, seg_index
+
+        traces = []
+        for first_iter, path, summary, endpoint_type in zip(
+            first_iters, paths, np.split(summaries, trace_ends[:-1]), endpoint_types[trace_ends - 1]
+        ):
+            first_iter = int(first_iter)
+            first_seg_id = int(path[0])
+            first_parent_id = ancestry.parent_id(first_iter, first_seg_id)
+
+            # Initial segment (for fetching initial state)
+            first_segment = Segment(n_iter=first_iter, seg_id=first_seg_id, parent_id=first_parent_id)
+
+            try:
+                initial_state = data_manager.get_segment_initial_states([first_segment], first_iter)[0]
+            except KeyError:
+                # old HDF5 version
+                assert first_parent_id < 0
+                istate_pcoord = data_manager.get_iter_group(first_iter)['pcoord'][first_seg_id, 0]
+                istate_id = -(first_parent_id + 1)
+                basis_state = None
+                initial_state = InitialState(istate_id, None, iter_created=0, pcoord=istate_pcoord)
+
+            else:
+                basis_state = data_manager.get_basis_states(first_iter)[initial_state.basis_state_id]
+
+            traces.append(cls(summary, endpoint_type, basis_state, initial_state, data_manager))
 
-        return cls(summary, endpoint_type, basis_state, initial_state, data_manager)
+        return traces
 
     def get_segment_data_slice(self, datafile, dsname, n_iter, seg_id, slice_=None, index_data=None, iter_prec=None):
         '''Return the data from the dataset named ``dsname`` within the given ``datafile`` (an open
@@ -440,12 +445,12 @@ The following options for datasets are supported:
         except ValueError:
             trajs_group = self.output_file['trajectories']
 
-        for n_iter, seg_id in self.endpoints:
+        traces = Trace.from_data_manager_batch(self.endpoints, self.data_reader.data_manager)
+
+        for (n_iter, seg_id), trace in zip(self.endpoints, traces):
             trajname = self.output_pattern % (n_iter, seg_id)
             trajgroup = trajs_group.create_group(trajname)
 
-            trace = Trace.from_data_manager(n_iter, seg_id, self.data_reader.data_manager)
-
             with open(trajname + '_trace.txt', 'wt') as trace_output:
                 self.emit_trace_text(trace, trace_output)
 
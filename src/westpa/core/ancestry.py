@@ -0,0 +1,201 @@
+'''An index of the history graph of a simulation (the parent of every segment of every iteration), packed into one
+array, so that many trajectories can be traced back to their origins at once, without reading the segment index of
+every iteration once for each segment traced.'''
+
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# The same as westpa.core.data_manager.seg_id_dtype, which cannot be imported here
+seg_id_dtype = np.int64
+offset_dtype = np.int64
+
+ancestry_group_name = 'ancestry'
+
+
+def get_iter_parent_ids(iter_group):
+    '''Return the parent IDs of all segments in the given iteration group, including for files written by versions of
+    WESTPA which stored parents in a separate table.'''
+    seg_index = iter_group['seg_index']
+    if 'parent_id' in seg_index.dtype.names:
+        return np.asarray(seg_index['parent_id'], dtype=seg_id_dtype)
+    else:
+        return iter_group['parents'][...].take(seg_index['parents_offset']).astype(seg_id_dtype)
+
+
+class AncestryIndex:
+    '''The parent of every segment in iterations 1 through ``n_iters``. Parent IDs are stored as in the segment
+    index (seg_ids in the previous iteration, or negative values for segments started from initial states), with
+    those of all iterations packed into the single array ``parent_ids``; the parent IDs of the segments in
+    iteration ``n_iter`` are ``parent_ids[iter_offsets[n_iter - 1] : iter_offsets[n_iter]]``.'''
+
+    def __init__(self, parent_ids=None, iter_offsets=None):
+        # Parent IDs are stored in a buffer with room to add iterations without copying all parent IDs each time
+        self._parent_ids = np.array(parent_ids if parent_ids is not None else [], dtype=seg_id_dtype)
+        self.iter_offsets = np.array(iter_offsets if iter_offsets is not None else [0], dtype=offset_dtype)
+        if len(self.iter_offsets) < 1 or self.iter_offsets[0] != 0 or self.iter_offsets[-1] != len(self._parent_ids):
+            raise ValueError('iteration offsets do not match parent IDs')
+
+        # Number of segments in the lineage ending at each segment, computed as needed
+        self._depths = np.empty((0,), dtype=offset_dtype)
+
+    def __repr__(self):
+        return '<{} of {:d} iterations, {:d} segments>'.format(self.__class__.__name__, self.n_iters, len(self.parent_ids))
+
+    @property
+    def parent_ids(self):
+        '''The parent IDs of the segments of all iterations, one iteration after another.'''
+        return self._parent_ids[: self.iter_offsets[-1]]
+
+    @property
+    def n_iters(self):
+        '''The number of iterations indexed.'''
+        return len(self.iter_offsets) - 1
+
+    def n_segs(self, n_iter):
+        '''Return the number of segments in iteration ``n_iter``.'''
+        return int(self.iter_offsets[n_iter] - self.iter_offsets[n_iter - 1])
+
+    def iter_parent_ids(self, n_iter):
+        '''Return the parent IDs of the segments in iteration ``n_iter``, indexed by seg_id.'''
+        if not 1 <= n_iter <= self.n_iters:
+            raise IndexError('iteration {} is not indexed'.format(n_iter))
+        return self.parent_ids[self.iter_offsets[n_iter - 1] : self.iter_offsets[n_iter]]
+
+    def truncate(self, n_iters):
+        '''Discard iterations after ``n_iters``.'''
+        if n_iters < self.n_iters:
+            self.iter_offsets = self.iter_offsets[: n_iters + 1].copy()
+            self._depths = self._depths[: self.iter_offsets[-1]]
+
+    def set_iteration(self, n_iter, parent_ids):
+        '''Store ``parent_ids`` (indexed by seg_id) as the parents of the segments in iteration ``n_iter``,
+        discarding any iterations from ``n_iter`` on. Iterations must be indexed in order.'''
+        if not 1 <= n_iter <= self.n_iters + 1:
+            raise ValueError('cannot index iteration {} after iteration {}'.format(n_iter, self.n_iters))
+        self.truncate(n_iter - 1)
+        lb = self.iter_offsets[-1]
+        ub = lb + len(parent_ids)
+        if ub > len(self._parent_ids):
+            buffer = np.empty((max(ub, 2 * len(self._parent_ids)),), dtype=seg_id_dtype)
+            buffer[:lb] = self._parent_ids[:lb]
+            self._parent_ids = buffer
+        self._parent_ids[lb:ub] = parent_ids
+        self.iter_offsets = np.append(self.iter_offsets, ub)
+
+    @property
+    def depths(self):
+        '''The number of segments in the lineage ending at each segment (1 for segments started from initial
+        states), indexed as ``parent_ids``.'''
+        first_iter = np.searchsorted(self.iter_offsets, len(self._depths), side='right')
+        if first_iter <= self.n_iters:
+            depths = np.empty((len(self.parent_ids),), dtype=offset_dtype)
+            depths[: len(self._depths)] = self._depths
+            # Parents are always in the previous iteration, so one sweep forward in time finds all depths
+            for n_iter in range(first_iter, self.n_iters + 1):
+                lb, ub = self.iter_offsets[n_iter - 1], self.iter_offsets[n_iter]
+                parent_ids = self.parent_ids[lb:ub]
+                iter_depths = depths[lb:ub]
+                iter_depths[:] = 1
+                if n_iter > 1:
+                    has_parent = parent_ids >= 0
+                    iter_depths[has_parent] += depths[self.iter_offsets[n_iter - 2] + parent_ids[has_parent]]
+            self._depths = depths
+        return self._depths
+
+    def _rows(self, n_iters, seg_ids):
+        n_iters, seg_ids = (np.ravel(a) for a in np.broadcast_arrays(np.asarray(n_iters), np.asarray(seg_ids)))
+        n_iters = n_iters.astype(offset_dtype)
+        seg_ids = seg_ids.astype(seg_id_dtype)
+        if len(n_iters):
+            if n_iters.min() < 1 or n_iters.max() > self.n_iters:
+                raise IndexError('iterations must be in [1, {}]'.format(self.n_iters))
+            n_segs = self.iter_offsets[n_iters] - self.iter_offsets[n_iters - 1]
+            if (seg_ids < 0).any() or (seg_ids >= n_segs).any():
+                raise IndexError('seg_id out of range')
+        return n_iters, seg_ids, self.iter_offsets[n_iters - 1] + seg_ids
+
+    def parent_id(self, n_iter, seg_id):
+        '''Return the parent ID of segment ``seg_id`` in iteration ``n_iter``.'''
+        return int(self.parent_ids[self._rows(n_iter, seg_id)[2][0]])
+
+    def trace(self, n_iters, seg_ids, max_length=None):
+        '''Trace the lineages ending in the given segments (identified by ``n_iters`` and ``seg_ids``, which are
+        broadcast against each other) back to the segments started from initial states, or through at most
+        ``max_length`` segments. All lineages are traced together, one iteration at a time.
+
+        Returns ``(first_iters, paths)``, where ``paths[i]`` is an array of the seg_ids of the segments in the
+        ``i``-th lineage, in chronological order, the first of which is in iteration ``first_iters[i]``.'''
+
+        n_iters, seg_ids, rows = self._rows(n_iters, seg_ids)
+        lengths = self.depths[rows]
+        if max_length is not None:
+            lengths = np.minimum(lengths, max_length)
+        ends = np.cumsum(lengths)
+        flat_paths = np.empty((ends[-1] if len(ends) else 0,), dtype=seg_id_dtype)
+
+        cur_iters = n_iters.copy()
+        cur_seg_ids = seg_ids.copy()
+        active = np.arange(len(n_iters))
+        for step in range(int(lengths.max()) if len(lengths) else 0):
+            active = active[lengths[active] > step]
+            flat_paths[ends[active] - 1 - step] = cur_seg_ids[active]
+            cur_seg_ids[active] = self.parent_ids[self.iter_offsets[cur_iters[active] - 1] + cur_seg_ids[active]]
+            cur_iters[active] -= 1
+
+        return n_iters - lengths + 1, np.split(flat_paths, ends[:-1])
+
+    @classmethod
+    def from_h5file(cls, h5file, n_iters, get_iter_group=None):
+        '''Return the index of iterations 1 through ``n_iters`` of the given WEST HDF5 file, as stored by
+        ``save()``. Iterations which are not stored (or were stored with a different number of segments than
+        recorded in the summary table, as when a simulation is truncated and continued by an earlier version
+        of WESTPA) are indexed from their segment indexes, which are read using ``get_iter_group`` (by default,
+        ``h5file.get_iter_group``).'''
+
+        index = cls()
+        try:
+            group = h5file[ancestry_group_name]
+            iter_offsets = group['iter_offsets'][: n_iters + 1]
+            parent_ids = group['parent_ids'][: iter_offsets[-1]]
+        except KeyError:
+            pass
+        else:
+            n_particles = np.diff(iter_offsets)
+            try:
+                n_particles_expected = h5file['summary']['n_particles'][: len(n_particles)]
+            except KeyError:
+                n_particles_expected = []
+            n_valid = 0
+            while n_valid < len(n_particles_expected) and n_particles[n_valid] == n_particles_expected[n_valid]:
+                n_valid += 1
+            index = cls(parent_ids[: iter_offsets[n_valid]], iter_offsets[: n_valid + 1])
+
+        if index.n_iters < n_iters:
+            log.debug('indexing ancestry of iterations {} to {}'.format(index.n_iters + 1, n_iters))
+            get_iter_group = get_iter_group or h5file.get_iter_group
+        for n_iter in range(index.n_iters + 1, n_iters + 1):
+            index.set_iteration(n_iter, get_iter_parent_ids(get_iter_group(n_iter)))
+        return index
+
+    def save(self, h5file, first_iter=1):
+        '''Store the index in the given (writable) WEST HDF5 file, replacing the stored parents of iterations from
+        ``first_iter`` on (or from the first iteration not yet stored, if earlier) and discarding any stored
+        iterations after ``n_iters``.'''
+
+        group = h5file.require_group(ancestry_group_name)
+        try:
+            parent_ids_ds = group['parent_ids']
+            iter_offsets_ds = group['iter_offsets']
+        except KeyError:
+            parent_ids_ds = group.create_dataset('parent_ids', shape=(0,), dtype=seg_id_dtype, maxshape=(None,), chunks=(65536,))
+            iter_offsets_ds = group.create_dataset('iter_offsets', data=[0], dtype=offset_dtype, maxshape=(None,), chunks=(4096,))
+
+        first_iter = max(1, min(first_iter, len(iter_offsets_ds)))
+        lb = self.iter_offsets[first_iter - 1]
+        parent_ids_ds.resize((len(self.parent_ids),))
+        parent_ids_ds[lb:] = self.parent_ids[lb:]
+        iter_offsets_ds.resize((len(self.iter_offsets),))
+        iter_offsets_ds[first_iter:] = self.iter_offsets[first_iter:]
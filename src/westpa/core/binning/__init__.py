@@ -9,6 +9,8 @@ from .assign import (
     RecursiveBinMapper,
     VectorizingFuncBinMapper,
     VoronoiBinMapper,
+    euclidean_dfunc,
+    periodic_dfunc,
 )
 
 from .mab import map_mab, MABBinMapper
@@ -37,6 +39,8 @@ __all__ = [
     'RecursiveBinMapper',
     'VectorizingFuncBinMapper',
     'VoronoiBinMapper',
+    'euclidean_dfunc',
+    'periodic_dfunc',
     'map_mab',
     'map_binless',
     'MABBinMapper',
@@ -175,6 +175,24 @@ class RectilinearBinMapper(BinMapper):
 
         return output
 
+    def reachable_bins(self, bins, max_displacement):
+        '''Return a boolean array indicating which bins contain points within ``max_displacement`` (a scalar,
+        or one value per dimension) along every dimension of a point in any of the bins ``bins``.'''
+        shape = tuple(self._boundlens - 1)
+        max_displacement = np.broadcast_to(np.asarray(max_displacement, dtype=coord_dtype), (self.ndim,))
+        reachable = np.zeros(shape, dtype=np.bool_)
+
+        indices = np.unravel_index(np.unique(np.asarray(bins, dtype=index_dtype)), shape)
+        limits = []
+        for idim, bounds in enumerate(self._boundaries):
+            lower = np.searchsorted(bounds, bounds[indices[idim]] - max_displacement[idim], side='right') - 1
+            upper = np.searchsorted(bounds, bounds[indices[idim] + 1] + max_displacement[idim], side='left') - 1
+            limits.append((np.clip(lower, 0, shape[idim] - 1), np.clip(upper, 0, shape[idim] - 1)))
+
+        for ibin in range(len(indices[0])):
+            reachable[tuple(slice(lower[ibin], upper[ibin] + 1) for (lower, upper) in limits)] = True
+        return reachable.ravel()
+
 
 class PiecewiseBinMapper(BinMapper):
     '''Binning using a set of functions returing boolean values; if the Nth function
@@ -286,10 +304,36 @@ class VectorizingFuncBinMapper(BinMapper):
         return output
 
 
+def euclidean_dfunc(coord, centers):
+    '''Return the Euclidean distances between ``coord`` and each of ``centers``. A
+    :class:`VoronoiBinMapper` using this distance function assigns coordinates using
+    a k-d tree built over its centers.'''
+    return np.sqrt(np.square(centers - coord).sum(axis=-1)).astype(coord_dtype)
+
+
+def periodic_dfunc(coord, centers, box):
+    '''Return the Euclidean distances between ``coord`` and each of ``centers`` under the
+    minimum image convention, where ``box`` gives the period of each dimension (or 0 for
+    dimensions which are not periodic). A :class:`VoronoiBinMapper` using this distance
+    function assigns coordinates using a periodic k-d tree built over its centers.'''
+    box = np.asarray(box, dtype=np.float64)
+    periodic = box > 0
+    delta = np.abs(centers - coord)
+    wrapped = np.mod(delta[:, periodic], box[periodic])
+    delta[:, periodic] = np.minimum(wrapped, box[periodic] - wrapped)
+    return np.sqrt(np.square(delta).sum(axis=-1)).astype(coord_dtype)
+
+
 class VoronoiBinMapper(BinMapper):
     '''A one-dimensional mapper which assigns a multidimensional pcoord to the
     closest center based on a distance metric. Both the list of centers and the
-    distance function must be supplied.'''
+    distance function must be supplied.
+
+    If the distance function is :func:`euclidean_dfunc` or :func:`periodic_dfunc`, nearest
+    centers are found in batch with a k-d tree, which is built over the centers on first use
+    (and not pickled). Coordinates whose two nearest centers are equidistant to within
+    single precision are assigned with the distance function, so that assignments are
+    identical to those found by evaluating it for every coordinate.'''
 
     def __init__(self, dfunc, centers, dfargs=None, dfkwargs=None):
         self.dfunc = dfunc
@@ -299,12 +343,75 @@ class VoronoiBinMapper(BinMapper):
         self.nbins = self.centers.shape[0]
         self.ndim = self.centers.shape[1]
         self.labels = ['center={!r}'.format(center) for center in self.centers]
+        self._tree = None
 
         # Sanity check: does the distance map the centers to themselves?
         check = self.assign(self.centers)
         if (check != np.arange(len(self.centers))).any():
             raise TypeError('dfunc does not map centers to themselves')
 
+    def __getstate__(self):
+        # The tree is rebuilt on demand, and must not change the pickled (and hashed) state
+        state = self.__dict__.copy()
+        state.pop('_tree', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._tree = None
+
+    @property
+    def box(self):
+        '''The period of each dimension for :func:`periodic_dfunc` (0 where not periodic),
+        or None for other distance functions.'''
+        if self.dfunc is not periodic_dfunc:
+            return None
+        box = self.dfargs[0] if self.dfargs else self.dfkwargs['box']
+        return np.broadcast_to(np.asarray(box, dtype=np.float64), (self.ndim,))
+
+    @property
+    def tree(self):
+        '''A k-d tree over the centers, or None if the distance function is not one for which
+        nearest centers can be found with one.'''
+        if self._tree is None and self.dfunc in (euclidean_dfunc, periodic_dfunc):
+            from scipy.spatial import cKDTree
+
+            box = self.box
+            if box is None:
+                self._tree = cKDTree(np.asarray(self.centers, dtype=np.float64))
+            else:
+                self._tree = cKDTree(self._wrap(self.centers, box), boxsize=box)
+        return self._tree
+
+    @staticmethod
+    def _wrap(coords, box):
+        coords = np.array(coords, dtype=np.float64)
+        periodic = box > 0
+        coords[:, periodic] = np.mod(coords[:, periodic], box[periodic])
+        return coords
+
+    def _assign_nearest(self, tree, coords, mask, output):
+        selected = np.flatnonzero(mask)
+        coords = coords[selected]
+        box = self.box
+        points = coords.astype(np.float64) if box is None else self._wrap(coords, box)
+
+        if self.nbins == 1:
+            output[selected] = 0
+            return
+
+        dist, nearest = tree.query(points, k=2)
+
+        # The distance function evaluates distances in single precision, taking the first of
+        # equidistant centers; where this could make a difference, evaluate it
+        gap = dist[:, 1] - dist[:, 0]
+        ambiguous = np.flatnonzero(gap <= 2 * np.spacing(dist[:, 1].astype(coord_dtype)))
+        nearest = nearest[:, 0]
+        for i in ambiguous:
+            nearest[i] = np.argmin(self.dfunc(coords[i], self.centers, *self.dfargs, **self.dfkwargs))
+
+        output[selected] = nearest
+
     def assign(self, coords, mask=None, output=None):
         try:
             passed_coord_dtype = coords.dtype
@@ -326,7 +433,11 @@ class VoronoiBinMapper(BinMapper):
         elif len(output) != len(coords):
             raise TypeError('output has different length than coords')
 
-        apply_down_argmin_across(self.dfunc, (self.centers,) + self.dfargs, self.dfkwargs, self.nbins, coords, mask, output)
+        tree = self.tree
+        if tree is not None:
+            self._assign_nearest(tree, coords, mask, output)
+        else:
+            apply_down_argmin_across(self.dfunc, (self.centers,) + self.dfargs, self.dfkwargs, self.nbins, coords, mask, output)
 
         return output
 
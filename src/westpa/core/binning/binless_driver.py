@@ -31,13 +31,11 @@ class BinlessDriver(WEDriver):
 
         initial_binning = self.initial_binning
         final_binning = self.final_binning
-        flux_matrix = self.flux_matrix
-        transition_matrix = self.transition_matrix
         for segment, iidx, fidx in zip(segments, initial_assignments, final_assignments):
             initial_binning[iidx].add(segment)
             final_binning[fidx].add(segment)
-            flux_matrix[iidx, fidx] += segment.weight
-            transition_matrix[iidx, fidx] += 1
+        weights = np.fromiter((segment.weight for segment in segments), dtype=np.float64, count=len(segments))
+        self.transitions.add(initial_assignments, final_assignments, weights)
 
         n_recycled_total = self.n_recycled_segs
         n_new_states = n_recycled_total - len(self.avail_initial_states)
@@ -60,8 +60,7 @@ class BinlessSimManager(WESimManager):
                 istate_gen_futures.update(new_istate_futures)
                 futures.update(new_istate_futures)
 
-                with self.data_manager.expiring_flushing_lock():
-                    self.data_manager.update_segments(self.n_iter, incoming)
+                self.data_manager.update_segments_async(self.n_iter, incoming)
 
             elif future in istate_gen_futures:
                 istate_gen_futures.remove(future)
@@ -75,6 +74,9 @@ class BinlessSimManager(WESimManager):
                 log.error('unknown future {!r} received from work manager'.format(future))
                 raise AssertionError('untracked future {!r}'.format(future))
 
+        # Wait for segment data to be written before assignment updates the segments
+        self.data_manager.flush_writes()
+
         # Collectively assign all segments to their bins...
         self.we_driver.assign(self.segments.values())
 
@@ -301,32 +301,43 @@ def detect_bottlenecks(unmasked_coords, unmasked_weights, n_coords, n):
     # Also sort in reverse order for opposite direction
     coords_srt_flip = np.flipud(coords_srt)
     weights_srt_flip = np.flipud(weights_srt)
-    # Initialize the max directional differences along current dimension as None (these may not be updated)
-    bottleneck_coords, bottleneck_coords_flip = None, None
-    maxdiff, maxdiff_flip = -np.inf, -np.inf
-    # Looping through all non-boundary coords
-    # Compute the cumulative weight on either side of each non-boundary walker
-    for i in range(1, n_coords - 1):
-        # Summing up weights of all walkers ahead of current walker along current dim in both directions
-        cumulative_prob = np.sum(weights_srt[i + 1 :])
-        cumulative_prob_flip = np.sum(weights_srt_flip[i + 1 :])
-        # Compute the difference of log cumulative weight of current walker and all walkers ahead of it (Z im the MAB paper)
-        # We use the log as weights vary over many orders of magnitude
-        # Note a negative Z indicates the cumulative weight ahead of the current walker is larger than the weight of the current walker,
-        # while a positive Z indicates the cumulative weight ahead of the current walker is smaller, indicating a barrier
-        Z = np.log(weights_srt[i]) - np.log(cumulative_prob)
-        Z_flip = np.log(weights_srt_flip[i]) - np.log(cumulative_prob_flip)
-        # Update ALL coords of the current walker into bottlenecks_forward if it is largest
-        # This way we uniquely identify a walker by its full set of coordinates
-        if Z > maxdiff:
-            bottleneck_coords = coords_srt[i, :]
-            maxdiff = Z
-        if Z_flip > maxdiff_flip:
-            bottleneck_coords_flip = coords_srt_flip[i, :]
-            maxdiff_flip = Z_flip
+    # Find the walker with the largest directional difference along current dimension in each direction
+    ibottleneck = _max_log_weight_ratio(weights_srt, n_coords)
+    ibottleneck_flip = _max_log_weight_ratio(weights_srt_flip, n_coords)
+    bottleneck_coords = coords_srt[ibottleneck, :] if ibottleneck is not None else None
+    bottleneck_coords_flip = coords_srt_flip[ibottleneck_flip, :] if ibottleneck_flip is not None else None
     return bottleneck_coords, bottleneck_coords_flip
 
 
+def _max_log_weight_ratio(weights_srt, n_coords):
+    """
+    Return the index of the first non-boundary walker (1 <= i < n_coords - 1) for which
+    Z = log(w[i]) - log(sum(w[i+1:])) is largest, or None if there is no such walker.
+    """
+    if n_coords < 3:
+        return None
+    # Cumulative weight of all walkers ahead of each walker along current dim, from a reverse cumulative sum
+    cumulative_prob = np.cumsum(weights_srt[::-1], dtype=np.float64)[::-1]
+    # Compute the difference of log cumulative weight of current walker and all walkers ahead of it (Z im the MAB paper)
+    # We use the log as weights vary over many orders of magnitude
+    # Note a negative Z indicates the cumulative weight ahead of the current walker is larger than the weight of the current walker,
+    # while a positive Z indicates the cumulative weight ahead of the current walker is smaller, indicating a barrier
+    Z = np.log(weights_srt[1 : n_coords - 1], dtype=np.float64) - np.log(cumulative_prob[2:n_coords])
+    Z[np.isnan(Z)] = -np.inf
+    if not np.any(Z > -np.inf):
+        return None
+    # Summing each tail separately (with np.sum, in the precision of the weights) rounds differently from the cumulative
+    # sum, so walkers within rounding error of the largest Z are re-evaluated that way; this way, ties resolve exactly
+    # as in a walker-by-walker scan
+    tolerance = 4 * ((16 + np.log2(n_coords)) * np.finfo(weights_srt.dtype).eps + n_coords * np.finfo(np.float64).eps)
+    candidates = np.flatnonzero(Z >= Z.max() - tolerance) + 1
+    if len(candidates) == 1:
+        return candidates[0]
+    Z_exact = np.array([np.log(weights_srt[i]) - np.log(np.sum(weights_srt[i + 1 :])) for i in candidates])
+    Z_exact[np.isnan(Z_exact)] = -np.inf
+    return candidates[np.argmax(Z_exact)]
+
+
 def log_mab_stats(minlist, maxlist, direction, skip):
     westpa.rc.pstatus("################ MAB stats ################")
     westpa.rc.pstatus(f"minima in each dimension:      {minlist}")
@@ -385,81 +396,75 @@ def bin_assignment(
     # In reverse, we add the number of forward bottleneck bins to the offset
     bneck_bin_id_offset_rev = bneck_bin_id_offset_fwd + (~skip_bneck_fwd).sum()
 
-    # Bin assignment loop over all walkers
-    for i in range(len(output)):
-        # Skip masked walkers, these walkers bin IDs are unchanged
-        if not mask[i]:
-            continue
-        # Initialize bin ID and special tracker for current coord
-        # The special variable indicates a boundary or bottleneck walker (not assigned to the linear space)
-        bin_id, special = 0, False
-
-        # Searching for bottleneck bins first
-        if splitting and bottleneck:
-            for n in active_dims:
-                # Grab coord(s) of current walker
-                coord = coords[i][:ndim]
-                # Assign bottlenecks, taking directionality into account
-                # Check both directions when using 0 or 86
-                # Note: 86 implies no leading or lagging bins, but does add bottlenecks for *both* directions when bottleneck is enabled
-                # Note: All bottleneck bins will typically be filled unless a walker is simultaneously in bottleneck bins along multiple dimensions
-                # or there are too few walkers to compute free energy barriers
-                if (coord == bottlenecks_forward[n]).all() and not skip_bneck_fwd[n]:
-                    bin_id = bneck_bin_id_offset_fwd + n - skip_bneck_fwd[:n].sum()
-                    special = True
-                    n_bottleneck_filled += 1
-                    break
-                elif (coord == bottlenecks_reverse[n]).all() and not skip_bneck_rev[n]:
-                    bin_id = bneck_bin_id_offset_rev + n - skip_bneck_rev[:n].sum()
-                    special = True
-                    n_bottleneck_filled += 1
-                    break
-
-        # Now check for boundary walkers, taking directionality into account
-        # This should only be done after fully checking for bottleneck walkers
-        if splitting and not special:
-            for n in active_dims:
-                # Grab coord of current walker along current dimension
-                coord = coords[i, n]
-                if (coord == maxlist[n]) and not skip_lead[n]:
-                    bin_id = boundary_bin_id_offset_fwd + n - skip_lead[:n].sum()
-                    special = True
-                    break
-                elif (coord == minlist[n]) and not skip_lag[n]:
-                    bin_id = boundary_bin_id_offset_rev + n - skip_lag[:n].sum()
-                    special = True
-                    break
-
-        # Now check for linear bin walkers
-        if not special:
-            # Again we loop over the dimensions
-            # Note: no need to worry about skipping as we've already set all skipped dimensions to 1 bin
-            for n in range(ndim):
-                coord = coords[i][n]
-                nbins = nbins_per_dim[n]
-                minp = minlist[n]
-                maxp = maxlist[n]
-
-                # Generate the bins along this dimension
-                bins = np.linspace(minp, maxp, nbins + 1)
-
-                # Assign walker to a bin along this dimension
-                bin_number = np.digitize(coord, bins) - 1  # note np.digitize is 1-indexed
-
-                # Sometimes the walker is exactly at the max/min value,
-                # which would put it in the next bin
-                if bin_number == nbins:
-                    bin_number -= 1
-                elif bin_number == -1:
-                    bin_number = 0
-                elif bin_number > nbins or bin_number < -1:
-                    raise ValueError("Walker out of boundary.")
-
-                # Assign to bin within the full dimensional space
-                bin_id += bin_number * np.prod(nbins_per_dim[:n])
-
-        # Output is the main list that, for each segment, holds the bin assignment
-        output[i] = bin_id
+    # Only unmasked walkers are assigned; masked walkers bin IDs are unchanged
+    walkers = np.flatnonzero(mask)
+    coords = np.asarray(coords)[walkers, :ndim]
+    bin_ids = np.zeros(len(walkers), dtype=np.int64)
+    # The special array indicates a boundary or bottleneck walker (not assigned to the linear space)
+    special = np.zeros(len(walkers), dtype=bool)
+
+    # Searching for bottleneck bins first
+    if splitting and bottleneck:
+        # Assign bottlenecks, taking directionality into account
+        # Check both directions when using 0 or 86, lower dimensions first
+        # Note: 86 implies no leading or lagging bins, but does add bottlenecks for *both* directions when bottleneck is enabled
+        # Note: All bottleneck bins will typically be filled unless a walker is simultaneously in bottleneck bins along multiple dimensions
+        # or there are too few walkers to compute free energy barriers
+        for n in active_dims:
+            for bottlenecks, skip_bneck, bneck_bin_id_offset in (
+                (bottlenecks_forward, skip_bneck_fwd, bneck_bin_id_offset_fwd),
+                (bottlenecks_reverse, skip_bneck_rev, bneck_bin_id_offset_rev),
+            ):
+                if bottlenecks[n] is None or skip_bneck[n]:
+                    continue
+                # A bottleneck walker is uniquely identified by its full set of coordinates
+                is_bneck = ~special & (coords == bottlenecks[n]).all(axis=1)
+                bin_ids[is_bneck] = bneck_bin_id_offset + n - skip_bneck[:n].sum()
+                special |= is_bneck
+        n_bottleneck_filled = int(special.sum())
+
+    # Now check for boundary walkers, taking directionality into account
+    # This should only be done after fully checking for bottleneck walkers
+    if splitting:
+        for n in active_dims:
+            for extrema, skip_boundary, boundary_bin_id_offset in (
+                (maxlist, skip_lead, boundary_bin_id_offset_fwd),
+                (minlist, skip_lag, boundary_bin_id_offset_rev),
+            ):
+                if skip_boundary[n]:
+                    continue
+                is_boundary = ~special & (coords[:, n] == extrema[n])
+                bin_ids[is_boundary] = boundary_bin_id_offset + n - skip_boundary[:n].sum()
+                special |= is_boundary
+
+    # Now check for linear bin walkers
+    # Note: no need to worry about skipping as we've already set all skipped dimensions to 1 bin
+    linear = ~special
+    for n in range(ndim):
+        nbins = nbins_per_dim[n]
+
+        # Generate the bins along this dimension
+        bins = np.linspace(minlist[n], maxlist[n], nbins + 1)
+
+        # Assign walkers to a bin along this dimension
+        bin_numbers = np.digitize(coords[linear, n], bins) - 1  # note np.digitize is 1-indexed
+        if np.any((bin_numbers > nbins) | (bin_numbers < -1)):
+            raise ValueError("Walker out of boundary.")
+
+        # Sometimes the walker is exactly at the max/min value,
+        # which would put it in the next bin
+        bin_numbers[bin_numbers == nbins] -= 1
+        bin_numbers[bin_numbers == -1] = 0
+
+        # Assign to bin within the full dimensional space
+        bin_ids[linear] += bin_numbers * np.prod(nbins_per_dim[:n])
+
+    # Output is the main list that, for each segment, holds the bin assignment
+    if isinstance(output, np.ndarray):
+        output[walkers] = bin_ids
+    else:
+        for i, bin_id in zip(walkers, bin_ids):
+            output[i] = bin_id
     return n_bottleneck_filled
 
 
@@ -18,6 +18,9 @@ The data is laid out in HDF5 as follows:
             - wtg_parents -- data used to reconstruct the split/merge history of trajectories
             - recycling -- flux and event count for recycled particles, on a per-target-state basis
             - auxdata/ -- auxiliary datasets (data stored on the 'data' field of Segment objects)
+    - /ancestry/ -- the parent_id of every segment, for all iterations (see westpa.core.ancestry)
+        - parent_ids -- parent IDs of the segments of all iterations, one iteration after another
+        - iter_offsets -- offset of each iteration's segments into parent_ids
 
 The file root object has an integer attribute 'west_file_format_version' which can be used to
 determine how to access data even as the file format (i.e. organization of data within HDF5 file)
@@ -44,10 +47,12 @@ Version history:
 import logging
 import pickle
 import posixpath
+import queue
 import sys
 import threading
 import time
 import builtins
+from collections.abc import Mapping
 from operator import attrgetter
 from os.path import relpath, dirname
 
@@ -56,6 +61,8 @@ from h5py import h5s
 import numpy as np
 
 from . import h5io
+from .ancestry import AncestryIndex, ancestry_group_name
+from .restarts import RestartStorage
 from .segment import Segment
 from .states import BasisState, TargetState, InitialState
 from .we_driver import NewWeightEntry
@@ -131,6 +138,7 @@ summary_table_dtype = np.dtype(
         ('cputime', utime_dtype),  # Total CPU time for this iteration
         ('walltime', utime_dtype),  # Total wallclock time for this iteration
         ('binhash', binhash_dtype),
+        ('load_imbalance', np.float64),  # Fraction of worker time left idle while propagating segments
     ]
 )
 
@@ -204,6 +212,210 @@ nw_index_dtype = np.dtype(
 binning_index_dtype = np.dtype([('hash', binhash_dtype), ('pickle_len', np.uint32)])
 
 
+class SegmentTable(Mapping):
+    '''A columnar view of (some of) the segments of one iteration, as returned by
+    ``WESTDataManager.get_segments_columnar()``.
+
+    The per-segment data are held as arrays: ``seg_index`` is the record array of the
+    iteration's segment index, ``pcoords`` is the ``(n_segs, pcoord_len, pcoord_ndim)`` block of
+    progress coordinates (or None if not loaded), ``parent_ids`` holds the primary parent of each
+    segment, and the weight graph is stored in compressed sparse row form, such that the
+    weight transfer parents of the ``i``-th row are ``wtg_parent_ids[wtg_offsets[i]:wtg_offsets[i+1]]``.
+    Any auxiliary datasets loaded alongside are stored in ``data``, keyed by dataset name.
+
+    The table is also a read-only mapping of seg_id to ``Segment``. ``Segment`` objects are only
+    constructed when accessed, and are cached thereafter, so that repeated lookups return the
+    same object. Code which only needs a few fields of many segments (weights, parents, or
+    progress coordinates, say) should use the arrays directly.'''
+
+    def __init__(self, n_iter, seg_ids, seg_index, parent_ids, wtg_offsets, wtg_parent_ids, pcoords=None, data=None):
+        self.n_iter = n_iter
+        self.seg_ids = np.asarray(seg_ids, dtype=seg_id_dtype)
+        self.seg_index = seg_index
+        self.parent_ids = parent_ids
+        self.wtg_offsets = wtg_offsets
+        self.wtg_parent_ids = wtg_parent_ids
+        self.pcoords = pcoords
+        self.data = data if data is not None else {}
+
+        self._segments = [None] * len(self.seg_ids)
+        self._columns = None
+        self._contiguous = len(self.seg_ids) == 0 or (self.seg_ids[0] == 0 and self.seg_ids[-1] == len(self.seg_ids) - 1)
+
+    @classmethod
+    def from_iter_group(cls, n_iter, iter_group, file_version, seg_ids=None, load_pcoords=True, datasets=None):
+        '''Read the given (or all) segments of iteration ``n_iter`` from its HDF5 group ``iter_group``, in a
+        file of format version ``file_version``. The segment index, progress coordinates, weight graph, and
+        the datasets named in ``datasets`` (a mapping of dataset name to path within the iteration group)
+        are each read with a single bulk HDF5 read.'''
+
+        seg_index_ds = iter_group['seg_index']
+
+        if file_version < 5:
+            wtgraph_ds = iter_group['parents']
+        else:
+            wtgraph_ds = iter_group.get('wtgraph')
+        all_parent_ids = wtgraph_ds[...] if wtgraph_ds is not None else np.empty((0,), seg_id_dtype)
+
+        if seg_ids is not None:
+            seg_ids = np.unique(np.asarray(seg_ids, dtype=seg_id_dtype))
+            if len(seg_ids) == len(seg_index_ds) and (len(seg_ids) == 0 or seg_ids[-1] == len(seg_ids) - 1):
+                # All segments requested; a contiguous read is faster than a selection
+                selection = Ellipsis
+            else:
+                selection = seg_ids.tolist()
+        else:
+            seg_ids = np.arange(len(seg_index_ds), dtype=seg_id_dtype)
+            selection = Ellipsis
+
+        seg_index_entries = seg_index_ds[selection]
+        pcoord_entries = iter_group['pcoord'][selection] if load_pcoords else None
+
+        if file_version < 5:
+            wtg_n_parents = seg_index_entries['n_parents'].astype(np.int64)
+            wtg_file_offsets = seg_index_entries['parents_offset'].astype(np.int64)
+        else:
+            wtg_n_parents = seg_index_entries['wtg_n_parents'].astype(np.int64)
+            wtg_file_offsets = seg_index_entries['wtg_offset'].astype(np.int64)
+
+        # Gather the weight graph entries of the selected segments into CSR form
+        wtg_offsets = np.zeros((len(seg_ids) + 1,), dtype=np.int64)
+        np.cumsum(wtg_n_parents, out=wtg_offsets[1:])
+        n_total_parents = int(wtg_offsets[-1])
+        gather = np.arange(n_total_parents, dtype=np.int64)
+        gather += np.repeat(wtg_file_offsets - wtg_offsets[:-1], wtg_n_parents)
+        wtg_parent_ids = all_parent_ids[gather]
+        del all_parent_ids, gather
+
+        if file_version < 5:
+            parent_ids = wtg_parent_ids[wtg_offsets[:-1]].astype(seg_id_dtype)
+        else:
+            parent_ids = seg_index_entries['parent_id'].astype(seg_id_dtype)
+
+        # If any other data sets are requested, load them as well
+        data = {}
+        for dsname, h5path in (datasets or {}).items():
+            try:
+                ds = iter_group[h5path]
+            except KeyError:
+                ds = None
+
+            if ds is not None:
+                data[dsname] = ds[selection]
+
+        return cls(
+            n_iter,
+            seg_ids,
+            seg_index_entries,
+            parent_ids,
+            wtg_offsets,
+            wtg_parent_ids,
+            pcoords=pcoord_entries,
+            data=data,
+        )
+
+    @property
+    def nbytes(self):
+        '''The number of bytes occupied by the arrays of this table.'''
+        arrays = [self.seg_ids, self.seg_index, self.parent_ids, self.wtg_offsets, self.wtg_parent_ids, self.pcoords]
+        arrays.extend(self.data.values())
+        return sum(np.asarray(array).nbytes for array in arrays if array is not None)
+
+    @property
+    def weights(self):
+        return self.seg_index['weight']
+
+    @property
+    def statuses(self):
+        return self.seg_index['status']
+
+    @property
+    def endpoint_types(self):
+        return self.seg_index['endpoint_type']
+
+    @property
+    def n_wtg_parents(self):
+        return np.diff(self.wtg_offsets)
+
+    def wtg_parents(self, iseg):
+        '''Return the weight transfer parents of the ``iseg``-th row of this table.'''
+        return self.wtg_parent_ids[self.wtg_offsets[iseg] : self.wtg_offsets[iseg + 1]]
+
+    def row_of(self, seg_id):
+        '''Return the row of this table holding the given segment, raising KeyError if
+        the segment is not present.'''
+        if self._contiguous:
+            if 0 <= seg_id < len(self.seg_ids):
+                return int(seg_id)
+        else:
+            irow = int(np.searchsorted(self.seg_ids, seg_id))
+            if irow < len(self.seg_ids) and self.seg_ids[irow] == seg_id:
+                return irow
+        raise KeyError(seg_id)
+
+    def segment_at(self, iseg):
+        '''Return the ``Segment`` stored in the ``iseg``-th row of this table.'''
+        segment = self._segments[iseg]
+        if segment is None:
+            if self._columns is None:
+                # Convert each column to Python scalars once, rather than once per field per segment
+                self._columns = {
+                    field: self.seg_index[field].tolist() for field in ('status', 'endpoint_type', 'walltime', 'cputime', 'weight')
+                }
+                self._columns['seg_id'] = self.seg_ids.tolist()
+                self._columns['parent_id'] = self.parent_ids.tolist()
+                self._columns['wtg_offset'] = self.wtg_offsets.tolist()
+                self._columns['wtg_parent_ids'] = self.wtg_parent_ids.tolist()
+            columns = self._columns
+
+            wtg_parent_ids = columns['wtg_parent_ids'][columns['wtg_offset'][iseg] : columns['wtg_offset'][iseg + 1]]
+            segment = Segment(
+                seg_id=columns['seg_id'][iseg],
+                n_iter=self.n_iter,
+                status=columns['status'][iseg],
+                endpoint_type=columns['endpoint_type'][iseg],
+                walltime=columns['walltime'][iseg],
+                cputime=columns['cputime'][iseg],
+                weight=columns['weight'][iseg],
+                parent_id=columns['parent_id'][iseg],
+                wtg_parent_ids=wtg_parent_ids,
+            )
+            assert len(segment.wtg_parent_ids) == len(wtg_parent_ids)
+
+            if self.pcoords is not None:
+                segment.pcoord = self.pcoords[iseg]
+
+            for dsname, dsdata in self.data.items():
+                segment.data[dsname] = dsdata[iseg]
+
+            segment = self._segments[iseg] = segment
+        return segment
+
+    def segments(self):
+        '''Return a list of all segments in this table, in order of seg_id.'''
+        return [self.segment_at(iseg) for iseg in range(len(self.seg_ids))]
+
+    def __getitem__(self, seg_id):
+        return self.segment_at(self.row_of(seg_id))
+
+    def __contains__(self, seg_id):
+        try:
+            self.row_of(seg_id)
+        except (KeyError, TypeError):
+            return False
+        else:
+            return True
+
+    def __iter__(self):
+        return iter(self.seg_ids.tolist())
+
+    def __len__(self):
+        return len(self.seg_ids)
+
+    def __repr__(self):
+        return '<{} at 0x{:x} for iteration {}, {} segments>'.format(self.__class__.__name__, id(self), self.n_iter, len(self))
+
+
 class WESTDataManager:
     """Data manager for assisiting the reading and writing of WEST data from/to HDF5 files."""
 
@@ -212,6 +424,7 @@ class WESTDataManager:
     default_we_h5filename = 'west.h5'
     default_we_h5file_driver = None
     default_flush_period = 60
+    default_write_behind = True
 
     # Compress any auxiliary dataset whose total size (across all segments) is more than 1MB
     default_aux_compression_threshold = 1048576
@@ -247,8 +460,10 @@ class WESTDataManager:
             ['west', 'data', 'aux_compression_threshold'], self.default_aux_compression_threshold
         )
         self.flush_period = config.get(['west', 'data', 'flush_period'], self.default_flush_period)
+        self.write_behind = bool(config.get(['west', 'data', 'write_behind'], self.default_write_behind))
         self.iter_ref_h5_template = config.get(['west', 'data', 'data_refs', 'iteration'], None)
         self.store_h5 = self.iter_ref_h5_template is not None
+        self.restart_storage = RestartStorage.from_config(config)
 
         # Process dataset options
         dsopts_list = config.get(['west', 'data', 'datasets']) or []
@@ -279,9 +494,19 @@ class WESTDataManager:
         self.flush_period = None
         self.last_flush = 0
 
+        # Background writer for segment updates (see update_segments_async())
+        self.write_behind = self.default_write_behind
+        self._write_queue = None
+        self._writer_thread = None
+        self._writer_error = None
+
         self._system = None
         self.iter_ref_h5_template = None
         self.store_h5 = False
+        self.restart_storage = RestartStorage()
+
+        # Parents of all segments, for tracing (see get_ancestry_index())
+        self._ancestry_index = None
 
         self.dataset_options = {}
         self.process_config()
@@ -385,10 +610,14 @@ class WESTDataManager:
             self.we_h5file.create_group('/iterations')
 
     def close_backing(self):
-        if self.we_h5file is not None:
-            with self.lock:
-                self.we_h5file.close()
-            self.we_h5file = None
+        try:
+            self.stop_writer()
+        finally:
+            if self.we_h5file is not None:
+                with self.lock:
+                    self.we_h5file.close()
+                self.we_h5file = None
+            self._ancestry_index = None
 
     def flush_backing(self):
         if self.we_h5file is not None:
@@ -574,7 +803,7 @@ class WESTDataManager:
 
         with h5io.WESTIterationFile(iter_ref_h5_file, 'a') as outf:
             for segment in segments:
-                outf.write_segment(segment, True)
+                outf.write_segment(segment, True, self.restart_storage)
 
         iter_group = self.get_iter_group(n_iter)
 
@@ -842,7 +1071,8 @@ class WESTDataManager:
             seg_index_table = seg_index_table_ds[...]
 
             if not init:
-                summary_row = np.zeros((1,), dtype=summary_table_dtype)
+                # Files created by earlier versions have fewer columns
+                summary_row = np.zeros((1,), dtype=summary_table.dtype)
                 summary_row['n_particles'] = n_particles
                 summary_row['norm'] = np.add.reduce(list(map(attrgetter('weight'), segments)))
                 summary_table[n_iter - 1] = summary_row
@@ -913,6 +1143,39 @@ class WESTDataManager:
             seg_index_table_ds[:] = seg_index_table
             pcoord_ds[...] = pcoord
 
+            if not init:
+                self.update_ancestry_index(n_iter, seg_index_table['parent_id'])
+
+    def get_ancestry_index(self):
+        '''Return the index of the parents of all segments up to the current iteration (an ``AncestryIndex``),
+        as stored in the HDF5 file. Iterations which are not stored (as in files written by earlier versions of
+        WESTPA) are indexed from their segment indexes as needed.'''
+        with self.lock:
+            n_iters = self.current_iteration
+            if self._ancestry_index is None or self._ancestry_index.n_iters < n_iters:
+                self._ancestry_index = AncestryIndex.from_h5file(self.we_h5file, n_iters, self.get_iter_group)
+            return self._ancestry_index
+
+    def update_ancestry_index(self, n_iter, parent_ids):
+        '''Record ``parent_ids`` as the parents of the segments of iteration ``n_iter`` in the ancestry index,
+        discarding any later iterations.'''
+        with self.lock:
+            index = self._ancestry_index
+            if index is None or index.n_iters < n_iter - 1:
+                index = AncestryIndex.from_h5file(self.we_h5file, n_iter - 1, self.get_iter_group)
+            index.set_iteration(n_iter, parent_ids)
+            index.save(self.we_h5file, n_iter)
+            self._ancestry_index = index
+
+    def truncate_ancestry_index(self, n_iters):
+        '''Discard the parents of segments after iteration ``n_iters`` from the ancestry index.'''
+        with self.lock:
+            if self._ancestry_index is not None:
+                self._ancestry_index.truncate(n_iters)
+            if ancestry_group_name in self.we_h5file:
+                index = AncestryIndex.from_h5file(self.we_h5file, n_iters, self.get_iter_group)
+                index.save(self.we_h5file, n_iters + 1)
+
     def update_iter_group_links(self, n_iter):
         '''Update the per-iteration hard links pointing to the tables of target and initial/basis states for the
         given iteration.  These links are not used by this class, but are remarkably convenient for third-party
@@ -951,6 +1214,7 @@ class WESTDataManager:
         '''Update segment information in the HDF5 file; all prior information for each
         ``segment`` is overwritten, except for parent and weight transfer information.'''
 
+        write_start = time.time()
         segments = sorted(segments, key=attrgetter('seg_id'))
 
         with self.lock:
@@ -977,11 +1241,9 @@ class WESTDataManager:
             pc_fsel = pc_dsid.get_space()
             si_fsel = si_dsid.get_space()
 
-            for iseg in range(n_segments):
-                seg_id = seg_ids[iseg]
-                op = h5s.SELECT_OR if iseg != 0 else h5s.SELECT_SET
-                si_fsel.select_hyperslab((seg_id,), (1,), op=op)
-                pc_fsel.select_hyperslab((seg_id, 0, 0), (1, pcoord_len, pcoord_ndim), op=op)
+            seg_id_runs = _contiguous_runs(seg_ids)
+            _select_runs(si_fsel, seg_id_runs)
+            _select_runs(pc_fsel, seg_id_runs, (pcoord_len, pcoord_ndim))
 
             # read summary data so that we have valud parent and weight transfer information
             si_dsid.read(si_msel, si_fsel, seg_index_entries)
@@ -1021,118 +1283,192 @@ class WESTDataManager:
 
             # Then we iterate over data sets and store data
             if dsets:
-                for dsname, (shape, dtype) in dsets.items():
+                for dsname, (shape, dtype) in list(dsets.items()):
                     # dset = self._require_aux_dataset(iter_group, dsname, n_total_segments, shape, dtype)
                     try:
                         dsopts = self.dataset_options[dsname]
                     except KeyError:
                         dsopts = normalize_dataset_options({'name': dsname}, path_prefix='auxdata')
 
-                    shape = (n_total_segments,) + shape
                     dset = require_dataset_from_dsopts(
-                        iter_group, dsopts, shape, dtype, autocompress_threshold=self.aux_compression_threshold, n_iter=n_iter
+                        iter_group,
+                        dsopts,
+                        (n_total_segments,) + shape,
+                        dtype,
+                        autocompress_threshold=self.aux_compression_threshold,
+                        n_iter=n_iter,
                     )
                     if dset is None:
                         # storage is suppressed
                         continue
-                    for segment in segments:
-                        try:
-                            auxdataset = segment.data[dsname]
-                        except KeyError:
-                            pass
-                        else:
-                            source_rank = len(auxdataset.shape)
-                            source_sel = h5s.create_simple(auxdataset.shape, (h5s.UNLIMITED,) * source_rank)
-                            source_sel.select_all()
-                            dest_sel = dset.id.get_space()
-                            dest_sel.select_hyperslab((segment.seg_id,) + (0,) * source_rank, (1,) + auxdataset.shape)
-                            dset.id.write(source_sel, dest_sel, auxdataset)
+
+                    # Stack the data for this batch of segments into one buffer, and write it with a single
+                    # selection made of runs of consecutive segments, rather than one write per segment;
+                    # every separate write is a separate trip through the chunk cache and filter pipeline.
+                    # Data of any other shape is written on its own, at its own shape, as it would be alone.
+                    aux_segments = [segment for segment in segments if dsname in segment.data]
+                    stacked = [segment for segment in aux_segments if segment.data[dsname].shape == shape]
+                    unstacked = [segment for segment in aux_segments if segment.data[dsname].shape != shape]
+
+                    aux_entries = np.empty((len(stacked),) + shape, dtype=dtype)
+                    for ientry, segment in enumerate(stacked):
+                        aux_entries[ientry] = segment.data[dsname]
+
+                    source_sel = h5s.create_simple(aux_entries.shape, (h5s.UNLIMITED,) * aux_entries.ndim)
+                    source_sel.select_all()
+                    dest_sel = dset.id.get_space()
+                    _select_runs(dest_sel, _contiguous_runs([segment.seg_id for segment in stacked]), shape)
+                    dset.id.write(source_sel, dest_sel, aux_entries)
+                    del aux_entries
+
+                    for segment in unstacked:
+                        auxdataset = segment.data[dsname]
+                        if len(auxdataset.shape) != len(shape) or any(n > m for n, m in zip(auxdataset.shape, shape)):
+                            raise ValueError(
+                                'auxiliary data {!r} of segment {:d} has shape {!r}, which does not fit in {!r}'.format(
+                                    dsname, segment.seg_id, auxdataset.shape, shape
+                                )
+                            )
+                        log.debug(
+                            'auxiliary data {!r} of segment {:d} has shape {!r}, not {!r}'.format(
+                                dsname, segment.seg_id, auxdataset.shape, shape
+                            )
+                        )
+                        source_rank = len(auxdataset.shape)
+                        source_sel = h5s.create_simple(auxdataset.shape, (h5s.UNLIMITED,) * source_rank)
+                        source_sel.select_all()
+                        dest_sel = dset.id.get_space()
+                        dest_sel.select_hyperslab((segment.seg_id,) + (0,) * source_rank, (1,) + auxdataset.shape)
+                        dset.id.write(source_sel, dest_sel, auxdataset)
+
                     if 'delram' in list(dsopts.keys()):
                         del dsets[dsname]
 
             self.update_iter_h5file(n_iter, segments)
 
-    def get_segments(self, n_iter=None, seg_ids=None, load_pcoords=True):
-        '''Return the given (or all) segments from a given iteration.
+            # Keep a running total of the time spent writing segment data for this iteration
+            iter_group.attrs['writetime'] = iter_group.attrs.get('writetime', 0.0) + (time.time() - write_start)
 
-        If the optional parameter ``load_auxdata`` is true, then all auxiliary datasets
-        available are loaded and mapped onto the ``data`` dictionary of each segment. If
-        ``load_auxdata`` is None, then use the default ``self.auto_load_auxdata``, which can
-        be set by the option ``load_auxdata`` in the ``[data]`` section of ``west.cfg``. This
-        essentially requires as much RAM as there is per-iteration auxiliary data, so this
-        behavior is not on by default.'''
+    def update_segments_async(self, n_iter, segments):
+        '''Queue segment information to be written to the HDF5 file, as by ``update_segments()``,
+        by a background writer thread, so that the caller can carry on (e.g. harvesting completed
+        propagation tasks) while HDF5 compresses and writes. Updates queued while the writer is
+        busy are coalesced into a single call to ``update_segments()``.
 
-        n_iter = n_iter or self.current_iteration
-        file_version = self.we_h5file_version
+        The segments must not be modified until ``flush_writes()`` is called, which waits for all
+        queued writes to complete. If write-behind is disabled (``write_behind: False`` in the
+        ``data`` section of ``west.cfg``), the segments are written immediately.'''
+
+        if not self.write_behind:
+            with self.expiring_flushing_lock():
+                self.update_segments(n_iter, segments)
+            return
 
+        self._raise_writer_error()
+        if self._writer_thread is None:
+            self._write_queue = queue.Queue()
+            self._writer_thread = threading.Thread(target=self._write_segments_loop, name='WESTDataManager writer', daemon=True)
+            self._writer_thread.start()
+        self._write_queue.put((n_iter, list(segments)))
+
+    def flush_writes(self):
+        '''Wait for all segment updates queued with ``update_segments_async()`` to be written,
+        re-raising any exception which occurred while writing them. Must not be called while
+        holding ``self.lock``.'''
+
+        if self._write_queue is not None:
+            self._write_queue.join()
+        self._raise_writer_error()
+
+    def stop_writer(self):
+        '''Write any queued segment updates and stop the background writer thread, if running.'''
+        if self._writer_thread is not None:
+            self._write_queue.put(None)
+            self._writer_thread.join()
+            self._writer_thread = None
+            self._write_queue = None
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        if self._writer_error is not None:
+            error, self._writer_error = self._writer_error, None
+            raise error
+
+    def _write_segments_loop(self):
+        write_queue = self._write_queue
+        while True:
+            # Take everything queued so far, so that updates which accumulated while the previous
+            # batch was being written go out in one pass
+            entries = [write_queue.get()]
+            while True:
+                try:
+                    entries.append(write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                pending = {}
+                for entry in entries:
+                    if entry is not None:
+                        n_iter, segments = entry
+                        pending.setdefault(n_iter, {}).update((segment.seg_id, segment) for segment in segments)
+
+                # After a failure, drop further writes; the error is raised in the caller at the next
+                # call to update_segments_async() or flush_writes()
+                if self._writer_error is None:
+                    for n_iter, segments in sorted(pending.items()):
+                        with self.expiring_flushing_lock():
+                            self.update_segments(n_iter, list(segments.values()))
+            except Exception as e:
+                log.error('error writing segment data: {!r}'.format(e))
+                self._writer_error = e
+            finally:
+                for _entry in entries:
+                    write_queue.task_done()
+
+            if None in entries:
+                return
+
+    def get_iter_write_time(self, n_iter=None):
+        '''Return the total time spent in ``update_segments()`` for the given iteration.'''
+        n_iter = n_iter or self.current_iteration
         with self.lock:
-            iter_group = self.get_iter_group(n_iter)
-            seg_index_ds = iter_group['seg_index']
+            return float(self.get_iter_group(n_iter).attrs.get('writetime', 0.0))
 
-            if file_version < 5:
-                all_parent_ids = iter_group['parents'][...]
-            else:
-                all_parent_ids = iter_group['wtgraph'][...]
+    def get_segments_columnar(self, n_iter=None, seg_ids=None, load_pcoords=True):
+        '''Return the given (or all) segments from a given iteration as a ``SegmentTable``.
 
-            if seg_ids is not None:
-                seg_ids = list(sorted(seg_ids))
-                seg_index_entries = seg_index_ds[seg_ids]
-                if load_pcoords:
-                    pcoord_entries = iter_group['pcoord'][seg_ids]
-            else:
-                seg_ids = list(range(len(seg_index_ds)))
-                seg_index_entries = seg_index_ds[...]
-                if load_pcoords:
-                    pcoord_entries = iter_group['pcoord'][...]
-
-            segments = []
-
-            for iseg, (seg_id, row) in enumerate(zip(seg_ids, seg_index_entries)):
-                segment = Segment(
-                    seg_id=seg_id,
-                    n_iter=n_iter,
-                    status=int(row['status']),
-                    endpoint_type=int(row['endpoint_type']),
-                    walltime=float(row['walltime']),
-                    cputime=float(row['cputime']),
-                    weight=float(row['weight']),
-                )
+        The segment index, progress coordinates, weight graph, and any auxiliary datasets
+        marked with ``load`` in the dataset options are each read with a single bulk HDF5
+        read; ``Segment`` objects are only constructed if and when the table is indexed.'''
 
-                if load_pcoords:
-                    segment.pcoord = pcoord_entries[iseg]
+        n_iter = n_iter or self.current_iteration
+        datasets = {dsinfo['name']: dsinfo['h5path'] for dsinfo in self.dataset_options.values() if dsinfo.get('load', False)}
 
-                if file_version < 5:
-                    wtg_n_parents = row['n_parents']
-                    wtg_offset = row['parents_offset']
-                    wtg_parent_ids = all_parent_ids[wtg_offset : wtg_offset + wtg_n_parents]
-                    segment.parent_id = int(wtg_parent_ids[0])
-                else:
-                    wtg_n_parents = row['wtg_n_parents']
-                    wtg_offset = row['wtg_offset']
-                    wtg_parent_ids = all_parent_ids[wtg_offset : wtg_offset + wtg_n_parents]
-                    segment.parent_id = int(row['parent_id'])
-                segment.wtg_parent_ids = set(map(int, wtg_parent_ids))
-                assert len(segment.wtg_parent_ids) == wtg_n_parents
-                segments.append(segment)
-            del all_parent_ids
-            if load_pcoords:
-                del pcoord_entries
-
-            # If any other data sets are requested, load them as well
-            for dsinfo in self.dataset_options.values():
-                if dsinfo.get('load', False):
-                    dsname = dsinfo['name']
-                    try:
-                        ds = iter_group[dsinfo['h5path']]
-                    except KeyError:
-                        ds = None
+        with self.lock:
+            return SegmentTable.from_iter_group(
+                n_iter,
+                self.get_iter_group(n_iter),
+                self.we_h5file_version,
+                seg_ids=seg_ids,
+                load_pcoords=load_pcoords,
+                datasets=datasets,
+            )
+
+    def get_segments(self, n_iter=None, seg_ids=None, load_pcoords=True):
+        '''Return the given (or all) segments from a given iteration.
+
+        If the optional parameter ``load_auxdata`` is true, then all auxiliary datasets
+        available are loaded and mapped onto the ``data`` dictionary of each segment. If
+        ``load_auxdata`` is None, then use the default ``self.auto_load_auxdata``, which can
+        be set by the option ``load_auxdata`` in the ``[data]`` section of ``west.cfg``. This
+        essentially requires as much RAM as there is per-iteration auxiliary data, so this
+        behavior is not on by default.
 
-                    if ds is not None:
-                        for segment in segments:
-                            seg_id = segment.seg_id
-                            segment.data[dsname] = ds[seg_id]
+        See ``get_segments_columnar()`` for a variant which avoids constructing a ``Segment``
+        object per segment.'''
 
-        return segments
+        return self.get_segments_columnar(n_iter, seg_ids, load_pcoords).segments()
 
     def prepare_segment_restarts(self, segments, basis_states=None, initial_states=None):
         '''Prepare the necessary folder and files given the data stored in parent per-iteration HDF5 file
@@ -1142,6 +1478,8 @@ class WESTDataManager:
         if not self.store_h5:
             return
 
+        # Find the parent of each segment, so that each parent per-iteration HDF5 file is opened once
+        parents = {}
         for segment in segments:
             if segment.parent_id < 0:
                 if initial_states is None or basis_states is None:
@@ -1160,15 +1498,26 @@ class WESTDataManager:
             else:
                 parent = Segment(n_iter=segment.n_iter - 1, seg_id=segment.parent_id)
 
-            try:
-                parent_iter_ref_h5_file = makepath(self.iter_ref_h5_template, {'n_iter': parent.n_iter})
-
-                with h5io.WESTIterationFile(parent_iter_ref_h5_file, 'r') as outf:
-                    outf.read_restart(parent)
+            parents.setdefault(parent.n_iter, []).append((segment, parent))
 
-                segment.data['iterh5/restart'] = parent.data['iterh5/restart']
+        # Restart files stored in ``stream`` or ``link`` mode are only referenced here, and are
+        # read by the worker propagating the segment (see westpa.core.restarts)
+        for parent_n_iter, segment_parents in parents.items():
+            parent_iter_ref_h5_file = makepath(self.iter_ref_h5_template, {'n_iter': parent_n_iter})
+            try:
+                outf = h5io.WESTIterationFile(parent_iter_ref_h5_file, 'r')
             except Exception as e:
-                print('could not prepare restart data for segment {}/{}: {}'.format(segment.n_iter, segment.seg_id, str(e)))
+                for segment, parent in segment_parents:
+                    print('could not prepare restart data for segment {}/{}: {}'.format(segment.n_iter, segment.seg_id, str(e)))
+                continue
+
+            with outf:
+                for segment, parent in segment_parents:
+                    try:
+                        outf.read_restart(parent)
+                        segment.data['iterh5/restart'] = parent.data['iterh5/restart']
+                    except Exception as e:
+                        print('could not prepare restart data for segment {}/{}: {}'.format(segment.n_iter, segment.seg_id, str(e)))
 
     def get_all_parent_ids(self, n_iter):
         file_version = self.we_h5file_version
@@ -1619,14 +1968,14 @@ def create_dataset_from_dsopts(group, dsopts, shape=None, dtype=None, data=None,
     if chunks_directive is None:
         chunks = None
     elif chunks_directive is True:
-        chunks = calc_chunksize(shape, h5_dtype)
+        chunks = calc_segment_chunksize(shape, h5_dtype)
     elif chunks_directive is False:
         chunks = None
     else:
         chunks = tuple(chunks_directive[i] if chunks_directive[i] <= shape[i] else shape[i] for i in range(len(shape)))
 
     if not chunks and need_chunks:
-        chunks = calc_chunksize(shape, h5_dtype)
+        chunks = calc_segment_chunksize(shape, h5_dtype)
 
     opts = {'shape': shape, 'dtype': h5_dtype, 'compression': compression, 'shuffle': shuffle, 'chunks': chunks}
 
@@ -1692,3 +2041,49 @@ def calc_chunksize(shape, dtype, max_chunksize=262144):
         )
     )
     return chunk_shape
+
+
+def calc_segment_chunksize(shape, dtype, max_chunksize=16384):
+    '''Calculate a chunk size for a per-segment HDF5 dataset, the first dimension of which
+    is the number of segments in the iteration.
+
+    Segment data are written back in scattered batches as segments complete, and every chunk
+    touched by a write must be read, decompressed, and recompressed. Chunks are therefore
+    kept small (up to ``max_chunksize`` bytes) and made of whole segments, so that writing a
+    segment touches exactly one chunk, and the segments of the iteration are spread evenly
+    over chunks, so that no chunk is left nearly empty. Falls back to ``calc_chunksize()`` if
+    the data for a single segment does not fit in one chunk.'''
+
+    n_segments = shape[0]
+    seg_nbytes = int(np.multiply.reduce(shape[1:])) * dtype.itemsize
+    if n_segments < 1 or seg_nbytes < 1 or seg_nbytes > max_chunksize:
+        return calc_chunksize(shape, dtype, max_chunksize)
+
+    n_chunks = -(-n_segments // min(n_segments, max_chunksize // seg_nbytes))
+    chunk_shape = (-(-n_segments // n_chunks),) + tuple(shape[1:])
+    log.debug(
+        'selected chunk shape {} for per-segment data set of type {} shaped {} (chunk size = {} bytes)'.format(
+            chunk_shape, dtype, shape, chunk_shape[0] * seg_nbytes
+        )
+    )
+    return chunk_shape
+
+
+def _contiguous_runs(seg_ids):
+    '''Return ``(starts, lengths)`` of the runs of consecutive IDs in the sorted sequence ``seg_ids``.'''
+    seg_ids = np.asarray(seg_ids, dtype=seg_id_dtype)
+    if not len(seg_ids):
+        return seg_ids, seg_ids
+    breaks = np.flatnonzero(np.diff(seg_ids) != 1) + 1
+    starts = seg_ids[np.concatenate(([0], breaks))]
+    lengths = np.diff(np.concatenate(([0], breaks, [len(seg_ids)])))
+    return starts, lengths
+
+
+def _select_runs(space, runs, extent=()):
+    '''Select the rows of the dataspace ``space`` given by ``runs`` (as returned by
+    ``_contiguous_runs()``), each row having the shape ``extent``, as one hyperslab per run.'''
+    zeros = (0,) * len(extent)
+    space.select_none()
+    for start, length in zip(*runs):
+        space.select_hyperslab((int(start),) + zeros, (int(length),) + tuple(extent), op=h5s.SELECT_OR)
@@ -13,6 +13,7 @@ import warnings
 
 import h5py
 import numpy as np
+import scipy.sparse
 from numpy import index_exp
 from tables import NaturalNameWarning
 
@@ -21,6 +22,7 @@ from mdtraj.utils import in_units_of, import_, ensure_type
 from mdtraj.formats import HDF5TrajectoryFile
 from mdtraj.formats.hdf5 import _check_mode, Frames
 
+from .restarts import RestartFiles, RestartStorage, StoredRestart
 from .trajectory import WESTTrajectory
 
 try:
@@ -327,6 +329,79 @@ def get_iteration_slice(h5object, iter_start, iter_stop=None, iter_stride=None):
     return np.index_exp[start_index:stop_index:iter_stride]
 
 
+def get_iter_assignments(h5file, dsname, n_iter, seg_index=None):
+    '''Read the per-segment, per-timepoint data set ``dsname`` (``assignments``, ``trajlabels`` or ``statelabels``)
+    for iteration ``n_iter`` from the assignments file ``h5file`` written by ``w_assign``, as an array of shape
+    (nsegs, npts), whichever layout the file uses. Files are either dense, with data sets indexed by
+    [iteration][segment][timepoint] and padded to the largest number of segments and timepoints, or ragged
+    (``layout`` attribute ``ragged``), with the (nsegs, npts) arrays of each iteration flattened and stored one
+    after another, starting at the positions given in the ``iter_offsets`` data set. ``seg_index``, if given,
+    selects segments (as an integer, slice or array of segment IDs) before returning.'''
+
+    ds = h5file[dsname]
+    (iiter,) = get_iteration_entry(h5file, n_iter)
+    nsegs = int(h5file['nsegs'][iiter])
+    npts = int(h5file['npts'][iiter])
+    if isinstance(seg_index, (int, np.integer)) and not 0 <= seg_index < nsegs:
+        raise IndexError('segment {} not available in iteration {} of {!r}'.format(seg_index, n_iter, ds))
+
+    if tostr(ds.attrs.get('layout', 'dense')) == 'ragged':
+        offset = int(h5file['iter_offsets'][iiter])
+        if isinstance(seg_index, (int, np.integer)):
+            return ds[offset + seg_index * npts : offset + (seg_index + 1) * npts]
+        data = ds[offset : offset + nsegs * npts].reshape(nsegs, npts)
+    elif isinstance(seg_index, (int, np.integer)):
+        return ds[iiter, seg_index, :npts]
+    else:
+        data = ds[iiter, :nsegs, :npts]
+
+    return data if seg_index is None else data[seg_index]
+
+
+###
+# Sparse matrices
+###
+def save_sparse_matrix(h5group, name, matrix, dense=False, **kwargs):
+    '''Store the two-dimensional ``matrix`` (a ``scipy.sparse`` matrix or an array) as ``name`` in ``h5group``,
+    replacing any existing entry. Unless ``dense`` is true, only its nonzero entries are stored, in a group (with
+    ``layout`` attribute ``coo`` and ``shape`` attribute giving the shape of the matrix) holding the row indices
+    (``rows``), column indices (``cols``) and values (``data``) of the entries, in row-major order. Otherwise
+    the matrix is stored as an ordinary data set. Additional keyword arguments are passed to
+    ``create_dataset()``.'''
+
+    try:
+        del h5group[name]
+    except KeyError:
+        pass
+
+    if dense:
+        return h5group.create_dataset(name, data=matrix.toarray() if scipy.sparse.issparse(matrix) else matrix, **kwargs)
+
+    matrix = scipy.sparse.coo_matrix(matrix)
+    matrix.sum_duplicates()
+    group = h5group.create_group(name)
+    group.attrs['layout'] = 'coo'
+    group.attrs['shape'] = matrix.shape
+    group.create_dataset('rows', data=matrix.row.astype(np.int64), **kwargs)
+    group.create_dataset('cols', data=matrix.col.astype(np.int64), **kwargs)
+    group.create_dataset('data', data=matrix.data, **kwargs)
+    return group
+
+
+def load_sparse_matrix(h5object, dense=False):
+    '''Read a matrix stored by ``save_sparse_matrix()``, in either layout, returning it as a
+    ``scipy.sparse`` CSR matrix, or as an array if ``dense`` is true.'''
+
+    if isinstance(h5object, h5py.Dataset):
+        return h5object[...] if dense else scipy.sparse.csr_matrix(h5object[...])
+
+    if tostr(h5object.attrs.get('layout')) != 'coo':
+        raise ValueError('{!r} is not a sparse matrix'.format(h5object))
+    shape = tuple(h5object.attrs['shape'])
+    matrix = scipy.sparse.csr_matrix((h5object['data'][...], (h5object['rows'][...], h5object['cols'][...])), shape=shape)
+    return matrix.toarray() if dense else matrix
+
+
 ###
 # Axis label metadata
 ###
@@ -646,13 +721,73 @@ class WESTIterationFile(HDF5TrajectoryFile):
         )
 
     def read_restart(self, segment):
+        '''Retrieve the restart data of ``segment`` into ``segment.data['iterh5/restart']``. Restart files
+        stored in ``stream`` or ``link`` mode (see ``westpa.core.restarts``) are not read; a reference
+        to them is retrieved instead, and they are read by its ``extract()`` method.'''
         if self.has_restart(segment):
-            data = self.read_data('/restart/%d_%d' % (segment.n_iter, segment.seg_id), 'data')
+            where = '/restart/%d_%d' % (segment.n_iter, segment.seg_id)
+            group = self._get_node(where)
+            if 'link_root' in group._v_attrs:
+                data = RestartFiles(group._v_attrs['link_root'], group._v_attrs['link_files'], group._v_attrs['link_methods'])
+            elif 'files' in group:
+                data = StoredRestart(os.path.abspath(self._handle.filename), where)
+            else:
+                data = self.read_data(where, 'data')
             segment.data['iterh5/restart'] = data
         else:
             raise ValueError('no restart data available for {}'.format(str(segment)))
 
-    def write_segment(self, segment, pop=False):
+    def write_files(self, where, restart_files, storage):
+        '''Store the files of ``restart_files`` (a ``RestartFiles`` object) under the node ``where``, as
+        directed by ``storage`` (a ``RestartStorage`` object): in ``link`` mode, only the location of
+        the files is recorded; otherwise, each file is copied into a chunked dataset of its own, one
+        chunk at a time, and then deleted.'''
+
+        parent, name = where.rsplit('/', 1)
+        if self._has_node(parent, name):
+            self._remove_node(parent, name=name, recursive=True)
+        group = self._create_group(parent, name, createparents=True)
+
+        if storage.mode == 'link':
+            group._v_attrs['link_root'] = restart_files.root
+            group._v_attrs['link_files'] = list(restart_files.files)
+            group._v_attrs['link_methods'] = list(restart_files.link_methods)
+            return
+
+        filters = storage.filters(self.tables)
+        files_group = self._create_group(group, 'files')
+        for i, (file, src) in enumerate(zip(restart_files.files, restart_files.paths())):
+            size = os.path.getsize(src)
+            node = self._create_earray(
+                files_group,
+                'f%d' % i,
+                atom=self.tables.UInt8Atom(),
+                shape=(0,),
+                filters=filters,
+                chunkshape=(max(1, min(storage.chunk_size, size)),),
+                expectedrows=size,
+            )
+            node.attrs['path'] = file
+            with open(src, 'rb') as f:
+                while True:
+                    chunk = f.read(storage.chunk_size)
+                    if not chunk:
+                        break
+                    node.append(np.frombuffer(chunk, dtype=np.uint8))
+        restart_files.remove()
+
+    def extract_files(self, where, path):
+        '''Write the files stored (by ``write_files()``) under the node ``where`` into the directory
+        ``path``, one chunk at a time.'''
+        for node in self._get_node(where + '/files'):
+            dst = os.path.join(path, node.attrs['path'])
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            step = node.chunkshape[0]
+            with open(dst, 'wb') as f:
+                for start in range(0, node.nrows, step):
+                    f.write(node.read(start, start + step).tobytes())
+
+    def write_segment(self, segment, pop=False, restart_storage=None):
         n_iter = segment.n_iter
 
         self.root._v_attrs['n_iter'] = n_iter
@@ -709,8 +844,13 @@ class WESTIterationFile(HDF5TrajectoryFile):
             elif self.mode == 'w':
                 self.topology = traj.topology
 
+        if restart_storage is None:
+            restart_storage = RestartStorage(mode='stream')
+
         # restart
-        if restart is not None:
+        if isinstance(restart, RestartFiles):
+            self.write_files('/restart/%d_%d' % (segment.n_iter, segment.seg_id), restart, restart_storage)
+        elif restart is not None:
             if self.has_restart(segment):
                 self._remove_node('/restart', name='%d_%d' % (segment.n_iter, segment.seg_id), recursive=True)
 
@@ -722,7 +862,9 @@ class WESTIterationFile(HDF5TrajectoryFile):
                 createparents=True,
             )
 
-        if slog is not None:
+        if isinstance(slog, RestartFiles):
+            self.write_files('/log/%d_%d' % (segment.n_iter, segment.seg_id), slog, restart_storage)
+        elif slog is not None:
             if self._has_node('/log', str(segment.seg_id)):
                 self._remove_node('/log', name=str(segment.seg_id), recursive=True)
 
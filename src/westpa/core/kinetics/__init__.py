@@ -4,7 +4,7 @@ Kinetics analysis library
 
 import logging
 
-from .rate_averaging import RateAverager  # noqa
+from .rate_averaging import RateAverager, SlidingWindowRateAverager  # noqa
 
 from . import _kinetics  # noqa
 from ._kinetics import (  # noqa
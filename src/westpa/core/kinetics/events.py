@@ -94,15 +94,12 @@ class WKinetics:
             parent_ids = self.data_reader.parent_id_dsspec.get_iter_data(n_iter)
 
             # Get bin and traj. ensemble assignments from the previously-generated assignments file
-            assignment_iiter = h5io.get_iteration_entry(self.assignments_file, n_iter)
-            bin_assignments = np.require(
-                self.assignments_file['assignments'][assignment_iiter + np.s_[:nsegs, :npts]], dtype=index_dtype
-            )
+            bin_assignments = np.require(h5io.get_iter_assignments(self.assignments_file, 'assignments', n_iter), dtype=index_dtype)
             label_assignments = np.require(
-                self.assignments_file['trajlabels'][assignment_iiter + np.s_[:nsegs, :npts]], dtype=index_dtype
+                h5io.get_iter_assignments(self.assignments_file, 'trajlabels', n_iter), dtype=index_dtype
             )
             state_assignments = np.require(
-                self.assignments_file['statelabels'][assignment_iiter + np.s_[:nsegs, :npts]], dtype=index_dtype
+                h5io.get_iter_assignments(self.assignments_file, 'statelabels', n_iter), dtype=index_dtype
             )
 
             # Prepare to run analysis
@@ -2,15 +2,16 @@ from collections import namedtuple
 from itertools import zip_longest
 
 import numpy as np
+import scipy.sparse
 
 import westpa
+from westpa.core.h5io import tostr
 from westpa.core.kinetics._kinetics import (
-    flux_assign,
     pop_assign,
-    calc_rates,
     StreamingStats1D,
     StreamingStats2D,
 )  # @UnresolvedImport
+from westpa.core.transitions import SparseStreamingStats, SparseTransitionCounter, sparse_rate_matrix
 
 
 # Named tuple proxy for StreamingStats class
@@ -42,112 +43,136 @@ def tuple2stats(stat_tuple):
     return stats
 
 
-def process_iter_chunk(bin_mapper, iter_indices, iter_data=None):
-    '''Calculate the flux matrices and populations of a set of iterations specified
-    by iter_indices. Optionally provide the necessary arrays to perform the calculation
-    in iter_data. Otherwise get data from the data_manager directly.
-    '''
+def iteration_fluxes(bin_mapper, iter_group, pcoord_len, from_iter_data=False):
+    '''Return the sparse flux matrix and the population vector of a single iteration, read
+    from its HDF5 group ``iter_group``, or if ``from_iter_data`` is true, from the dict of
+    arrays extracted from it by ``RateAverager.extract_data()``.'''
 
-    data_manager = westpa.rc.get_data_manager()
-    system = westpa.rc.get_system_driver()
-
-    # itercount = len(iter_indices)
     nbins = bin_mapper.nbins
+    assign = bin_mapper.assign
+    transitions = SparseTransitionCounter(nbins)
+    population_vector = np.zeros((nbins,), np.float64)
 
-    flux_stats = StreamingStats2D((nbins, nbins))
-    rate_stats = StreamingStats2D((nbins, nbins))
-    pop_stats = StreamingStats1D(nbins)
+    # first, account for the flux due to recycling
+    # we access the hdf5 file directly to avoid nearly 50% overhead of creating a ton of
+    # tiny newweightentry objects
+    try:
+        nwgroup = iter_group['new_weights']
+    except KeyError:
+        # no new weight data
+        pass
+    else:
+        if from_iter_data:
+            weights = nwgroup['weight']
+            prev_init_pcoords = nwgroup['prev_init_pcoord']
+            new_init_pcoords = nwgroup['new_init_pcoord']
+        else:
+            weights = nwgroup['index'][...]['weight']
+            prev_init_pcoords = nwgroup['prev_init_pcoord'][...]
+            new_init_pcoords = nwgroup['new_init_pcoord'][...]
 
-    nomask1d = np.zeros((nbins,), np.uint8)
-    nomask2d = np.zeros((nbins, nbins), np.uint8)
-    rate_mask = np.zeros((nbins, nbins), np.uint8)
+        transitions.add(assign(prev_init_pcoords), assign(new_init_pcoords), weights)
+        del prev_init_pcoords, new_init_pcoords, weights
 
-    flux_matrix = np.zeros((nbins, nbins), np.float64)
-    rate_matrix = np.zeros((nbins, nbins), np.float64)
-    population_vector = np.zeros((nbins,), np.float64)
+    if from_iter_data:
+        weights = iter_group['weight']
+        initial_pcoords = iter_group['initial_pcoords']
+        final_pcoords = iter_group['final_pcoords']
+    else:
+        weights = iter_group['seg_index']['weight']
+        initial_pcoords = iter_group['pcoord'][:, 0]
+        final_pcoords = iter_group['pcoord'][:, pcoord_len - 1]
 
-    pcoord_len = system.pcoord_len
-    assign = bin_mapper.assign
+    initial_assignments = assign(initial_pcoords)
+    final_assignments = assign(final_pcoords)
+
+    transitions.add(initial_assignments, final_assignments, weights)
+    pop_assign(weights, initial_assignments, population_vector)
+
+    return transitions.flux_matrix, population_vector
 
-    for iiter, n_iter in enumerate(iter_indices):
-        flux_matrix.fill(0.0)
-        population_vector.fill(0.0)
 
+def _iter_groups(iter_indices, iter_data=None):
+    data_manager = westpa.rc.get_data_manager()
+    for n_iter in iter_indices:
         if iter_data:
             iter_group_name = 'iter_{:0{prec}d}'.format(int(n_iter), prec=data_manager.iter_prec)
-            iter_group = iter_data[iter_group_name]
+            yield n_iter, iter_data[iter_group_name]
         else:
-            iter_group = data_manager.get_iter_group(n_iter)
+            yield n_iter, data_manager.get_iter_group(n_iter)
 
-        # first, account for the flux due to recycling
-        # we access the hdf5 file directly to avoid nearly 50% overhead of creating a ton of
-        # tiny newweightentry objects
-        try:
-            nwgroup = iter_group['new_weights']
-        except KeyError:
-            # no new weight data
-            pass
-        else:
-            if iter_data:
-                index = None
-                weights = nwgroup['weight']
-                prev_init_pcoords = nwgroup['prev_init_pcoord']
-                new_init_pcoords = nwgroup['new_init_pcoord']
-            else:
-                index = nwgroup['index'][...]
-                weights = index['weight']
-                prev_init_pcoords = nwgroup['prev_init_pcoord'][...]
-                new_init_pcoords = nwgroup['new_init_pcoord'][...]
 
-            prev_init_assignments = assign(prev_init_pcoords)
-            new_init_assignments = assign(new_init_pcoords)
+def process_iter_chunk(bin_mapper, iter_indices, iter_data=None):
+    '''Calculate the flux matrices and populations of a set of iterations specified
+    by iter_indices. Optionally provide the necessary arrays to perform the calculation
+    in iter_data. Otherwise get data from the data_manager directly.
+
+    Fluxes and rates are accumulated as sparse matrices, in ``SparseStreamingStats``.
+    '''
 
-            flux_assign(weights, prev_init_assignments, new_init_assignments, flux_matrix)
-            # for (weight,i,j) in izip (weights, prev_init_assignments, new_init_assignments):
-            #    flux_matrices[iiter,i,j] += weight
-            del index
-            del prev_init_pcoords, new_init_pcoords, prev_init_assignments, new_init_assignments, weights
+    system = westpa.rc.get_system_driver()
 
-        # iter_group = data_manager.get_iter_group(n_iter)
-        if iter_data:
-            weights = iter_group['weight']
-            initial_pcoords = iter_group['initial_pcoords']
-            final_pcoords = iter_group['final_pcoords']
-        else:
-            weights = iter_group['seg_index']['weight']
-            initial_pcoords = iter_group['pcoord'][:, 0]
-            final_pcoords = iter_group['pcoord'][:, pcoord_len - 1]
+    nbins = bin_mapper.nbins
+
+    flux_stats = SparseStreamingStats((nbins, nbins))
+    rate_stats = SparseStreamingStats((nbins, nbins))
+    pop_stats = StreamingStats1D(nbins)
 
-        initial_assignments = assign(initial_pcoords)
-        final_assignments = assign(final_pcoords)
+    nomask1d = np.zeros((nbins,), np.uint8)
 
-        flux_assign(weights, initial_assignments, final_assignments, flux_matrix)
-        pop_assign(weights, initial_assignments, population_vector)
+    for n_iter, iter_group in _iter_groups(iter_indices, iter_data):
+        flux_matrix, population_vector = iteration_fluxes(bin_mapper, iter_group, system.pcoord_len, bool(iter_data))
 
-        flux_stats.update(flux_matrix, nomask2d)
+        flux_stats.update(flux_matrix)
         pop_stats.update(population_vector, nomask1d)
 
-        calc_rates(flux_matrix, population_vector, rate_matrix, rate_mask)
+        rate_matrix, rate_mask = sparse_rate_matrix(flux_matrix, population_vector)
         rate_stats.update(rate_matrix, rate_mask)
 
-        del weights
-        del initial_assignments, final_assignments
-        del initial_pcoords, final_pcoords
-        del iter_group
+        del flux_matrix, rate_matrix, iter_group
 
-    # Create namedtuple proxies for the cython StreamingStats objects
+    # Create a namedtuple proxy for the cython StreamingStats object
     # since the typed memoryviews class variables do not seem to return
     # cleanly from the zmq workers
-    c_flux_stats = StreamingStatsTuple(flux_stats.M1, flux_stats.M2, flux_stats.n)
-    c_rate_stats = StreamingStatsTuple(rate_stats.M1, rate_stats.M2, rate_stats.n)
     c_pop_stats = StreamingStatsTuple(pop_stats.M1, pop_stats.M2, pop_stats.n)
 
-    return c_flux_stats, c_rate_stats, c_pop_stats
+    return flux_stats, rate_stats, c_pop_stats
+
+
+def process_iter_fluxes(bin_mapper, iter_indices, iter_data=None):
+    '''Return a list of ``(n_iter, flux_matrix, population_vector)`` for each of the
+    iterations specified by iter_indices, as calculated by ``iteration_fluxes()``. The
+    data are taken from iter_data if given, or from the data_manager otherwise.'''
+
+    system = westpa.rc.get_system_driver()
+    return [
+        (n_iter,) + iteration_fluxes(bin_mapper, iter_group, system.pcoord_len, bool(iter_data))
+        for n_iter, iter_group in _iter_groups(iter_indices, iter_data)
+    ]
+
+
+def _store_resizable(h5group, name, data):
+    '''Store ``data`` in the dataset ``name`` of ``h5group``, resizing it along its first axis
+    (or replacing it, if its other dimensions or type differ) if it already exists.'''
+    try:
+        dataset = h5group[name]
+    except KeyError:
+        pass
+    else:
+        if dataset.shape[1:] == data.shape[1:] and dataset.dtype == data.dtype:
+            dataset.resize(data.shape)
+            dataset[...] = data
+            return
+        del h5group[name]
+    h5group.create_dataset(name, data=data, maxshape=(None,) + data.shape[1:], chunks=True)
 
 
 class RateAverager:
     '''Calculate bin-to-bin kinetic properties (fluxes, rates, populations) at
-    1-tau resolution'''
+    1-tau resolution. Fluxes and rates are accumulated sparsely, and are available
+    after ``calculate()`` as ``SparseStreamingStats`` in ``flux_stats`` and
+    ``rate_stats``; the ``average_flux``, ``stderr_flux``, ``average_rate`` and
+    ``stderr_rate`` properties return them as dense (nbins, nbins) arrays.'''
 
     def __init__(self, bin_mapper, system=None, data_manager=None, work_manager=None):
         self.bin_mapper = bin_mapper
@@ -206,23 +231,19 @@ class RateAverager:
         nbins = self.bin_mapper.nbins
 
         if n_blocks == 1:
-            flux_stats_t, rate_stats_t, population_stats_t = process_iter_chunk(self.bin_mapper, list(range(iter_start, iter_stop)))
+            flux_stats, rate_stats, population_stats_t = process_iter_chunk(self.bin_mapper, list(range(iter_start, iter_stop)))
 
-            flux_stats = tuple2stats(flux_stats_t)
-            rate_stats = tuple2stats(rate_stats_t)
             population_stats = tuple2stats(population_stats_t)
         else:
-            flux_stats = StreamingStats2D((nbins, nbins))
-            rate_stats = StreamingStats2D((nbins, nbins))
+            flux_stats = SparseStreamingStats((nbins, nbins))
+            rate_stats = SparseStreamingStats((nbins, nbins))
             population_stats = StreamingStats1D(nbins)
 
             task_generator = self.task_generator(iter_start, iter_stop, block_size)
 
             for future in self.work_manager.submit_as_completed(task_generator, queue_size):
-                chunk_flux_stats_t, chunk_rate_stats_t, chunk_pop_stats_t = future.get_result()
+                chunk_flux_stats, chunk_rate_stats, chunk_pop_stats_t = future.get_result()
 
-                chunk_flux_stats = tuple2stats(chunk_flux_stats_t)
-                chunk_rate_stats = tuple2stats(chunk_rate_stats_t)
                 chunk_pop_stats = tuple2stats(chunk_pop_stats_t)
 
                 # Update statistics with chunked subsets
@@ -230,19 +251,192 @@ class RateAverager:
                 rate_stats += chunk_rate_stats
                 population_stats += chunk_pop_stats
 
-        self.average_flux = flux_stats.mean
-        self.stderr_flux = np.nan_to_num(np.sqrt(flux_stats.var) / flux_stats.n)
+        self.flux_stats = flux_stats
+        self.rate_stats = rate_stats
 
         self.average_populations = population_stats.mean
         self.stderr_populations = np.nan_to_num(np.sqrt(population_stats.var) / population_stats.n)
 
-        self.average_rate = rate_stats.mean
-        self.stderr_rate = np.nan_to_num(np.sqrt(rate_stats.var) / rate_stats.n)
+        assert ~np.any(np.isinf(flux_stats.stderr.data))
+        assert ~np.any(np.isinf(rate_stats.stderr.data))
+        assert ~np.any(np.isinf(self.stderr_populations))
+
+    @property
+    def average_flux(self):
+        return self.flux_stats.mean.toarray()
+
+    @property
+    def stderr_flux(self):
+        return self.flux_stats.stderr.toarray()
+
+    @property
+    def average_rate(self):
+        return self.rate_stats.mean.toarray()
+
+    @property
+    def stderr_rate(self):
+        return self.rate_stats.stderr.toarray()
+
+
+class SlidingWindowRateAverager(RateAverager):
+    '''Calculate bin-to-bin kinetic properties, as ``RateAverager`` does, over a window of
+    iterations which slides forward as the simulation proceeds. The flux matrix and population
+    vector of each iteration in the window are kept, along with sums of them (and of the
+    corresponding rates, and their squares) over the window, so that moving the window only
+    requires adding the iterations entering it and subtracting those leaving it, rather than
+    re-reading and re-binning every iteration in the window.
+
+    The contributions of each iteration depend on the bin mapper, which is identified by
+    ``mapper_hash``; ``save()`` and ``load()`` store and retrieve the window in an HDF5 group
+    (such as that of the WEED or WESS plugins), so that a restarted simulation need not
+    recalculate it.'''
+
+    def __init__(self, bin_mapper, system=None, data_manager=None, work_manager=None, mapper_hash=None):
+        super().__init__(bin_mapper, system, data_manager, work_manager)
+        self.mapper_hash = mapper_hash
+
+        # Mapping of n_iter to (flux matrix, population vector)
+        self.iter_fluxes = {}
+        self._reset_sums()
+
+    def _reset_sums(self):
+        nbins = self.bin_mapper.nbins
+        self.flux_stats = SparseStreamingStats((nbins, nbins))
+        self.rate_stats = SparseStreamingStats((nbins, nbins))
+        self._pop_S1 = np.zeros((nbins,), np.float64)
+        self._pop_S2 = np.zeros((nbins,), np.float64)
+        self._n_removed = 0
+
+    def _add(self, flux_matrix, population_vector, sign=1):
+        rate_matrix, rate_mask = sparse_rate_matrix(flux_matrix, population_vector)
+        if sign > 0:
+            self.flux_stats.update(flux_matrix)
+            self.rate_stats.update(rate_matrix, rate_mask)
+        else:
+            self.flux_stats.remove(flux_matrix)
+            self.rate_stats.remove(rate_matrix, rate_mask)
+        self._pop_S1 += sign * population_vector
+        self._pop_S2 += sign * population_vector * population_vector
+
+    def add_iteration(self, n_iter, flux_matrix, population_vector):
+        '''Add the flux matrix and population vector of iteration ``n_iter`` to the window.'''
+        self.remove_iteration(n_iter)
+        self.iter_fluxes[n_iter] = (flux_matrix, population_vector)
+        self._add(flux_matrix, population_vector)
+
+    def remove_iteration(self, n_iter):
+        '''Remove iteration ``n_iter`` from the window, if present.'''
+        try:
+            flux_matrix, population_vector = self.iter_fluxes.pop(n_iter)
+        except KeyError:
+            return
+        self._add(flux_matrix, population_vector, sign=-1)
+        self._n_removed += 1
+
+    def resum(self):
+        '''Recalculate the sums over the window from the contributions of each iteration,
+        discarding any rounding error accumulated by adding and subtracting iterations.'''
+        self._reset_sums()
+        for flux_matrix, population_vector in self.iter_fluxes.values():
+            self._add(flux_matrix, population_vector)
+
+    def calculate(self, iter_start=None, iter_stop=None, n_blocks=1, queue_size=1):
+        '''Move the window to the iterations in the range [iter_start, iter_stop), and
+        calculate average fluxes, rates and populations over it. Only iterations not already
+        in the window are read; if there are more than one, they are read in n_blocks blocks,
+        with at most queue_size in the work queue at once. The last iteration of the range
+        (which may have been re-run since it was last read) is always read afresh.'''
+
+        iter_start = iter_start or 1
+        iter_stop = iter_stop or self.data_manager.current_iteration
+
+        for n_iter in sorted(self.iter_fluxes):
+            if n_iter < iter_start or n_iter >= iter_stop - 1:
+                self.remove_iteration(n_iter)
+        if self._n_removed > len(self.iter_fluxes):
+            self.resum()
 
-        assert ~np.any(np.isinf(self.stderr_flux))
-        assert ~np.any(np.isinf(self.stderr_rate))
+        missing = [n_iter for n_iter in range(iter_start, iter_stop) if n_iter not in self.iter_fluxes]
+        if n_blocks == 1 or len(missing) < 2:
+            iter_fluxes = process_iter_fluxes(self.bin_mapper, missing)
+        else:
+            block_size = max(1, len(missing) // n_blocks)
+            task_generator = (
+                (process_iter_fluxes, (self.bin_mapper, iter_block), {'iter_data': self.extract_data(iter_block)})
+                for iter_block in (missing[i : i + block_size] for i in range(0, len(missing), block_size))
+            )
+            iter_fluxes = []
+            for future in self.work_manager.submit_as_completed(task_generator, queue_size):
+                iter_fluxes.extend(future.get_result())
+
+        for n_iter, flux_matrix, population_vector in iter_fluxes:
+            self.add_iteration(n_iter, flux_matrix, population_vector)
+
+        n = len(self.iter_fluxes)
+        if n:
+            self.average_populations = self._pop_S1 / n
+            pop_var = np.maximum(self._pop_S2 / n - self.average_populations**2, 0.0)
+            self.stderr_populations = np.sqrt(pop_var) / n
+        else:
+            self.average_populations = np.zeros_like(self._pop_S1)
+            self.stderr_populations = np.zeros_like(self._pop_S1)
+
+        assert ~np.any(np.isinf(self.flux_stats.stderr.data))
+        assert ~np.any(np.isinf(self.rate_stats.stderr.data))
         assert ~np.any(np.isinf(self.stderr_populations))
 
+    def save(self, h5group):
+        '''Store the contributions of the iterations in the window in ``h5group``, replacing
+        any stored previously. Flux matrices are stored in a single set of COO arrays,
+        the entries of the ``i``-th iteration being ``flux_offsets[i]:flux_offsets[i+1]``.
+        Datasets are resized and overwritten in place, so that saving the window after every
+        reweighting does not leave unreclaimed space in the HDF5 file.'''
+
+        nbins = self.bin_mapper.nbins
+        n_iters = np.array(sorted(self.iter_fluxes), dtype=np.int64)
+        flux_matrices = [self.iter_fluxes[n_iter][0].tocoo() for n_iter in n_iters]
+        flux_offsets = np.zeros((len(n_iters) + 1,), dtype=np.int64)
+        np.cumsum([matrix.nnz for matrix in flux_matrices], out=flux_offsets[1:])
+
+        h5group.attrs['mapper_hash'] = self.mapper_hash or ''
+        h5group.attrs['nbins'] = nbins
+        _store_resizable(h5group, 'n_iters', n_iters)
+        _store_resizable(
+            h5group, 'populations', np.array([self.iter_fluxes[n_iter][1] for n_iter in n_iters], np.float64).reshape(-1, nbins)
+        )
+        _store_resizable(h5group, 'flux_offsets', flux_offsets)
+        _store_resizable(h5group, 'flux_rows', np.concatenate([matrix.row for matrix in flux_matrices] + [[]]).astype(np.int64))
+        _store_resizable(h5group, 'flux_cols', np.concatenate([matrix.col for matrix in flux_matrices] + [[]]).astype(np.int64))
+        _store_resizable(h5group, 'flux_data', np.concatenate([matrix.data for matrix in flux_matrices] + [[]]).astype(np.float64))
+
+    @classmethod
+    def load(cls, h5group, bin_mapper, mapper_hash, system=None, data_manager=None, work_manager=None):
+        '''Return an averager with the window stored in ``h5group`` by ``save()``, if any,
+        and if it was calculated with the same bin mapper (identified by ``mapper_hash``).
+        Otherwise, the window of the returned averager is empty.'''
+
+        averager = cls(bin_mapper, system, data_manager, work_manager, mapper_hash=mapper_hash)
+        if (
+            h5group is None
+            or mapper_hash is None
+            or tostr(h5group.attrs.get('mapper_hash')) != mapper_hash
+            or h5group.attrs.get('nbins') != bin_mapper.nbins
+        ):
+            return averager
+
+        nbins = bin_mapper.nbins
+        n_iters = h5group['n_iters'][...]
+        populations = h5group['populations'][...]
+        flux_offsets = h5group['flux_offsets'][...]
+        flux_rows = h5group['flux_rows'][...]
+        flux_cols = h5group['flux_cols'][...]
+        flux_data = h5group['flux_data'][...]
+        for i, n_iter in enumerate(n_iters):
+            lb, ub = flux_offsets[i], flux_offsets[i + 1]
+            flux_matrix = scipy.sparse.csr_matrix((flux_data[lb:ub], (flux_rows[lb:ub], flux_cols[lb:ub])), shape=(nbins, nbins))
+            averager.add_iteration(int(n_iter), flux_matrix, populations[i])
+        return averager
+
 
 if __name__ == '__main__':
     # Tests this file on the west.h5 data in the current (sim root) directory
@@ -1,3 +1,4 @@
+import atexit
 import logging
 import os
 import shutil
@@ -6,6 +7,7 @@ import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import tarfile
 import pickle
@@ -16,6 +18,8 @@ import numpy as np
 import westpa
 from westpa.core.extloader import get_object
 from westpa.core.propagators import WESTPropagator
+from westpa.core.propagators.runner import PersistentRunner
+from westpa.core.restarts import get_restart_storage
 from westpa.core.states import BasisState, InitialState, return_state_type
 from westpa.core.segment import Segment
 from westpa.core.yamlcfg import check_bool
@@ -40,7 +44,21 @@ def pcoord_loader(fieldname, pcoord_return_filename, destobj, single_point):
 
     assert fieldname == 'pcoord'
 
-    pcoord = np.loadtxt(pcoord_return_filename, dtype=system.pcoord_dtype)
+    return_format = detect_return_format(pcoord_return_filename)
+    if return_format == 'text':
+        destobj.pcoord = check_pcoord_shape(np.loadtxt(pcoord_return_filename, dtype=system.pcoord_dtype), single_point)
+    else:
+        # Check the shape against the mapped file before copying (and converting) the data
+        pcoord = check_pcoord_shape(load_return_array(pcoord_return_filename, return_format), single_point)
+        destobj.pcoord = np.array(pcoord, dtype=system.pcoord_dtype)
+
+
+def check_pcoord_shape(pcoord, single_point):
+    """Return the progress coordinate array ``pcoord``, reshaped if it has been flattened, raising
+    ``ValueError`` if it does not have the shape expected for a single point (if ``single_point``
+    is true) or for a segment (otherwise)."""
+
+    system = westpa.rc.get_system_driver()
 
     if single_point:
         expected_shape = (system.pcoord_ndim,)
@@ -56,7 +74,87 @@ def pcoord_loader(fieldname, pcoord_return_filename, destobj, single_point):
                 pcoord.shape, expected_shape
             )
         )
-    destobj.pcoord = pcoord
+    return pcoord
+
+
+# Fixed-size header of the binary return format: magic string, dtype string (as in ``numpy.dtype.str``,
+# NUL-padded), number of dimensions, padding, and up to BINARY_MAX_NDIM dimensions, all little-endian.
+# The array data follows immediately, in C order.
+BINARY_MAGIC = b'\x93WESTBIN'
+BINARY_MAX_NDIM = 5
+BINARY_HEADER_DTYPE = np.dtype(
+    [('magic', 'S8'), ('dtype', 'S8'), ('ndim', '<u4'), ('reserved', '<u4'), ('shape', '<u8', (BINARY_MAX_NDIM,))]
+)
+NPY_MAGIC = b'\x93NUMPY'
+
+# File name suffixes used for return files, by format
+return_format_suffixes = {'text': '', 'npy': '.npy', 'binary': '.wbin'}
+
+
+def detect_return_format(filename):
+    """Return the format (``'npy'``, ``'binary'``, or ``'text'``) of the data returned in ``filename``,
+    from its extension if it has a known one, and otherwise from the first few bytes of the file."""
+
+    for return_format, suffix in return_format_suffixes.items():
+        if suffix and filename.endswith(suffix):
+            return return_format
+
+    with open(filename, 'rb') as f:
+        magic = f.read(len(BINARY_MAGIC))
+    if magic.startswith(NPY_MAGIC):
+        return 'npy'
+    elif magic == BINARY_MAGIC:
+        return 'binary'
+    else:
+        return 'text'
+
+
+def read_binary_header(f):
+    """Read the header of a fixed-header binary file from the open file ``f``, returning the
+    dtype and shape of the data which follows it."""
+
+    header = np.frombuffer(f.read(BINARY_HEADER_DTYPE.itemsize), dtype=BINARY_HEADER_DTYPE, count=1)[0]
+    if header['magic'] != BINARY_MAGIC:
+        raise ValueError('not a binary return file')
+    ndim = int(header['ndim'])
+    if ndim > BINARY_MAX_NDIM:
+        raise ValueError('binary return data has {} dimensions, at most {} are supported'.format(ndim, BINARY_MAX_NDIM))
+    return np.dtype(header['dtype'].decode('ascii')), tuple(int(n) for n in header['shape'][:ndim])
+
+
+def binary_data_writer(filename, data):
+    """Write the array ``data`` to ``filename`` in the fixed-header binary return format."""
+
+    data = np.ascontiguousarray(data)
+    if data.ndim > BINARY_MAX_NDIM:
+        raise ValueError('at most {} dimensions are supported'.format(BINARY_MAX_NDIM))
+    header = np.zeros((), dtype=BINARY_HEADER_DTYPE)
+    header['magic'] = BINARY_MAGIC
+    header['dtype'] = data.dtype.str.encode('ascii')
+    header['ndim'] = data.ndim
+    header['shape'][: data.ndim] = data.shape
+    with open(filename, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(data.tobytes())
+
+
+def load_return_array(filename, return_format=None):
+    """Load the array returned in ``filename`` in the given binary format (``'npy'`` or ``'binary'``;
+    detected if not given), without reading its contents into memory. Text data is read with
+    ``numpy.loadtxt``."""
+
+    return_format = return_format or detect_return_format(filename)
+
+    if return_format == 'npy':
+        return np.load(filename, mmap_mode='r')
+    elif return_format == 'binary':
+        with open(filename, 'rb') as f:
+            dtype, shape = read_binary_header(f)
+        if 0 in shape:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r', offset=BINARY_HEADER_DTYPE.itemsize, shape=shape)
+    else:
+        return np.loadtxt(filename)
 
 
 def aux_data_loader(fieldname, data_filename, segment, single_point):
@@ -74,6 +172,25 @@ def npy_data_loader(fieldname, coord_file, segment, single_point):
         raise ValueError('could not read any data for {}'.format(fieldname))
 
 
+def mmap_data_loader(fieldname, data_file, segment, single_point):
+    """Load data returned in ``.npy`` or fixed-header binary format by memory mapping it. Text is
+    accepted too, but only when the file is not in either binary format."""
+    log.debug('using mmap_data_loader')
+    data = load_return_array(data_file)
+    segment.data[fieldname] = data
+    if data.nbytes == 0:
+        raise ValueError('could not read any data for {}'.format(fieldname))
+
+
+def binary_data_loader(fieldname, data_file, segment, single_point):
+    """Load data returned in the fixed-header binary format (see ``binary_data_writer``)."""
+    log.debug('using binary_data_loader')
+    data = load_return_array(data_file, 'binary')
+    segment.data[fieldname] = data
+    if data.nbytes == 0:
+        raise ValueError('could not read any data for {}'.format(fieldname))
+
+
 def pickle_data_loader(fieldname, coord_file, segment, single_point):
     log.debug('using pickle_data_loader')
     with open(coord_file, 'rb') as fo:
@@ -94,10 +211,27 @@ def trajectory_loader(fieldname, coord_folder, segment, single_point):
         log.warning('could not read any {} data for HDF5 Framework: {}'.format(fieldname, str(e)))
 
 
+def _staging_prefix(state):
+    if isinstance(state, Segment):
+        return '{}_{}_'.format(state.n_iter, state.seg_id)
+    return ''
+
+
 def restart_loader(fieldname, restart_folder, segment, single_point):
     '''Load data from the restart return. The loader will tar all files in ``restart_folder``
     and store it in the per-iteration HDF5 file. ``segment`` is the ``Segment`` object that
-    the data is associated with. ``single_point`` is not used by this loader.'''
+    the data is associated with. ``single_point`` is not used by this loader.
+
+    If restart files are not stored as archives (see ``westpa.core.restarts``), the files are
+    instead linked into the restart store, to be streamed into the per-iteration HDF5 file.'''
+    storage = get_restart_storage()
+    if not storage.archive:
+        try:
+            segment.data['iterh5/restart'] = storage.stage(restart_folder, _staging_prefix(segment))
+        except Exception as e:
+            log.warning('could not read any {} data for HDF5 Framework: {}'.format(fieldname, str(e)))
+        return
+
     try:
         d = BytesIO()
         with tarfile.open(mode='w:gz', fileobj=d) as t:
@@ -112,12 +246,18 @@ def restart_loader(fieldname, restart_folder, segment, single_point):
 
 def restart_writer(path, segment):
     '''Prepare the necessary files from the per-iteration HDF5 file to run ``segment``.'''
+    d = None
     try:
         restart = segment.data.pop('iterh5/restart', None)
         # Making an exception for start states in iteration 1
         if restart is None:
             raise ValueError('restart data is not present')
 
+        if hasattr(restart, 'extract'):
+            # Restart files stored by reference (see westpa.core.restarts)
+            restart.extract(path)
+            return
+
         d = BytesIO(restart[:-1])  # remove tail protection
         with tarfile.open(fileobj=d, mode='r:gz') as t:
             safe_extract(t, path=path)
@@ -134,13 +274,25 @@ def restart_writer(path, segment):
     except Exception as e:
         log.warning('could not write HDF5 Framework restart data for {}: {}'.format(str(segment), str(e)))
     finally:
-        d.close()
+        if d is not None:
+            d.close()
 
 
 def seglog_loader(fieldname, log_file, segment, single_point):
     '''Load data from the log return. The loader will tar all files in ``log_file``
     and store it in the per-iteration HDF5 file. ``segment`` is the ``Segment`` object that
-    the data is associated with. ``single_point`` is not used by this loader.'''
+    the data is associated with. ``single_point`` is not used by this loader.
+
+    As for ``restart_loader()``, the file is instead linked into the restart store if restart files
+    are not stored as archives.'''
+    storage = get_restart_storage()
+    if not storage.archive:
+        try:
+            segment.data['iterh5/log'] = storage.stage(log_file, _staging_prefix(segment))
+        except Exception as e:
+            log.warning('could not read any data for {}: {}'.format(fieldname, str(e)))
+        return
+
     try:
         d = BytesIO()
         with tarfile.open(mode='w:gz', fileobj=d) as t:
@@ -163,6 +315,10 @@ data_loaders = {
     'npy_data_loader': npy_data_loader,
     'pickle_loader': pickle_data_loader,
     'pickle_data_loader': pickle_data_loader,
+    'mmap_loader': mmap_data_loader,
+    'mmap_data_loader': mmap_data_loader,
+    'binary_loader': binary_data_loader,
+    'binary_data_loader': binary_data_loader,
 }
 
 
@@ -248,6 +404,12 @@ class ExecutablePropagator(WESTPropagator):
             self.exe_info[child_type]['stderr'] = child_info.get('stderr', None)
             self.exe_info[child_type]['cwd'] = child_info.get('cwd', None)
 
+            if child_type == 'propagator':
+                # optional persistent runner, replacing one process per segment (see westpa.core.propagators.runner)
+                self.exe_info[child_type]['runner'] = child_info.get('runner', None)
+                self.exe_info[child_type]['runner_entry_point'] = child_info.get('runner_entry_point', None)
+                self.exe_info[child_type]['runner_module_path'] = child_info.get('runner_module_path', None)
+
             if child_type not in ('propagator', 'get_pcoord', 'gen_istate'):
                 self.exe_info[child_type]['enabled'] = child_info.get('enabled', True)
             else:
@@ -259,6 +421,11 @@ class ExecutablePropagator(WESTPropagator):
 
         log.debug('exe_info: {!r}'.format(self.exe_info))
 
+        # Persistent runners are started on first use by get_runner(), one for each thread
+        self.runners = []
+        self._runner_local = threading.local()
+        self._runner_lock = threading.Lock()
+
         # Load configuration items relating to dataset input
         self.data_info['pcoord'] = {'name': 'pcoord', 'loader': pcoord_loader, 'enabled': True, 'filename': None, 'dir': False}
         self.data_info['trajectory'] = {
@@ -291,6 +458,13 @@ class ExecutablePropagator(WESTPropagator):
             else:
                 check_bool(dsinfo.setdefault('enabled', True))
 
+            if dsinfo.get('format', 'text') not in return_format_suffixes:
+                raise ValueError(
+                    'invalid return format {!r} for dataset {!r}; expected one of {}'.format(
+                        dsinfo['format'], dsname, ', '.join(return_format_suffixes)
+                    )
+                )
+
             loader_directive = dsinfo.get('loader', None)
             if callable(loader_directive):
                 loader = loader_directive
@@ -300,7 +474,8 @@ class ExecutablePropagator(WESTPropagator):
                 else:
                     loader = get_object(loader_directive)
             elif dsname not in ['pcoord', 'seglog', 'restart', 'trajectory']:
-                loader = aux_data_loader
+                # Data returned in a binary format cannot be read by np.loadtxt
+                loader = aux_data_loader if dsinfo.get('format', 'text') == 'text' else mmap_data_loader
             else:
                 # YOLO. Or maybe it wasn't specified.
                 loader = loader_directive
@@ -377,6 +552,40 @@ class ExecutablePropagator(WESTPropagator):
         rc = proc.wait()
         return (rc, rusage)
 
+    def get_runner(self):
+        '''Return the persistent runner for propagation in the calling thread, creating it if
+        necessary, or None if propagation is to execute one child process per segment. Each thread
+        (as used by the threads work manager) has a runner of its own, since a runner serves one
+        segment at a time.'''
+
+        runner = getattr(self._runner_local, 'runner', None)
+        if runner is None:
+            child_info = self.exe_info['propagator']
+            if child_info.get('runner'):
+                args = [self.makepath(child_info['runner'])]
+            elif child_info.get('runner_entry_point'):
+                args = [sys.executable, '-m', 'westpa.core.propagators.runner', child_info['runner_entry_point']]
+                if child_info.get('runner_module_path'):
+                    args.append(self.makepath(child_info['runner_module_path']))
+            else:
+                return None
+
+            all_environ = dict(os.environ)
+            all_environ.update(self.addtl_child_environ)
+            runner = PersistentRunner(args, environ=all_environ)
+            with self._runner_lock:
+                self.runners.append(runner)
+            atexit.register(runner.close)
+            self._runner_local.runner = runner
+        return runner
+
+    def close_runners(self):
+        '''Close all persistent runners started by this propagator.'''
+        with self._runner_lock:
+            runners, self.runners = self.runners, []
+        for runner in runners:
+            runner.close()
+
     def exec_child_from_child_info(self, child_info, template_args, environ):
         for key, value in child_info.get('environ', {}).items():
             environ[key] = self.makepath(value)
@@ -561,7 +770,9 @@ class ExecutablePropagator(WESTPropagator):
                 if isdir:
                     rfname = tempfile.mkdtemp()
                 else:
-                    (fd, rfname) = tempfile.mkstemp()
+                    # The suffix lets loaders recognize binary formats (and stops numpy.save() from adding one)
+                    suffix = return_format_suffixes[self.data_info[dataset].get('format', 'text')]
+                    (fd, rfname) = tempfile.mkstemp(suffix=suffix)
                     os.close(fd)
                 return_files[dataset] = rfname
                 del_return_files[dataset] = True
@@ -570,6 +781,32 @@ class ExecutablePropagator(WESTPropagator):
 
         return addtl_env, return_files, del_return_files
 
+    def retrieve_runner_data(self, segment, data, return_files):
+        '''Store data returned in memory by a persistent runner on ``segment``. ``data`` is a
+        ``dict`` mapping dataset names to (nested lists of) values. Datasets returned through files
+        (those in ``return_files``) are skipped; see ``retrieve_dataset_return()``.'''
+
+        for dataset in self.data_info:
+            if dataset in return_files or not self.data_info[dataset].get('enabled', False):
+                continue
+
+            try:
+                if dataset not in data:
+                    raise ValueError('no data returned')
+                if dataset == 'pcoord':
+                    segment.pcoord = check_pcoord_shape(
+                        np.asarray(data[dataset], dtype=westpa.rc.get_system_driver().pcoord_dtype), False
+                    )
+                else:
+                    value = np.asarray(data[dataset])
+                    if value.nbytes == 0:
+                        raise ValueError('could not read any data for {}'.format(dataset))
+                    segment.data[dataset] = value
+            except Exception as e:
+                log.error('could not read {} for segment {} from runner: {!r}'.format(dataset, segment.seg_id, e))
+                segment.status = Segment.SEG_STATUS_FAILED
+                break
+
     def retrieve_dataset_return(self, state, return_files, del_return_files, single_point):
         '''Retrieve returned data from the temporary locations directed by the environment variables.
         ``state`` is a ``Segment``, ``BasisState`` , or ``InitialState``object that the return data is
@@ -684,6 +921,10 @@ class ExecutablePropagator(WESTPropagator):
     def propagate(self, segments):
         child_info = self.exe_info['propagator']
 
+        runner = self.get_runner()
+        if runner is not None:
+            return self.propagate_with_runner(runner, segments)
+
         for segment in segments:
             starttime = time.time()
 
@@ -713,3 +954,65 @@ class ExecutablePropagator(WESTPropagator):
             segment.walltime = time.time() - starttime
             segment.cputime = rusage.ru_utime
         return segments
+
+    def propagate_with_runner(self, runner, segments):
+        '''Propagate segments by sending them, one at a time, to the persistent runner ``runner``.
+        The progress coordinate and auxiliary datasets are returned in the runner's reply; only
+        datasets which are stored as directories or in explicitly named files are returned
+        through ``WEST_*_RETURN`` paths.'''
+
+        child_info = self.exe_info['propagator']
+        file_datasets = [
+            dataset
+            for dataset, info in self.data_info.items()
+            if info.get('dir', False) or info.get('filename') or info.get('loader') is seglog_loader
+        ]
+
+        for segment in segments:
+            starttime = time.time()
+
+            addtl_env, return_files, del_return_files = self.setup_dataset_return(segment, subset_keys=file_datasets)
+
+            template_args, environ = {}, {}
+            self.update_args_env_iter(template_args, environ, segment.n_iter)
+            self.update_args_env_segment(template_args, environ, segment)
+            environ.update(addtl_env)
+            self.prepare_file_system(segment, environ)
+            for key, value in child_info.get('environ', {}).items():
+                environ[key] = self.makepath(value)
+
+            job_environ = self.random_val_env_vars()
+            job_environ.update(environ)
+
+            # As for a child process, output is written to the configured files (seg logs)
+            cwd = self.makepath(child_info['cwd'], template_args) if child_info['cwd'] else environ[self.ENV_CURRENT_SEG_DATA_REF]
+            stdout = os.path.abspath(self.makepath(child_info['stdout'], template_args)) if child_info['stdout'] else None
+            stderr = child_info['stderr']
+            if stderr and stderr != 'stdout':
+                stderr = os.path.abspath(self.makepath(stderr, template_args))
+
+            try:
+                reply = runner.run(job_environ, os.path.abspath(cwd), stdout=stdout, stderr=stderr)
+            except Exception as e:
+                log.error('persistent runner failed for segment {}: {}'.format(segment.seg_id, e))
+                segment.status = Segment.SEG_STATUS_FAILED
+                continue
+
+            if reply.get('status', 0) != 0:
+                log.error('persistent runner returned status {} for segment {}'.format(reply['status'], segment.seg_id))
+                segment.status = Segment.SEG_STATUS_FAILED
+                continue
+            segment.status = Segment.SEG_STATUS_COMPLETE
+
+            self.retrieve_dataset_return(segment, return_files, del_return_files, False)
+            if segment.status == Segment.SEG_STATUS_FAILED:
+                continue
+
+            self.retrieve_runner_data(segment, reply.get('data') or {}, return_files)
+            if segment.status == Segment.SEG_STATUS_FAILED:
+                continue
+
+            # Record timing info
+            segment.walltime = time.time() - starttime
+            segment.cputime = float(reply.get('cputime', 0.0))
+        return segments
@@ -0,0 +1,237 @@
+'''Persistent segment runners for the executable propagator.
+
+Rather than executing a new process for every segment, the executable propagator may
+be configured to start one long-lived runner process per worker and feed it segments
+one at a time. Jobs and replies are exchanged as single lines of JSON on the runner's
+standard input and standard output, respectively::
+
+    {"environ": {"WEST_CURRENT_SEG_ID": "12", ...}, "cwd": "traj_segs/000003/000012", "stdout": "seg_logs/000003-000012.log"}
+    {"status": 0, "cputime": 1.25, "data": {"pcoord": [[0.5], [0.75], ...], "energy": [...]}}
+
+``environ`` holds the environment variables which would have been set for the segment if
+it were run by its own child process (``WEST_CURRENT_SEG_ID``, ``WEST_PARENT_DATA_REF``, and
+so on), and ``cwd`` is the directory in which the segment is to be run. The optional
+``stdout`` and ``stderr`` name files to which output produced while running the segment is
+to be written, as configured for the propagator; ``stderr`` may be ``"stdout"`` to write both
+to the same file. Relative paths are relative to the directory in which the runner was
+started. In the reply, a nonzero ``status`` marks the segment as failed, ``data`` holds the
+progress coordinate and any auxiliary datasets as (nested) lists, and ``cputime`` is optional.
+The runner must not write anything else to standard output; diagnostics go to standard error.
+The runner should exit when its standard input is closed.
+
+Running this module as a script, as in::
+
+    python -m westpa.core.propagators.runner module.function [module_path]
+
+serves jobs by calling ``function(environ)`` from the given module for each segment, with
+``environ`` also applied to ``os.environ``, the working directory set to ``cwd``, and file
+descriptors 1 and 2 redirected to ``stdout`` and ``stderr``. The function returns the ``data``
+dictionary of the reply, and an exception marks the segment as failed.
+'''
+
+import contextlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class PersistentRunner:
+    '''The master side of a persistent runner process. The process is started when the first
+    job is sent, and restarted as necessary if it exits. The runner serves one job at a time;
+    concurrent calls to ``run()`` from several threads are sent one after another.'''
+
+    def __init__(self, args, environ=None, cwd=None):
+        self.args = list(args)
+        self.environ = environ
+        self.cwd = cwd
+        self.proc = None
+        # Held for a whole job, so that replies are read by the thread which sent the job
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        log.debug('starting persistent runner {!r}'.format(self.args))
+        self.proc = subprocess.Popen(
+            self.args,
+            cwd=self.cwd,
+            env=self.environ,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            close_fds=True,
+            universal_newlines=True,
+            bufsize=1,
+        )
+
+    def run(self, environ, cwd, stdout=None, stderr=None):
+        '''Send a job to the runner and return its reply as a dictionary. Output produced while
+        running the job is written to the files ``stdout`` and ``stderr``, if given. Raises
+        ``RuntimeError`` if the runner exits or replies with something other than a JSON object.'''
+
+        job = {'environ': environ, 'cwd': cwd}
+        if stdout:
+            job['stdout'] = stdout
+        if stderr:
+            job['stderr'] = stderr
+
+        with self.lock:
+            return self._exchange(json.dumps(job) + '\n')
+
+    def _exchange(self, line):
+        if not self.running:
+            self.start()
+
+        try:
+            self.proc.stdin.write(line)
+            self.proc.stdin.flush()
+            reply = self.proc.stdout.readline()
+        except OSError:
+            reply = ''
+
+        if not reply:
+            rc = self.proc.wait()
+            self.proc = None
+            raise RuntimeError('persistent runner {!r} exited with code {}'.format(self.args[0], rc))
+
+        try:
+            reply = json.loads(reply)
+        except ValueError:
+            reply = None
+        if not isinstance(reply, dict):
+            self.close()
+            raise RuntimeError('persistent runner {!r} sent a malformed reply'.format(self.args[0]))
+        return reply
+
+    def close(self, timeout=10):
+        '''Ask the runner to exit by closing its standard input, killing it if it does not do so
+        within ``timeout`` seconds.'''
+        if self.proc is None:
+            return
+
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            log.warning('persistent runner {!r} did not exit; killing it'.format(self.args[0]))
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+
+def _jsonify(obj):
+    try:
+        return obj.tolist()
+    except AttributeError:
+        raise TypeError('cannot return object of type {}'.format(type(obj).__name__))
+
+
+@contextlib.contextmanager
+def _redirect_output(stdout=None, stderr=None):
+    '''Redirect file descriptors 1 and 2 (and so the output of child processes, too) to the files
+    ``stdout`` and ``stderr`` while in the context. ``stderr`` may be ``'stdout'``.'''
+
+    targets = []
+    if stdout:
+        targets.append((1, open(stdout, 'wb')))
+    if stderr == 'stdout':
+        if stdout:
+            targets.append((2, targets[0][1]))
+    elif stderr:
+        targets.append((2, open(stderr, 'wb')))
+
+    saved = []
+    try:
+        for fd, f in targets:
+            (sys.stdout if fd == 1 else sys.stderr).flush()
+            saved.append((fd, os.dup(fd)))
+            os.dup2(f.fileno(), fd)
+        yield
+    finally:
+        for fd, saved_fd in reversed(saved):
+            (sys.stdout if fd == 1 else sys.stderr).flush()
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        for _fd, f in targets:
+            f.close()
+
+
+def serve(function, stdin=None, stdout=None):
+    '''Serve jobs from ``stdin`` by calling ``function(environ)``, until ``stdin`` is closed.'''
+
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    base_environ = dict(os.environ)
+    base_cwd = os.getcwd()
+
+    for line in stdin:
+        job = json.loads(line)
+        environ = job.get('environ') or {}
+
+        os.environ.clear()
+        os.environ.update(base_environ)
+        os.environ.update(environ)
+        # Paths in the job are relative to the directory the runner was started in
+        stdout_file, stderr_file = (
+            os.path.join(base_cwd, job[key]) if job.get(key) and job[key] != 'stdout' else job.get(key)
+            for key in ('stdout', 'stderr')
+        )
+        os.chdir(os.path.join(base_cwd, job.get('cwd') or ''))
+
+        start = time.process_time()
+        try:
+            with _redirect_output(stdout_file, stderr_file):
+                try:
+                    data = function(environ)
+                except Exception:
+                    log.exception('segment run failed')
+                    reply = {'status': 1}
+                else:
+                    reply = {'status': 0, 'data': data or {}}
+        except OSError as e:
+            log.error('could not redirect output: {}'.format(e))
+            reply = {'status': 1}
+        reply['cputime'] = time.process_time() - start
+
+        try:
+            stdout.write(json.dumps(reply, default=_jsonify) + '\n')
+        except TypeError as e:
+            log.error('could not send data: {}'.format(e))
+            stdout.write(json.dumps({'status': 1}) + '\n')
+        stdout.flush()
+
+
+def main(argv=None):
+    from westpa.core.extloader import get_object
+
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        sys.stderr.write('usage: python -m westpa.core.propagators.runner module.function [module_path]\n')
+        return 2
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+
+    # Keep the protocol on the original standard output, and send anything the function prints
+    # to standard error instead
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    function = get_object(argv[0], [argv[1]] if len(argv) > 1 else None)
+    serve(function, sys.stdin, protocol_out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
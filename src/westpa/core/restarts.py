@@ -0,0 +1,209 @@
+'''Storage of segment restart files in the per-iteration HDF5 files.
+
+By default (``archive`` mode), the files returned through ``$WEST_RESTART_RETURN`` are
+packed into a gzip-compressed tar archive, which is held in memory and stored as a single
+string in the per-iteration HDF5 file. For large restart files, the storage mode can be set
+in the configuration file::
+
+    west:
+      data:
+        restart_storage:
+          mode: stream
+          codec: blosc:lz4
+          level: 1
+          chunk_size: 4194304
+          link: [reflink, hardlink]
+          store: $WEST_SIM_ROOT/restarts
+
+In ``stream`` mode, each file is copied in chunks of ``chunk_size`` bytes into a chunked
+dataset of its own, compressed with ``codec`` (``none``, or any compression library supported
+by PyTables). In ``link`` mode, files are kept on disk under ``store``, and only their names are
+recorded in the HDF5 file. In both modes, files are placed in ``store`` (and back into segment
+directories) by trying each method in ``link`` in turn, falling back to copying; ``reflink``
+shares data between the files copy-on-write, on filesystems which support it, while a
+``hardlink`` shares the file itself, and so must only be used if the propagator never
+modifies its restart files in place.
+'''
+
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+
+import westpa
+
+log = logging.getLogger(__name__)
+
+# ioctl to clone a file (copy-on-write) on Linux
+FICLONE = 0x40049409
+
+restart_storage_modes = ('archive', 'stream', 'link')
+link_methods = ('reflink', 'hardlink', 'copy')
+
+
+def reflink(src, dst):
+    '''Clone the file ``src`` to ``dst``, sharing its data copy-on-write. Raises ``OSError`` if
+    the filesystem does not support this.'''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+def link_file(src, dst, methods=('reflink',)):
+    '''Place a copy of the file ``src`` at ``dst``, trying each of ``methods`` (``reflink``,
+    ``hardlink``, or ``copy``) in turn, and copying if none of them succeeds. Returns the
+    method used.'''
+
+    for method in methods:
+        try:
+            if method == 'reflink':
+                reflink(src, dst)
+            elif method == 'hardlink':
+                os.link(src, dst)
+            elif method == 'copy':
+                break
+            else:
+                raise ValueError('unknown link method {!r}'.format(method))
+        except OSError as e:
+            log.debug('could not {} {!r} to {!r}: {}'.format(method, src, dst, e))
+        else:
+            return method
+
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def walk_files(path):
+    '''Return the paths of all files under the directory ``path``, relative to it.'''
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+        for filename in filenames:
+            files.append(os.path.relpath(os.path.join(dirpath, filename), path))
+    return sorted(files)
+
+
+class RestartFiles:
+    '''Restart files on disk, as the (relative) paths ``files`` under the directory ``root``.'''
+
+    def __init__(self, root, files, link_methods=('reflink',)):
+        self.root = root
+        self.files = list(files)
+        self.link_methods = tuple(link_methods)
+
+    def __repr__(self):
+        return '<{} {!r}: {:d} files>'.format(self.__class__.__name__, self.root, len(self.files))
+
+    def paths(self):
+        return [os.path.join(self.root, file) for file in self.files]
+
+    def extract(self, path):
+        '''Place the files under the directory ``path``.'''
+        for file in self.files:
+            dst = os.path.join(path, file)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            link_file(os.path.join(self.root, file), dst, self.link_methods)
+
+    def remove(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class StoredRestart:
+    '''Restart files stored as chunked datasets under the node ``where`` of the per-iteration HDF5
+    file ``filename``.'''
+
+    def __init__(self, filename, where):
+        self.filename = filename
+        self.where = where
+
+    def __repr__(self):
+        return '<{} {}:{}>'.format(self.__class__.__name__, self.filename, self.where)
+
+    def extract(self, path):
+        '''Write the files under the directory ``path``, one chunk at a time.'''
+        from westpa.core.h5io import WESTIterationFile
+
+        with WESTIterationFile(self.filename, 'r') as iter_file:
+            iter_file.extract_files(self.where, path)
+
+
+class RestartStorage:
+    '''Options for storing restart files, read from ``west.data.restart_storage``.'''
+
+    default_chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, mode='archive', codec='none', level=None, chunk_size=None, link=('reflink',), store=None):
+        if mode not in restart_storage_modes:
+            raise ValueError('invalid restart storage mode {!r}; expected one of {}'.format(mode, ', '.join(restart_storage_modes)))
+        for method in link:
+            if method not in link_methods:
+                raise ValueError('invalid link method {!r}; expected one of {}'.format(method, ', '.join(link_methods)))
+
+        self.mode = mode
+        self.codec = codec or 'none'
+        self.level = level
+        self.chunk_size = int(chunk_size or self.default_chunk_size)
+        self.link_methods = tuple(link)
+        self.store = store
+
+    @classmethod
+    def from_config(cls, config=None):
+        config = config if config is not None else westpa.rc.config
+        link = config.get(['west', 'data', 'restart_storage', 'link'], ['reflink'])
+        if isinstance(link, str):
+            link = [link]
+        return cls(
+            mode=config.get(['west', 'data', 'restart_storage', 'mode'], 'archive'),
+            codec=config.get(['west', 'data', 'restart_storage', 'codec'], 'none'),
+            level=config.get(['west', 'data', 'restart_storage', 'level'], None),
+            chunk_size=config.get(['west', 'data', 'restart_storage', 'chunk_size'], None),
+            link=link,
+            store=config.get_path(['west', 'data', 'restart_storage', 'store'], '$WEST_SIM_ROOT/restarts'),
+        )
+
+    @property
+    def archive(self):
+        return self.mode == 'archive'
+
+    def filters(self, tables):
+        '''Return the PyTables ``Filters`` for the configured codec.'''
+        if self.codec == 'none':
+            return tables.Filters(complevel=0)
+        return tables.Filters(complevel=5 if self.level is None else self.level, complib=self.codec, shuffle=False)
+
+    def stage(self, path, prefix=''):
+        '''Place the file ``path``, or all files under the directory ``path``, in a new directory
+        under the restart store, returning a ``RestartFiles`` object. Symbolic links are followed,
+        so that the files they point to are linked into the store.'''
+
+        os.makedirs(self.store, exist_ok=True)
+        root = tempfile.mkdtemp(prefix=prefix, dir=self.store)
+
+        try:
+            if os.path.isdir(path):
+                files = walk_files(path)
+                srcs = [os.path.join(path, file) for file in files]
+            else:
+                files = [os.path.basename(path)]
+                srcs = [path]
+
+            for file, src in zip(files, srcs):
+                dst = os.path.join(root, file)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                link_file(os.path.realpath(src), dst, self.link_methods)
+        except Exception:
+            shutil.rmtree(root, ignore_errors=True)
+            raise
+
+        return RestartFiles(root, files, self.link_methods)
+
+
+def get_restart_storage():
+    '''Return the restart storage options from the current configuration.'''
+    return RestartStorage.from_config(westpa.rc.config)
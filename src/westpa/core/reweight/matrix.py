@@ -73,16 +73,12 @@ class FluxMatrix:
             weights = seg_index['weight']
 
             # Get bin and traj. ensemble assignments from the previously-generated assignments file
-            assignment_iiter = h5io.get_iteration_entry(self.assignments_file, n_iter)
-            bin_assignments = np.require(
-                self.assignments_file['assignments'][assignment_iiter + np.s_[:nsegs, :npts]], dtype=index_dtype
-            )
+            bin_assignments = np.require(h5io.get_iter_assignments(self.assignments_file, 'assignments', n_iter), dtype=index_dtype)
 
             mask_unknown = np.zeros_like(bin_assignments, dtype=np.uint16)
 
-            macrostate_iiter = h5io.get_iteration_entry(self.assignments_file, n_iter)
             macrostate_assignments = np.require(
-                self.assignments_file['trajlabels'][macrostate_iiter + np.s_[:nsegs, :npts]], dtype=index_dtype
+                h5io.get_iter_assignments(self.assignments_file, 'trajlabels', n_iter), dtype=index_dtype
             )
 
             # Transform bin_assignments to take macrostate membership into account
@@ -0,0 +1,70 @@
+'''Scheduling of segment propagation: predicting the cost of each segment from the history of its trajectory,
+grouping segments into tasks longest-first, and measuring how evenly the work was spread over workers.'''
+
+import numpy as np
+
+
+def predict_segment_costs(segments, parent_costs=None):
+    '''Return an array of the predicted cost (in seconds) of propagating each of ``segments``, taken to be the
+    cost of propagating its parent. ``parent_costs`` is an array of the cost of each segment of the previous
+    iteration, indexed by seg_id, where zero means the cost is unknown. Segments whose parent's cost is
+    unknown (including those starting from initial states) are predicted to cost the mean of the known
+    costs, or 1 if no costs are known.'''
+
+    parent_ids = np.fromiter((segment.parent_id for segment in segments), dtype=np.int64, count=len(segments))
+    costs = np.zeros(len(segments), dtype=np.float64)
+    if parent_costs is not None and len(parent_costs):
+        parent_costs = np.asarray(parent_costs, dtype=np.float64)
+        has_parent = (parent_ids >= 0) & (parent_ids < len(parent_costs))
+        costs[has_parent] = parent_costs[parent_ids[has_parent]]
+
+    known = costs > 0
+    costs[~known] = costs[known].mean() if known.any() else 1.0
+    return costs
+
+
+def get_parent_costs(seg_index):
+    '''Return the cost of propagating each segment in ``seg_index`` (a segment index table, as stored for
+    each iteration): its wallclock time, or where that was not recorded, its CPU time.'''
+    walltime = np.nan_to_num(np.asarray(seg_index['walltime'], dtype=np.float64))
+    cputime = np.nan_to_num(np.asarray(seg_index['cputime'], dtype=np.float64))
+    return np.where(walltime > 0, walltime, cputime)
+
+
+def cost_ordered_blocks(segments, costs, n_workers, max_block_size, blocks_per_worker=4):
+    '''Group ``segments`` into blocks (lists of segments) to be propagated as one task each, in order of
+    decreasing predicted cost, so that the longest segments are started first and the shortest fill in at
+    the end. Blocks are filled up to about ``1 / (n_workers * blocks_per_worker)`` of the total cost, and
+    at most ``max_block_size`` segments, so that cheap segments are grouped into fewer tasks while leaving
+    enough tasks to spread evenly over the workers. Returns a list of (block, block cost) pairs.'''
+
+    if not len(segments):
+        return []
+
+    costs = np.asarray(costs, dtype=np.float64)
+    order = np.argsort(-costs, kind='stable')
+    target_cost = costs.sum() / (max(1, n_workers) * blocks_per_worker)
+    max_block_size = max(1, max_block_size)
+
+    blocks = []
+    block = []
+    block_cost = 0.0
+    for iseg in order:
+        block.append(segments[iseg])
+        block_cost += costs[iseg]
+        if len(block) >= max_block_size or block_cost >= target_cost:
+            blocks.append((block, block_cost))
+            block = []
+            block_cost = 0.0
+    if block:
+        blocks.append((block, block_cost))
+    return blocks
+
+
+def load_imbalance(busy_time, elapsed, n_workers):
+    '''Return the fraction of the time available to ``n_workers`` workers over ``elapsed`` seconds which was
+    not spent on ``busy_time`` seconds of work (0 for perfectly balanced work, approaching 1 as one worker
+    does everything while the rest are idle), or NaN if this cannot be determined.'''
+    if elapsed <= 0 or busy_time <= 0 or n_workers < 1:
+        return float('nan')
+    return min(1.0, max(0.0, 1.0 - busy_time / (n_workers * elapsed)))
@@ -1,3 +1,4 @@
+import copy
 import logging
 import math
 import operator
@@ -15,6 +16,8 @@ from .data_manager import weight_dtype
 from .segment import Segment
 from .states import InitialState
 from . import extloader
+from . import h5io
+from . import scheduling
 from . import wm_ops
 
 
@@ -37,12 +40,36 @@ class PropagationError(RuntimeError):
 class WESimManager:
     def process_config(self):
         config = self.rc.config
-        for entry, type_ in [('gen_istates', bool), ('block_size', int), ('save_transition_matrices', bool)]:
+        for entry, type_ in [
+            ('gen_istates', bool),
+            ('block_size', int),
+            ('save_transition_matrices', bool),
+            ('transition_matrix_format', str),
+            ('scheduling', str),
+            ('redispatch_stragglers', bool),
+            ('straggler_factor', (int, float)),
+            ('pipeline', bool),
+            ('pipeline_max_displacement', (int, float, list)),
+        ]:
             config.require_type_if_present(['west', 'propagation', entry], type_)
 
         self.do_gen_istates = config.get(['west', 'propagation', 'gen_istates'], False)
         self.propagator_block_size = config.get(['west', 'propagation', 'block_size'], 1)
+        self.propagation_scheduling = config.get(['west', 'propagation', 'scheduling'], 'fifo')
+        if self.propagation_scheduling not in ('fifo', 'cost'):
+            raise ValueError('invalid propagation scheduling {!r}; use \'fifo\' or \'cost\''.format(self.propagation_scheduling))
+        self.redispatch_stragglers = config.get(['west', 'propagation', 'redispatch_stragglers'], False)
+        self.straggler_factor = config.get(['west', 'propagation', 'straggler_factor'], 2.0)
+        self.pipeline = config.get(['west', 'propagation', 'pipeline'], False)
+        self.pipeline_max_displacement = config.get(['west', 'propagation', 'pipeline_max_displacement'], None)
+        if self.pipeline and self.pipeline_max_displacement is None:
+            raise ValueError('pipelined propagation requires west.propagation.pipeline_max_displacement')
         self.save_transition_matrices = config.get(['west', 'propagation', 'save_transition_matrices'], False)
+        self.transition_matrix_format = config.get(['west', 'propagation', 'transition_matrix_format'], 'sparse')
+        if self.transition_matrix_format not in ('sparse', 'dense'):
+            raise ValueError(
+                'invalid transition matrix format {!r}; use \'sparse\' or \'dense\''.format(self.transition_matrix_format)
+            )
         self.max_run_walltime = config.get(['west', 'propagation', 'max_run_wallclock'], default=None)
         self.max_total_iterations = config.get(['west', 'propagation', 'max_total_iterations'], default=None)
 
@@ -74,7 +101,13 @@ class WESimManager:
         # config items
         self.do_gen_istates = False
         self.propagator_block_size = 1
+        self.propagation_scheduling = 'fifo'
+        self.redispatch_stragglers = False
+        self.straggler_factor = 2.0
+        self.pipeline = False
+        self.pipeline_max_displacement = None
         self.save_transition_matrices = False
+        self.transition_matrix_format = 'sparse'
         self.max_run_walltime = None
         self.max_total_iterations = None
         self.process_config()
@@ -98,6 +131,16 @@ class WESimManager:
         # Tracking of binning
         self.bin_mapper_hash = None  # Hash of bin mapper from most recently-run WE, for use by post-WE analysis plugins
 
+        # Fraction of worker time left idle while propagating this iteration's segments
+        self.load_imbalance = None
+
+        # Segments of the next iteration dispatched before this iteration is complete (see pipeline_bins):
+        # all such segments, in order of seg_id; futures propagating those not yet complete, mapped to
+        # their blocks of segments; and those complete, by seg_id
+        self.pipelined_children = []
+        self.pipelined_futures = {}
+        self.pipelined_segments = {}
+
     def register_callback(self, hook, function, priority=0):
         '''Registers a callback to execute during the given ``hook`` into the simulation loop. The optional
         priority is used to order when the function is called relative to other registered callbacks.'''
@@ -452,14 +495,27 @@ class WESimManager:
         # Get basis states used in this iteration
         self.current_iter_bstates = self.data_manager.get_basis_states(self.n_iter)
 
-        # Get the segments for this iteration and separate into complete and incomplete
+        # Get the segments for this iteration and separate into complete and incomplete.
+        # The segments are read in bulk as a columnar table, whose arrays are used below to bin the
+        # initial points; every segment is still needed as a Segment object, to be propagated or
+        # passed to the WE driver, so all are constructed here.
+        segment_table = None
         if self.segments is None:
-            segments = self.segments = {segment.seg_id: segment for segment in self.data_manager.get_segments()}
+            segment_table = self.data_manager.get_segments_columnar()
+            segments = self.segments = dict(zip(segment_table.seg_ids.tolist(), segment_table.segments()))
             log.debug('loaded {:d} segments'.format(len(segments)))
         else:
             segments = self.segments
             log.debug('using {:d} pre-existing segments'.format(len(segments)))
 
+            if self.pipelined_segments:
+                # Segments of this iteration propagated while the last was completing
+                pipelined_segments = list(self.pipelined_segments.values())
+                self.adopt_pipelined_segments(pipelined_segments)
+                segments.update({segment.seg_id: segment for segment in pipelined_segments})
+                self.data_manager.update_segments_async(self.n_iter, pipelined_segments)
+                self.pipelined_segments = {}
+
         completed_segments = self.completed_segments = {}
         incomplete_segments = self.incomplete_segments = {}
         for segment in segments.values():
@@ -485,15 +541,20 @@ class WESimManager:
         log.debug('This iteration uses {:d} initial states'.format(len(self.current_iter_istates)))
 
         # Assign this iteration's segments' initial points to bins and report on bin population
-        initial_pcoords = self.system.new_pcoord_array(len(segments))
         initial_binning = self.system.bin_mapper.construct_bins()
-        for iseg, segment in enumerate(segments.values()):
-            initial_pcoords[iseg] = segment.pcoord[0]
-        initial_assignments = self.system.bin_mapper.assign(initial_pcoords)
+        if segment_table is not None:
+            initial_pcoords = np.require(segment_table.pcoords[:, 0], dtype=self.system.pcoord_dtype, requirements='C')
+            parent_ids = segment_table.parent_ids
+        else:
+            initial_pcoords = self.system.new_pcoord_array(len(segments))
+            for iseg, segment in enumerate(segments.values()):
+                initial_pcoords[iseg] = segment.pcoord[0]
+            parent_ids = [segment.parent_id for segment in segments.values()]
+        initial_assignments = self.assign_initial_points(initial_pcoords, parent_ids)
         for segment, assignment in zip(iter(segments.values()), initial_assignments):
             initial_binning[assignment].add(segment)
         self.report_bin_statistics(initial_binning, [], save_summary=True)
-        del initial_pcoords, initial_binning
+        del initial_pcoords, initial_binning, segment_table
 
         self.rc.pstatus('Waiting for segments to complete...')
 
@@ -501,9 +562,12 @@ class WESimManager:
         if completed_segments:
             self.we_driver.assign(list(completed_segments.values()))
 
-        # load restart data
+        # load restart data, except for segments already being propagated
+        in_flight = {segment.seg_id for block in self.pipelined_futures.values() for segment in block}
         self.data_manager.prepare_segment_restarts(
-            incomplete_segments.values(), self.current_iter_bstates, self.current_iter_istates
+            [segment for segment in incomplete_segments.values() if segment.seg_id not in in_flight],
+            self.current_iter_bstates,
+            self.current_iter_istates,
         )
 
         # Get the basis states and initial states for the next iteration, necessary for doing on-the-fly recycling
@@ -522,6 +586,31 @@ class WESimManager:
         log.debug('dispatching propagator prep_iter to work manager')
         self.work_manager.submit(wm_ops.prep_iter, args=(self.n_iter, segments)).get_result()
 
+    def assign_initial_points(self, initial_pcoords, parent_ids):
+        '''Assign the initial points ``initial_pcoords`` of this iteration's segments (with parents
+        ``parent_ids``) to bins. These are the final points of the previous iteration, or initial states
+        for recycled walkers, which the WE driver has already assigned if it was run in this process
+        with a bin mapper of the same hash; only points missing from its assignment cache are assigned here.'''
+
+        # The mapper may have been changed (even in place) since the WE driver assigned these points,
+        # so the cache is only used if the current mapper hashes the same
+        bin_mapper = self.system.bin_mapper
+        try:
+            mapper_hash = bin_mapper.pickle_and_hash()[1]
+        except (PickleError, AttributeError, TypeError):
+            mapper_hash = None
+        initial_assignments, found = self.we_driver.assignment_cache.lookup(
+            mapper_hash, self.n_iter - 1, np.asarray(parent_ids).tolist()
+        )
+
+        missing = ~found
+        if missing.all():
+            initial_assignments = bin_mapper.assign(initial_pcoords)
+        elif missing.any():
+            initial_assignments[missing] = bin_mapper.assign(np.ascontiguousarray(initial_pcoords[missing]))
+        log.debug('{:d} of {:d} initial points found in the assignment cache'.format(np.count_nonzero(found), len(found)))
+        return initial_assignments
+
     def finalize_iteration(self):
         '''Clean up after an iteration and prepare for the next.'''
         log.debug('finalizing iteration {:d}'.format(self.n_iter))
@@ -575,37 +664,231 @@ class WESimManager:
         self.data_manager.update_initial_states(updated_states, n_iter=self.n_iter + 1)
         return futures
 
+    @property
+    def n_workers(self):
+        '''The number of workers propagating segments, if the work manager reports it, or 1.'''
+        return max(1, getattr(self.work_manager, 'n_workers', 1) or 1)
+
+    def get_propagation_blocks(self, segments):
+        '''Group ``segments`` into blocks to be propagated as one task each. By default, blocks are
+        ``block_size`` segments in the order given. With ``scheduling: cost``, segments are instead ordered
+        longest-first and grouped into blocks sized to the number of workers (with at most ``block_size``
+        segments each), using costs predicted from the propagation time of their parents (see
+        ``westpa.core.scheduling``). Returns a list of (block, predicted cost) pairs, where the predicted
+        cost is None if not known.'''
+
+        if self.propagation_scheduling != 'cost':
+            return [([segment for segment in block if segment], None) for block in grouper(self.propagator_block_size, segments)]
+
+        parent_costs = None
+        if self.n_iter > 1:
+            with self.data_manager.lock:
+                parent_costs = scheduling.get_parent_costs(self.data_manager.get_seg_index(self.n_iter - 1)[...])
+        costs = scheduling.predict_segment_costs(segments, parent_costs)
+        blocks = scheduling.cost_ordered_blocks(segments, costs, self.n_workers, self.propagator_block_size)
+        if parent_costs is None or not (parent_costs > 0).any():
+            # With no history, the predicted costs are all the same, and only good for sizing blocks
+            blocks = [(block, None) for block, _cost in blocks]
+        return blocks
+
+    def submit_propagation(self, segment_block):
+        '''Dispatch propagation of ``segment_block`` to the work manager, returning its future.'''
+        pbstates, pistates = westpa.core.states.pare_basis_initial_states(
+            self.current_iter_bstates, list(self.current_iter_istates.values()), segment_block
+        )
+        return self.work_manager.submit(wm_ops.propagate, args=(pbstates, pistates, segment_block))
+
+    def find_stragglers(self, pending_blocks, block_costs, block_starts, completed_costs, now):
+        '''Return a tuple (stragglers, wait), where ``stragglers`` is the list of indices of pending blocks
+        which have run for longer than ``straggler_factor`` times their expected time, and ``wait`` is the time
+        until the next pending block would become a straggler (or None). Blocks are only considered once
+        workers are left idle, and only if they have been started and their expected time is known (from
+        their predicted cost, or otherwise the median time of blocks already completed).'''
+
+        if len(pending_blocks) >= self.n_workers:
+            return [], None
+
+        median_cost = float(np.median(completed_costs)) if completed_costs else None
+        stragglers = []
+        wait = None
+        for iblock in pending_blocks:
+            expected = block_costs[iblock] or median_cost
+            if not expected or block_starts[iblock] is None:
+                continue
+            remaining = block_starts[iblock] + self.straggler_factor * expected - now
+            if remaining <= 0:
+                stragglers.append(iblock)
+            elif wait is None or remaining < wait:
+                wait = remaining
+        return stragglers, wait
+
+    def adopt_pipelined_segments(self, incoming):
+        '''Give segments of this iteration which were propagated while the last was completing (see
+        ``pipeline_bins``) the weights and weight-transfer parents held here, which may have been changed
+        (for instance, by plugins reweighting walkers) since the segments were dispatched.'''
+        for segment in incoming:
+            local = self.segments[segment.seg_id]
+            segment.weight = local.weight
+            segment.wtg_parent_ids = local.wtg_parent_ids
+
+    def find_finished_bins(self, start_bins):
+        '''Return the indices of the bins whose walkers for the next iteration can be resampled before
+        propagation of this iteration is complete: bins in which walkers have ended, which neither the
+        segments still being propagated (starting in the bins ``start_bins``) can reach, given
+        ``pipeline_max_displacement``, nor recycled walkers can enter, and which are not target states.'''
+
+        we_driver = self.we_driver
+        bin_mapper = we_driver.bin_mapper
+        deferred = bin_mapper.reachable_bins(start_bins, self.pipeline_max_displacement)
+
+        target_bins = list(we_driver.target_states)
+        if target_bins:
+            if deferred[target_bins].any() or any(len(we_driver.final_binning[ibin]) for ibin in target_bins):
+                # Walkers will be recycled into the bins of basis states (or of unused initial states); those
+                # of initial states yet to be generated are unknown
+                if self.do_gen_istates:
+                    return []
+                pcoords = [bstate.pcoord for bstate in self.next_iter_bstates]
+                pcoords += [istate.pcoord for istate in we_driver.avail_initial_states.values()]
+                if any(pcoord is None for pcoord in pcoords):
+                    return []
+                if pcoords:
+                    deferred[bin_mapper.assign(np.array(pcoords, dtype=self.system.pcoord_dtype).reshape(len(pcoords), -1))] = True
+            deferred[target_bins] = True
+        deferred[list(we_driver.resampled_bins)] = True
+
+        occupied = np.fromiter((len(_bin) > 0 for _bin in we_driver.final_binning), dtype=np.bool_, count=bin_mapper.nbins)
+        return np.flatnonzero(occupied & ~deferred).tolist()
+
+    def pipeline_bins(self, outstanding_segments):
+        '''Resample the bins of the next iteration which are finished (see ``find_finished_bins``) while
+        ``outstanding_segments`` are still being propagated, and dispatch propagation of the segments of the
+        next iteration in them. These are given the first seg_ids of the next iteration, and their results
+        are kept until it begins. Returns the number of segments dispatched.'''
+
+        bin_mapper = self.we_driver.bin_mapper
+        start_pcoords = self.system.new_pcoord_array(len(outstanding_segments))
+        for iseg, segment in enumerate(outstanding_segments):
+            start_pcoords[iseg] = segment.pcoord[0]
+        finished_bins = self.find_finished_bins(bin_mapper.assign(start_pcoords) if outstanding_segments else [])
+        if not finished_bins:
+            return 0
+
+        children = self.we_driver.resample_bins(finished_bins)
+        for segment in children:
+            segment.seg_id = len(self.pipelined_children)
+            self.pipelined_children.append(segment)
+        log.debug(
+            'resampled {:d} bins early; dispatching {:d} segments of the next iteration'.format(len(finished_bins), len(children))
+        )
+
+        # Data for the parents must be on disk before restart data for their children can be prepared
+        self.data_manager.flush_writes()
+        self.data_manager.prepare_segment_restarts(children)
+        for segment_block in grouper(self.propagator_block_size, children):
+            segment_block = [segment for segment in segment_block if segment]
+            self.pipelined_futures[self.submit_propagation(segment_block)] = segment_block
+        return len(children)
+
     def propagate(self):
-        segments = list(self.incomplete_segments.values())
-        log.debug('iteration {:d}: propagating {:d} segments'.format(self.n_iter, len(segments)))
+        # Blocks of segments of this iteration already being propagated (see pipeline_bins)
+        carried_blocks = list(self.pipelined_futures.items())
+        self.pipelined_futures = {}
+        self.pipelined_children = []
+        in_flight = {segment.seg_id for _future, block in carried_blocks for segment in block}
+
+        segments = [segment for segment in self.incomplete_segments.values() if segment.seg_id not in in_flight]
+        log.debug('iteration {:d}: propagating {:d} segments'.format(self.n_iter, len(segments) + len(in_flight)))
+
+        # Walkers for the next iteration are only resampled early with a mapper which can tell what bins
+        # segments may reach, and not in the last iteration of the run
+        pipelining = (
+            self.pipeline
+            and callable(getattr(self.we_driver.bin_mapper, 'reachable_bins', None))
+            and (self.max_total_iterations is None or self.n_iter < self.max_total_iterations)
+        )
+        if self.pipeline and not pipelining:
+            log.debug('not pipelining iteration {:d}'.format(self.n_iter))
 
         # all futures dispatched for this iteration
         futures = set()
-        segment_futures = set()
+
+        # futures propagating blocks of segments, mapped to the index of their block; a block
+        # re-dispatched as a straggler has two futures, the first to complete being used
+        segment_futures = {}
 
         # Immediately dispatch any necessary initial state generation
         istate_gen_futures = self.get_istate_futures()
         futures.update(istate_gen_futures)
 
         # Dispatch propagation tasks using work manager
-        for segment_block in grouper(self.propagator_block_size, segments):
-            segment_block = [_f for _f in segment_block if _f]
-            pbstates, pistates = westpa.core.states.pare_basis_initial_states(
-                self.current_iter_bstates, list(self.current_iter_istates.values()), segment_block
-            )
-            future = self.work_manager.submit(wm_ops.propagate, args=(pbstates, pistates, segment_block))
+        propagation_start = time.time()
+        blocks = [(segment_block, None) for _future, segment_block in carried_blocks]
+        for iblock, (future, _segment_block) in enumerate(carried_blocks):
             futures.add(future)
-            segment_futures.add(future)
+            segment_futures[future] = iblock
+        blocks += self.get_propagation_blocks(segments)
+        for iblock in range(len(carried_blocks), len(blocks)):
+            future = self.submit_propagation(blocks[iblock][0])
+            futures.add(future)
+            segment_futures[future] = iblock
+
+        # Blocks are started in the order dispatched, as workers become free; the block dispatched
+        # n_workers after another is taken to start when that one (or any other) completes
+        block_costs = [cost for _block, cost in blocks]
+        block_starts = [propagation_start if iblock < self.n_workers else None for iblock in range(len(blocks))]
+        pending_blocks = set(range(len(blocks)))
+        redispatched_blocks = set()
+        completed_costs = []
+        busy_time = 0.0
+        propagation_end = propagation_start
 
         while futures:
             # TODO: add capacity for timeout or SIGINT here
-            future = self.work_manager.wait_any(futures)
+            wait = None
+            if self.redispatch_stragglers:
+                stragglers, wait = self.find_stragglers(
+                    pending_blocks - redispatched_blocks, block_costs, block_starts, completed_costs, time.time()
+                )
+                for iblock in stragglers:
+                    log.info('re-dispatching straggling block of {:d} segments'.format(len(blocks[iblock][0])))
+                    # the copy is propagated independently of the original, which carries on
+                    future = self.submit_propagation(copy.deepcopy(blocks[iblock][0]))
+                    futures.add(future)
+                    segment_futures[future] = iblock
+                    redispatched_blocks.add(iblock)
+                if stragglers:
+                    continue
+
+            future = self.work_manager.wait_any(futures.union(self.pipelined_futures), timeout=wait)
+            if future is None:
+                continue
+            elif future in self.pipelined_futures:
+                del self.pipelined_futures[future]
+                self.pipelined_segments.update({segment.seg_id: segment for segment in future.get_result()})
+                continue
             futures.remove(future)
 
             if future in segment_futures:
-                segment_futures.remove(future)
+                iblock = segment_futures.pop(future)
                 incoming = future.get_result()
                 self.n_propagated += 1
+                if iblock < len(carried_blocks):
+                    self.adopt_pipelined_segments(incoming)
+
+                # Forget any other copy of this block
+                for other_future in [other for other, jblock in segment_futures.items() if jblock == iblock]:
+                    del segment_futures[other_future]
+                    futures.remove(other_future)
+                pending_blocks.remove(iblock)
+
+                propagation_end = time.time()
+                nstarted = len(blocks) - len(pending_blocks) - 1 + self.n_workers
+                if nstarted < len(blocks):
+                    block_starts[nstarted] = propagation_end
+                block_time = sum(segment.walltime for segment in incoming)
+                completed_costs.append(block_time)
+                busy_time += block_time
 
                 self.segments.update({segment.seg_id: segment for segment in incoming})
                 self.completed_segments.update({segment.seg_id: segment for segment in incoming})
@@ -615,8 +898,11 @@ class WESimManager:
                 istate_gen_futures.update(new_istate_futures)
                 futures.update(new_istate_futures)
 
-                with self.data_manager.expiring_flushing_lock():
-                    self.data_manager.update_segments(self.n_iter, incoming)
+                self.data_manager.update_segments_async(self.n_iter, incoming)
+
+                # Once no more blocks are waiting for a worker, start on the next iteration where possible
+                if pipelining and pending_blocks and len(pending_blocks) <= self.n_workers:
+                    self.pipeline_bins([segment for jblock in pending_blocks for segment in blocks[jblock][0]])
 
             elif future in istate_gen_futures:
                 istate_gen_futures.remove(future)
@@ -630,25 +916,28 @@ class WESimManager:
                 log.error('unknown future {!r} received from work manager'.format(future))
                 raise AssertionError('untracked future {!r}'.format(future))
 
+        self.load_imbalance = scheduling.load_imbalance(
+            busy_time, propagation_end - propagation_start, min(self.n_workers, len(segments))
+        )
+
         log.debug('done with propagation')
+        self.data_manager.flush_writes()
         self.save_bin_data()
         self.data_manager.flush_backing()
 
     def save_bin_data(self):
-        '''Calculate and write flux and transition count matrices to HDF5. Population and rate matrices
+        '''Calculate and write flux and transition count matrices to HDF5, sparsely (see
+        ``h5io.save_sparse_matrix()``) unless the dense format was requested. Population and rate matrices
         are likely useless at the single-tau level and are no longer written.'''
         # save_bin_data(self, populations, n_trans, fluxes, rates, n_iter=None)
 
         if self.save_transition_matrices:
+            dense = self.transition_matrix_format == 'dense'
+            transitions = self.we_driver.transitions
             with self.data_manager.expiring_flushing_lock():
                 iter_group = self.data_manager.get_iter_group(self.n_iter)
-                for key in ['bin_ntrans', 'bin_fluxes']:
-                    try:
-                        del iter_group[key]
-                    except KeyError:
-                        pass
-                iter_group['bin_ntrans'] = self.we_driver.transition_matrix
-                iter_group['bin_fluxes'] = self.we_driver.flux_matrix
+                h5io.save_sparse_matrix(iter_group, 'bin_ntrans', transitions.transition_matrix, dense=dense)
+                h5io.save_sparse_matrix(iter_group, 'bin_fluxes', transitions.flux_matrix, dense=dense)
 
     def check_propagation(self):
         '''Check for failures in propagation or initial state generation, and raise an exception
@@ -685,6 +974,9 @@ class WESimManager:
         # mapper used for binning this iteration, and update initial states
         # that have been used
 
+        # All segment data from propagation must be on disk before the next iteration is constructed
+        self.data_manager.flush_writes()
+
         try:
             pickled, hashed = self.we_driver.bin_mapper.pickle_and_hash()
         except PickleError:
@@ -721,6 +1013,7 @@ class WESimManager:
 
     def prepare_new_iteration(self):
         '''Commit data for the coming iteration to the HDF5 file.'''
+        self.data_manager.flush_writes()
         self.invoke_callbacks(self.prepare_new_iteration)
 
         if self.rc.debug_mode:
@@ -728,7 +1021,15 @@ class WESimManager:
             for segment in self.we_driver.next_iter_segments:
                 self.rc.pstatus('{!r} pcoord[0]={!r}'.format(segment, segment.pcoord[0]))
 
-        self.data_manager.prepare_iteration(self.n_iter + 1, list(self.we_driver.next_iter_segments))
+        segments = list(self.we_driver.next_iter_segments)
+        if self.pipelined_children:
+            # Segments already dispatched (see pipeline_bins) have the first seg_ids
+            pipelined = set(map(id, self.pipelined_children))
+            others = [segment for segment in segments if id(segment) not in pipelined]
+            if len(others) + len(self.pipelined_children) != len(segments):
+                raise RuntimeError('segments dispatched ahead of iteration {:d} are missing from it'.format(self.n_iter + 1))
+            segments = self.pipelined_children + others
+        self.data_manager.prepare_iteration(self.n_iter + 1, segments)
         self.data_manager.save_new_weight_data(self.n_iter + 1, self.we_driver.new_weights)
 
     def run(self):
@@ -781,7 +1082,11 @@ class WESimManager:
                 iter_summary = self.data_manager.get_iter_summary()
                 iter_summary['walltime'] += iter_elapsed
                 iter_summary['cputime'] = cputime
+                # Files created by earlier versions have no column for this
+                if self.load_imbalance is not None and 'load_imbalance' in iter_summary.dtype.names:
+                    iter_summary['load_imbalance'] = self.load_imbalance
                 self.data_manager.update_iter_summary(iter_summary)
+                writetime = timedelta(seconds=self.data_manager.get_iter_write_time())
 
                 self.n_iter += 1
                 self.data_manager.current_iteration += 1
@@ -797,10 +1102,32 @@ class WESimManager:
                 except ValueError:
                     cputime = 0.0
 
-                self.rc.pstatus('Iteration wallclock: {0!s}, cputime: {1!s}\n'.format(walltime, cputime))
+                if self.load_imbalance is None or math.isnan(self.load_imbalance):
+                    load_imbalance = 'n/a'
+                else:
+                    load_imbalance = '{:.1%}'.format(self.load_imbalance)
+
+                self.rc.pstatus(
+                    'Iteration wallclock: {0!s}, cputime: {1!s}, segment data write time: {2!s}, load imbalance: {3!s}\n'.format(
+                        walltime, cputime, writetime, load_imbalance
+                    )
+                )
                 self.rc.pflush()
-            finally:
-                self.data_manager.flush_backing()
+            except BaseException:
+                # Segment data queued for writing must reach the file even if this iteration failed,
+                # but an error in writing it must not replace the error which ended the iteration
+                try:
+                    self.data_manager.flush_writes()
+                except Exception:
+                    log.exception('error writing segment data after iteration {:d} failed'.format(self.n_iter))
+                finally:
+                    self.data_manager.flush_backing()
+                raise
+            else:
+                try:
+                    self.data_manager.flush_writes()
+                finally:
+                    self.data_manager.flush_backing()
 
         self.rc.pstatus('\n%s' % time.asctime())
         self.rc.pstatus('WEST run complete.')
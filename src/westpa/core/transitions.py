@@ -0,0 +1,152 @@
+'''Sparse accumulation of bin-to-bin fluxes, transition counts and rates. With binning schemes of many bins
+(recursive or adaptive schemes may have tens of thousands), walkers only move between a few of the possible pairs
+of bins in any iteration, so these are stored as ``scipy.sparse`` matrices rather than dense (nbins, nbins)
+arrays.'''
+
+import numpy as np
+import scipy.sparse
+
+weight_dtype = np.float64
+count_dtype = np.uint64
+
+
+def sparse_flux_matrix(nbins, initial_assignments, final_assignments, weights, dtype=weight_dtype):
+    '''Return the (nbins, nbins) CSR matrix whose ``[i, j]`` entry is the sum of ``weights`` of the transitions
+    from bin ``initial_assignments`` to bin ``final_assignments``.'''
+    return scipy.sparse.csr_matrix(
+        (np.asarray(weights, dtype=dtype), (np.asarray(initial_assignments), np.asarray(final_assignments))),
+        shape=(nbins, nbins),
+    )
+
+
+def sparse_rate_matrix(fluxes, populations):
+    '''Return the rate matrix corresponding to the sparse flux matrix ``fluxes`` and the bin ``populations``,
+    and a boolean array which is true for the rows (bins) of zero population, for which rates are undefined
+    (and zero in the returned matrix). This is the sparse analogue of ``calc_rates()``.'''
+    populations = np.asarray(populations, dtype=weight_dtype)
+    row_mask = populations == 0.0
+    inv_populations = np.divide(1.0, populations, out=np.zeros_like(populations), where=~row_mask)
+    rates = scipy.sparse.diags(inv_populations).dot(fluxes).tocsr()
+    rates.eliminate_zeros()
+    return rates, row_mask
+
+
+class SparseTransitionCounter:
+    '''Accumulate the weighted transitions of walkers between bins, as they are assigned, into a sparse flux
+    matrix (the total weight moving from bin ``i`` to bin ``j``) and transition count matrix (the number of
+    walkers doing so), each of shape (nbins, nbins).'''
+
+    def __init__(self, nbins):
+        self.nbins = nbins
+        self._initial_assignments = []
+        self._final_assignments = []
+        self._weights = []
+        self._flux_matrix = None
+        self._transition_matrix = None
+
+    def add(self, initial_assignments, final_assignments, weights):
+        '''Record transitions from bins ``initial_assignments`` to bins ``final_assignments`` carrying
+        ``weights``.'''
+        self._initial_assignments.append(np.asarray(initial_assignments, dtype=np.intp))
+        self._final_assignments.append(np.asarray(final_assignments, dtype=np.intp))
+        self._weights.append(np.asarray(weights, dtype=weight_dtype))
+        self._flux_matrix = self._transition_matrix = None
+
+    def _transitions(self):
+        if not self._weights:
+            return np.empty((0,), np.intp), np.empty((0,), np.intp), np.empty((0,), weight_dtype)
+        return np.concatenate(self._initial_assignments), np.concatenate(self._final_assignments), np.concatenate(self._weights)
+
+    @property
+    def flux_matrix(self):
+        '''The (nbins, nbins) CSR matrix of the total weight moving between each pair of bins.'''
+        if self._flux_matrix is None:
+            initial_assignments, final_assignments, weights = self._transitions()
+            self._flux_matrix = sparse_flux_matrix(self.nbins, initial_assignments, final_assignments, weights)
+        return self._flux_matrix
+
+    @property
+    def transition_matrix(self):
+        '''The (nbins, nbins) CSR matrix of the number of walkers moving between each pair of bins.'''
+        if self._transition_matrix is None:
+            initial_assignments, final_assignments, weights = self._transitions()
+            counts = np.ones(weights.shape, dtype=count_dtype)
+            self._transition_matrix = sparse_flux_matrix(
+                self.nbins, initial_assignments, final_assignments, counts, dtype=count_dtype
+            )
+        return self._transition_matrix
+
+
+class SparseStreamingStats:
+    '''Calculate the mean and variance of each entry of a series of sparse matrices of a given shape. Whole
+    rows of a matrix may be excluded from the statistics (as rates are for bins of zero population), so the
+    number of observations is counted per row. Only sums of the entries and of their squares are kept,
+    which are as sparse as the union of the matrices observed; entries never observed to be nonzero have
+    zero mean and variance.'''
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.S1 = scipy.sparse.csr_matrix(self.shape, dtype=weight_dtype)
+        self.S2 = scipy.sparse.csr_matrix(self.shape, dtype=weight_dtype)
+        self.n = np.zeros((self.shape[0],), dtype=count_dtype)
+
+    def update(self, x, row_mask=None):
+        '''Update the statistics with the sparse matrix ``x``, excluding the rows for which ``row_mask`` (if
+        given) is true. Entries of excluded rows of ``x`` must be zero.'''
+        x = scipy.sparse.csr_matrix(x, dtype=weight_dtype)
+        self.S1 = self.S1 + x
+        self.S2 = self.S2 + x.multiply(x)
+        if row_mask is None:
+            self.n += 1
+        else:
+            self.n[~np.asarray(row_mask, dtype=bool)] += 1
+
+    def remove(self, x, row_mask=None):
+        '''Remove the sparse matrix ``x`` (with the same ``row_mask``) from the statistics, undoing an earlier
+        call to ``update()``.'''
+        x = scipy.sparse.csr_matrix(x, dtype=weight_dtype)
+        self.S1 = self.S1 - x
+        self.S2 = self.S2 - x.multiply(x)
+        if row_mask is None:
+            self.n -= 1
+        else:
+            self.n[~np.asarray(row_mask, dtype=bool)] -= 1
+
+    def __add__(self, other):
+        if self.shape != other.shape:
+            raise ValueError('cannot combine statistics of shapes {} and {}'.format(self.shape, other.shape))
+        combined = SparseStreamingStats(self.shape)
+        combined.S1 = self.S1 + other.S1
+        combined.S2 = self.S2 + other.S2
+        combined.n = self.n + other.n
+        return combined
+
+    def __iadd__(self, other):
+        return self + other
+
+    def _scale_rows(self, matrix, power=1):
+        n = self.n.astype(weight_dtype)
+        scale = np.divide(1.0, n**power, out=np.zeros_like(n), where=n > 0)
+        return scipy.sparse.diags(scale).dot(matrix).tocsr()
+
+    @property
+    def mean(self):
+        '''The mean of each entry, as a CSR matrix.'''
+        return self._scale_rows(self.S1)
+
+    @property
+    def var(self):
+        '''The (population) variance of each entry, as a CSR matrix.'''
+        mean = self.mean
+        var = self._scale_rows(self.S2) - mean.multiply(mean)
+        var.data = np.maximum(var.data, 0.0)
+        var.eliminate_zeros()
+        return var.tocsr()
+
+    @property
+    def stderr(self):
+        '''The standard deviation of each entry divided by the number of observations, as a CSR matrix.'''
+        return self._scale_rows(self.var.sqrt())
+
+    def __repr__(self):
+        return '<{} of shape {}, {:d} nonzero entries>'.format(self.__class__.__name__, self.shape, self.S1.nnz)
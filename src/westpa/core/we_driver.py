@@ -1,11 +1,15 @@
+import heapq
 import logging
 import math
 import operator
 import random
+from pickle import PickleError
 
 import numpy as np
 
 import westpa
+from .binning.assign import index_dtype
+from .transitions import SparseTransitionCounter
 from .segment import Segment
 from .states import InitialState
 
@@ -58,6 +62,364 @@ class NewWeightEntry:
         )
 
 
+class BinResampler:
+    '''Array-backed split/merge engine for the walkers of a single bin.
+
+    Every walker is a row in a set of NumPy arrays (``weights``, ``histories``, ``groups``).
+    ``histories`` indexes a table of histories, which are either one of the incoming
+    segments or the product of a merge; a history determines the parent ID, weight graph
+    parents and initial progress coordinate a walker inherits. Splitting only replicates rows,
+    and merging appends one history and one row, so no ``Segment`` objects are created until
+    ``get_segments()`` is called at the end of resampling.
+
+    Split/merge rules, the weight-proportional selection of merge histories (drawn from the
+    ``random`` module, as in ``WEDriver._merge_walkers()``), and the endpoint type and initial
+    state bookkeeping for parents are the same as those of the segment-based methods of
+    ``WEDriver``.
+    '''
+
+    def __init__(self, we_driver, subgroups):
+        self.we_driver = we_driver
+
+        segments = [segment for subgroup in subgroups for segment in subgroup]
+        n_segs = len(segments)
+        self.segments = segments
+
+        # History table; the first n_segs entries are the incoming segments
+        self.hist_segment = list(range(n_segs))
+        self.hist_parent_id = [segment.parent_id for segment in segments]
+        self.hist_wtg_parent_ids = [None] * n_segs
+
+        # Walker table
+        self.weights = np.fromiter((segment.weight for segment in segments), dtype=np.float64, count=n_segs)
+        self.histories = np.arange(n_segs, dtype=np.intp)
+        self.groups = np.repeat(np.arange(len(subgroups), dtype=np.intp), [len(subgroup) for subgroup in subgroups])
+        self.modified = np.zeros((n_segs,), dtype=np.bool_)
+
+        # Number of walkers in this bin starting from each initial state
+        self.istate_refs = {}
+        self._add_istate_refs(range(n_segs), +1)
+
+    def __len__(self):
+        return len(self.weights)
+
+    @property
+    def ngroups(self):
+        return int(self.groups.max()) + 1 if len(self.groups) else 0
+
+    def _set_walkers(self, weights, histories, groups, modified):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.histories = np.asarray(histories, dtype=np.intp)
+        self.groups = np.asarray(groups, dtype=np.intp)
+        self.modified = np.asarray(modified, dtype=np.bool_)
+
+    def _group_order(self, igroup):
+        '''Indices of the walkers in group ``igroup``, sorted by increasing weight.'''
+        walkers = np.flatnonzero(self.groups == igroup)
+        return walkers[np.argsort(self.weights[walkers], kind='stable')]
+
+    def _add_istate_refs(self, histories, delta):
+        for ihist in histories:
+            parent_id = self.hist_parent_id[ihist]
+            if parent_id < 0:
+                istate_id = -(parent_id + 1)
+                self.istate_refs[istate_id] = self.istate_refs.get(istate_id, 0) + delta
+
+    def _new_merged_history(self, weights, histories):
+        '''Select a history for the merge of the walkers with the given (sorted) ``weights`` and
+        ``histories``, update endpoint types and initial states accordingly, and return the index
+        of the new history and the total weight.'''
+
+        we_driver = self.we_driver
+        histories = list(histories)
+        cumul_weight = np.add.accumulate(weights)
+        weight = cumul_weight[-1]
+
+        # Select the history to continue with a probability proportional to weight
+        iparent = min(np.digitize((random.uniform(0, weight),), cumul_weight)[0], len(histories) - 1)
+        gparent_history = histories[iparent]
+
+        # Weight graph parents are the union of those of all walkers merged
+        wtg_parent_ids = set()
+        for ihist in set(histories):
+            hist_wtg_parent_ids = self.hist_wtg_parent_ids[ihist]
+            if hist_wtg_parent_ids is None:
+                hist_wtg_parent_ids = self.segments[self.hist_segment[ihist]].wtg_parent_ids
+            wtg_parent_ids |= hist_wtg_parent_ids
+
+        self.hist_segment.append(self.hist_segment[gparent_history])
+        self.hist_parent_id.append(self.hist_parent_id[gparent_history])
+        self.hist_wtg_parent_ids.append(wtg_parent_ids)
+        new_history = len(self.hist_segment) - 1
+
+        # The historical parent of the selected history continues; all others are merged. As
+        # in _merge_walkers(), the last walker merged determines the endpoint type of a parent
+        endpoint_types = {}
+        freed_istate_ids = set()
+        for imember, ihist in enumerate(histories):
+            parent_id = self.hist_parent_id[ihist]
+            if parent_id >= 0:
+                if imember == iparent:
+                    endpoint_types[parent_id] = Segment.SEG_ENDPOINT_CONTINUES
+                else:
+                    endpoint_types[parent_id] = Segment.SEG_ENDPOINT_MERGED
+            elif imember != iparent:
+                freed_istate_ids.add(-(parent_id + 1))
+        for parent_id, endpoint_type in endpoint_types.items():
+            we_driver._parent_map[parent_id].endpoint_type = endpoint_type
+
+        # Free initial states no longer used by any walker in this bin
+        self._add_istate_refs(histories, -1)
+        self._add_istate_refs([new_history], +1)
+        for istate_id in sorted(freed_istate_ids):
+            if self.istate_refs.get(istate_id, 0) > 0:
+                log.debug('initial state in use by other walker; not removing')
+                continue
+            initial_state = we_driver.used_initial_states.pop(istate_id, None)
+            if initial_state is not None:
+                log.debug('freeing initial state {!r} for future use (merged)'.format(initial_state))
+                we_driver.avail_initial_states[initial_state.state_id] = initial_state
+                initial_state.iter_used = None
+
+        return new_history, weight
+
+    def split(self, walkers, counts):
+        '''Split each walker in ``walkers`` into the corresponding number of walkers in ``counts``.'''
+        if len(walkers) == 0:
+            return
+
+        repeats = np.ones((len(self),), dtype=np.intp)
+        repeats[walkers] = counts
+        log.debug('splitting {:d} walkers into {:d}'.format(len(walkers), int(repeats[walkers].sum())))
+
+        self._add_istate_refs(np.repeat(self.histories[walkers], repeats[walkers] - 1).tolist(), +1)
+        self._set_walkers(
+            np.repeat(self.weights / repeats, repeats),
+            np.repeat(self.histories, repeats),
+            np.repeat(self.groups, repeats),
+            np.repeat(self.modified | (repeats > 1), repeats),
+        )
+
+    def merge(self, walkers):
+        '''Merge ``walkers`` (sorted by increasing weight) into one walker.'''
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('merging {:d} walkers with weights {!r} into 1'.format(len(walkers), self.weights[walkers]))
+
+        new_history, weight = self._new_merged_history(self.weights[walkers], self.histories[walkers].tolist())
+        igroup = self.groups[walkers[0]]
+
+        keep = np.ones((len(self),), dtype=np.bool_)
+        keep[walkers] = False
+        self._set_walkers(
+            np.append(self.weights[keep], weight),
+            np.append(self.histories[keep], new_history),
+            np.append(self.groups[keep], igroup),
+            np.append(self.modified[keep], True),
+        )
+
+    def merge_groups(self):
+        '''Merge all walkers in each group into one walker.'''
+        for igroup in range(self.ngroups):
+            walkers = self._group_order(igroup)
+            if len(walkers) > 1:
+                self.merge(walkers)
+
+    def split_by_weight(self, ideal_weight):
+        '''Split overweight walkers'''
+        walkers = np.flatnonzero(self.weights > self.we_driver.weight_split_threshold * ideal_weight)
+        self.split(walkers, np.ceil(self.weights[walkers] / ideal_weight).astype(np.intp))
+
+    def merge_by_weight(self, igroup, ideal_weight):
+        '''Merge underweight walkers in group ``igroup``'''
+        cutoff = ideal_weight * self.we_driver.weight_merge_cutoff
+        while True:
+            walkers = self._group_order(igroup)
+            cumul_weight = np.add.accumulate(self.weights[walkers])
+            to_merge = walkers[cumul_weight <= cutoff]
+            if len(to_merge) < 2:
+                return
+            self.merge(to_merge)
+
+    def split_by_threshold(self, igroup):
+        '''Split walkers in group ``igroup`` heavier than the largest allowed weight'''
+        largest_allowed_weight = self.we_driver.largest_allowed_weight
+        walkers = np.flatnonzero((self.groups == igroup) & (self.weights > largest_allowed_weight))
+        self.split(walkers, np.ceil(self.weights[walkers] / largest_allowed_weight).astype(np.intp))
+
+    def merge_by_threshold(self, igroup):
+        '''Merge walkers in group ``igroup`` lighter than the smallest allowed weight'''
+        while True:
+            walkers = self._group_order(igroup)
+            to_merge = walkers[self.weights[walkers] < self.we_driver.smallest_allowed_weight]
+            if len(to_merge) < 2:
+                return
+            self.merge(to_merge)
+
+    def adjust_count(self, target_count, ordered_groups):
+        '''Split the heaviest or merge the two lightest walkers of each group in ``ordered_groups``
+        in turn until there are exactly ``target_count`` walkers. Groups are traversed in the given
+        order when splitting, and alternately in reverse and forward order when merging.'''
+
+        n_walkers = len(self)
+        if n_walkers == target_count:
+            return
+
+        weights = self.weights.tolist()
+        histories = self.histories.tolist()
+        groups = self.groups.tolist()
+        modified = self.modified.tolist()
+        alive = [True] * n_walkers
+
+        present = set(groups)
+        ordered_groups = [igroup for igroup in ordered_groups if igroup in present]
+
+        if n_walkers < target_count:
+            # max-heaps of (weight, walker)
+            heaps = {igroup: [] for igroup in ordered_groups}
+            for iwalker, (weight, igroup) in enumerate(zip(weights, groups)):
+                heaps[igroup].append((-weight, -iwalker))
+            for heap in heaps.values():
+                heapq.heapify(heap)
+
+            while n_walkers < target_count:
+                for igroup in ordered_groups:
+                    log.debug('adjusting counts by splitting')
+                    # always split the highest probability walker into two
+                    _, iwalker = heapq.heappop(heaps[igroup])
+                    iwalker = -iwalker
+                    weights[iwalker] = weights[iwalker] / 2
+                    modified[iwalker] = True
+                    weights.append(weights[iwalker])
+                    histories.append(histories[iwalker])
+                    groups.append(igroup)
+                    modified.append(True)
+                    alive.append(True)
+                    self._add_istate_refs([histories[iwalker]], +1)
+                    heapq.heappush(heaps[igroup], (-weights[iwalker], -iwalker))
+                    heapq.heappush(heaps[igroup], (-weights[iwalker], -(len(weights) - 1)))
+                    n_walkers += 1
+
+                    if n_walkers == target_count:
+                        break
+        else:
+            # min-heaps of (weight, walker)
+            heaps = {igroup: [] for igroup in ordered_groups}
+            for iwalker, (weight, igroup) in enumerate(zip(weights, groups)):
+                heaps[igroup].append((weight, iwalker))
+            for heap in heaps.values():
+                heapq.heapify(heap)
+
+            while n_walkers > target_count:
+                ordered_groups.reverse()
+                for igroup in ordered_groups:
+                    heap = heaps[igroup]
+                    # Ensures that there are least two walkers to merge
+                    if len(heap) > 1:
+                        log.debug('adjusting counts by merging')
+                        # always merge the two lowest-probability walkers
+                        pair = [heapq.heappop(heap), heapq.heappop(heap)]
+                        new_history, weight = self._new_merged_history(
+                            [weight for weight, _ in pair], [histories[iwalker] for _, iwalker in pair]
+                        )
+                        for _, iwalker in pair:
+                            alive[iwalker] = False
+                        weights.append(weight)
+                        histories.append(new_history)
+                        groups.append(igroup)
+                        modified.append(True)
+                        alive.append(True)
+                        heapq.heappush(heap, (weight, len(weights) - 1))
+                        n_walkers -= 1
+
+                        if n_walkers == target_count:
+                            break
+
+        alive = np.array(alive, dtype=np.bool_)
+        self._set_walkers(np.array(weights)[alive], np.array(histories)[alive], np.array(groups)[alive], np.array(modified)[alive])
+
+    def get_segments(self):
+        '''Return a list of segments corresponding to the current set of walkers. Incoming segments
+        which have not been split or merged are returned as-is.'''
+        new_pcoord_array = self.we_driver.system.new_pcoord_array
+        n_segs = len(self.segments)
+        new_segments = []
+        for weight, ihist, modified in zip(self.weights.tolist(), self.histories.tolist(), self.modified.tolist()):
+            segment = self.segments[self.hist_segment[ihist]]
+            if ihist < n_segs:
+                if not modified:
+                    new_segments.append(segment)
+                    continue
+                new_segment = Segment(
+                    n_iter=segment.n_iter,
+                    weight=weight,
+                    parent_id=segment.parent_id,
+                    wtg_parent_ids=set(segment.wtg_parent_ids),
+                    pcoord=segment.pcoord.copy(),
+                    status=Segment.SEG_STATUS_PREPARED,
+                )
+            else:
+                new_segment = Segment(
+                    n_iter=segment.n_iter,
+                    weight=weight,
+                    parent_id=segment.parent_id,
+                    wtg_parent_ids=set(self.hist_wtg_parent_ids[ihist]),
+                    pcoord=new_pcoord_array(),
+                    status=Segment.SEG_STATUS_PREPARED,
+                )
+                new_segment.pcoord[0, :] = segment.pcoord[0, :]
+            new_segments.append(new_segment)
+        return new_segments
+
+
+class AssignmentCache:
+    '''Bin assignments of the final points of the segments of one iteration, keyed by the hash of the
+    mapper (from its ``pickle_and_hash()`` method), the iteration number, and the segment ID. These are
+    the initial points of the next iteration, whose segments are looked up by parent ID; recycled
+    walkers are stored under their (negative) parent ID in the same way. Storing assignments for a
+    different mapper or iteration discards those previously stored.'''
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.mapper_hash = None
+        self.n_iter = None
+        self.assignments = {}
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def store(self, mapper_hash, n_iter, seg_ids, assignments):
+        '''Store the bin ``assignments`` of the final points of the segments ``seg_ids`` of iteration
+        ``n_iter``, as assigned by the mapper with hash ``mapper_hash``. Nothing is stored if
+        ``mapper_hash`` is None (that is, if the mapper cannot be pickled).'''
+        if mapper_hash is None:
+            return
+        if mapper_hash != self.mapper_hash or n_iter != self.n_iter:
+            self.clear()
+            self.mapper_hash = mapper_hash
+            self.n_iter = n_iter
+        self.assignments.update(zip(seg_ids, assignments))
+
+    def lookup(self, mapper_hash, n_iter, seg_ids, dtype=index_dtype):
+        '''Return a tuple ``(assignments, found)`` of arrays giving the assignments of the final points
+        of the segments ``seg_ids`` of iteration ``n_iter`` and a mask of those that were found in the
+        cache; ``assignments`` is zero where ``found`` is false.'''
+        n_segs = len(seg_ids)
+        assignments = np.zeros((n_segs,), dtype=dtype)
+        found = np.zeros((n_segs,), dtype=np.bool_)
+        if mapper_hash is None or mapper_hash != self.mapper_hash or n_iter != self.n_iter:
+            return assignments, found
+
+        get = self.assignments.get
+        for i, seg_id in enumerate(seg_ids):
+            assignment = get(seg_id)
+            if assignment is not None:
+                assignments[i] = assignment
+                found[i] = True
+        return assignments, found
+
+
 class WEDriver:
     '''A class implemented Huber & Kim's weighted ensemble algorithm over Segment objects.
     This class handles all binning, recycling, and preparation of new Segment objects for the
@@ -73,8 +435,13 @@ class WEDriver:
       3) Call `run_we()`, optionally providing a set of initial states that will be used to
          recycle walkers.
 
-    Note the presence of flux_matrix, transition_matrix,
-    current_iter_segments, next_iter_segments, recycling_segments,
+    Bins which no further walkers can enter may be resampled ahead of the others, once all of their
+    walkers have been assigned, by calling `resample_bins()` before `construct_next()`.
+
+    Fluxes and transition counts between bins are accumulated sparsely in ``transitions`` (a
+    ``SparseTransitionCounter``); ``flux_matrix`` and ``transition_matrix`` return them as dense arrays.
+
+    Note the presence of current_iter_segments, next_iter_segments, recycling_segments,
     initial_binning, final_binning, next_iter_binning, and new_weights (to be documented soon).
     '''
 
@@ -90,10 +457,17 @@ class WEDriver:
         # Whether to adjust counts to exactly match target count
         self.do_adjust_counts = True
 
+        # Whether to split/merge with the array-backed BinResampler rather than Segment by Segment
+        self.do_array_resampling = True
+
         # bin mapper and per-bin target counts (see new_iteration for initialization)
         self.bin_mapper = None
+        self.bin_mapper_hash = None
         self.bin_target_counts = None
 
+        # Assignments of the final points of the last iteration assigned, kept across iterations
+        self.assignment_cache = AssignmentCache()
+
         # Mapping of bin index to target state
         self.target_states = None
 
@@ -106,9 +480,11 @@ class WEDriver:
         # binning on initial points for next iteration
         self.next_iter_binning = None
 
-        # Flux and rate matrices for the current iteration
-        self.flux_matrix = None
-        self.transition_matrix = None
+        # indices of bins of the next iteration already resampled by resample_bins()
+        self.resampled_bins = set()
+
+        # Fluxes and transition counts between bins for the current iteration
+        self.transitions = None
 
         # Information on new weights (e.g. from recycling) for the next iteration
         self.new_weights = None
@@ -133,12 +509,17 @@ class WEDriver:
 
         config.require_type_if_present(['west', 'we', 'thresholds'], bool)
 
+        config.require_type_if_present(['west', 'we', 'array_resampling'], bool)
+
         self.do_adjust_counts = config.get(['west', 'we', 'adjust_counts'], True)
         log.info('Adjust counts to exactly match target_counts: {}'.format(self.do_adjust_counts))
 
         self.do_thresholds = config.get(['west', 'we', 'thresholds'], True)
         log.info('Obey abolute weight thresholds: {}'.format(self.do_thresholds))
 
+        self.do_array_resampling = config.get(['west', 'we', 'array_resampling'], True)
+        log.info('Array-backed resampling: {}'.format(self.do_array_resampling))
+
         self.weight_split_threshold = config.get(['west', 'we', 'weight_split_threshold'], self.weight_split_threshold)
         log.info('Split threshold: {}'.format(self.weight_split_threshold))
 
@@ -232,17 +613,17 @@ class WEDriver:
         '''Explicitly delete all Segment-related state.'''
 
         del self.initial_binning, self.final_binning, self.next_iter_binning
-        del self.flux_matrix, self.transition_matrix
+        del self.transitions
         del self.new_weights, self.used_initial_states, self.avail_initial_states
 
         self.initial_binning = None
         self.final_binning = None
         self.next_iter_binning = None
-        self.flux_matrix = None
-        self.transition_matrix = None
+        self.transitions = None
         self.avail_initial_states = None
         self.used_initial_states = None
         self.new_weights = None
+        self.resampled_bins = set()
 
     def new_iteration(self, initial_states=None, target_states=None, new_weights=None, bin_mapper=None, bin_target_counts=None):
         '''Prepare for a new iteration. ``initial_states`` is a sequence of all InitialState objects valid
@@ -270,6 +651,11 @@ class WEDriver:
         else:
             self.bin_mapper = self.system.bin_mapper
 
+        try:
+            self.bin_mapper_hash = self.bin_mapper.pickle_and_hash()[1]
+        except (PickleError, AttributeError, TypeError):
+            self.bin_mapper_hash = None
+
         if bin_target_counts is not None:
             self.bin_target_counts = bin_target_counts
         else:
@@ -281,8 +667,7 @@ class WEDriver:
         self.final_binning = self.bin_mapper.construct_bins()
         self.next_iter_binning = None
 
-        flux_matrix = self.flux_matrix = np.zeros((nbins, nbins), dtype=np.float64)
-        transition_matrix = self.transition_matrix = np.zeros((nbins, nbins), np.uint)
+        self.transitions = SparseTransitionCounter(nbins)
 
         # map target state specifications to bins
         target_states = target_states or []
@@ -305,15 +690,26 @@ class WEDriver:
             init_assignments = self.bin_mapper.assign(init_pcoords)
             prev_init_assignments = self.bin_mapper.assign(prev_init_pcoords)
 
-            for entry, i, j in zip(new_weights, prev_init_assignments, init_assignments):
-                flux_matrix[i, j] += entry.weight
-                transition_matrix[i, j] += 1
+            weights = np.fromiter((entry.weight for entry in new_weights), dtype=np.float64, count=len(new_weights))
+            self.transitions.add(prev_init_assignments, init_assignments, weights)
 
             del init_pcoords, prev_init_pcoords, init_assignments, prev_init_assignments
 
         self.avail_initial_states = {state.state_id: state for state in initial_states}
         self.used_initial_states = {}
 
+    @property
+    def flux_matrix(self):
+        '''The (nbins, nbins) matrix of the weight moving between each pair of bins in this iteration, as a
+        dense array. Use ``transitions.flux_matrix`` for the sparse matrix.'''
+        return self.transitions.flux_matrix.toarray() if self.transitions is not None else None
+
+    @property
+    def transition_matrix(self):
+        '''The (nbins, nbins) matrix of the number of walkers moving between each pair of bins in this
+        iteration, as a dense array. Use ``transitions.transition_matrix`` for the sparse matrix.'''
+        return self.transitions.transition_matrix.toarray() if self.transitions is not None else None
+
     def add_initial_states(self, initial_states):
         '''Add newly-prepared initial states to the pool available for recycling.'''
         for state in initial_states:
@@ -346,16 +742,21 @@ class WEDriver:
             final_assignments = initial_assignments
         else:
             final_assignments = self.bin_mapper.assign(all_pcoords[1, :, :])
+            if segments:
+                self.assignment_cache.store(
+                    self.bin_mapper_hash, segments[0].n_iter, [segment.seg_id for segment in segments], final_assignments
+                )
+
+        if self.resampled_bins and not self.resampled_bins.isdisjoint(np.unique(final_assignments).tolist()):
+            raise ConsistencyError('segments have ended in bins which have already been resampled for the next iteration')
 
         initial_binning = self.initial_binning
         final_binning = self.final_binning
-        flux_matrix = self.flux_matrix
-        transition_matrix = self.transition_matrix
         for segment, iidx, fidx in zip(segments, initial_assignments, final_assignments):
             initial_binning[iidx].add(segment)
             final_binning[fidx].add(segment)
-            flux_matrix[iidx, fidx] += segment.weight
-            transition_matrix[iidx, fidx] += 1
+        weights = np.fromiter((segment.weight for segment in segments), dtype=np.float64, count=len(segments))
+        self.transitions.add(initial_assignments, final_assignments, weights)
 
         n_recycled_total = self.n_recycled_segs
         n_new_states = n_recycled_total - len(self.avail_initial_states)
@@ -389,51 +790,72 @@ class WEDriver:
                 )
             )
 
-        used_istate_ids = set()
+        # Pair recycled walkers with initial states, and assign all of the initial states at once
+        recycled = []
         istateiter = iter(self.avail_initial_states.values())
         for ibin, target_state in self.target_states.items():
+            for segment in set(self.next_iter_binning[ibin]):
+                recycled.append((ibin, target_state, segment, next(istateiter)))
+
+        istate_pcoords = np.empty((len(recycled), self.system.pcoord_ndim), dtype=self.system.pcoord_dtype)
+        for i, (ibin, target_state, segment, initial_state) in enumerate(recycled):
+            istate_pcoords[i] = initial_state.pcoord
+        istate_assignments = self.bin_mapper.assign(istate_pcoords)
+
+        # The initial states are the initial points of the recycled walkers in the next iteration
+        self.assignment_cache.store(
+            self.bin_mapper_hash,
+            recycled[0][2].n_iter - 1,
+            [-(initial_state.state_id + 1) for (ibin, target_state, segment, initial_state) in recycled],
+            istate_assignments,
+        )
+
+        used_istate_ids = set()
+        for (ibin, target_state, segment, initial_state), istate_assignment in zip(recycled, istate_assignments):
             target_bin = self.next_iter_binning[ibin]
-            for segment in set(target_bin):
-                initial_state = next(istateiter)
-                istate_assignment = self.bin_mapper.assign([initial_state.pcoord])[0]
-                parent = self._parent_map[segment.parent_id]
-                parent.endpoint_type = Segment.SEG_ENDPOINT_RECYCLED
-
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug(
-                        'recycling {!r} from target state {!r} to initial state {!r}'.format(segment, target_state, initial_state)
-                    )
-                    log.debug('parent is {!r}'.format(parent))
-
-                segment.parent_id = -(initial_state.state_id + 1)
-                segment.pcoord[0] = initial_state.pcoord
-
-                self.new_weights.append(
-                    NewWeightEntry(
-                        source_type=NewWeightEntry.NW_SOURCE_RECYCLED,
-                        weight=parent.weight,
-                        prev_seg_id=parent.seg_id,
-                        # the .copy() is crucial, otherwise the slice of pcoords will
-                        # keep the parent segments' pcoord data alive unnecessarily long
-                        prev_init_pcoord=parent.pcoord[0].copy(),
-                        prev_final_pcoord=parent.pcoord[-1].copy(),
-                        new_init_pcoord=initial_state.pcoord.copy(),
-                        target_state_id=target_state.state_id,
-                        initial_state_id=initial_state.state_id,
-                    )
+            parent = self._parent_map[segment.parent_id]
+            parent.endpoint_type = Segment.SEG_ENDPOINT_RECYCLED
+
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(
+                    'recycling {!r} from target state {!r} to initial state {!r}'.format(segment, target_state, initial_state)
                 )
+                log.debug('parent is {!r}'.format(parent))
+
+            segment.parent_id = -(initial_state.state_id + 1)
+            segment.pcoord[0] = initial_state.pcoord
+
+            self.new_weights.append(
+                NewWeightEntry(
+                    source_type=NewWeightEntry.NW_SOURCE_RECYCLED,
+                    weight=parent.weight,
+                    prev_seg_id=parent.seg_id,
+                    # the .copy() is crucial, otherwise the slice of pcoords will
+                    # keep the parent segments' pcoord data alive unnecessarily long
+                    prev_init_pcoord=parent.pcoord[0].copy(),
+                    prev_final_pcoord=parent.pcoord[-1].copy(),
+                    new_init_pcoord=initial_state.pcoord.copy(),
+                    target_state_id=target_state.state_id,
+                    initial_state_id=initial_state.state_id,
+                )
+            )
 
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug('new weight entry is {!r}'.format(self.new_weights[-1]))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('new weight entry is {!r}'.format(self.new_weights[-1]))
 
-                self.next_iter_binning[istate_assignment].add(segment)
+            if istate_assignment in self.resampled_bins:
+                raise ConsistencyError(
+                    'cannot recycle {!r} into bin {:d}, which has already been resampled'.format(segment, istate_assignment)
+                )
+            self.next_iter_binning[istate_assignment].add(segment)
 
-                initial_state.iter_used = segment.n_iter
-                log.debug('marking initial state {!r} as used'.format(initial_state))
-                used_istate_ids.add(initial_state.state_id)
-                target_bin.remove(segment)
+            initial_state.iter_used = segment.n_iter
+            log.debug('marking initial state {!r} as used'.format(initial_state))
+            used_istate_ids.add(initial_state.state_id)
+            target_bin.remove(segment)
 
-            assert len(target_bin) == 0
+        for ibin in self.target_states:
+            assert len(self.next_iter_binning[ibin]) == 0
 
         # Transfer newly-assigned states from "available" to "used"
         for state_id in used_istate_ids:
@@ -630,6 +1052,71 @@ class WEDriver:
             bin.update(new_segments_list)
             subgroup.update(new_segments_list)
 
+    def _resample_bin_arrays(self, bin, subgroups, target_count, ideal_weight):
+        '''Split and merge the walkers in ``subgroups`` using a BinResampler, then place the
+        resulting segments in ``bin``.'''
+        resampler = BinResampler(self, subgroups)
+
+        # Determines to see whether we have more sub bins than we have target walkers in a bin (or equal to), and then uses
+        # different logic to deal with those cases.  Should devolve to the Huber/Kim algorithm in the case of few subgroups.
+        if len(subgroups) >= target_count:
+            resampler.merge_groups()
+            if len(subgroups) > target_count:
+                resampler.groups[:] = 0
+                resampler.adjust_count(target_count, [0])
+
+        if len(subgroups) < target_count:
+            resampler.split_by_weight(ideal_weight)
+            for igroup in range(len(subgroups)):
+                resampler.merge_by_weight(igroup, ideal_weight)
+            if self.do_adjust_counts:
+                group_weights = np.bincount(resampler.groups, weights=resampler.weights, minlength=len(subgroups))
+                resampler.adjust_count(target_count, np.argsort(group_weights, kind='stable').tolist())
+
+        if self.do_thresholds:
+            for igroup in range(resampler.ngroups):
+                resampler.split_by_threshold(igroup)
+                resampler.merge_by_threshold(igroup)
+
+        bin.update(resampler.get_segments())
+
+    def _resample_bin_segments(self, bin, subgroups, target_count, ideal_weight):
+        '''Split and merge the walkers in ``subgroups`` one Segment at a time, placing the
+        resulting segments in ``bin``.'''
+        # Determines to see whether we have more sub bins than we have target walkers in a bin (or equal to), and then uses
+        # different logic to deal with those cases.  Should devolve to the Huber/Kim algorithm in the case of few subgroups.
+        if len(subgroups) >= target_count:
+            for i in subgroups:
+                # Merges all members of set i.  Checks to see whether there are any to merge.
+                if len(i) > 1:
+                    # Initial states are only released if no walker outside this subgroup uses them
+                    (segment, parent) = self._merge_walkers(
+                        list(i),
+                        np.add.accumulate(np.array(list(map(operator.attrgetter('weight'), i)))),
+                        bin.union(*(j for j in subgroups if j is not i)),
+                    )
+                    i.clear()
+                    i.add(segment)
+                # Add all members of the set i to the bin.  This keeps the bins in sync for the adjustment step.
+                bin.update(i)
+
+            if len(subgroups) > target_count:
+                self._adjust_count(bin, subgroups, target_count)
+
+        if len(subgroups) < target_count:
+            for i in subgroups:
+                self._split_by_weight(i, target_count, ideal_weight)
+                self._merge_by_weight(i, target_count, ideal_weight)
+                # Same logic here.
+                bin.update(i)
+            if self.do_adjust_counts:
+                # A modified adjustment routine is necessary to ensure we don't unnecessarily destroy trajectory pathways.
+                self._adjust_count(bin, subgroups, target_count)
+        if self.do_thresholds:
+            for i in subgroups:
+                self._split_by_threshold(bin, i)
+                self._merge_by_threshold(bin, i)
+
     def _check_pre(self):
         for ibin, _bin in enumerate(self.next_iter_binning):
             if self.bin_target_counts[ibin] == 0 and len(_bin) > 0:
@@ -644,6 +1131,31 @@ class WEDriver:
         '''Prepare internal state for WE recycle/split/merge.'''
         self._parent_map = {}
         self.next_iter_binning = self.bin_mapper.construct_bins()
+        self.resampled_bins = set()
+
+    def _resample_bin(self, ibin):
+        '''Split and merge the walkers in bin ``ibin`` of the next iteration, returning the number of
+        subgroups the bin was divided into.'''
+        bin = self.next_iter_binning[ibin]
+
+        # Splits the bin into subgroups as defined by the called function
+        target_count = self.bin_target_counts[ibin]
+        subgroups = self.subgroup_function(self, ibin, **self.subgroup_function_kwargs)
+        # Clear the bin
+        weights = np.sort(np.fromiter(map(operator.attrgetter('weight'), bin), dtype=np.float64, count=len(bin)))
+        ideal_weight = weights.sum() / target_count
+        bin.clear()
+        if self.do_array_resampling:
+            self._resample_bin_arrays(bin, subgroups, target_count, ideal_weight)
+        else:
+            self._resample_bin_segments(bin, subgroups, target_count, ideal_weight)
+        if self.do_thresholds:
+            for iseg in bin:
+                if iseg.weight > self.largest_allowed_weight or iseg.weight < self.smallest_allowed_weight:
+                    log.warning(
+                        f'Unable to fulfill threshold conditions for {iseg}. The given threshold range is likely too small.'
+                    )
+        return len(subgroups)
 
     def _run_we(self):
         '''Run recycle/split/merge. Do not call this function directly; instead, use
@@ -656,58 +1168,10 @@ class WEDriver:
         # Regardless of current particle count, always split overweight particles and merge underweight particles
         # Then and only then adjust for correct particle count
         total_number_of_subgroups = 0
-        total_number_of_particles = 0
         for ibin, bin in enumerate(self.next_iter_binning):
-            if len(bin) == 0:
+            if len(bin) == 0 or ibin in self.resampled_bins:
                 continue
-
-            # Splits the bin into subgroups as defined by the called function
-            target_count = self.bin_target_counts[ibin]
-            subgroups = self.subgroup_function(self, ibin, **self.subgroup_function_kwargs)
-            total_number_of_subgroups += len(subgroups)
-            # Clear the bin
-            segments = np.array(sorted(bin, key=operator.attrgetter('weight')), dtype=np.object_)
-            weights = np.array(list(map(operator.attrgetter('weight'), segments)))
-            ideal_weight = weights.sum() / target_count
-            bin.clear()
-            # Determines to see whether we have more sub bins than we have target walkers in a bin (or equal to), and then uses
-            # different logic to deal with those cases.  Should devolve to the Huber/Kim algorithm in the case of few subgroups.
-            if len(subgroups) >= target_count:
-                for i in subgroups:
-                    # Merges all members of set i.  Checks to see whether there are any to merge.
-                    if len(i) > 1:
-                        (segment, parent) = self._merge_walkers(
-                            list(i),
-                            np.add.accumulate(np.array(list(map(operator.attrgetter('weight'), i)))),
-                            i,
-                        )
-                        i.clear()
-                        i.add(segment)
-                    # Add all members of the set i to the bin.  This keeps the bins in sync for the adjustment step.
-                    bin.update(i)
-
-                if len(subgroups) > target_count:
-                    self._adjust_count(bin, subgroups, target_count)
-
-            if len(subgroups) < target_count:
-                for i in subgroups:
-                    self._split_by_weight(i, target_count, ideal_weight)
-                    self._merge_by_weight(i, target_count, ideal_weight)
-                    # Same logic here.
-                    bin.update(i)
-                if self.do_adjust_counts:
-                    # A modified adjustment routine is necessary to ensure we don't unnecessarily destroy trajectory pathways.
-                    self._adjust_count(bin, subgroups, target_count)
-            if self.do_thresholds:
-                for i in subgroups:
-                    self._split_by_threshold(bin, i)
-                    self._merge_by_threshold(bin, i)
-                for iseg in bin:
-                    if iseg.weight > self.largest_allowed_weight or iseg.weight < self.smallest_allowed_weight:
-                        log.warning(
-                            f'Unable to fulfill threshold conditions for {iseg}. The given threshold range is likely too small.'
-                        )
-            total_number_of_particles += len(bin)
+            total_number_of_subgroups += self._resample_bin(ibin)
         log.debug('Total number of subgroups: {!r}'.format(total_number_of_subgroups))
 
         self._check_post()
@@ -835,47 +1299,83 @@ class WEDriver:
         Enough unused initial states must be present in ``self.avail_initial_states`` for every recycled
         walker to be assigned an initial state.
 
-        After this function completes, ``self.flux_matrix`` contains a valid flux matrix for this
+        After this function completes, ``self.transitions`` contains a valid flux matrix for this
         iteration (including any contributions from recycling from the previous iteration), and
         ``self.next_iter_segments`` contains a list of segments ready for the next iteration,
         with appropriate values set for weight, endpoint type, parent walkers, and so on.
         '''
 
-        self._prep_we()
+        if not self.resampled_bins:
+            self._prep_we()
 
         # Create new segments for the next iteration
         # We assume that everything is going to continue without being touched by recycling or WE, and
         # adjust later
+        for ibin in range(len(self.final_binning)):
+            if ibin not in self.resampled_bins:
+                self._continue_walkers(ibin)
+
+        self._run_we()
+
+        log.debug('used initial states: {!r}'.format(self.used_initial_states))
+        log.debug('available initial states: {!r}'.format(self.avail_initial_states))
+
+    def _continue_walkers(self, ibin):
+        '''Create a segment for the next iteration continuing each walker ending in bin ``ibin``, placing
+        it in the same bin of the next iteration.'''
         new_pcoord_array = self.system.new_pcoord_array
         n_iter = None
 
-        for ibin, _bin in enumerate(self.final_binning):
-            for segment in _bin:
-                if n_iter is None:
-                    n_iter = segment.n_iter
-                else:
-                    assert segment.n_iter == n_iter
+        for segment in self.final_binning[ibin]:
+            if n_iter is None:
+                n_iter = segment.n_iter
+            else:
+                assert segment.n_iter == n_iter
 
-                segment.endpoint_type = Segment.SEG_ENDPOINT_CONTINUES
-                new_segment = Segment(
-                    n_iter=segment.n_iter + 1,
-                    parent_id=segment.seg_id,
-                    weight=segment.weight,
-                    wtg_parent_ids=[segment.seg_id],
-                    pcoord=new_pcoord_array(),
-                    status=Segment.SEG_STATUS_PREPARED,
-                )
-                new_segment.pcoord[0] = segment.pcoord[-1]
-                self.next_iter_binning[ibin].add(new_segment)
+            segment.endpoint_type = Segment.SEG_ENDPOINT_CONTINUES
+            new_segment = Segment(
+                n_iter=segment.n_iter + 1,
+                parent_id=segment.seg_id,
+                weight=segment.weight,
+                wtg_parent_ids=[segment.seg_id],
+                pcoord=new_pcoord_array(),
+                status=Segment.SEG_STATUS_PREPARED,
+            )
+            new_segment.pcoord[0] = segment.pcoord[-1]
+            self.next_iter_binning[ibin].add(new_segment)
 
-                # Store a link to the parent segment, so we can update its endpoint status as we need,
-                # based on its ID
-                self._parent_map[segment.seg_id] = segment
+            # Store a link to the parent segment, so we can update its endpoint status as we need,
+            # based on its ID
+            self._parent_map[segment.seg_id] = segment
 
-        self._run_we()
+    def resample_bins(self, bin_indices):
+        '''Construct and split/merge the walkers of the next iteration in the bins ``bin_indices``, ahead
+        of ``construct_next()``, which then leaves these bins alone. This is only valid once every walker
+        of this iteration which ends in these bins has been assigned, and if no walker will be recycled into
+        them; a ConsistencyError is raised if one is. Target state bins cannot be resampled early. Returns
+        a list of the new segments in these bins.'''
 
-        log.debug('used initial states: {!r}'.format(self.used_initial_states))
-        log.debug('available initial states: {!r}'.format(self.avail_initial_states))
+        if self.next_iter_binning is None:
+            self._prep_we()
+
+        new_segments = []
+        for ibin in bin_indices:
+            if ibin in self.resampled_bins:
+                continue
+            elif ibin in self.target_states:
+                raise ValueError('cannot resample target state bin {:d} before recycling'.format(ibin))
+
+            self._continue_walkers(ibin)
+            bin = self.next_iter_binning[ibin]
+            if len(bin):
+                if self.bin_target_counts[ibin] == 0:
+                    raise ConsistencyError('bin {:d} has target count of 0 but contains {:d} walkers'.format(ibin, len(bin)))
+                self._resample_bin(ibin)
+            self.resampled_bins.add(ibin)
+            new_segments.extend(bin)
+
+        self._check_post()
+        return new_segments
 
     def _log_bin_stats(self, bin, heading=None, level=logging.DEBUG):
         if log.isEnabledFor(level):
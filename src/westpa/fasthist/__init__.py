@@ -1,4 +1,4 @@
-from ._fasthist import histnd  # noqa
+from ._fasthist import histnd, minmax  # noqa
 
 import numpy as np
 
@@ -29,12 +29,25 @@ cpdef histnd(values, binbounds, weights=1.0, out=None, binbound_check = True, ig
     the same length as ``values`` (for unequal weights). If ``binbound_check`` is True, then
     the boundaries are checked for strict positive monotonicity; set to False to shave a few
     microseconds if you know your bin boundaries to be monotonically increasing. 
+    
+    ``values`` may also be a 3-D array indexed as [segment][timepoint][dimension], in which
+    case all timepoints are binned at once, and ``weights`` (if a vector) gives the weight of
+    each segment, which is applied to each of its timepoints.
     '''
     
-    if values.ndim != 2:
+    values = numpy.asanyarray(values)
+    if values.ndim == 3:
+        nsegs = values.shape[0]
+        _weights = numpy.require(weights, numpy.float64, 'C')
+        if _weights.ndim == 1:
+            if _weights.shape[0] != nsegs:
+                raise TypeError('weights and values must be equal in length')
+            weights = numpy.repeat(_weights, values.shape[1])
+        values = values.reshape((nsegs * values.shape[1], values.shape[2]))
+    elif values.ndim != 2:
         values = numpy.atleast_2d(values)
         if values.ndim > 2:
-            raise TypeError('values must be 2-D')
+            raise TypeError('values must be 2-D or 3-D')
     
     cdef:
         Py_ssize_t npts = values.shape[0]
@@ -220,3 +233,46 @@ cdef _histnd(real_numeric[:,:] values, object[:] binbounds, numpy.uint32_t* nbou
         PyBuffer_Release(&outputview)
 
 
+
+
+def minmax(values):
+    '''Return the minimum and maximum of ``values`` in each dimension, as a pair of vectors
+    ``(minvals, maxvals)``. The last axis of ``values`` indexes dimension (so that [point][dimension]
+    and [segment][timepoint][dimension] arrays may be given), and the data are scanned once for both
+    the minimum and the maximum.'''
+
+    values = numpy.asanyarray(values)
+    if values.ndim == 1:
+        values = values.reshape((values.shape[0], 1))
+    elif values.ndim > 2:
+        values = values.reshape((-1, values.shape[values.ndim-1]))
+    if values.shape[0] == 0:
+        raise ValueError('cannot find the range of an empty array')
+    if not values.flags.writeable:
+        values = values.copy()
+
+    minvals = numpy.array(values[0])
+    maxvals = numpy.array(values[0])
+    try:
+        _minmax(values, minvals, maxvals)
+    except TypeError:
+        raise TypeError('real floating-point or integer input required')
+    return minvals, maxvals
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _minmax(real_numeric[:,:] values, real_numeric[:] minvals, real_numeric[:] maxvals):
+    cdef:
+        Py_ssize_t npts = values.shape[0], ndim = values.shape[1]
+        Py_ssize_t ipt, idim
+        real_numeric val
+
+    with nogil:
+        for ipt in range(npts):
+            for idim in range(ndim):
+                val = values[ipt,idim]
+                if val < minvals[idim]:
+                    minvals[idim] = val
+                elif val > maxvals[idim]:
+                    maxvals[idim] = val
@@ -1,9 +1,34 @@
 '''A package for performing Monte Carlo bootstrap estimates of
 statistics.'''
 
+import zlib
+
 import numpy as np
 
-from ._mclib import mcbs_correltime, get_bssize, mcbs_ci
+from ._mclib import (  # noqa
+    mcbs_correltime,
+    get_bssize,
+    mcbs_ci,
+    bootstrap_indices,
+    call_estimator,
+    get_seed_sequence,
+    child_seed_sequence,
+    MCBS_CHUNK_SIZE,
+)
+
+
+def batched(estimator):
+    '''Mark ``estimator`` as accepting data sets with a leading replicate axis, so that it may be
+    evaluated on many synthetic data sets at once. A batched estimator is called with each
+    resampled data set of shape (n_replicates, n_samples, ...) and must return an array of
+    n_replicates estimates (reducing over axis 1, not axis 0). Returns ``estimator``.'''
+    estimator.batched = True
+    return estimator
+
+
+@batched
+def _mean_estimator(dataset, stride=None):
+    return np.mean(dataset, axis=1)
 
 
 def mcbs_ci_correl(
@@ -18,6 +43,8 @@ def mcbs_ci_correl(
     do_correl=True,
     mcbs_enable=None,
     estimator_kwargs={},
+    seed=None,
+    executor=None,
 ):
     '''Perform a Monte Carlo bootstrap estimate for the (1-``alpha``) confidence interval
     on the given ``dataset`` with the given ``estimator``.  This routine is appropriate
@@ -37,10 +64,17 @@ def mcbs_ci_correl(
       * np.mean -- calculate the confidence interval on the mean of ``dataset``
       * np.median -- calculate a confidence interval on the median of ``dataset``
       * np.std -- calculate a confidence interval on the standard deviation of ``datset``.
+    Estimators marked with `batched()`_ are evaluated on all synthetic data sets at once; other
+    estimators are evaluated one synthetic data set at a time, in parallel if ``executor`` is given
+    (see `mcbs_ci()`_).
 
     ``n_sets`` is the number of synthetic data sets to generate using the given ``estimator``,
     which will be chosen using `get_bssize()`_ if ``n_sets`` is not given.
 
+    All random numbers are drawn from streams derived from ``seed`` (an integer or
+    ``np.random.SeedSequence``), so that results are reproducible for a given seed. If no seed
+    is given, fresh entropy is used.
+
     ``autocorrel_alpha`` (which defaults to ``alpha``) can be used to adjust the significance
     level of the autocorrelation calculation. Note that too high a significance level (too low an
     alpha) for evaluating the significance of autocorrelation values can result in a failure to
@@ -88,24 +122,21 @@ def mcbs_ci_correl(
         # supporting this functionality here makes writing the code a lot easier, as we can just pass in a flag.
         # Specifically, this is for situations in which error is not desired (that is, only a reasonable mean is desired).
         # It's often useful when doing a quick analysis.
-        estimator_datasets.update(estimator_kwargs)
-        try:
-            estimator_datasets.update({'stride': 1})
-        except Exception:
-            pass
-
-        return_set = estimator(**estimator_datasets)
+        return_set = call_estimator(estimator, estimator_datasets, dict(estimator_kwargs, stride=1))
         # We don't try and pretend we're doing any error analysis.
         return return_set, return_set, return_set, 0, 1
 
+    # Independent streams for the correlation analysis, the subsampling, and the bootstrap itself
+    seedseq = get_seed_sequence(seed)
+    correl_seed, subsample_seed, mcbs_seed = (child_seed_sequence(seedseq, i) for i in range(3))
+
     # We need to pre-generate the data; why not do it here?  We're already set up for it...
     precalc_kwargs = estimator_kwargs.copy()
     precalc_kwargs['stride'] = 1
     pre_calculated = []
     for block in range(1, dlen + 1):
-        for key, dset in estimator_datasets.items():
-            precalc_kwargs[key] = dset[0:block]
-        pre_calculated.append(estimator(**precalc_kwargs))
+        precalc_datasets = {key: dset[0:block] for key, dset in estimator_datasets.items()}
+        pre_calculated.append(call_estimator(estimator, precalc_datasets, precalc_kwargs))
     # We need to get rid of any NaNs.
     pre_calculated = np.asanyarray(pre_calculated)
     pre_calculated = pre_calculated[np.isfinite(pre_calculated)]
@@ -117,18 +148,18 @@ def mcbs_ci_correl(
     # If pre-calculated is not None, we'll use that instead of dataset.
     # We can also assume that it's a 1 dimensional set with nothing needed, so 'key' should work.
     if do_correl is True:
-        correl_len = mcbs_correltime(pre_calculated, autocorrel_alpha, autocorrel_n_sets)
+        correl_len = mcbs_correltime(pre_calculated, autocorrel_alpha, autocorrel_n_sets, seed=correl_seed)
     else:
         correl_len = 0
     if correl_len == len(pre_calculated):
         # too correlated for meaningful calculations
-        estimator_datasets.update(estimator_kwargs)
-        try:
-            estimator_datasets.update({'stride': 1})
-        except Exception:
-            pass
-
-        return estimator(**estimator_datasets), pre_calculated.min(), pre_calculated.max(), (np.std(pre_calculated)), correl_len
+        return (
+            call_estimator(estimator, estimator_datasets, dict(estimator_kwargs, stride=1)),
+            pre_calculated.min(),
+            pre_calculated.max(),
+            np.std(pre_calculated),
+            correl_len,
+        )
 
     # else, do a blocked bootstrap
     stride = correl_len + 1
@@ -145,9 +176,16 @@ def mcbs_ci_correl(
             args=args,
             kwargs=estimator_kwargs,
             sort=np.msort,
+            seed=mcbs_seed,
+            executor=executor,
         ) + (correl_len,)
     else:
-        subsample = subsample or (lambda x: x[np.random.randint(len(x))])
+        if subsample is None:
+            subsample_rng = np.random.default_rng(subsample_seed)
+
+            def subsample(x):
+                return x[subsample_rng.integers(len(x))]
+
         # Let's make sure we decimate every array properly...
         decim_list = {}
         for key, dset in estimator_datasets.items():
@@ -176,9 +214,20 @@ def mcbs_ci_correl(
             args=args,
             kwargs=estimator_kwargs,
             sort=np.msort,
+            seed=mcbs_seed,
+            executor=executor,
         ) + (correl_len,)
 
 
+def block_seed_sequence(seed, name, *keys):
+    '''Return the seed for the bootstrap of the quantity ``name`` identified by ``keys`` (such as
+    the block and state indices), derived from ``seed``, or None if ``seed`` is None. Each
+    quantity thus has its own random stream, whichever worker evaluates it.'''
+    if seed is None:
+        return None
+    return child_seed_sequence(seed, zlib.crc32(name.encode()), *keys)
+
+
 # These are blocks designed to evaluate simple information sets.
 # Whether they should go here or in westtoools is somewhat up for debate.
 # Currently, nothing actually uses them, so there's that.
@@ -197,6 +246,7 @@ def _1D_simple_eval_block(
     do_correl,
     mcbs_enable,
     subsample=np.mean,
+    mcbs_seed=None,
     **extra
 ):
     # This is actually appropriate for anything with a directly measured, 1D dataset, i.e.,
@@ -208,13 +258,14 @@ def _1D_simple_eval_block(
         estimator_datasets = {'dataset': data_input['dataset'][:, istate]}
         ci_res = mcbs_ci_correl(
             estimator_datasets,
-            estimator=(lambda stride, dataset: np.mean(dataset)),
+            estimator=_mean_estimator,
             alpha=mcbs_alpha,
             n_sets=mcbs_nsets,
             autocorrel_alpha=mcbs_acalpha,
             subsample=subsample,
             do_correl=do_correl,
             mcbs_enable=mcbs_enable,
+            seed=block_seed_sequence(mcbs_seed, name, iblock, istate),
         )
 
         results.append((name, iblock, istate, (start, stop) + ci_res))
@@ -235,6 +286,7 @@ def _2D_simple_eval_block(
     do_correl,
     mcbs_enable,
     subsample=np.mean,
+    mcbs_seed=None,
     **extra
 ):
     # This is really just a simple 2D block for less complex datasets, but there it is.
@@ -250,13 +302,14 @@ def _2D_simple_eval_block(
             estimator_datasets = {'dataset': data_input['dataset'][:, istate, jstate]}
             ci_res = mcbs_ci_correl(
                 estimator_datasets,
-                estimator=(lambda stride, dataset: np.mean(dataset)),
+                estimator=_mean_estimator,
                 alpha=mcbs_alpha,
                 n_sets=mcbs_nsets,
                 autocorrel_alpha=mcbs_acalpha,
                 subsample=subsample,
                 do_correl=do_correl,
                 mcbs_enable=mcbs_enable,
+                seed=block_seed_sequence(mcbs_seed, name, iblock, istate, jstate),
             )
 
             results.append((name, iblock, istate, jstate, (start, stop) + ci_res))
@@ -23,6 +23,11 @@ ctypedef fused _fptype:
 # calculation.
 cdef Py_ssize_t CORRELTIME_CROSSOVER = 512*1024*1024
 
+# Number of synthetic data sets generated together from one random stream. Each chunk of synthetic
+# data sets has its own stream, derived from the seed and the index of the chunk, so that the same
+# synthetic data sets are generated however the chunks are divided among workers.
+MCBS_CHUNK_SIZE = 256
+
 
 @cython.cdivision(True)
 @cython.boundscheck(False)
@@ -78,23 +83,99 @@ cpdef Py_ssize_t get_bssize(double alpha) nogil:
         bssize *= 10
     return bssize
 
-cpdef mcbs_ci(dataset, estimator, alpha, dlen, n_sets=None, args=None, kwargs=None, sort=numpy.msort):
+def get_seed_sequence(seed=None):
+    '''Return a ``numpy.random.SeedSequence`` for ``seed``, which may be None (to draw fresh entropy
+    from the operating system), an integer or sequence of integers, or a ``SeedSequence`` (which is
+    returned unchanged).'''
+    if isinstance(seed, numpy.random.SeedSequence):
+        return seed
+    return numpy.random.SeedSequence(seed)
+
+def child_seed_sequence(seed, *keys):
+    '''Return the ``SeedSequence`` identified by ``keys`` (a sequence of non-negative integers) among
+    the children of ``seed``. Unlike ``SeedSequence.spawn()``, this gives the same child for the same
+    keys however many other children are created, and in whichever order.'''
+    seedseq = get_seed_sequence(seed)
+    return numpy.random.SeedSequence(seedseq.entropy, spawn_key=tuple(seedseq.spawn_key) + tuple(keys))
+
+def _chunk_indices(seedseq, Py_ssize_t ichunk, Py_ssize_t dlen):
+    '''Return the (MCBS_CHUNK_SIZE, dlen) matrix of resampling indices for the ``ichunk``-th chunk of
+    synthetic data sets generated from ``seedseq``.'''
+    rng = numpy.random.default_rng(child_seed_sequence(seedseq, ichunk))
+    return rng.integers(dlen, size=(MCBS_CHUNK_SIZE, dlen))
+
+cpdef bootstrap_indices(Py_ssize_t dlen, Py_ssize_t n_sets, seed=None):
+    '''Return an (``n_sets``, ``dlen``) matrix of indices into a data set of length ``dlen``, each
+    row of which selects one synthetic (resampled) data set. Rows are generated in chunks of
+    ``MCBS_CHUNK_SIZE``, each from its own random stream derived from ``seed``, so that a given row
+    is the same however many rows are generated, and whichever process generates it.'''
+    seedseq = get_seed_sequence(seed)
+    indices = numpy.empty((n_sets, dlen), numpy.intp)
+    for lb in range(0, n_sets, MCBS_CHUNK_SIZE):
+        ub = min(n_sets, lb + MCBS_CHUNK_SIZE)
+        indices[lb:ub] = _chunk_indices(seedseq, lb // MCBS_CHUNK_SIZE, dlen)[:ub - lb]
+    return indices
+
+def call_estimator(estimator, dataset, kwargs=None):
+    '''Apply ``estimator`` to the data sets in the dictionary ``dataset``, with the additional keyword
+    arguments ``kwargs``. Batched estimators (see ``batched``) are given the data sets with a leading
+    replicate axis of length one, and the single result is returned.'''
+    d_input = dict(dataset)
+    if getattr(estimator, 'batched', False):
+        for key, dset in dataset.items():
+            d_input[key] = numpy.asanyarray(dset)[numpy.newaxis]
+    if kwargs:
+        d_input.update(kwargs)
+    if getattr(estimator, 'batched', False):
+        return estimator(**d_input)[0]
+    else:
+        return estimator(**d_input)
+
+def _mcbs_eval_chunk(estimator, dataset, kwargs, seedseq, Py_ssize_t ichunk, Py_ssize_t chunk_size, Py_ssize_t dlen):
+    '''Apply ``estimator`` to the ``ichunk``-th chunk of synthetic data sets generated from ``dataset``,
+    of which the first ``chunk_size`` are used, returning a sequence of estimates.'''
+    indices = _chunk_indices(seedseq, ichunk, dlen)[:chunk_size]
+    if getattr(estimator, 'batched', False):
+        d_synth = {key: numpy.take(dset, indices, axis=0) for key, dset in dataset.items()}
+        if kwargs:
+            d_synth.update(kwargs)
+        return estimator(**d_synth)
+
+    f_synth = []
+    for row in indices:
+        d_synth = {key: numpy.take(dset, row, axis=0) for key, dset in dataset.items()}
+        if kwargs:
+            d_synth.update(kwargs)
+        f_synth.append(estimator(**d_synth))
+    return f_synth
+
+cpdef mcbs_ci(dataset, estimator, alpha, dlen, n_sets=None, args=None, kwargs=None, sort=numpy.msort, seed=None,
+              executor=None):
     '''Perform a Monte Carlo bootstrap estimate for the (1-``alpha``) confidence interval
     on the given ``dataset`` with the given ``estimator``.  This routine is not appropriate
     for time-correlated data.
 
-    Returns ``(estimate, ci_lb, ci_ub)`` where ``estimate`` is the application of the
-    given ``estimator`` to the input ``dataset``, and ``ci_lb`` and ``ci_ub`` are the
+    Returns ``(estimate, ci_lb, ci_ub, sterr)`` where ``estimate`` is the application of the
+    given ``estimator`` to the input ``dataset``, ``ci_lb`` and ``ci_ub`` are the
     lower and upper limits, respectively, of the (1-``alpha``) confidence interval on
-    ``estimate``.
+    ``estimate``, and ``sterr`` is the standard deviation of the synthetic estimates.
 
-    ``estimator`` is called as ``estimator(dataset, *args, **kwargs)``. Common estimators include:
+    ``dataset`` is a dictionary of arrays of length ``dlen``, which are resampled together, and
+    ``estimator`` is called as ``estimator(**dataset, **kwargs)``. Common estimators include:
       * numpy.mean -- calculate the confidence interval on the mean of ``dataset``
       * numpy.median -- calculate a confidence interval on the median of ``dataset``
       * numpy.std -- calculate a confidence interval on the standard deviation of ``datset``.
 
+    Estimators marked as batched (see ``batched``) are called once per chunk of synthetic data sets,
+    with each array in ``dataset`` given a leading replicate axis, and must return one estimate per
+    replicate. Other estimators are called once per synthetic data set; if ``executor`` (an object
+    with a ``map()`` method, such as a ``concurrent.futures`` executor) is given, chunks of synthetic
+    data sets are evaluated through it in parallel.
+
     ``n_sets`` is the number of synthetic data sets to generate using the given ``estimator``,
-    which will be chosen using `get_bssize()`_ if ``n_sets`` is not given.
+    which will be chosen using `get_bssize()`_ if ``n_sets`` is not given. Synthetic data sets are
+    drawn from random streams derived from ``seed`` (see `bootstrap_indices()`_), so that results
+    are reproducible for a given seed, whether or not an ``executor`` is used.
 
     ``sort`` can be used
     to override the sorting routine used to calculate the confidence interval, which should
@@ -104,18 +185,10 @@ cpdef mcbs_ci(dataset, estimator, alpha, dlen, n_sets=None, args=None, kwargs=No
     if alpha > 0.5:
         raise ValueError('alpha ({}) > 0.5'.format(alpha))
 
-    args = args or ()
     kwargs = kwargs or {}
+    seedseq = get_seed_sequence(seed)
 
-    # dataset SHOULD be a dictionary.
-    d_input = dataset.copy()
-    # Here, we're dumping in any extra kwarg arguments to pass in to the estimator.
-    try:
-        d_input.update(kwargs)
-    except Exception:
-        pass
-
-    fhat = estimator(**d_input)
+    fhat = call_estimator(estimator, dataset, kwargs)
 
     try:
         estimator_shape = fhat.shape
@@ -131,18 +204,23 @@ cpdef mcbs_ci(dataset, estimator, alpha, dlen, n_sets=None, args=None, kwargs=No
 
     f_synth = numpy.empty((n_sets,) + estimator_shape, dtype=estimator_dtype)
 
-    for i in xrange(n_sets):
-        indices = numpy.random.randint(dlen, size=(dlen,))
-        d_synth = {}
-        for key, dset in dataset.iteritems():
-            d_synth[key] = numpy.take(dset, indices, axis=0)
-        d_input = d_synth.copy()
-        try:
-            d_input.update(kwargs)
-        except Exception:
-            pass
-        f_synth[i] = estimator(**d_input)
-        del indices
+    chunks = [(ichunk, min(MCBS_CHUNK_SIZE, n_sets - lb)) for ichunk, lb in enumerate(range(0, n_sets, MCBS_CHUNK_SIZE))]
+    eval_args = (
+        [estimator] * len(chunks),
+        [dataset] * len(chunks),
+        [kwargs] * len(chunks),
+        [seedseq] * len(chunks),
+        [ichunk for ichunk, chunk_size in chunks],
+        [chunk_size for ichunk, chunk_size in chunks],
+        [dlen] * len(chunks),
+    )
+    if executor is None or getattr(estimator, 'batched', False):
+        chunk_results = map(_mcbs_eval_chunk, *eval_args)
+    else:
+        chunk_results = executor.map(_mcbs_eval_chunk, *eval_args)
+
+    for (ichunk, chunk_size), chunk_result in zip(chunks, chunk_results):
+        f_synth[ichunk * MCBS_CHUNK_SIZE : ichunk * MCBS_CHUNK_SIZE + chunk_size] = chunk_result
 
     f_synth_sorted = sort(f_synth)
     lbi = int(math.floor(n_sets*alpha/2.0))
@@ -154,12 +232,13 @@ cpdef mcbs_ci(dataset, estimator, alpha, dlen, n_sets=None, args=None, kwargs=No
     del f_synth_sorted, f_synth
     return (fhat, lb, ub, sterr)
 
-cpdef mcbs_correltime(dataset, alpha, n_sets = None):
+cpdef mcbs_correltime(dataset, alpha, n_sets = None, seed=None):
     '''Calculate the correlation time of the given ``dataset``, significant to the
     (1-``alpha``) level, using the method described in Huber & Kim, "Weighted-ensemble
     Brownian dynamics simulations for protein association reactions" (1996),
     doi:10.1016/S0006-3495(96)79552-8. An appropriate balance between space and speed
-    is chosen based on the size of the input data.
+    is chosen based on the size of the input data. Synthetic data sets are drawn from
+    random streams derived from ``seed`` (see `bootstrap_indices()`_).
 
     Returns 0 for data statistically uncorrelated with (1-alpha) confidence, otherwise
     the correlation length. (Thus, the appropriate stride for blocking is the
@@ -167,28 +246,31 @@ cpdef mcbs_correltime(dataset, alpha, n_sets = None):
 
     n_sets = n_sets or get_bssize(alpha)
     if dataset.nbytes * n_sets > CORRELTIME_CROSSOVER:
-        return mcbs_correltime_fullauto(dataset, alpha, n_sets)
+        return mcbs_correltime_fullauto(dataset, alpha, n_sets, seed)
     else:
-        return mcbs_correltime_small(dataset, alpha, n_sets)
+        return mcbs_correltime_small(dataset, alpha, n_sets, seed)
 
-cpdef mcbs_correltime_fullauto(dataset, alpha, n_sets):
+cpdef mcbs_correltime_fullauto(dataset, alpha, n_sets, seed=None):
     '''Specialization of `mcbs_correltime`_ for large datasets, where rather than generating
     ``n_sets`` synthetic datasets and then evaluating autocorrelation elements on them, a
     synthetic data set is generated for each autocorrelation element required. This trades time
     for space.'''
 
+    seedseq = get_seed_sequence(seed)
     for k in xrange(1,len(dataset)//2):
-        data_rho, synrho_lb, synrho_ub = mcbs_ci(dataset, autocorrel_elem, alpha, n_sets, args=(k,))
+        data_rho, synrho_lb, synrho_ub, synrho_sterr = mcbs_ci({'xs': dataset}, autocorrel_elem, alpha, len(dataset), n_sets,
+                                                               kwargs={'k': k}, seed=child_seed_sequence(seedseq, k))
         if data_rho > synrho_lb and data_rho < synrho_ub:
             return k-1
     else:
         return len(dataset)
         #raise ValueError('correlation length exceeds half the data set length')
 
-cpdef mcbs_correltime_small(dataset, alpha, n_sets):
+cpdef mcbs_correltime_small(dataset, alpha, n_sets, seed=None):
     '''Specialization of `mcbs_correltime`_ for small-to-mediam datasets, where ``n_sets``
     synthetic datasets are generated and stored, and then autocorrelation elements
-    calculated on them. This implementation trades space for time.'''
+    calculated on them, all synthetic data sets at once. This implementation trades space
+    for time.'''
 
     if alpha > 0.5:
         raise ValueError('alpha ({}) > 0.5'.format(alpha))
@@ -197,24 +279,22 @@ cpdef mcbs_correltime_small(dataset, alpha, n_sets):
     lbi = int(math.floor(n_sets*alpha/2.0))
     ubi = int(math.ceil(n_sets*(1-alpha/2.0)))
 
-    synth_sets = numpy.empty((n_sets,)+dataset.shape, dtype=dataset.dtype)
-    synth_acf_elems = numpy.empty((n_sets,), numpy.float64)
-
-    for i in xrange(n_sets):
-        synth_sets[i] = numpy.take(dataset,numpy.random.randint(dlen,size=(dlen,)))
-
-    for k in xrange(1,dlen//2):
-        data_rho = autocorrel_elem(dataset, k)
-
-        for i in xrange(n_sets):
-            synth_acf_elems[i] = autocorrel_elem(synth_sets[i],k)
+    synth_sets = numpy.take(numpy.asarray(dataset, numpy.float64), bootstrap_indices(dlen, n_sets, seed))
 
-        synth_acf_elems.sort()
+    # Deviations from the mean and their sums of squares, shared by all autocorrelation elements
+    synth_devs = synth_sets - synth_sets.mean(axis=1)[:, numpy.newaxis]
+    synth_norms = (synth_devs * synth_devs).sum(axis=1)
+    del synth_sets
 
-        if data_rho > synth_acf_elems[lbi] and data_rho < synth_acf_elems[ubi]:
-            return k-1
-    else:
-        #raise ValueError('correlation length exceeds half the data set length')
-        return len(dataset)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for k in xrange(1,dlen//2):
+            data_rho = autocorrel_elem(dataset, k)
 
+            synth_acf_elems = (synth_devs[:, :dlen-k] * synth_devs[:, k:]).sum(axis=1) * dlen / ((dlen-k) * synth_norms)
+            synth_acf_elems.sort()
 
+            if data_rho > synth_acf_elems[lbi] and data_rho < synth_acf_elems[ubi]:
+                return k-1
+        else:
+            #raise ValueError('correlation length exceeds half the data set length')
+            return len(dataset)
@@ -43,6 +43,7 @@ class WESTKineticsBase(WESTSubcommand):
         self.mcbs_alpha = None
         self.mcbs_acalpha = None
         self.mcbs_nsets = None
+        self.mcbs_seed = None
 
         # Now we're adding in things that come from the old w_kinetics
         self.do_compression = True
@@ -142,6 +143,13 @@ class AverageCommands(WESTKineticsBase):
                              in a noisy flux signal. (Default: same as ALPHA.)''',
         )
         cgroup.add_argument('--nsets', type=int, help='''Use NSETS samples for bootstrapping (default: chosen based on ALPHA)''')
+        cgroup.add_argument(
+            '--seed',
+            type=int,
+            help='''Seed the random number generators used for bootstrapping with SEED, so that confidence
+                             intervals are reproducible, however many workers are used. (Default: a fresh seed
+                             for each run.)''',
+        )
 
         cogroup = parser.add_argument_group('calculation options')
         cogroup.add_argument(
@@ -182,6 +190,7 @@ class AverageCommands(WESTKineticsBase):
         self.mcbs_alpha = args.alpha
         self.mcbs_acalpha = args.acalpha if args.acalpha else self.mcbs_alpha
         self.mcbs_nsets = args.nsets if args.nsets else mclib.get_bssize(self.mcbs_alpha)
+        self.mcbs_seed = args.seed
 
         self.display_averages = args.display_averages
 
@@ -194,6 +203,8 @@ class AverageCommands(WESTKineticsBase):
         dataset.attrs['mcbs_alpha'] = self.mcbs_alpha
         dataset.attrs['mcbs_acalpha'] = self.mcbs_acalpha
         dataset.attrs['mcbs_nsets'] = self.mcbs_nsets
+        if self.mcbs_seed is not None:
+            dataset.attrs['mcbs_seed'] = self.mcbs_seed
 
     def open_files(self):
         self.output_file = h5io.WESTPAH5File(self.output_filename, 'a', creating_program=True)
@@ -298,6 +309,7 @@ class AverageCommands(WESTKineticsBase):
                     do_correl=self.do_correl,
                     name=name,
                     mcbs_enable=self.mcbs_enable,
+                    mcbs_seed=self.mcbs_seed,
                     data_input={},
                     **extra
                 )
@@ -2,6 +2,7 @@ import numpy as np
 import scipy.sparse as sp
 
 from westpa.tools import Plotter
+from westpa.core import h5io
 
 # A useful dataclass used as a wrapper for w_ipa to facilitate
 # ease-of-use in ipython/jupyter notebooks/sessions.
@@ -393,8 +394,8 @@ class __get_data_for_iteration__:
         current['summary'] = parent.data_reader.data_manager.get_iter_summary(int(value))
         current['seg_id'] = np.array(list(range(0, iter_group['seg_index'].shape[0])))[seg_ids]
         current['walkers'] = current['summary']['n_particles']
-        current['states'] = parent.assign['trajlabels'][value - 1, : current['walkers'], :][seg_ids]
-        current['bins'] = parent.assign['assignments'][value - 1, : current['walkers'], :][seg_ids]
+        current['states'] = h5io.get_iter_assignments(parent.assign, 'trajlabels', value, seg_ids)
+        current['bins'] = h5io.get_iter_assignments(parent.assign, 'assignments', value, seg_ids)
         # Calculates the bin population for this iteration.
         nbins = parent.assign['state_map'].shape[0]
         # We have to take the 'unknown' state into account
@@ -1,11 +1,12 @@
 import logging
 import operator
+from pickle import PickleError
 
 import numpy as np
 
 import westpa
 from westpa.core.yamlcfg import check_bool
-from westpa.core.kinetics import RateAverager
+from westpa.core.kinetics import SlidingWindowRateAverager
 from westpa.westext.weed.ProbAdjustEquil import probAdjustEquil
 from westpa.core._rc import bins_from_yaml_dict
 
@@ -13,6 +14,9 @@ EPS = np.finfo(np.float64).eps
 
 log = logging.getLogger(__name__)
 
+# Subgroup of the global group of the plugin in which the rate averaging window is stored
+rate_window_group_name = 'rate_window'
+
 
 class WEEDDriver:
     def __init__(self, sim_manager, plugin_config):
@@ -53,6 +57,7 @@ class WEEDDriver:
 
         self.rate_calc_queue_size = plugin_config.get('rate_calc_queue_size', 1)
         self.rate_calc_n_blocks = plugin_config.get('rate_calc_n_blocks', 1)
+        self.averager = None
 
         bin_obj = plugin_config.get('bins', None)
         if isinstance(bin_obj, dict):
@@ -74,10 +79,35 @@ class WEEDDriver:
         else:  # self.windowtype == 'fixed':
             eff_windowsize = min(n_iter, self.windowsize or 0)
 
-        averager = RateAverager(mapper, self.system, self.data_manager, self.work_manager)
+        try:
+            mapper_hash = mapper.pickle_and_hash()[1]
+        except (PickleError, AttributeError, TypeError):
+            mapper_hash = None
+
+        # Reuse the fluxes of the iterations still in the window, kept from the last reweighting or,
+        # after a restart, stored in the HDF5 file; these depend on the mapper, so are discarded if
+        # it changes (or cannot be identified).
+        averager = self.averager
+        if averager is None or mapper_hash is None or averager.mapper_hash != mapper_hash:
+            with self.data_manager.lock:
+                weed_global_group = self.data_manager.we_h5file.require_group('weed')
+                averager = SlidingWindowRateAverager.load(
+                    weed_global_group.get(rate_window_group_name),
+                    mapper,
+                    mapper_hash,
+                    self.system,
+                    self.data_manager,
+                    self.work_manager,
+                )
+
         averager.calculate(max(1, n_iter - eff_windowsize), n_iter + 1, self.rate_calc_n_blocks, self.rate_calc_queue_size)
         self.eff_windowsize = eff_windowsize
 
+        if mapper_hash is not None:
+            with self.data_manager.lock:
+                averager.save(self.data_manager.we_h5file.require_group('weed').require_group(rate_window_group_name))
+        self.averager = averager
+
         return averager
 
     def prepare_new_iteration(self):
@@ -138,9 +138,10 @@ class WorkManager:
                 yield future
                 pending.remove(future)
 
-    def wait_any(self, futures):
+    def wait_any(self, futures, timeout=None):
         '''Wait on any of the given ``futures`` and return the first one which has a result available.
-        If more than one result is or becomes available simultaneously, any completed future may be returned.'''
+        If more than one result is or becomes available simultaneously, any completed future may be returned.
+        If ``timeout`` is given and no result becomes available within ``timeout`` seconds, return None.'''
         pending = set(futures)
         with WMFuture.all_acquired(pending):
             completed = {future for future in futures if future.done}
@@ -152,7 +153,11 @@ class WorkManager:
                 # Otherwise, we need to install a watcher
                 watcher = FutureWatcher(futures, threshold=1)
 
-        watcher.wait()
+        if not watcher.wait(timeout):
+            watcher.remove(futures)
+            # A result may have arrived between the timeout and removing the watcher
+            completed = watcher.reset()
+            return completed.pop() if completed else None
         completed = watcher.reset()
         return completed.pop()
 
@@ -194,9 +199,10 @@ class FutureWatcher:
             if len(self.completed) >= self.threshold:
                 self.event.set()
 
-    def wait(self):
-        '''Wait on one or more futures.'''
-        return self.event.wait()
+    def wait(self, timeout=None):
+        '''Wait on one or more futures, for at most ``timeout`` seconds if given. Returns False if the wait
+        timed out.'''
+        return self.event.wait(timeout)
 
     def reset(self):
         '''Reset this watcher's list of completed futures, returning the list of completed futures
@@ -212,6 +218,11 @@ class FutureWatcher:
         for future in futures:
             future._add_watcher(self)
 
+    def remove(self, futures):
+        '''Remove watchers from all futures in the iterable of futures.'''
+        for future in futures:
+            future._remove_watcher(self)
+
 
 class WMFuture:
     '''A "future", representing work which has been dispatched for completion asynchronously.'''
@@ -284,6 +295,11 @@ class WMFuture:
             else:
                 self._watchers.add(watcher)
 
+    def _remove_watcher(self, watcher):
+        '''Remove the given update watcher from the internal list of watchers, if present.'''
+        with self._condition:
+            self._watchers.discard(watcher)
+
     def _add_callback(self, callback):
         '''Add the given update callback to the internal list of callbacks. If a result is available,
         invokes the callback immediately without updating the list of callbacks.'''
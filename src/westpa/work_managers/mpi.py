@@ -3,13 +3,13 @@ A work manager which uses MPI to distribute tasks and collect results.
 """
 
 import sys
-import time
 import traceback
 import logging
 import threading
 from collections import deque
 from mpi4py import MPI
-from westpa.work_managers import WorkManager, WMFuture
+import westpa.work_managers as work_managers
+from westpa.work_managers import WorkManager, WMFuture, serialization
 
 log = logging.getLogger(__name__)
 
@@ -30,19 +30,67 @@ class Task:
         return '<Task {self.task_id}: {self.fn!r}(*{self.args!r}, **{self.kwargs!r})>'.format(self=self)
 
 
+def node_layout(hosts, managerID=0, node_leaders=False):
+    """Given the host name of each rank, return a dict mapping each rank
+    which dispatches tasks to the list of ranks it sends tasks to.  The
+    manager sends tasks to every other rank, unless node_leaders is true, in
+    which case the lowest rank on each host other than the manager's (and
+    with more than one rank) is a leader, to which the manager sends tasks
+    for that host, and which relays them to the other ranks on its host.
+    """
+    ranks_by_host = {}
+    for rank, host in enumerate(hosts):
+        if rank != managerID:
+            ranks_by_host.setdefault(host, []).append(rank)
+
+    layout = {managerID: []}
+    for host, ranks in ranks_by_host.items():
+        if node_leaders and host != hosts[managerID] and len(ranks) > 1:
+            layout[managerID].append(ranks[0])
+            layout[ranks[0]] = ranks[1:]
+        else:
+            layout[managerID].extend(ranks)
+    layout[managerID].sort()
+    return layout
+
+
 # +----------------+
 # | MPIWorkManager |
 # +----------------+
 class MPIWorkManager(WorkManager):
     """MPIWorkManager factory."""
 
+    @classmethod
+    def add_wm_args(cls, parser, wmenv=None):
+        if wmenv is None:
+            wmenv = work_managers.environment.default_env
+
+        wm_group = parser.add_argument_group('options for MPI ("mpi") work manager')
+        wm_group.add_argument(
+            wmenv.arg_flag('mpi_prefetch'),
+            metavar='N_TASKS',
+            type=int,
+            help='Queue up to N_TASKS tasks on each worker rank at a time (default: 1).',
+        )
+        wm_group.add_argument(
+            wmenv.arg_flag('mpi_node_leaders'),
+            action='store_const',
+            const=1,
+            help='''Send the tasks for each node other than the master's to one rank on that node,
+                    which relays them to the other ranks on the node, rather than sending tasks
+                    from the master to every rank.''',
+        )
+
     @classmethod
     def from_environ(cls, wmenv=None):
-        return cls()
+        if wmenv is None:
+            wmenv = work_managers.environment.default_env
+        return cls(prefetch=wmenv.get_val('mpi_prefetch', 1, int), node_leaders=bool(wmenv.get_val('mpi_node_leaders', 0, int)))
 
-    def __new__(cls):
+    def __new__(cls, prefetch=1, node_leaders=False):
         """Creates a Serial WorkManager if size is 1.  Otherwise creates a
-        single Manager and size-1 Worker.
+        single Manager, a NodeLeader for each node other than the manager's
+        if node_leaders is true, and Workers on the remaining ranks.
         """
         log.debug('MPIWorkManager.__new__()')
         assert MPI.Is_initialized()
@@ -53,12 +101,21 @@ class MPIWorkManager(WorkManager):
 
         if size == 1:
             return super().__new__(Serial)
-        elif rank == 0:
-            return super().__new__(Manager)
+
+        # Collective; every rank must be created with the same arguments
+        hosts = MPI.COMM_WORLD.allgather(MPI.Get_processor_name()) if node_leaders else [None] * size
+        layout = node_layout(hosts, node_leaders=node_leaders)
+
+        if rank == 0:
+            instance = super().__new__(Manager)
+        elif rank in layout:
+            instance = super().__new__(NodeLeader)
         else:
-            return super().__new__(Worker)
+            instance = super().__new__(Worker)
+        instance.layout = layout
+        return instance
 
-    def __init__(self):
+    def __init__(self, prefetch=1, node_leaders=False):
         """Initialize info shared by Manager and Worker classes."""
         log.debug('MPIWorkManager.__init__()')
 
@@ -69,6 +126,10 @@ class MPIWorkManager(WorkManager):
         self.size = comm.Get_size()
         self.name = MPI.Get_processor_name()
 
+        # number of tasks each worker rank may hold at once
+        self.prefetch = max(1, prefetch or 1)
+        self.node_leaders = node_leaders
+
         # some tags
         self.task_tag = 110  # tag for server to client msgs
         self.result_tag = 120  # tag for client to server msgs
@@ -76,12 +137,50 @@ class MPIWorkManager(WorkManager):
 
         self.managerID = 0
 
+        # rank from which this rank receives tasks
+        self.upstreamID = None
+        for rank, dests in getattr(self, 'layout', {}).items():
+            if self.rank in dests:
+                self.upstreamID = rank
+
     def submit(self, fn, args=None, kwargs=None):
         """Adhere to WorkManager interface.  This method should never be
         called.
         """
         assert False
 
+    def isend_object(self, obj, dest, tag):
+        """Start sending obj to dest.  The pickled object is sent first,
+        along with the sizes of any large buffers (such as the contents of
+        NumPy arrays) split out of it, which follow as separate messages sent
+        directly from the memory of obj.  Returns the list of requests.
+        """
+        data, buffers = serialization.dumps(obj)
+        reqs = [self.comm.isend((data, [buffer.nbytes for buffer in buffers]), dest=dest, tag=tag)]
+        for buffer in buffers:
+            reqs.append(self.comm.Isend([buffer, MPI.BYTE], dest=dest, tag=tag))
+        return reqs
+
+    def send_object(self, obj, dest, tag):
+        """Send obj to dest, as for isend_object, waiting for completion."""
+        MPI.Request.Waitall(requests=self.isend_object(obj, dest, tag))
+
+    def recv_object(self, source, tag, status=None):
+        """Receive an object sent by isend_object or send_object.  Buffers
+        are received directly into the memory of the arrays rebuilt from
+        them.  If given, status is set from the first message received.
+        """
+        if status is None:
+            status = MPI.Status()
+        data, sizes = self.comm.recv(source=source, tag=tag, status=status)
+        buffers = []
+        for size in sizes:
+            buffer = bytearray(size)
+            # Messages from one source with one tag are received in the order they were sent
+            self.comm.Recv([buffer, MPI.BYTE], source=status.Get_source(), tag=status.Get_tag())
+            buffers.append(buffer)
+        return serialization.loads(data, buffers)
+
 
 # +--------+
 # | Serial |
@@ -92,8 +191,8 @@ class Serial(MPIWorkManager):
     that request only 1 (size=1) processor.
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, prefetch=1, node_leaders=False):
+        super().__init__(prefetch, node_leaders)
         log.debug('Serial.__init__()')
 
     def submit(self, fn, args=None, kwargs=None):
@@ -115,30 +214,42 @@ class Serial(MPIWorkManager):
 class Manager(MPIWorkManager):
     """Manager of the MPIWorkManage.  Distributes tasks to Worker as they are
     received from the sim_manager.  In addition to the main thread, this class
-    spawns two threads, a receiver and a dispatcher.
+    spawns two threads, a receiver and a dispatcher, which sleep on a condition
+    variable until there is work for them.
+
+    Each destination rank is sent up to a fixed number of tasks (prefetch
+    tasks for a Worker, or prefetch tasks per worker on its node for a
+    NodeLeader) before it returns any results, in batches of several tasks
+    where there is enough work to go around.
     """
 
-    def __init__(self):
+    def __init__(self, prefetch=1, node_leaders=False):
         """Initialize different state variables used by Manager."""
-        super().__init__()
+        super().__init__(prefetch, node_leaders)
         log.debug('Manager__init__()')
 
-        # number of workers
-        self.nworkers = self.size - 1
+        # ranks this rank sends tasks to directly
+        self.workerIDs = self.layout[self.rank]
+        self.nworkers = len(self.workerIDs)
 
-        # list of worker ranks
-        self.workerIDs = range(1, self.size)
-        assert self.nworkers == len(self.workerIDs)
+        # number of ranks running tasks, including those reached through node leaders
+        self.n_workers = sum(len(self.layout.get(rank, [rank])) for rank in self.workerIDs)
 
-        # deque of idle workers
+        # number of tasks each destination may yet be sent
+        self.free_slots = {rank: self.prefetch * len(self.layout.get(rank, [rank])) for rank in self.workerIDs}
+
+        # deque of destinations with free slots
         self.dests = deque(self.workerIDs)
 
         # deque of tesks
         self.tasks = deque()
 
-        # number of unmatched send/receive pairs
+        # number of tasks sent and not yet returned
         self.nPending = 0
 
+        # sends not yet known to be complete, which hold references to the data being sent
+        self.send_requests = []
+
         # thread shutdown sentinel
         self.shutItDown = False
 
@@ -148,8 +259,9 @@ class Manager(MPIWorkManager):
         # list of manager threads
         self.workers = []
 
-        # thread lock
+        # thread lock, and condition variable on which the threads wait for changes in the state above
         self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
 
     def startup(self):
         """Spawns the dispatcher and receiver threads."""
@@ -161,63 +273,97 @@ class Manager(MPIWorkManager):
 
             for t in self.workers:
                 t.start()
-                log.info('Started thread: %s' % t.getName())
+                log.info('Started thread: %s' % t.name)
 
             self.running = True
 
+    def _assign_tasks(self):
+        """Match queued tasks with destinations with free slots, returning a
+        list of (destination, tasks) pairs.  Each destination is given an even
+        share of the queued tasks, up to its number of free slots, so that
+        tasks are spread over destinations when there are few of them.  Must be
+        called with the lock held.
+        """
+        batches = []
+        while self.tasks and self.dests:
+            dest = self.dests.popleft()
+            ntasks = min(self.free_slots[dest], max(1, len(self.tasks) // (len(self.dests) + 1)))
+            batches.append((dest, [self.tasks.popleft() for _i in range(ntasks)]))
+            self.free_slots[dest] -= ntasks
+            self.nPending += ntasks
+            if self.free_slots[dest]:
+                self.dests.append(dest)
+        return batches
+
     def _dispatcher(self):
-        """Continuously dispatches tasks to idle destinations until the
-        shutdown sentinel is set.
+        """Dispatches tasks to destinations with free slots as tasks and free
+        slots become available, until the shutdown sentinel is set.
         """
         log.debug('Manager._dispatcher()')
         assert MPI.Is_thread_main() is False
-        assert threading.currentThread().getName() == "dispatcher"
+        assert threading.current_thread().name == "dispatcher"
 
-        while not self.shutItDown:
-            req = []
-            # do we have work and somewhere to send it?
-            while self.tasks and self.dests:
-                with self.lock:
-                    task = self.tasks.popleft()
-                    sendTo = self.dests.popleft()
-                    self.nPending += 1
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.shutItDown or (self.tasks and self.dests))
+                if self.shutItDown:
+                    break
+                batches = self._assign_tasks()
+                # wake the receiver to collect the results
+                self.cond.notify_all()
 
-                req.append(self.comm.isend(task, dest=sendTo, tag=self.task_tag))
+            for dest, batch in batches:
+                self.send_requests.extend(self.isend_object(batch, dest=dest, tag=self.task_tag))
 
-            # make sure all sends completed
-            MPI.Request.Waitall(requests=req)
+            # release the data of completed sends, without waiting for the rest, since sends of
+            # large tasks may not complete until their destination has finished its previous tasks
+            self.send_requests = [req for req in self.send_requests if not req.Test()]
 
-            # force context switching ( 1ms )
-            time.sleep(0.001)
+        MPI.Request.Waitall(requests=self.send_requests)
+        self.send_requests = []
 
     def _receiver(self):
-        """Continuously receives futures from workers until the shutdown
-        sentinel is set.
+        """Receives results from destinations while any tasks are outstanding,
+        until the shutdown sentinel is set.
         """
         log.debug('Manager._receiver()')
         assert MPI.Is_thread_main() is False
-        assert threading.currentThread().getName() == "receiver"
+        assert threading.current_thread().name == "receiver"
 
-        while not self.shutItDown:
-            # are we waiting on any results?
-            while self.nPending:
-                stat = MPI.Status()
-                (tid, msg, val) = self.comm.recv(source=MPI.ANY_SOURCE, tag=self.result_tag, status=stat)
-                log.debug('Manager._receiver received task: %s' % tid)
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.shutItDown or self.nPending)
+                if not self.nPending:
+                    break
 
-                # update future
-                ft = self.pending_futures.pop(tid)
-                if msg == 'exception':
-                    ft._set_exception(*val)
-                else:
-                    ft._set_result(val)
+            stat = MPI.Status()
+            result = self.recv_object(source=MPI.ANY_SOURCE, tag=self.result_tag, status=stat)
+            log.debug('Manager._receiver received task: %s' % result[0])
+            self._handle_result(result)
+
+            with self.cond:
+                source = stat.Get_source()
+                if not self.free_slots[source]:
+                    self.dests.append(source)
+                self.free_slots[source] += 1
+                self.nPending -= 1
+                self.cond.notify_all()
+
+    def _handle_result(self, result):
+        """Complete the future for result, a tuple (task_id, 'result' or
+        'exception', value).
+        """
+        (tid, msg, val) = result
 
-                with self.lock:
-                    self.dests.append(stat.Get_source())
-                    self.nPending -= 1
+        # update future
+        ft = self.pending_futures[tid]
+        if msg == 'exception':
+            ft._set_exception(*val)
+        else:
+            ft._set_result(val)
 
-            # force context switching ( 1ms )
-            time.sleep(0.001)
+        with self.cond:
+            del self.pending_futures[tid]
 
     def submit(self, fn, args=None, kwargs=None):
         """Receive task from simulation manager and add it to pending_futures."""
@@ -225,37 +371,113 @@ class Manager(MPIWorkManager):
 
         ft = WMFuture()
         task_id = ft.task_id
-        with self.lock:
+        with self.cond:
             self.tasks.append(Task(task_id, fn, args, kwargs))
             self.pending_futures[task_id] = ft
+            self.cond.notify_all()
 
         return ft
 
-    def shutdown(self):
-        """Send shutdown tag to all worker processes, and set the shutdown
+    def submit_many(self, tasks):
+        """Receive tasks from simulation manager, waking the dispatcher once for all of them."""
+        log.debug('Manager.submit_many()')
+
+        futures = []
+        with self.cond:
+            for fn, args, kwargs in tasks:
+                ft = WMFuture()
+                self.tasks.append(Task(ft.task_id, fn, args, kwargs))
+                self.pending_futures[ft.task_id] = ft
+                futures.append(ft)
+            self.cond.notify_all()
+
+        return futures
+
+    def _stop(self):
+        """Send shutdown tag to all destinations, and set the shutdown
         sentinel to stop the receiver and dispatcher loops.
         """
-        log.debug('Manager.shutdown()')
+        # stop threads, which finish any sends still in progress
+        with self.cond:
+            self.shutItDown = True
+            self.cond.notify_all()
 
-        # wait on any unfinished work
-        while self.pending_futures:
-            pass
+        for t in self.workers:
+            t.join()
+            log.info('Stopped thread: %s' % t.name)
 
-        # send shutdown msg to all workers
-        req = [MPI.REQUEST_NULL] * self.nworkers
+        # send shutdown msg to all destinations
+        req = []
         for rank in self.workerIDs:
-            req[rank - 1] = self.comm.isend(MPI.BOTTOM, dest=rank, tag=self.shutdown_tag)
+            req.extend(self.isend_object(None, dest=rank, tag=self.shutdown_tag))
 
         MPI.Request.Waitall(requests=req)
 
-        # stop threads
-        self.shutItDown = True
+        self.running = False
 
-        for t in self.workers:
-            t.join()
-            log.info('Stopped thread: %s' % t.getName())
+    def shutdown(self):
+        """Wait for any unfinished work, then shut down workers and threads."""
+        log.debug('Manager.shutdown()')
 
-        self.running = False
+        with self.cond:
+            self.cond.wait_for(lambda: not self.pending_futures)
+
+        self._stop()
+
+
+# +------------+
+# | NodeLeader |
+# +------------+
+class NodeLeader(Manager):
+    """Relays tasks from the Manager to the Workers on its node, and their
+    results back to the Manager, so that the Manager need only communicate
+    with one rank per node.  Like a Worker, it runs until the Manager shuts
+    it down.
+    """
+
+    def __init__(self, prefetch=1, node_leaders=False):
+        super().__init__(prefetch, node_leaders)
+        log.debug('NodeLeader.__init__() %s' % self.rank)
+
+    def startup(self):
+        """Relay tasks and results until shut down by the Manager."""
+        log.debug('NodeLeader.startup() %s' % self.rank)
+        if not self.running:
+            super().startup()
+            self.relay()
+
+    def relay(self):
+        """Queue tasks from the Manager for dispatch to this node's Workers."""
+        log.info('Node leader %s relaying tasks to ranks %s.' % (self.rank, list(self.workerIDs)))
+
+        while True:
+            stat = MPI.Status()
+            tasks = self.recv_object(source=self.upstreamID, tag=MPI.ANY_TAG, status=stat)
+
+            if stat.Get_tag() == self.shutdown_tag:
+                # the manager has received all results, so none are outstanding here
+                log.info('Node leader %s clocking out.' % self.rank)
+                self._stop()
+                return
+
+            with self.cond:
+                self.tasks.extend(tasks)
+                self.cond.notify_all()
+
+    def _handle_result(self, result):
+        """Pass result back to the Manager."""
+        self.send_object(result, dest=self.upstreamID, tag=self.result_tag)
+
+    def shutdown(self):
+        """Node leaders are shut down by the Manager."""
+        pass
+
+    @property
+    def is_master(self):
+        """Node leaders need to be marked as not manager.  This ensures that
+        the proper branching is followed in w_run.py.
+        """
+        return False
 
 
 # +--------+
@@ -266,8 +488,8 @@ class Worker(MPIWorkManager):
     MPI Work Manager
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, prefetch=1, node_leaders=False):
+        super().__init__(prefetch, node_leaders)
         log.debug('Worker.__init__() %s' % self.rank)
 
     def startup(self):
@@ -280,31 +502,32 @@ class Worker(MPIWorkManager):
 
     def clockIn(self):
         """Do each task as it comes in.  The completion of a task is
-        notice to the manager that more work is welcome.
+        notice to the manager that more work is welcome.  Tasks arrive in
+        batches; any further tasks sent wait in MPI's queue of incoming
+        messages until those already received are done.
         """
         log.info('Worker %s clocking in.' % self.rank)
 
-        comm = self.comm
-
         while True:
             stat = MPI.Status()
-            task = comm.recv(source=self.managerID, tag=MPI.ANY_TAG, status=stat)
+            tasks = self.recv_object(source=self.upstreamID, tag=MPI.ANY_TAG, status=stat)
 
             tag = stat.Get_tag()
 
             if tag == self.task_tag:
-                log.debug('Worker %s received task: %s' % (self.rank, task.task_id))
-
-                # do the work
-                try:
-                    rv = task.fn(*task.args, **task.kwargs)
-                except BaseException as e:
-                    ro = (task.task_id, 'exception', (e, traceback.format_exc()))
-                else:
-                    ro = (task.task_id, 'result', rv)
-
-                # send result back to manager
-                comm.send(ro, dest=self.managerID, tag=self.result_tag)
+                for task in tasks:
+                    log.debug('Worker %s received task: %s' % (self.rank, task.task_id))
+
+                    # do the work
+                    try:
+                        rv = task.fn(*task.args, **task.kwargs)
+                    except BaseException as e:
+                        ro = (task.task_id, 'exception', (e, traceback.format_exc()))
+                    else:
+                        ro = (task.task_id, 'result', rv)
+
+                    # send result back to manager
+                    self.send_object(ro, dest=self.upstreamID, tag=self.result_tag)
 
             if tag == self.shutdown_tag:
                 log.info('Worker %s clocking out.' % self.rank)
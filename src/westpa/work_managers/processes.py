@@ -4,25 +4,87 @@ import random
 import logging
 import threading
 import traceback
+import collections
 import multiprocessing
-from multiprocessing.queues import Empty
+import multiprocessing.connection
+from multiprocessing import resource_tracker, shared_memory
 
 import westpa.work_managers as work_managers
+from . import serialization
 from .core import WorkManager, WMFuture
 
 log = logging.getLogger(__name__)
 
-# Tasks are tuples ('task', task_id, fn, args, kwargs).
+# Tasks are tuples ('task', task_id, fn, args, kwargs), sent to each worker over a pipe of its own.
 # Results are tuples (rtype, task_id, payload) where rtype is 'result' or 'exception' and payload is the return value
-# or exception, respectively.
+# or exception, respectively. Results are pickled (see westpa.work_managers.serialization) before being sent back
+# over a second pipe; large buffers (such as the contents of NumPy arrays) are passed out-of-band, through shared memory.
 
 task_shutdown_sentinel = ('shutdown', None, None, (), {})
-result_shutdown_sentinel = ('shutdown', None, None)
+
+# Size (in bytes) above which buffers in results are returned through shared memory
+default_shm_threshold = 1024 * 1024
+
+
+def dump_result(result_tuple, shm_threshold=default_shm_threshold):
+    '''Pickle ``result_tuple``, copying any buffers of at least ``shm_threshold`` bytes into a
+    single new shared memory segment. Returns a tuple (pickled_data, shm_name, layout), where
+    ``layout`` is the list of (offset, length) of each buffer in the segment; ``shm_name`` is
+    ``None`` if no buffers were large enough.'''
+
+    data, views = serialization.dumps(result_tuple, shm_threshold)
+    if not views:
+        return data, None, []
+
+    layout = []
+    offset = 0
+    for view in views:
+        layout.append((offset, view.nbytes))
+        offset += view.nbytes
+
+    shm = shared_memory.SharedMemory(create=True, size=offset)
+    try:
+        for (offset, length), view in zip(layout, views):
+            shm.buf[offset : offset + length] = view
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return data, shm.name, layout
+
+
+def load_result(data, shm_name=None, layout=()):
+    '''Unpickle a result dumped by ``dump_result``, copying any buffers out of (and removing)
+    its shared memory segment.'''
+
+    if shm_name is None:
+        return serialization.loads(data)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buffers = []
+        for offset, length in layout:
+            with shm.buf[offset : offset + length] as view:
+                buffers.append(bytearray(view))
+    finally:
+        shm.close()
+        shm.unlink()
+    return serialization.loads(data, buffers)
 
 
 class ProcessWorkManager(WorkManager):
     '''A work manager using the ``multiprocessing`` module.
 
+    Each worker process receives tasks over a pipe of its own, and returns results over another.
+    Workers block while waiting for tasks, and the master collects results in a single thread
+    which blocks until any worker has a result ready, so that idle workers use no CPU time.
+    Up to ``prefetch`` tasks are sent to each worker at once, so that a worker can begin its next
+    task as soon as it has finished the last one. As tasks are not redistributed once sent, the
+    default of one task per worker gives the best load balance when tasks vary in length.
+    Buffers in results (the data of NumPy arrays, in particular) of at least ``shm_threshold``
+    bytes are returned through shared memory rather than through the pipe.
+
     Notes
     -----
 
@@ -38,13 +100,37 @@ class ProcessWorkManager(WorkManager):
     https://docs.python.org/3/library/multiprocessing.html#the-spawn-and-forkserver-start-methods for more details.
     '''
 
+    @classmethod
+    def add_wm_args(cls, parser, wmenv=None):
+        if wmenv is None:
+            wmenv = work_managers.environment.default_env
+
+        wm_group = parser.add_argument_group('options for multiprocessing ("processes") work manager')
+        wm_group.add_argument(
+            wmenv.arg_flag('processes_prefetch'),
+            metavar='N_TASKS',
+            type=int,
+            help='Send up to N_TASKS tasks to each worker at a time (default: 1).',
+        )
+        wm_group.add_argument(
+            wmenv.arg_flag('processes_shm_threshold'),
+            metavar='BYTES',
+            type=int,
+            help='Return arrays of at least BYTES bytes from workers through shared memory '
+            + '(default: {:d}).'.format(default_shm_threshold),
+        )
+
     @classmethod
     def from_environ(cls, wmenv=None):
         if wmenv is None:
             wmenv = work_managers.environment.default_env
-        return cls(wmenv.get_val('n_workers', multiprocessing.cpu_count(), int))
+        return cls(
+            wmenv.get_val('n_workers', multiprocessing.cpu_count(), int),
+            prefetch=wmenv.get_val('processes_prefetch', 1, int),
+            shm_threshold=wmenv.get_val('processes_shm_threshold', default_shm_threshold, int),
+        )
 
-    def __init__(self, n_workers=None, shutdown_timeout=1):
+    def __init__(self, n_workers=None, shutdown_timeout=1, prefetch=1, shm_threshold=default_shm_threshold):
         super().__init__()
 
         try:
@@ -55,16 +141,29 @@ class ProcessWorkManager(WorkManager):
             log.debug('failed to set start method to fork')
 
         self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.prefetch = max(1, prefetch or 1)
+        self.shm_threshold = shm_threshold
         self.workers = None
-        self.task_queue = multiprocessing.Queue()
-        self.result_queue = multiprocessing.Queue()
+        self.task_pipes = None
+        self.result_pipes = None
+        self.dispatch_thread = None
         self.receive_thread = None
         self.pending = None
 
+        # Tasks not yet sent, and the IDs of the tasks sent to each worker but not yet returned,
+        # guarded by self.lock; self.dispatch_cond is notified whenever either changes
+        self.lock = threading.Lock()
+        self.dispatch_cond = threading.Condition(self.lock)
+        self.backlog = collections.deque()
+        self.assigned = None
+        self.alive = None
+
         self.shutdown_received = threading.Event()
         self.shutdown_timeout = shutdown_timeout or 1
+        self._wakeup = None
+        self._worker_ends = []
 
-    def task_loop(self):
+    def task_loop(self, task_pipe, result_pipe):
         # Close standard input, so we don't get SIGINT from ^C
         try:
             sys.stdin.close()
@@ -74,46 +173,148 @@ class ProcessWorkManager(WorkManager):
         # (re)initialize random number generator in this process
         random.seed()
 
-        while not self.shutdown_received.is_set():
-            if not self.task_queue.empty():
-                message, task_id, fn, args, kwargs = self.task_queue.get()[:5]
+        # Close the master's ends of all pipes, and other workers' ends, inherited on fork
+        for conn in self.task_pipes + self.result_pipes + list(self._wakeup):
+            conn.close()
+        for conn in self._worker_ends:
+            if conn is not task_pipe and conn is not result_pipe:
+                conn.close()
 
-                if message == 'shutdown':
-                    break
+        # Receive tasks in a separate thread, so that prefetched tasks are read from the pipe
+        # while the current one runs (and the master never blocks sending them)
+        tasks = collections.deque()
+        tasks_ready = threading.Condition()
+
+        def receive_tasks():
+            while True:
                 try:
-                    result = fn(*args, **kwargs)
-                except BaseException as e:
-                    result_tuple = ('exception', task_id, (e, traceback.format_exc()))
-                else:
-                    result_tuple = ('result', task_id, result)
-                self.result_queue.put(result_tuple)
+                    task = task_pipe.recv()
+                except (EOFError, OSError):
+                    task = task_shutdown_sentinel
+                with tasks_ready:
+                    tasks.append(task)
+                    tasks_ready.notify()
+                if task[0] == 'shutdown':
+                    return
+
+        receiver = threading.Thread(target=receive_tasks, name='task-receiver')
+        receiver.daemon = True
+        receiver.start()
+
+        while True:
+            with tasks_ready:
+                while not tasks:
+                    tasks_ready.wait()
+                message, task_id, fn, args, kwargs = tasks.popleft()[:5]
+
+            if message == 'shutdown':
+                break
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                result_tuple = ('exception', task_id, (e, traceback.format_exc()))
+            else:
+                result_tuple = ('result', task_id, result)
+
+            try:
+                message = dump_result(result_tuple, self.shm_threshold)
+            except Exception as e:
+                message = dump_result(('exception', task_id, (e, traceback.format_exc())))
+            try:
+                result_pipe.send(message)
+            except (EOFError, OSError):
+                break
 
         log.debug('exiting task_loop')
         return
 
+    def dispatch_loop(self):
+        '''Send tasks from the backlog to workers with fewer than ``prefetch`` tasks outstanding.'''
+        while True:
+            with self.dispatch_cond:
+                while not self.shutdown_received.is_set():
+                    if self.backlog:
+                        workers = [i for i in range(self.n_workers) if self.alive[i]]
+                        iworker = min(workers, key=lambda i: len(self.assigned[i]), default=None)
+                        if iworker is not None and len(self.assigned[iworker]) < self.prefetch:
+                            break
+                    self.dispatch_cond.wait()
+                else:
+                    break
+
+                task = self.backlog.popleft()
+                self.assigned[iworker].add(task[1])
+
+            try:
+                self.task_pipes[iworker].send(task)
+            except (EOFError, OSError) as e:
+                log.error('could not send task to worker {:d}: {}'.format(iworker, e))
+            except Exception as e:
+                # Most likely, the task could not be pickled
+                with self.lock:
+                    self.assigned[iworker].discard(task[1])
+                    future = self.pending.pop(task[1], None)
+                    self.dispatch_cond.notify()
+                if future is not None:
+                    future._set_exception(e, traceback.format_exc())
+
+        log.debug('exiting dispatch_loop')
+
     def results_loop(self):
-        while not self.shutdown_received.is_set():
-            if not self.result_queue.empty():
-                message, task_id, payload = self.result_queue.get()[:3]
+        conns = {conn: iworker for iworker, conn in enumerate(self.result_pipes)}
+        wakeup = self._wakeup[0]
 
-                if message == 'shutdown':
+        while conns and not self.shutdown_received.is_set():
+            for conn in multiprocessing.connection.wait(list(conns) + [wakeup]):
+                if conn is wakeup:
                     break
-                elif message == 'exception':
+
+                iworker = conns[conn]
+                try:
+                    message, task_id, payload = load_result(*conn.recv())[:3]
+                except (EOFError, OSError):
+                    log.debug('lost connection to worker {:d}'.format(iworker))
+                    del conns[conn]
+                    self._worker_lost(iworker)
+                    continue
+
+                with self.lock:
+                    self.assigned[iworker].discard(task_id)
                     future = self.pending.pop(task_id)
+                    self.dispatch_cond.notify()
+
+                if message == 'exception':
                     future._set_exception(*payload)
                 elif message == 'result':
-                    future = self.pending.pop(task_id)
                     future._set_result(payload)
                 else:
                     raise AssertionError('unknown message {!r}'.format((message, task_id, payload)))
 
         log.debug('exiting results_loop')
 
+    def _worker_lost(self, iworker):
+        '''Fail the tasks outstanding on a worker which has exited, and send it no more. If no
+        workers remain, fail all remaining tasks.'''
+        with self.lock:
+            self.alive[iworker] = False
+            task_ids = list(self.assigned[iworker])
+            self.assigned[iworker].clear()
+            if not any(self.alive):
+                task_ids.extend(task[1] for task in self.backlog)
+                self.backlog.clear()
+            futures = [self.pending.pop(task_id) for task_id in task_ids if task_id in self.pending]
+
+        if not self.shutdown_received.is_set():
+            for future in futures:
+                future._set_exception(RuntimeError('worker process {:d} exited unexpectedly'.format(iworker)))
+
     def submit(self, fn, args=None, kwargs=None):
         ft = WMFuture()
         log.debug('dispatching {!r}'.format(fn))
-        self.pending[ft.task_id] = ft
-        self.task_queue.put(('task', ft.task_id, fn, args or (), kwargs or {}))
+        with self.dispatch_cond:
+            self.pending[ft.task_id] = ft
+            self.backlog.append(('task', ft.task_id, fn, args or (), kwargs or {}))
+            self.dispatch_cond.notify()
         return ft
 
     def startup(self):
@@ -122,8 +323,27 @@ class ProcessWorkManager(WorkManager):
         if not self.running:
             log.debug('starting up work manager {!r}'.format(self))
             self.running = True
+            self.shutdown_received.clear()
+
+            # Make sure all workers share one resource tracker, which sees both the creation of
+            # shared memory segments (in workers) and their removal (in the master)
+            resource_tracker.ensure_running()
+
+            task_pipes = [multiprocessing.Pipe(duplex=False) for _i in range(self.n_workers)]
+            result_pipes = [multiprocessing.Pipe(duplex=False) for _i in range(self.n_workers)]
+            self.task_pipes = [task_w for (_task_r, task_w) in task_pipes]
+            self.result_pipes = [result_r for (result_r, _result_w) in result_pipes]
+            self._wakeup = multiprocessing.Pipe(duplex=False)
+            self._worker_ends = [
+                conn for (task_r, _task_w), (_result_r, result_w) in zip(task_pipes, result_pipes) for conn in (task_r, result_w)
+            ]
+
             self.workers = [
-                multiprocessing.Process(target=self.task_loop, name='worker-{:d}-{:x}'.format(i, id(self)))
+                multiprocessing.Process(
+                    target=self.task_loop,
+                    args=(task_pipes[i][0], result_pipes[i][1]),
+                    name='worker-{:d}-{:x}'.format(i, id(self)),
+                )
                 for i in range(self.n_workers)
             ]
 
@@ -136,35 +356,40 @@ class ProcessWorkManager(WorkManager):
             except KeyError:
                 pass
 
+            # Close the workers' ends of the pipes in the master
+            for conn in self._worker_ends:
+                conn.close()
+            self._worker_ends = []
+
             self.pending = dict()
+            self.backlog.clear()
+            self.assigned = [set() for _i in range(self.n_workers)]
+            self.alive = [True] * self.n_workers
 
             self.receive_thread = threading.Thread(target=self.results_loop, name='receiver')
             self.receive_thread.daemon = True
             self.receive_thread.start()
 
-    def _empty_queues(self):
-        '''Empty self.task_queue and self.result_queue until queue is empty'''
-        try:
-            while True:
-                self.task_queue.get_nowait()
-        except Empty:
-            pass
-
-        try:
-            while True:
-                self.result_queue.get_nowait()
-        except Empty:
-            pass
+            self.dispatch_thread = threading.Thread(target=self.dispatch_loop, name='dispatcher')
+            self.dispatch_thread.daemon = True
+            self.dispatch_thread.start()
 
     def shutdown(self):
         while self.running:
             log.debug('shutting down {!r}'.format(self))
-            self.shutdown_received.set()
-            self._empty_queues()
+            with self.dispatch_cond:
+                self.shutdown_received.set()
+                self.backlog.clear()
+                self.dispatch_cond.notify_all()
+            self._wakeup[1].send(None)
+            self.dispatch_thread.join()
 
             # Send shutdown signal
-            for _i in range(self.n_workers):
-                self.task_queue.put_nowait(task_shutdown_sentinel)
+            for task_pipe in self.task_pipes:
+                try:
+                    task_pipe.send(task_shutdown_sentinel)
+                except OSError:
+                    pass
 
             for worker in self.workers:
                 worker.join(self.shutdown_timeout)
@@ -181,7 +406,8 @@ class ProcessWorkManager(WorkManager):
                 else:
                     log.debug('worker process {:d} terminated gracefully with code {:d}'.format(worker.pid, worker.exitcode))
 
-            self._empty_queues()
-            self.result_queue.put(result_shutdown_sentinel)
+            self.receive_thread.join(self.shutdown_timeout)
+            for conn in self.task_pipes + self.result_pipes + list(self._wakeup):
+                conn.close()
 
             self.running = False
@@ -0,0 +1,73 @@
+'''Serialization of tasks and results for work managers which send them between processes.
+
+Objects are pickled with protocol 5. Buffers of at least a given size (the contents of NumPy arrays and
+long ``bytes`` strings, such as aux data and restart files) are split out of the pickled data and returned
+separately, as views of the memory of the objects they belong to. They can then be sent without being
+copied into the pickle, as separate ZeroMQ frames or MPI messages, and handed to ``loads()`` on the
+receiving end, where NumPy arrays are rebuilt around them directly.
+'''
+
+import io
+import pickle
+
+# Size (in bytes) at and above which buffers are sent out-of-band. Smaller buffers are cheaper to copy
+# into the pickled data than to send separately. This matches the size above which pyzmq avoids copying
+# message frames.
+default_threshold = 65536
+
+
+# Persistent ID standing in for a ``bytes`` string passed out-of-band
+_bytes_pid = 'bytes'
+
+
+class _Pickler(pickle.Pickler):
+    '''Pickler which passes buffers of at least ``threshold`` bytes out-of-band, appending them to
+    ``buffers``. Protocol 5 only does so for objects (such as NumPy arrays) whose reduction provides a
+    ``PickleBuffer``; long ``bytes`` strings are passed out-of-band through persistent IDs instead,
+    in the same sequence, so that both are consumed in order when unpickling.'''
+
+    def __init__(self, file, threshold, buffers):
+        super().__init__(file, protocol=5, buffer_callback=self.buffer_callback)
+        self.threshold = threshold
+        self.buffers = buffers
+
+    def buffer_callback(self, buffer):
+        view = buffer.raw()
+        if self.threshold is None or view.nbytes < self.threshold:
+            return True
+        self.buffers.append(view)
+        return False
+
+    def persistent_id(self, obj):
+        if type(obj) is bytes and self.threshold is not None and len(obj) >= self.threshold:
+            self.buffers.append(memoryview(obj))
+            return _bytes_pid
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, buffers):
+        self.buffer_iter = iter(buffers)
+        super().__init__(file, buffers=self.buffer_iter)
+
+    def persistent_load(self, pid):
+        if pid != _bytes_pid:
+            raise pickle.UnpicklingError('unsupported persistent ID {!r}'.format(pid))
+        return bytes(next(self.buffer_iter))
+
+
+def dumps(obj, threshold=default_threshold):
+    '''Pickle ``obj``, returning a tuple (data, buffers), where ``buffers`` is a list of contiguous,
+    one-dimensional memoryviews of the buffers of at least ``threshold`` bytes, which are not included
+    in ``data``. If ``threshold`` is None, all buffers are included in ``data``.'''
+
+    buffers = []
+    file = io.BytesIO()
+    _Pickler(file, threshold, buffers).dump(obj)
+    return file.getvalue(), buffers
+
+
+def loads(data, buffers=()):
+    '''Unpickle an object from the ``data`` and ``buffers`` returned by ``dumps()``. NumPy arrays
+    share memory with (and are writeable if) the corresponding buffers.'''
+    return _Unpickler(io.BytesIO(data), buffers).load()
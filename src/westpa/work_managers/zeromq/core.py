@@ -24,6 +24,8 @@ import uuid
 import zmq
 import numpy as np
 
+from westpa.work_managers import serialization
+
 # Every ten seconds the master requests a status report from workers.
 # This also notifies workers that the master is still alive
 DEFAULT_STATUS_POLL = 10
@@ -90,6 +92,11 @@ class Message:
     TASK = 'task'
     RESULT = 'result'
 
+    # Batches of tasks (the reply to a TASK_REQUEST whose payload is the number of tasks wanted)
+    # and of results
+    TASKS = 'tasks'
+    RESULTS = 'results'
+
     idempotent_announcement_messages = {SHUTDOWN, TASKS_AVAILABLE, MASTER_BEACON}
 
     def __init__(self, message=None, payload=None, master_id=None, src_id=None):
@@ -228,6 +235,7 @@ class PassiveMultiTimer:
         self._durations = np.delete(self._durations, idx)
         self._started = np.delete(self._started, idx)
         self._identifiers = np.delete(self._identifiers, idx)
+        self._indices = {identifier: idx for idx, identifier in enumerate(self._identifiers)}
 
     def change_duration(self, identifier, duration):
         idx = self._indices[identifier]
@@ -263,6 +271,50 @@ class PassiveMultiTimer:
         return self._identifiers[expired_indices]
 
 
+class CommCounters:
+    '''Counters of the traffic handled by a communications loop. Counts (such as the number of
+    tasks dispatched) accumulate, while levels (such as the number of tasks queued) are set to
+    their current value; ``update_rates()`` computes the rate of change of each count since it
+    was last called.'''
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.levels = {}
+        self.rates = {}
+        self._last_counts = {}
+        self._last_time = time.time()
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def level(self, name, value):
+        self.levels[name] = value
+
+    def update_rates(self, at=None):
+        at = at or time.time()
+        elapsed = at - self._last_time
+        if elapsed > 0:
+            self.rates = {name: (n - self._last_counts.get(name, 0)) / elapsed for name, n in self.counts.items()}
+        self._last_counts = dict(self.counts)
+        self._last_time = at
+
+    def snapshot(self):
+        '''Return the current counts, levels, and rates (as ``<count>_rate``) in one dictionary.'''
+        snapshot = dict(self.counts)
+        snapshot.update(self.levels)
+        snapshot.update(('{}_rate'.format(name), rate) for name, rate in self.rates.items())
+        return snapshot
+
+    def __repr__(self):
+        return '<{} {}>'.format(
+            self.__class__.__name__,
+            ', '.join(
+                '{}={:.4g}'.format(name, value) if isinstance(value, float) else '{}={}'.format(name, value)
+                for name, value in sorted(self.snapshot().items())
+            ),
+        )
+
+
 class ZMQCore:
     # The overall communication topology (socket layout, etc)
     # Cannot be updated without updating configuration files, command-line parameters,
@@ -277,7 +329,7 @@ class ZMQCore:
     # Minor updates and additions to the protocol.
     # Changes do not break the ZMQ WM library, but only add new
     # functionality/code paths without changing existing code paths.
-    PROTOCOL_UPDATE = 0
+    PROTOCOL_UPDATE = 1
 
     PROTOCOL_VERSION = (PROTOCOL_MAJOR, PROTOCOL_MINOR, PROTOCOL_UPDATE)
 
@@ -292,6 +344,15 @@ class ZMQCore:
     default_startup_timeout = 120.0
     default_shutdown_timeout = 5.0
 
+    # Number of tasks a worker holds at once, including the one it is running
+    default_prefetch = 1
+
+    # Number of tasks a node holds for its workers (0 to forward every request to the master)
+    default_node_buffer = 0
+
+    # Interval (in seconds) at which communication counters are updated and logged
+    default_stats_period = 10.0
+
     _ipc_endpoints_to_delete = []
 
     @classmethod
@@ -354,6 +415,10 @@ class ZMQCore:
         # and the master.
         self.startup_timeout = self.default_startup_timeout
 
+        # Counters of traffic handled by the communications loop, updated every stats_period seconds
+        self.comm_stats = CommCounters()
+        self.stats_period = self.default_stats_period
+
         # A friendlier description for logging
         self.node_description = '{!s} on {!s} at PID {:d}'.format(self.__class__.__name__, socket.gethostname(), os.getpid())
 
@@ -437,6 +502,18 @@ class ZMQCore:
             elif self.validation_fail_action == 'warn':
                 self.log.warning('message validation falied: {!s}'.format(e))
 
+    def encode_message(self, message):
+        '''Serialize ``message`` into a list of frames: the pickled message, followed by any large
+        buffers (such as the contents of NumPy arrays) it holds, which are sent without copying. These
+        buffers must not be modified until the message has been sent.'''
+        data, buffers = serialization.dumps(message)
+        return [data] + buffers
+
+    def decode_message(self, frames):
+        '''Deserialize a message from the list of frames (``zmq.Frame`` objects or bytes) produced by
+        ``encode_message()``. NumPy arrays in the message share memory with the frames.'''
+        return serialization.loads(memoryview(frames[0]), [memoryview(frame) for frame in frames[1:]])
+
     def recv_message(self, socket, flags=0, validate=True, timeout=None):
         '''Receive a message object from the given socket, using the given flags.
         Message validation is performed if ``validate`` is true.
@@ -445,14 +522,14 @@ class ZMQCore:
         ``flags`` includes ``zmq.NOBLOCK``.'''
 
         if timeout is None or flags & zmq.NOBLOCK:
-            message = socket.recv_pyobj(flags)
+            message = self.decode_message(socket.recv_multipart(flags, copy=False))
         else:
             poller = zmq.Poller()
             poller.register(socket, zmq.POLLIN)
             try:
                 poll_results = dict(poller.poll(timeout=timeout))
                 if socket in poll_results:
-                    message = socket.recv_pyobj(flags)
+                    message = self.decode_message(socket.recv_multipart(flags, copy=False))
                 else:
                     raise ZMQWMTimeout('recv timed out')
             finally:
@@ -495,7 +572,7 @@ class ZMQCore:
 
         if self._super_debug:
             self.log.debug('sending {!r}'.format(message))
-        socket.send_pyobj(message, flags)
+        socket.send_multipart(self.encode_message(message), flags, copy=False)
 
     def send_reply(self, socket, original_message, reply=Message.ACK, payload=None, flags=0):
         '''Send a reply to ``original_message`` on ``socket``. The reply message
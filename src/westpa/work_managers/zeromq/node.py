@@ -6,22 +6,50 @@ Created on Jun 11, 2015
 
 import logging
 
+from collections import deque
+
 log = logging.getLogger(__name__)
 
-from .core import ZMQCore, Message, PassiveMultiTimer, IsNode
+from .core import ZMQCore, Message, PassiveMultiTimer, IsNode, Result, Task, ZMQWorkerMissing
 
 import zmq
 from zmq.devices import ThreadProxy
 
 
 class ZMQNode(ZMQCore, IsNode):
-    def __init__(self, upstream_rr_endpoint, upstream_ann_endpoint, n_local_workers=None):
+    '''A node relaying tasks and results between the master and a group of workers (its own local
+    workers and any connecting to its downstream endpoints). By default, requests and replies
+    are forwarded unchanged. If ``task_buffer_size`` is nonzero, the node instead fetches up to
+    that many tasks from the master ahead of time, in batches, and hands them to its workers
+    as they ask for them.'''
+
+    def __init__(self, upstream_rr_endpoint, upstream_ann_endpoint, n_local_workers=None, task_buffer_size=None):
         ZMQCore.__init__(self)
         IsNode.__init__(self, n_local_workers)
 
         self.upstream_rr_endpoint = upstream_rr_endpoint
         self.upstream_ann_endpoint = upstream_ann_endpoint
 
+        self.task_buffer_size = self.default_node_buffer if task_buffer_size is None else task_buffer_size
+
+        # Tasks fetched from the master and not yet handed to a worker
+        self.task_buffer = deque()
+
+        # Tasks handed to workers and not yet completed, indexed by worker (ZeroMQ identity)
+        # and then by task ID
+        self.worker_tasks = dict()
+
+        # Task requests from workers waiting for tasks to arrive from the master
+        self.waiting_requests = deque()
+
+        # Messages sent by this node to the master and not yet replied to, and whether the master
+        # may have tasks to give
+        self.upstream_requests = deque()
+        self.upstream_tasks_available = True
+
+        # Last contact from workers (indexed by ZeroMQ identity)
+        self.worker_timeouts = PassiveMultiTimer()
+
     def __enter__(self):
         return self
 
@@ -35,6 +63,128 @@ class ZMQNode(ZMQCore, IsNode):
     def is_master(self):
         return False
 
+    def send_worker_message(self, socket, identity, message, payload=None):
+        '''Send a message to the worker with the given ZeroMQ identity through the ROUTER ``socket``.'''
+        message = Message(message, payload, master_id=self.master_id, src_id=self.node_id)
+        socket.send_multipart([identity, b''] + self.encode_message(message), copy=False)
+
+    def send_upstream_message(self, socket, message, payload=None):
+        '''Send a message from this node to the master through the DEALER ``socket``.'''
+        message = Message(message, payload, master_id=self.master_id, src_id=self.node_id)
+        socket.send_multipart([b''] + self.encode_message(message), copy=False)
+        self.upstream_requests.append(message.message)
+
+    def send_buffered_tasks(self, socket, identity, msg):
+        '''Reply to the task request ``msg`` from the worker ``identity`` with tasks from the buffer.
+        Returns False, sending nothing, if the buffer is empty.'''
+        if not self.task_buffer:
+            return False
+
+        n_tasks = 1 if msg.payload is None else max(1, msg.payload)
+        tasks = [self.task_buffer.popleft() for _i in range(min(n_tasks, len(self.task_buffer)))]
+        self.worker_tasks.setdefault(identity, {}).update((task.task_id, task) for task in tasks)
+        self.comm_stats.count('tasks_dispatched', len(tasks))
+
+        if msg.payload is None:
+            self.send_worker_message(socket, identity, Message.TASK, tasks[0])
+        else:
+            self.send_worker_message(socket, identity, Message.TASKS, tasks)
+        return True
+
+    def request_buffer_tasks(self, upstream_socket, force=False):
+        '''Ask the master for enough tasks to fill the buffer (and satisfy any waiting requests), unless
+        a request is already outstanding. Unless ``force`` is true, this is only done if the buffer
+        is at most half full and the master has announced tasks since it last had none to give.'''
+        if Message.TASK_REQUEST in self.upstream_requests:
+            return
+        if not force and (not self.upstream_tasks_available or len(self.task_buffer) > self.task_buffer_size // 2):
+            return
+
+        n_waiting = sum(1 if msg.payload is None else max(1, msg.payload) for _identity, msg in self.waiting_requests)
+        n_tasks = self.task_buffer_size + n_waiting - len(self.task_buffer)
+        if n_tasks > 0:
+            self.send_upstream_message(upstream_socket, Message.TASK_REQUEST, n_tasks)
+            self.comm_stats.count('buffer_requests')
+
+    def handle_upstream_reply(self, downstream_socket, upstream_socket):
+        '''Handle the master's reply to a message sent by this node.'''
+        # Strip the empty delimiter frame
+        msg = self.decode_message(upstream_socket.recv_multipart(copy=False)[1:])
+        with self.message_validation(msg):
+            self.validate_message(msg)
+        if self.master_id is None:
+            self.master_id = msg.master_id
+        if self.upstream_requests.popleft() != Message.TASK_REQUEST:
+            return
+
+        if msg.message == Message.NAK:
+            self.upstream_tasks_available = False
+        else:
+            with self.message_validation(msg):
+                assert msg.message == Message.TASKS
+                for task in msg.payload:
+                    assert isinstance(task, Task)
+            self.task_buffer.extend(msg.payload)
+            self.comm_stats.count('tasks_fetched', len(msg.payload))
+
+        # Serve workers waiting for tasks, or tell them there are none
+        while self.waiting_requests:
+            identity, request = self.waiting_requests.popleft()
+            if not self.send_buffered_tasks(downstream_socket, identity, request):
+                self.send_worker_message(downstream_socket, identity, Message.NAK)
+
+        self.request_buffer_tasks(upstream_socket)
+
+    def handle_worker_message(self, downstream_socket, forward_socket, upstream_socket):
+        '''Handle a message from a worker, replying to task requests from the buffer and forwarding
+        everything else (results, identification) to the master.'''
+        frames = downstream_socket.recv_multipart(copy=False)
+        identity = frames[0].bytes
+        # This costs a decode of results on their way through, in order to track which of the
+        # tasks handed out by this node have been completed
+        msg = self.decode_message(frames[2:])
+        with self.message_validation(msg):
+            self.validate_message(msg)
+
+        try:
+            self.worker_timeouts.reset(identity)
+        except KeyError:
+            self.worker_timeouts.add_timer(identity, self.worker_beacon_period * self.timeout_factor)
+
+        if msg.message == Message.TASK_REQUEST:
+            if not self.send_buffered_tasks(downstream_socket, identity, msg):
+                self.waiting_requests.append((identity, msg))
+                self.request_buffer_tasks(upstream_socket, force=True)
+            else:
+                self.request_buffer_tasks(upstream_socket)
+        else:
+            if msg.message in (Message.RESULT, Message.RESULTS):
+                results = [msg.payload] if msg.message == Message.RESULT else msg.payload
+                assigned = self.worker_tasks.get(identity, {})
+                for result in results:
+                    assigned.pop(result.task_id, None)
+            forward_socket.send_multipart(frames, copy=False)
+            self.comm_stats.count('messages_forwarded')
+
+    def check_workers(self, upstream_socket):
+        '''Report the tasks held by workers which have not been heard from as failed.'''
+        for identity in self.worker_timeouts.which_expired():
+            self.worker_timeouts.reset(identity)
+            lost_tasks = self.worker_tasks.pop(identity, {})
+            if lost_tasks:
+                self.log.error('no contact from worker {!r}; aborting {:d} tasks'.format(identity, len(lost_tasks)))
+                results = [
+                    Result(task_id, exception=ZMQWorkerMissing('worker running this task disappeared')) for task_id in lost_tasks
+                ]
+                self.send_upstream_message(upstream_socket, Message.RESULTS, results)
+
+    def update_comm_stats(self):
+        self.comm_stats.level('queue_depth', len(self.task_buffer))
+        self.comm_stats.level('tasks_assigned', sum(len(tasks) for tasks in self.worker_tasks.values()))
+        self.comm_stats.level('requests_waiting', len(self.waiting_requests))
+        self.comm_stats.update_rates()
+        self.log.debug('communication statistics: {!r}'.format(self.comm_stats))
+
     def comm_loop(self):
         self.context = zmq.Context.instance()
         # or else the proxies create sockets in a different context
@@ -42,30 +192,47 @@ class ZMQNode(ZMQCore, IsNode):
         self.context.linger = 100
         # So we don't have to destroy the context at the end of the loop
 
-        rr_proxy = ThreadProxy(zmq.ROUTER, zmq.DEALER)
-
         # We use push/pull so (1) we don't miss any announcements
         # and (2) we don't have to deal with subscription messages
         ann_proxy = ThreadProxy(zmq.SUB, zmq.PUB, zmq.PUSH)
         ann_monitor = self.context.socket(zmq.PULL)
 
-        # Not monitoring request/reply streams for two reasons:
-        # (1) we'd need to strip identity frames to interpret the messages
-        # (2) interpreting the messages means we'd have to decode (unpickle) and then re-encode
-        # all of the data flying through here, which seems like a waste just to see if
-        # clients start up. We miss the edge failure case where one node's workers
-        # start up but another's fail. Seems much less likely than all workers
-        # failing to start up, which would be caught by the master
+        rr_sockets = []
+        if self.task_buffer_size:
+            # Requests from workers are answered from the task buffer; everything else is passed
+            # on to the master, as by the proxy below. The node sends requests of its own (to fill
+            # the buffer) on a separate socket, so that replies to them are easily told apart.
+            downstream_socket = self.context.socket(zmq.ROUTER)
+            forward_socket = self.context.socket(zmq.DEALER)
+            upstream_socket = self.context.socket(zmq.DEALER)
+            rr_sockets = [downstream_socket, forward_socket, upstream_socket]
+
+            downstream_socket.bind(self.downstream_rr_endpoint)
+            if self.local_rr_endpoint:
+                downstream_socket.bind(self.local_rr_endpoint)
+            self.log.debug('connecting upstream_rr_endpoint = {!r}'.format(self.upstream_rr_endpoint))
+            forward_socket.connect(self.upstream_rr_endpoint)
+            upstream_socket.connect(self.upstream_rr_endpoint)
+        else:
+            rr_proxy = ThreadProxy(zmq.ROUTER, zmq.DEALER)
+
+            # Not monitoring request/reply streams for two reasons:
+            # (1) we'd need to strip identity frames to interpret the messages
+            # (2) interpreting the messages means we'd have to decode (unpickle) and then re-encode
+            # all of the data flying through here, which seems like a waste just to see if
+            # clients start up. We miss the edge failure case where one node's workers
+            # start up but another's fail. Seems much less likely than all workers
+            # failing to start up, which would be caught by the master
+
+            rr_proxy.bind_in(self.downstream_rr_endpoint)
+            if self.local_rr_endpoint:
+                rr_proxy.bind_in(self.local_rr_endpoint)
+            self.log.debug('connecting upstream_rr_endpoint = {!r}'.format(self.upstream_rr_endpoint))
+            rr_proxy.connect_out(self.upstream_rr_endpoint)
 
         ann_mon_endpoint = 'inproc://{:x}'.format(id(ann_monitor))
         ann_monitor.bind(ann_mon_endpoint)
 
-        rr_proxy.bind_in(self.downstream_rr_endpoint)
-        if self.local_rr_endpoint:
-            rr_proxy.bind_in(self.local_rr_endpoint)
-        self.log.debug('connecting upstream_rr_endpoint = {!r}'.format(self.upstream_rr_endpoint))
-        rr_proxy.connect_out(self.upstream_rr_endpoint)
-
         ann_proxy.bind_out(self.downstream_ann_endpoint)
         if self.local_ann_endpoint:
             ann_proxy.bind_out(self.local_ann_endpoint)
@@ -74,7 +241,8 @@ class ZMQNode(ZMQCore, IsNode):
         ann_proxy.setsockopt_in(zmq.SUBSCRIBE, b'')
         ann_proxy.connect_mon(ann_mon_endpoint)
 
-        rr_proxy.start()
+        if not self.task_buffer_size:
+            rr_proxy.start()
         ann_proxy.start()
 
         ann_monitor.connect(ann_mon_endpoint)
@@ -86,6 +254,10 @@ class ZMQNode(ZMQCore, IsNode):
         timers = PassiveMultiTimer()
         timers.add_timer('master_beacon', self.master_beacon_period)
         timers.add_timer('startup_timeout', self.startup_timeout)
+        timers.add_timer('stats', self.stats_period)
+        if self.task_buffer_size:
+            timers.add_timer('node_beacon', self.worker_beacon_period)
+            timers.add_timer('worker_timeout_check', self.worker_beacon_period * self.timeout_factor)
         timers.reset()
 
         self.log.debug('master beacon period: {!r}'.format(self.master_beacon_period))
@@ -96,12 +268,18 @@ class ZMQNode(ZMQCore, IsNode):
         poller = zmq.Poller()
         poller.register(ann_monitor, zmq.POLLIN)
         poller.register(inproc_socket, zmq.POLLIN)
+        for socket in rr_sockets:
+            poller.register(socket, zmq.POLLIN)
         try:
+            if self.task_buffer_size:
+                # Identify this node to the master first, so that it is not counted as a worker
+                self.send_upstream_message(upstream_socket, Message.IDENTIFY, self.get_identification())
+
             while True:
                 poll_results = dict(poller.poll((timers.next_expiration_in() or 0.001) * 1000))
 
                 if inproc_socket in poll_results:
-                    msgs = self.recv_all(ann_monitor, validate=False)
+                    msgs = self.recv_all(inproc_socket, validate=False)
                     if Message.SHUTDOWN in (msg.message for msg in msgs):
                         self.log.debug('shutdown received')
                         break
@@ -115,6 +293,32 @@ class ZMQNode(ZMQCore, IsNode):
                     if not peer_found and (Message.MASTER_BEACON in message_tags or Message.TASKS_AVAILABLE in message_tags):
                         peer_found = True
                         timers.remove_timer('startup_timeout')
+                    if msgs and self.master_id is None:
+                        self.master_id = msgs[0].master_id
+                    if self.task_buffer_size and Message.TASKS_AVAILABLE in message_tags:
+                        self.upstream_tasks_available = True
+                        self.request_buffer_tasks(upstream_socket)
+
+                if self.task_buffer_size:
+                    if upstream_socket in poll_results:
+                        self.handle_upstream_reply(downstream_socket, upstream_socket)
+                    if forward_socket in poll_results:
+                        downstream_socket.send_multipart(forward_socket.recv_multipart(copy=False), copy=False)
+                    if downstream_socket in poll_results:
+                        self.handle_worker_message(downstream_socket, forward_socket, upstream_socket)
+
+                    if timers.expired('node_beacon'):
+                        if self.task_buffer or any(self.worker_tasks.values()):
+                            self.send_upstream_message(upstream_socket, Message.IDENTIFY, self.get_identification())
+                        timers.reset('node_beacon')
+
+                    if timers.expired('worker_timeout_check'):
+                        self.check_workers(upstream_socket)
+                        timers.reset('worker_timeout_check')
+
+                if timers.expired('stats'):
+                    self.update_comm_stats()
+                    timers.reset('stats')
 
                 if not peer_found and timers.expired('startup_timeout'):
                     self.log.error('startup phase elapsed with no contact from peer; shutting down')
@@ -122,6 +326,8 @@ class ZMQNode(ZMQCore, IsNode):
 
         finally:
             self.log.debug('exiting')
+            for socket in rr_sockets:
+                socket.close()
             self.context = None
             self.remove_ipc_endpoints()
             IsNode.shutdown(self)
@@ -117,6 +117,23 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
             + 'on very large, heavily-loaded computer systems that start all processes '
             + 'simultaneously. ',
         )
+        wm_group.add_argument(
+            wmenv.arg_flag('zmq_prefetch'),
+            metavar='N_TASKS',
+            type=int,
+            help='Each worker holds up to N_TASKS tasks at once, requesting more before it has finished '
+            + 'those it has, so that it can start its next task without waiting for the master. '
+            + 'Larger values help with many short tasks, but may balance long tasks less evenly '
+            + '(default: {}).'.format(ZMQCore.default_prefetch),
+        )
+        wm_group.add_argument(
+            wmenv.arg_flag('zmq_node_buffer'),
+            metavar='N_TASKS',
+            type=int,
+            help='A node fetches up to N_TASKS tasks from the master in advance, handing them to its '
+            + 'workers as they ask for them, rather than forwarding every request to the master '
+            + '(default: {}, forwarding every request).'.format(ZMQCore.default_node_buffer),
+        )
         wm_group.add_argument(
             wmenv.arg_flag('zmq_shutdown_timeout'),
             metavar='SHUTDOWN_TIMEOUT',
@@ -157,6 +174,8 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
         worker_heartbeat = wmenv.get_val('zmq_worker_heartbeat', cls.default_worker_heartbeat, float)
         timeout_factor = wmenv.get_val('zmq_timeout_factor', cls.default_timeout_factor, float)
         startup_timeout = wmenv.get_val('zmq_startup_timeout', cls.default_startup_timeout, float)
+        prefetch = wmenv.get_val('zmq_prefetch', cls.default_prefetch, int)
+        node_buffer = wmenv.get_val('zmq_node_buffer', cls.default_node_buffer, int)
 
         if mode == 'master':
             instance = ZMQWorkManager(n_workers)
@@ -184,6 +203,7 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
             instance = ZMQNode(
                 upstream_ann_endpoint=upstream_ann_endpoint, upstream_rr_endpoint=upstream_rr_endpoint, n_local_workers=n_workers
             )
+            instance.task_buffer_size = node_buffer
 
         # Both server and node bind downstream endpoints, so that users get fan-out communications
         # "for free" when starting up a computational node
@@ -207,6 +227,7 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
             worker.worker_beacon_period = worker_heartbeat
             worker.timeout_factor = timeout_factor
             worker.startup_timeout = startup_timeout
+            worker.prefetch = prefetch
 
         # We always write host info (since we are always either master or node)
         # we choose not to in the special case that read_host_info is '' but not None
@@ -273,8 +294,10 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
         # Tasks pending distribution
         self.outgoing_tasks = deque()
 
-        # Tasks being processed by workers (indexed by worker_id)
+        # Tasks being processed by workers (indexed by worker_id, then task_id), and the worker
+        # (or node, for tasks it holds for its workers) to which each task was assigned
         self.assigned_tasks = dict()
+        self.task_assignees = dict()
 
         # Identity information and last contact from workers
         self.worker_information = dict()  # indexed by worker_id
@@ -290,7 +313,8 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
 
     @property
     def n_workers(self):
-        return len(self.worker_information)
+        # Nodes holding tasks for their workers identify themselves too, but do not run tasks
+        return sum(1 for info in self.worker_information.values() if info.get('class') != 'ZMQNode')
 
     def submit(self, fn, args=None, kwargs=None):
         if self.futures is None:
@@ -327,31 +351,54 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
     def handle_result(self, socket, msg):
         self.send_ack(socket, msg)
         with self.message_validation(msg):
-            assert msg.message == Message.RESULT
-            assert isinstance(msg.payload, Result)
-            assert msg.payload.task_id in self.futures
-            assert self.assigned_tasks[msg.src_id].task_id == msg.payload.task_id
-
-        result = msg.payload
+            if msg.message == Message.RESULT:
+                results = [msg.payload]
+            else:
+                assert msg.message == Message.RESULTS
+                results = msg.payload
+            for result in results:
+                assert isinstance(result, Result)
 
-        future = self.futures.pop(result.task_id)
-        del self.assigned_tasks[msg.src_id]
-        if result.exception is not None:
-            future._set_exception(result.exception, result.traceback)
-        else:
-            future._set_result(result.result)
+        for result in results:
+            try:
+                assignee = self.task_assignees.pop(result.task_id)
+            except KeyError:
+                # The task was aborted after its worker (or node) was presumed lost
+                self.log.warning('discarding result for unknown task {!s} from {!s}'.format(result.task_id, msg.src_id))
+                continue
+            del self.assigned_tasks[assignee][result.task_id]
+
+            future = self.futures.pop(result.task_id)
+            if result.exception is not None:
+                future._set_exception(result.exception, result.traceback)
+            else:
+                future._set_result(result.result)
+        self.comm_stats.count('results_received', len(results))
 
     def handle_task_request(self, socket, msg):
+        '''Send tasks in reply to a task request. The payload of the request is the number of tasks
+        wanted, sent in one TASKS message, or None for a single task sent in a TASK message.'''
+        self.comm_stats.count('task_requests')
         if not self.outgoing_tasks:
             # No tasks available
+            self.comm_stats.count('naks')
             self.send_nak(socket, msg)
-        else:
-            task = self.outgoing_tasks.popleft()
+            return
 
-            worker_id = msg.src_id
-            self.assigned_tasks[worker_id] = task
+        n_tasks = 1 if msg.payload is None else max(1, msg.payload)
+        tasks = [self.outgoing_tasks.popleft() for _i in range(min(n_tasks, len(self.outgoing_tasks)))]
 
-            self.send_message(socket, Message.TASK, task)
+        worker_id = msg.src_id
+        assigned = self.assigned_tasks.setdefault(worker_id, {})
+        for task in tasks:
+            assigned[task.task_id] = task
+            self.task_assignees[task.task_id] = worker_id
+        self.comm_stats.count('tasks_dispatched', len(tasks))
+
+        if msg.payload is None:
+            self.send_message(socket, Message.TASK, tasks[0])
+        else:
+            self.send_message(socket, Message.TASKS, tasks)
 
     def update_worker_information(self, msg):
         if msg.message == Message.IDENTIFY:
@@ -359,7 +406,7 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
                 assert isinstance(msg.payload, dict)
             self.worker_information[msg.src_id] = msg.payload
         else:
-            self.worker_information[msg.src_id] = {}
+            self.worker_information.setdefault(msg.src_id, {})
 
         try:
             self.worker_timeouts.reset(msg.src_id)
@@ -381,16 +428,20 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
             self.remove_worker(expired_worker_id)
 
     def remove_worker(self, worker_id):
-        try:
-            expired_task = self.assigned_tasks.pop(worker_id)
-        except KeyError:
-            pass
-        else:
+        for expired_task in self.assigned_tasks.pop(worker_id, {}).values():
             self.log.error('aborting task {!r} running on expired worker {!s}'.format(expired_task, worker_id))
+            del self.task_assignees[expired_task.task_id]
             future = self.futures.pop(expired_task.task_id)
             future._set_exception(ZMQWorkerMissing('worker running this task disappeared'))
         del self.worker_information[worker_id]
 
+    def update_comm_stats(self):
+        self.comm_stats.level('queue_depth', len(self.outgoing_tasks))
+        self.comm_stats.level('tasks_assigned', len(self.task_assignees))
+        self.comm_stats.level('n_workers', self.n_workers)
+        self.comm_stats.update_rates()
+        self.log.debug('communication statistics: {!r}'.format(self.comm_stats))
+
     def shutdown_clear_tasks(self):
         '''Abort pending tasks with error on shutdown.'''
         while self.futures:
@@ -425,6 +476,7 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
         timers.add_timer('master_beacon', self.master_beacon_period)
         timers.add_timer('worker_timeout_check', self.worker_beacon_period * self.timeout_factor)
         timers.add_timer('startup_timeout', self.startup_timeout)
+        timers.add_timer('stats', self.stats_period)
         timers.reset()
 
         self.log.debug('master beacon period: {!r}'.format(self.master_beacon_period))
@@ -462,7 +514,7 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
 
                     if msg.message == Message.TASK_REQUEST:
                         self.handle_task_request(rr_socket, msg)
-                    elif msg.message == Message.RESULT:
+                    elif msg.message in (Message.RESULT, Message.RESULTS):
                         self.handle_result(rr_socket, msg)
                     else:
                         self.send_ack(rr_socket, msg)
@@ -479,6 +531,10 @@ class ZMQWorkManager(ZMQCore, WorkManager, IsNode):
                     self.send_message(ann_socket, Message.MASTER_BEACON)
                     timers.reset('master_beacon')
 
+                if timers.expired('stats'):
+                    self.update_comm_stats()
+                    timers.reset('stats')
+
                 if peer_found and timers.expired('worker_timeout_check'):
                     self.check_workers()
                     if not self.worker_information:
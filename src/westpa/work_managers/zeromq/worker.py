@@ -4,6 +4,7 @@ Created on May 29, 2015
 @author: mzwier
 '''
 
+import collections
 import logging
 import multiprocessing
 import os
@@ -38,8 +39,10 @@ class ZMQWorker(ZMQCore):
         self.master_id = None
         self.identified = False
 
-        # The task currently being processed
-        self.pending_task = None
+        # Tasks sent to the executor and not yet completed, in the order they were received; up
+        # to ``prefetch`` tasks are held at once
+        self.pending_tasks = collections.OrderedDict()
+        self.prefetch = self.default_prefetch
 
         # Executor process
 
@@ -63,14 +66,16 @@ class ZMQWorker(ZMQCore):
         self.identified = True
 
     def request_task(self, rr_socket, task_socket):
+        '''Request as many tasks as needed to hold ``prefetch`` tasks, passing them to the executor.'''
+        n_wanted = self.prefetch - len(self.pending_tasks)
         if self.master_id is None:
             return
-        elif self.pending_task is not None:
+        elif n_wanted <= 0:
             return
         elif self.timers.expired(TIMEOUT_MASTER_BEACON):
             return
         else:
-            self.send_message(rr_socket, Message.TASK_REQUEST)
+            self.send_message(rr_socket, Message.TASK_REQUEST, n_wanted)
             reply = self.recv_message(rr_socket, timeout=self.master_beacon_period * self.timeout_factor * 1000)
             self.update_master_info(reply)
             if reply.message == Message.NAK:
@@ -78,10 +83,16 @@ class ZMQWorker(ZMQCore):
                 return
             else:
                 with self.message_validation(reply):
-                    assert isinstance(reply.payload, Task)
-                    task = reply.payload
-                self.pending_task = task
-                self.send_message(task_socket, Message.TASK, task)
+                    if reply.message == Message.TASK:
+                        tasks = [reply.payload]
+                    else:
+                        assert reply.message == Message.TASKS
+                        tasks = reply.payload
+                    for task in tasks:
+                        assert isinstance(task, Task)
+                for task in tasks:
+                    self.pending_tasks[task.task_id] = task
+                    self.send_message(task_socket, Message.TASK, task)
 
     def handle_reconfigure_timeout(self, msg, timers):
         with self.message_validation(msg):
@@ -91,15 +102,24 @@ class ZMQWorker(ZMQCore):
         timers.reset(timer)
 
     def handle_result(self, result_socket, rr_socket):
-        msg = self.recv_message(result_socket)
-        with self.message_validation(msg):
-            assert msg.message == Message.RESULT
-            assert isinstance(msg.payload, Result)
-            assert msg.payload.task_id == self.pending_task.task_id
+        '''Send all results available from the executor to the master, in one message.'''
+        msgs = self.recv_all(result_socket)
+        with self.message_validation(msgs):
+            for msg in msgs:
+                assert msg.message == Message.RESULT
+                assert isinstance(msg.payload, Result)
+                assert msg.payload.task_id in self.pending_tasks
+
+        if not msgs:
+            return
 
-        msg.src_id = self.node_id
-        self.pending_task = None
-        self.send_message(rr_socket, msg)
+        results = [msg.payload for msg in msgs]
+        for result in results:
+            del self.pending_tasks[result.task_id]
+        if len(results) == 1:
+            self.send_message(rr_socket, Message.RESULT, results[0])
+        else:
+            self.send_message(rr_socket, Message.RESULTS, results)
         reply = self.recv_ack(rr_socket, timeout=self.master_beacon_period * self.timeout_factor * 1000)
         self.update_master_info(reply)
 
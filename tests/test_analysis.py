@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+import pytest
+
+from westpa.analysis import (
+    Run,
+    block_error,
+    bootstrap_ci,
+    ensemble_moments,
+    time_average,
+    time_histogram,
+    time_variance,
+    vectorized,
+)
+from westpa.analysis.cache import LRUCache
+from westpa.core.segment import Segment
+from westpa.work_managers.threads import ThreadsWorkManager
+
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), 'refs')
+
+
+@pytest.fixture(params=[Run.DEFAULT_CACHE_SIZE, 0], ids=['cached', 'uncached'])
+def run(request):
+    with Run(os.path.join(REFERENCE_PATH, 'west_ref.h5'), cache_size=request.param) as run:
+        yield run
+
+
+class TestLRUCache:
+    def test_eviction(self):
+        cache = LRUCache(100)
+        cache.put('a', 1, 40)
+        cache.put('b', 2, 40)
+        assert cache.get('a') == 1
+        cache.put('c', 3, 40)
+        assert 'b' not in cache
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.nbytes == 80
+
+    def test_too_large(self):
+        cache = LRUCache(100)
+        cache.put('a', 1, 101)
+        assert 'a' not in cache
+        assert cache.nbytes == 0
+
+    def test_get_or_load(self):
+        cache = LRUCache(100)
+        value = cache.get_or_load('a', lambda: np.zeros(4))
+        assert cache.get_or_load('a', lambda: np.ones(4)) is value
+        assert cache.nbytes == value.nbytes
+
+
+class TestWalker:
+    def test_matches_hdf5(self, run):
+        for iteration in (run.iteration(1), run.iteration(25), run.iteration(run.num_iterations)):
+            seg_index = iteration.h5group['seg_index'][:]
+            pcoords = iteration.h5group['pcoord'][:]
+            for walker in iteration:
+                assert walker.weight == seg_index['weight'][walker.index]
+                assert np.array_equal(walker.pcoords, pcoords[walker.index])
+                assert walker.initial == (seg_index['parent_id'][walker.index] < 0)
+                assert walker.recycled == (seg_index['endpoint_type'][walker.index] == Segment.SEG_ENDPOINT_RECYCLED)
+                if not walker.initial:
+                    assert walker.parent.index == seg_index['parent_id'][walker.index]
+
+    def test_children(self, run):
+        iteration = run.iteration(25)
+        parent_ids = iteration.next.h5group['seg_index']['parent_id']
+        for walker in iteration:
+            assert [child.index for child in walker.children] == list(np.flatnonzero(parent_ids == walker.index))
+        assert not list(run.iteration(run.num_iterations).walker(0).children)
+
+
+class TestCache:
+    def test_bounded(self):
+        with Run(os.path.join(REFERENCE_PATH, 'west_ref.h5'), cache_size=64 * 1024) as run:
+            for iteration in run:
+                iteration.walker(0).weight
+                assert run.cache.nbytes <= run.cache.max_bytes
+            assert ('segments', run.num_iterations) in run.cache
+            assert ('segments', 1) not in run.cache
+
+    def test_read_only(self, run):
+        iteration = run.iteration(10)
+        if run.cache.max_bytes:
+            with pytest.raises(ValueError):
+                iteration.pcoords[0] = 0
+
+    def test_bin_mapper_memoized(self, run):
+        assert run.iteration(10).bin_mapper is run.iteration(11).bin_mapper
+
+
+def final_pcoord(walker):
+    return walker.pcoords[-1, 0]
+
+
+@vectorized
+def final_pcoords(iteration):
+    return iteration.pcoords[:, -1, 0]
+
+
+class TestStatistics:
+    def test_vectorized_matches_per_walker(self, run):
+        iterations = run.iterations[:10]
+        assert np.isclose(time_average(final_pcoords, iterations), time_average(final_pcoord, iterations))
+        assert np.isclose(time_variance(final_pcoords, iterations), time_variance(final_pcoord, iterations))
+
+    def test_moments(self, run):
+        iteration = run.iteration(10)
+        values = iteration.pcoords[:, -1, 0]
+        weights = iteration.weights
+        (mean,), (variance,) = ensemble_moments(final_pcoords, [iteration])
+        assert np.isclose(mean, np.average(values, weights=weights))
+        assert np.isclose(variance, np.average((values - mean) ** 2, weights=weights))
+
+    def test_histogram(self, run):
+        hist, edges = time_histogram(final_pcoords, run.iterations[:10], 20, range=(0, 10))
+        assert len(edges) == 21
+        assert np.isclose(hist.sum(), 1.0)
+        with pytest.raises(ValueError):
+            time_histogram(final_pcoords, run.iterations[:10], 20)
+
+    def test_work_manager(self, run):
+        iterations = run.iterations[:10]
+        work_manager = ThreadsWorkManager(n_workers=2)
+        work_manager.startup()
+        try:
+            parallel = time_average(final_pcoords, iterations, chunk_size=3, work_manager=work_manager)
+        finally:
+            work_manager.shutdown()
+        assert np.isclose(parallel, time_average(final_pcoords, iterations))
+
+    def test_errors(self):
+        values = np.random.default_rng(1).normal(size=100)
+        assert block_error(values, 10) > 0
+        mean, lb, ub, sterr = bootstrap_ci(values, seed=1)
+        assert lb < mean < ub
+        assert np.isclose(mean, values.mean())
+        with pytest.raises(ValueError):
+            block_error(values, 60)
@@ -0,0 +1,97 @@
+import h5py
+import numpy as np
+import pytest
+
+from westpa.core.ancestry import AncestryIndex
+
+
+def naive_trace(iter_parent_ids, n_iter, seg_id, max_length=None):
+    path = []
+    while n_iter > 0 and seg_id >= 0 and (max_length is None or len(path) < max_length):
+        path.append(seg_id)
+        seg_id = iter_parent_ids[n_iter - 1][seg_id]
+        n_iter -= 1
+    return n_iter + 1, path[::-1]
+
+
+@pytest.fixture
+def iter_parent_ids():
+    rng = np.random.default_rng(3)
+    parent_ids = [-np.arange(1, 9)]
+    for n_iter in range(2, 30):
+        n_segs = rng.integers(4, 12)
+        parents = rng.integers(len(parent_ids[-1]), size=n_segs)
+        # Some segments are recycled, and so start from initial states
+        parents[rng.random(n_segs) < 0.1] = -1
+        parent_ids.append(parents)
+    return parent_ids
+
+
+@pytest.fixture
+def index(iter_parent_ids):
+    index = AncestryIndex()
+    for n_iter, parent_ids in enumerate(iter_parent_ids, 1):
+        index.set_iteration(n_iter, parent_ids)
+    return index
+
+
+class TestAncestryIndex:
+    def test_layout(self, index, iter_parent_ids):
+        assert index.n_iters == len(iter_parent_ids)
+        for n_iter, parent_ids in enumerate(iter_parent_ids, 1):
+            assert index.n_segs(n_iter) == len(parent_ids)
+            assert np.array_equal(index.iter_parent_ids(n_iter), parent_ids)
+        assert index.parent_id(2, 0) == iter_parent_ids[1][0]
+
+    @pytest.mark.parametrize('max_length', [None, 1, 5])
+    def test_trace(self, index, iter_parent_ids, max_length):
+        n_iters = [n_iter for n_iter in (29, 20, 3, 1) for seg_id in range(len(iter_parent_ids[n_iter - 1]))]
+        seg_ids = [seg_id for n_iter in (29, 20, 3, 1) for seg_id in range(len(iter_parent_ids[n_iter - 1]))]
+
+        first_iters, paths = index.trace(n_iters, seg_ids, max_length=max_length)
+
+        assert len(paths) == len(n_iters)
+        for n_iter, seg_id, first_iter, path in zip(n_iters, seg_ids, first_iters, paths):
+            expected_first_iter, expected_path = naive_trace(iter_parent_ids, n_iter, seg_id, max_length)
+            assert first_iter == expected_first_iter
+            assert list(path) == expected_path
+
+    def test_trace_out_of_range(self, index):
+        with pytest.raises(IndexError):
+            index.trace(30, 0)
+        with pytest.raises(IndexError):
+            index.trace(1, 8)
+
+    def test_set_iteration(self, index, iter_parent_ids):
+        # Replacing an iteration discards those after it
+        index.depths
+        index.set_iteration(10, [0, 0, -1])
+        assert index.n_iters == 10
+        assert np.array_equal(index.iter_parent_ids(10), [0, 0, -1])
+        assert [len(path) for path in index.trace(10, [0, 1, 2])[1]] == [10, 10, 1]
+
+        with pytest.raises(ValueError):
+            index.set_iteration(12, [0])
+
+    def test_save(self, index, iter_parent_ids, tmp_path):
+        with h5py.File(tmp_path / 'west.h5', 'w') as h5file:
+            summary = h5file.create_dataset('summary', shape=(len(iter_parent_ids),), dtype=[('n_particles', np.int64)])
+            summary['n_particles'] = [len(parent_ids) for parent_ids in iter_parent_ids]
+            index.save(h5file)
+
+            loaded = AncestryIndex.from_h5file(h5file, index.n_iters, get_iter_group=None)
+            assert np.array_equal(loaded.parent_ids, index.parent_ids)
+            assert np.array_equal(loaded.iter_offsets, index.iter_offsets)
+
+            # Iterations which do not match the summary table are indexed from their segment indexes
+            summary[5] = (0,)
+            h5file.create_dataset('seg_index', data=np.array([(0,), (1,)], dtype=[('parent_id', np.int64)]))
+            loaded = AncestryIndex.from_h5file(h5file, 6, get_iter_group=lambda n_iter: h5file)
+            assert np.array_equal(loaded.iter_offsets[:6], index.iter_offsets[:6])
+            assert np.array_equal(loaded.iter_parent_ids(6), [0, 1])
+
+            # Saving a truncated index discards later iterations
+            index.truncate(4)
+            index.save(h5file, 5)
+            assert np.array_equal(h5file['ancestry/iter_offsets'][...], index.iter_offsets)
+            assert len(h5file['ancestry/parent_ids']) == index.iter_offsets[-1]
@@ -1,4 +1,5 @@
 import os
+import pickle
 import pytest
 
 import h5py
@@ -12,9 +13,12 @@ from westpa.core.binning.assign import (
     VectorizingFuncBinMapper,
     VoronoiBinMapper,
     RecursiveBinMapper,
+    euclidean_dfunc,
+    periodic_dfunc,
 )
-from westpa.core.binning.assign import coord_dtype
-from westpa.core.binning.mab import MABBinMapper, map_mab
+from westpa.core.binning.assign import coord_dtype, index_dtype
+from westpa.core.binning._assign import apply_down_argmin_across
+from westpa.core.binning.mab import MABBinMapper, map_mab, detect_bottlenecks
 
 
 REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'refs')
@@ -53,6 +57,16 @@ class TestRectilinearBinMapper:
 
         assert (assigner.assign(coords) == [0, 5, 10, 10, 15, 7, 8]).all()
 
+    def test_reachable_bins(self):
+        assigner = RectilinearBinMapper([(-1, -0.5, 0, 0.5, 1), (-1, -0.5, 0, 0.5, 1)])
+
+        # Within 0.25 of bin 5 ([-0.5, 0) x [-0.5, 0)) lie bins 0-2, 4-6 and 8-10, and within 0.25
+        # of bin 15 lie bins 10, 11, 14 and 15
+        reachable = assigner.reachable_bins([5, 15], 0.25)
+        assert np.flatnonzero(reachable).tolist() == [0, 1, 2, 4, 5, 6, 8, 9, 10, 11, 14, 15]
+        assert np.flatnonzero(assigner.reachable_bins([5], (0.0, 0.6))).tolist() == [4, 5, 6, 7]
+        assert not assigner.reachable_bins([], 1.0).any()
+
 
 class TestPiecewiseBinMapper:
     def test_bin_mapping(self):
@@ -113,6 +127,71 @@ class TestVoronoiBinMapper:
         output = mapper.assign(coords)
         assert list(output) == [0, 1, 0, 1]
 
+    @pytest.mark.parametrize('ndim', [1, 2, 3])
+    @pytest.mark.parametrize('periodic', [False, True], ids=['euclidean', 'periodic'])
+    def test_tree_matches_brute_force(self, ndim, periodic):
+        '''Assignments found with the k-d tree are identical to those found by evaluating the distance function.'''
+
+        rng = np.random.default_rng(1234)
+        centers = rng.random((500, ndim)) * 10
+        coords = (rng.random((2000, ndim)) * 12 - 1).astype(coord_dtype)
+
+        # Include points equidistant from two centers, and points exactly at centers
+        coords[:50] = (centers[:50] + centers[50:100]) / 2
+        coords[50:100] = centers[100:150]
+
+        if periodic:
+            dfunc, dfargs = periodic_dfunc, ([10.0] * (ndim - 1) + [0.0],)
+        else:
+            dfunc, dfargs = euclidean_dfunc, ()
+        mapper = VoronoiBinMapper(dfunc, centers, dfargs=dfargs)
+        assert mapper.tree is not None
+
+        expected = np.empty((len(coords),), dtype=index_dtype)
+        mask = np.ones((len(coords),), dtype=np.bool_)
+        apply_down_argmin_across(dfunc, (centers,) + dfargs, {}, mapper.nbins, coords, mask, expected)
+        assert (mapper.assign(coords) == expected).all()
+
+        # Masked coordinates are left alone
+        mask[::2] = False
+        output = np.full((len(coords),), 9999, dtype=index_dtype)
+        mapper.assign(coords, mask, output)
+        assert (output[mask] == expected[mask]).all()
+        assert (output[~mask] == 9999).all()
+
+    def test_periodic(self):
+        centers = np.array([[1.0, 0.0], [5.0, 0.0]])
+        mapper = VoronoiBinMapper(periodic_dfunc, centers, dfkwargs={'box': [10.0, 0.0]})
+        coords = np.array([[9.5, 0.0], [-0.5, 0.0], [4.0, 0.0], [21.2, 0.0]], dtype=coord_dtype)
+        assert list(mapper.assign(coords)) == [0, 0, 1, 0]
+
+    def test_tree_not_pickled(self):
+        mapper = VoronoiBinMapper(euclidean_dfunc, np.array([[0.0, 0.0], [2.0, 2.0]]))
+        pickled, hashed = mapper.pickle_and_hash()
+        assert mapper._tree is not None
+        restored = pickle.loads(pickled)
+        assert restored._tree is None
+        assert restored.pickle_and_hash()[1] == hashed
+        assert list(restored.assign(np.array([[0.9, 0.9], [1.1, 1.1]], dtype=coord_dtype))) == [0, 1]
+
+    def test_hash_unchanged(self):
+        '''The pickled state is exactly the mapper's attributes apart from the tree, so that
+        hashes match those of mappers pickled before the tree was added.'''
+        centers = np.array([[0.0, 0.0], [2.0, 2.0], [4.0, 0.0]])
+        mapper = VoronoiBinMapper(euclidean_dfunc, centers)
+        state = mapper.__getstate__()
+        assert '_tree' not in state
+        assert all(state[key] is value for key, value in vars(mapper).items() if key != '_tree')
+
+        hashed = mapper.pickle_and_hash()[1]
+        mapper.assign(np.array([[0.9, 0.9]], dtype=coord_dtype))
+        assert mapper._tree is not None
+        assert mapper.pickle_and_hash()[1] == hashed
+
+        legacy = VoronoiBinMapper(euclidean_dfunc, centers)
+        del legacy._tree
+        assert legacy.pickle_and_hash()[1] == hashed
+
 
 class TestNestingBinMapper:
     # pass
@@ -565,6 +644,26 @@ class TestMABBinMapper:
             output == self.ref_mab_results['2d_gauss'][ref_index]
         ), f"Unexpected 2D Gaussian MAB bin assignments with direction={direction}, bottleneck={bottleneck}, and skip={skip}"
 
+    @pytest.mark.parametrize('n_coords', [3, 10, 500])
+    def test_detect_bottlenecks(self, n_coords):
+        '''Test that bottleneck walkers are those found by scanning walkers one by one'''
+        rng = np.random.default_rng(seed=n_coords)
+        coords = rng.normal(size=(n_coords, 2)).astype(coord_dtype)
+        # Rounding the weights creates many ties between walkers
+        weights = np.round(rng.lognormal(sigma=3.0, size=n_coords), 1).astype(coord_dtype) + 1
+
+        expected = []
+        for coords_srt, weights_srt in [
+            (coords[coords[:, 1].argsort()], weights[coords[:, 1].argsort()]),
+            (coords[coords[:, 1].argsort()][::-1], weights[coords[:, 1].argsort()][::-1]),
+        ]:
+            Z = [np.log(weights_srt[i]) - np.log(np.sum(weights_srt[i + 1 :])) for i in range(1, n_coords - 1)]
+            expected.append(coords_srt[np.argmax(Z) + 1])
+
+        bottleneck_fwd, bottleneck_rev = detect_bottlenecks(coords, weights, n_coords, 1)
+        assert np.all(bottleneck_fwd == expected[0])
+        assert np.all(bottleneck_rev == expected[1])
+
 
 def output_mab_reference():
     '''
@@ -2,7 +2,12 @@ import unittest
 import argparse
 import os
 import tempfile
+
+import numpy as np
+
 import westpa
+from westpa.core.data_manager import calc_segment_chunksize
+from westpa.core.segment import Segment
 
 
 class TestDataManager(unittest.TestCase):
@@ -51,3 +56,177 @@ class TestDataManager(unittest.TestCase):
         assert os.path.basename(self.data_manager.we_h5filename) == 'west.h5'
         assert self.data_manager.aux_compression_threshold == 16384
         assert len(self.data_manager.dataset_options) == 2
+
+
+class TestSegmentStorage(unittest.TestCase):
+    def setUp(self):
+        parser = argparse.ArgumentParser()
+        westpa.rc.add_args(parser)
+
+        here = os.path.dirname(__file__)
+        os.environ['WEST_SIM_ROOT'] = os.path.join(here, 'fixtures', 'odld')
+
+        config_file_name = os.path.join(here, 'fixtures', 'odld', 'west.cfg')
+        args = parser.parse_args(['-r={}'.format(config_file_name)])
+        westpa.rc.process_args(args)
+
+        self.test_dir = tempfile.mkdtemp()
+        self.data_manager = westpa.rc.get_data_manager()
+        self.data_manager.we_h5filename = os.path.join(self.test_dir, 'west.h5')
+        self.data_manager.prepare_backing()
+        self.data_manager.create_ibstate_group([])
+        self.data_manager.save_target_states([])
+
+        system = westpa.rc.get_system_driver()
+        self.segments = []
+        for seg_id in range(6):
+            pcoord = system.new_pcoord_array()
+            pcoord[:] = seg_id
+            self.segments.append(
+                Segment(
+                    n_iter=1,
+                    seg_id=seg_id,
+                    weight=(seg_id + 1) / 21,
+                    parent_id=seg_id // 2,
+                    wtg_parent_ids={seg_id // 2} | ({4, 5} if seg_id == 3 else set()),
+                    pcoord=pcoord,
+                    status=Segment.SEG_STATUS_COMPLETE if seg_id % 2 else Segment.SEG_STATUS_PREPARED,
+                )
+            )
+        self.data_manager.prepare_iteration(1, self.segments)
+        self.data_manager.update_segments(1, self.segments)
+        self.data_manager.close_backing()
+        self.data_manager.open_backing()
+
+    def tearDown(self):
+        self.data_manager.close_backing()
+        del os.environ['WEST_SIM_ROOT']
+        westpa.rc = westpa.core._rc.WESTRC()
+
+    def test_columnar(self):
+        table = self.data_manager.get_segments_columnar(1)
+
+        assert len(table) == len(self.segments)
+        assert np.array_equal(table.seg_ids, np.arange(6))
+        assert np.allclose(table.weights, [segment.weight for segment in self.segments])
+        assert np.array_equal(table.parent_ids, [0, 0, 1, 1, 2, 2])
+        assert np.array_equal(table.n_wtg_parents, [1, 1, 1, 3, 1, 1])
+        assert set(table.wtg_parents(3)) == {1, 4, 5}
+        assert np.array_equal(table.pcoords[:, 0, 0], np.arange(6))
+
+    def test_ancestry_index(self):
+        segments = [
+            Segment(
+                n_iter=2,
+                seg_id=seg_id,
+                weight=1 / 3,
+                parent_id=parent_id,
+                wtg_parent_ids={parent_id},
+                status=Segment.SEG_STATUS_PREPARED,
+            )
+            for seg_id, parent_id in enumerate([5, 0, -1])
+        ]
+        self.data_manager.prepare_iteration(2, segments)
+        self.data_manager.current_iteration = 2
+
+        index = self.data_manager.get_ancestry_index()
+        assert index.n_iters == 2
+        assert np.array_equal(index.iter_parent_ids(2), [5, 0, -1])
+        first_iters, paths = index.trace(2, [0, 2])
+        assert list(first_iters) == [1, 2]
+        assert [list(path) for path in paths] == [[5, 0], [2]]
+
+        # The index is stored in the HDF5 file, and read back when reopened
+        self.data_manager.close_backing()
+        self.data_manager.open_backing()
+        assert np.array_equal(self.data_manager.we_h5file['ancestry/iter_offsets'][...], [0, 6, 9])
+        assert np.array_equal(self.data_manager.get_ancestry_index().parent_ids, index.parent_ids)
+
+        self.data_manager.truncate_ancestry_index(1)
+        assert np.array_equal(self.data_manager.we_h5file['ancestry/iter_offsets'][...], [0, 6])
+
+    def test_lazy_segments(self):
+        table = self.data_manager.get_segments_columnar(1, seg_ids=[5, 3])
+
+        assert list(table) == [3, 5]
+        assert 3 in table and 4 not in table
+        with self.assertRaises(KeyError):
+            table[4]
+
+        segment = table[3]
+        assert segment is table[3]
+        assert segment.wtg_parent_ids == {1, 4, 5}
+        assert segment.status == Segment.SEG_STATUS_COMPLETE
+        assert np.array_equal(segment.pcoord, self.segments[3].pcoord)
+
+    def test_get_segments(self):
+        segments = self.data_manager.get_segments(1)
+
+        for segment, expected in zip(segments, self.segments):
+            assert segment.seg_id == expected.seg_id
+            assert segment.weight == expected.weight
+            assert segment.parent_id == expected.parent_id
+            assert segment.wtg_parent_ids == expected.wtg_parent_ids
+            assert np.array_equal(segment.pcoord, expected.pcoord)
+
+    def test_update_auxdata(self):
+        for batch in ([4, 1], [0, 2, 3]):
+            segments = [self.segments[seg_id] for seg_id in batch]
+            for segment in segments:
+                segment.data['aux'] = np.full((3, 2), segment.seg_id, dtype=np.float32)
+                if segment.seg_id % 2:
+                    segment.data['odd'] = segment.seg_id
+            self.data_manager.update_segments(1, segments)
+
+        iter_group = self.data_manager.get_iter_group(1)
+        assert np.array_equal(iter_group['auxdata/aux'][:, 0, 0], [0, 1, 2, 3, 4, 0])
+        assert np.array_equal(iter_group['auxdata/odd'][[1, 3]], [1, 3])
+        assert self.data_manager.get_iter_write_time(1) > 0
+
+    def test_update_auxdata_mismatched_shapes(self):
+        # The dataset takes the shape of the last segment; data of other shapes must not be broadcast into it
+        for segment in self.segments:
+            segment.data['aux'] = np.full((3, 2), segment.seg_id + 1, dtype=np.float32)
+        self.segments[1].data['aux'] = np.full((1, 2), 10, dtype=np.float32)
+        self.data_manager.update_segments(1, self.segments)
+
+        aux = self.data_manager.get_iter_group(1)['auxdata/aux'][...]
+        assert np.array_equal(aux[1], [[10, 10], [0, 0], [0, 0]])
+        assert np.array_equal(aux[[0, 2, 3, 4, 5], :, 0], np.repeat([[1], [3], [4], [5], [6]], 3, axis=1))
+
+        # Data too large for the dataset is still an error
+        self.segments[2].data['aux'] = np.zeros((4, 2), dtype=np.float32)
+        with self.assertRaises(ValueError):
+            self.data_manager.update_segments(1, self.segments)
+
+    def test_update_segments_async(self):
+        for segment in self.segments:
+            segment.status = Segment.SEG_STATUS_COMPLETE
+            segment.cputime = segment.seg_id
+        self.data_manager.update_segments_async(1, self.segments[:3])
+        self.data_manager.update_segments_async(1, self.segments[3:])
+        self.data_manager.flush_writes()
+
+        seg_index = self.data_manager.get_seg_index(1)[...]
+        assert (seg_index['status'] == Segment.SEG_STATUS_COMPLETE).all()
+        assert np.array_equal(seg_index['cputime'], np.arange(6))
+
+    def test_update_segments_async_error(self):
+        self.segments[2].pcoord = np.zeros((2, 2, 2))
+        self.data_manager.update_segments_async(1, self.segments)
+        with self.assertRaises(ValueError):
+            self.data_manager.flush_writes()
+
+        # the writer recovers once the error has been reported
+        self.segments[2].pcoord = self.segments[1].pcoord
+        self.data_manager.update_segments_async(1, self.segments)
+        self.data_manager.flush_writes()
+
+
+def test_calc_segment_chunksize():
+    # whole segments per chunk, spread evenly over the segments of the iteration
+    assert calc_segment_chunksize((1000, 100, 2), np.dtype(np.float32)) == (20, 100, 2)
+    assert calc_segment_chunksize((10, 300), np.dtype(np.float64)) == (5, 300)
+    assert calc_segment_chunksize((10, 3), np.dtype(np.float64)) == (10, 3)
+    # segments too large for a single chunk are split
+    assert calc_segment_chunksize((1000, 5000), np.dtype(np.float64)) == (1, 1250)
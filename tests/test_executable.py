@@ -1,9 +1,31 @@
-import numpy as np
+import json
+import os
+import random
+import sys
+import time
 import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
 import westpa
 
-from westpa.core.propagators.executable import npy_data_loader, pickle_data_loader, aux_data_loader, ExecutablePropagator
+from westpa.core.propagators.executable import (
+    npy_data_loader,
+    pickle_data_loader,
+    aux_data_loader,
+    mmap_data_loader,
+    binary_data_loader,
+    binary_data_writer,
+    pcoord_loader,
+    detect_return_format,
+    ExecutablePropagator,
+)
+from westpa.core.propagators.runner import PersistentRunner
 from westpa.core.segment import Segment
+from westpa.core.systems import WESTSystem
 
 
 class Test_Executable:
@@ -60,3 +82,307 @@ class Test_Loaders:
         test_array = test_segment.data['test'][:]
 
         assert np.array_equal(test_array, ref_array)
+
+
+class Test_BinaryReturn:
+    '''Class to test loading data returned in binary formats.'''
+
+    @pytest.fixture(autouse=True)
+    def system(self, monkeypatch):
+        system = WESTSystem()
+        system.pcoord_ndim = 2
+        system.pcoord_len = 3
+        monkeypatch.setattr(westpa.rc, '_system', system)
+        return system
+
+    def test_detect_return_format(self, tmpdir):
+        '''Test that formats are detected from file names, or from file contents if necessary.'''
+
+        data = np.arange(6.0).reshape(3, 2)
+        np.save(str(tmpdir / 'a.npy'), data)
+        np.save(str(tmpdir / 'b'), data)
+        (tmpdir / 'b.npy').rename(tmpdir / 'b')
+        binary_data_writer(str(tmpdir / 'c'), data)
+        np.savetxt(str(tmpdir / 'd'), data)
+
+        assert detect_return_format(str(tmpdir / 'a.npy')) == 'npy'
+        assert detect_return_format(str(tmpdir / 'b')) == 'npy'
+        assert detect_return_format(str(tmpdir / 'c')) == 'binary'
+        assert detect_return_format(str(tmpdir / 'd')) == 'text'
+
+    @pytest.mark.parametrize('dtype', [np.float32, np.float64, np.int16])
+    def test_binary_loader(self, tmpdir, dtype):
+        '''Test that data written in the fixed-header binary format is loaded unchanged and memory mapped.'''
+
+        data = np.arange(24, dtype=dtype).reshape(2, 3, 4)
+        filename = str(tmpdir / 'data.wbin')
+        binary_data_writer(filename, data)
+
+        test_segment = Segment()
+        binary_data_loader('test', filename, test_segment, False)
+        assert isinstance(test_segment.data['test'], np.memmap)
+        assert test_segment.data['test'].dtype == dtype
+        assert np.array_equal(test_segment.data['test'], data)
+
+        test_segment = Segment()
+        mmap_data_loader('test', filename, test_segment, False)
+        assert np.array_equal(test_segment.data['test'], data)
+
+    def test_mmap_loader(self, tmpdir):
+        '''Test that .npy data is memory mapped.'''
+
+        data = np.random.random((10, 1000)).astype(np.float32)
+        filename = str(tmpdir / 'data.npy')
+        np.save(filename, data)
+
+        test_segment = Segment()
+        mmap_data_loader('test', filename, test_segment, False)
+        assert isinstance(test_segment.data['test'], np.memmap)
+        assert np.array_equal(test_segment.data['test'], data)
+
+    def test_empty_binary(self, tmpdir):
+        '''Test that empty binary data is rejected.'''
+
+        filename = str(tmpdir / 'data.wbin')
+        binary_data_writer(filename, np.empty((0, 3)))
+        with pytest.raises(ValueError):
+            binary_data_loader('test', filename, Segment(), False)
+
+    @pytest.mark.parametrize('return_format', ['npy', 'binary', 'text'])
+    def test_pcoord_loader(self, tmpdir, system, return_format):
+        '''Test that progress coordinates are loaded in each format, and converted to the system's dtype.'''
+
+        data = np.arange(6.0).reshape(3, 2)
+        filename = str(tmpdir / 'pcoord')
+        if return_format == 'npy':
+            np.save(filename, data)
+            filename += '.npy'
+        elif return_format == 'binary':
+            binary_data_writer(filename, data)
+        else:
+            np.savetxt(filename, data)
+
+        test_segment = Segment()
+        pcoord_loader('pcoord', filename, test_segment, False)
+        assert type(test_segment.pcoord) is np.ndarray
+        assert test_segment.pcoord.dtype == system.pcoord_dtype
+        assert np.array_equal(test_segment.pcoord, data)
+
+        # Flattened data is accepted too
+        binary_data_writer(str(tmpdir / 'flat'), data.ravel())
+        pcoord_loader('pcoord', str(tmpdir / 'flat'), test_segment, False)
+        assert np.array_equal(test_segment.pcoord, data)
+
+    def test_pcoord_loader_shape(self, tmpdir):
+        '''Test that binary progress coordinates of the wrong shape are rejected.'''
+
+        filename = str(tmpdir / 'pcoord.npy')
+        np.save(filename, np.zeros((4, 2)))
+        with pytest.raises(ValueError):
+            pcoord_loader('pcoord', filename, Segment(), False)
+
+        np.save(filename, np.zeros(2))
+        test_segment = Segment()
+        pcoord_loader('pcoord', filename, test_segment, True)
+        assert test_segment.pcoord.shape == (2,)
+
+    def test_return_format_config(self, ref_executable):
+        '''Test that the configured return format sets the suffix of temporary return files.'''
+
+        westpa.rc.read_config(filename='west.cfg')
+        westpa.rc.config['west', 'executable', 'datasets'] = [
+            {'name': 'pcoord', 'format': 'npy'},
+            {'name': 'displacement', 'loader': 'binary_loader', 'format': 'binary'},
+        ]
+        executable = ExecutablePropagator(rc=westpa.rc)
+        assert executable.data_info['displacement']['loader'] == binary_data_loader
+
+        # Auxiliary data in a binary format is memory mapped unless another loader is given
+        westpa.rc.config['west', 'executable', 'datasets'] = [{'name': 'displacement', 'format': 'npy'}]
+        assert ExecutablePropagator(rc=westpa.rc).data_info['displacement']['loader'] == mmap_data_loader
+        westpa.rc.config['west', 'executable', 'datasets'] = [
+            {'name': 'displacement', 'loader': 'aux_data_loader', 'format': 'npy'}
+        ]
+        assert ExecutablePropagator(rc=westpa.rc).data_info['displacement']['loader'] == aux_data_loader
+        westpa.rc.config['west', 'executable', 'datasets'] = [
+            {'name': 'pcoord', 'format': 'npy'},
+            {'name': 'displacement', 'loader': 'binary_loader', 'format': 'binary'},
+        ]
+        executable = ExecutablePropagator(rc=westpa.rc)
+
+        addtl_env, return_files, del_return_files = executable.setup_dataset_return(subset_keys=['pcoord', 'displacement'])
+        try:
+            assert return_files['pcoord'].endswith('.npy')
+            assert return_files['displacement'].endswith('.wbin')
+            assert addtl_env['WEST_PCOORD_RETURN'] == return_files['pcoord']
+        finally:
+            for filename in return_files.values():
+                os.unlink(filename)
+
+        westpa.rc.config['west', 'executable', 'datasets'] = [{'name': 'pcoord', 'format': 'hdf5'}]
+        with pytest.raises(ValueError):
+            ExecutablePropagator(rc=westpa.rc)
+
+
+RUNNER_MODULE = '''
+import os
+import sys
+import time
+import numpy as np
+
+
+def propagate(environ):
+    seg_id = int(environ['WEST_CURRENT_SEG_ID'])
+    if seg_id < 0:
+        raise ValueError('bad segment')
+    with open('seg.log', 'w') as f:
+        f.write(os.environ['WEST_PARENT_ID'])
+    print('running segment', seg_id)
+    sys.stderr.write('done\\n')
+    time.sleep(0.01)
+    return {'pcoord': np.array([[seg_id], [seg_id + 0.5]]), 'displacement': [0.5]}
+'''
+
+
+class Test_PersistentRunner:
+    '''Class to test propagation through a persistent runner process.'''
+
+    def make_propagator(self, **propagator_options):
+        with open('segrunner.py', 'w') as f:
+            f.write(RUNNER_MODULE)
+
+        westpa.rc.read_config(filename='west.cfg')
+        for key, value in propagator_options.items():
+            westpa.rc.config['west', 'executable', 'propagator', key] = value
+        westpa.rc.config['west', 'executable', 'propagator', 'runner_entry_point'] = 'segrunner.propagate'
+        westpa.rc.config['west', 'executable', 'propagator', 'runner_module_path'] = '$WEST_SIM_ROOT'
+        westpa.rc._system = WESTSystem()
+        return ExecutablePropagator(rc=westpa.rc)
+
+    def test_propagate(self, ref_executable):
+        '''Test that segments are propagated by one runner process, with data returned in its replies.'''
+
+        executable = self.make_propagator()
+        segments = [Segment(n_iter=2, seg_id=seg_id, parent_id=seg_id + 3, weight=0.5) for seg_id in range(2)]
+
+        try:
+            executable.propagate(segments)
+            pid = executable.get_runner().proc.pid
+            executable.propagate([Segment(n_iter=2, seg_id=-1, parent_id=0, weight=0.5)])
+            assert executable.get_runner().proc.pid == pid
+        finally:
+            executable.close_runners()
+
+        for segment in segments:
+            assert segment.status == Segment.SEG_STATUS_COMPLETE
+            assert segment.pcoord.dtype == np.float32
+            assert np.array_equal(segment.pcoord, [[segment.seg_id], [segment.seg_id + 0.5]])
+            assert np.array_equal(segment.data['displacement'], [0.5])
+            with open('traj_segs/000002/{:06d}/seg.log'.format(segment.seg_id)) as f:
+                assert f.read() == str(segment.parent_id)
+
+    def test_failed_segment(self, ref_executable):
+        '''Test that a segment raising an exception in the runner is marked as failed without stopping the runner.'''
+
+        executable = self.make_propagator()
+        segments = [Segment(n_iter=2, seg_id=seg_id, parent_id=0, weight=0.5) for seg_id in (-1, 0)]
+
+        try:
+            executable.propagate(segments)
+            assert executable.get_runner().running
+        finally:
+            executable.close_runners()
+
+        assert segments[0].status == Segment.SEG_STATUS_FAILED
+        assert segments[1].status == Segment.SEG_STATUS_COMPLETE
+
+    def test_output(self, ref_executable):
+        '''Test that the configured stdout, stderr and cwd of the propagator are used for each segment.'''
+
+        os.mkdir('seg_logs')
+        os.mkdir('work')
+        executable = self.make_propagator(
+            stdout='$WEST_SIM_ROOT/seg_logs/{segment.n_iter:06d}-{segment.seg_id:06d}.log', stderr='stdout', cwd='work'
+        )
+        segments = [Segment(n_iter=2, seg_id=seg_id, parent_id=0, weight=0.5) for seg_id in range(2)]
+
+        try:
+            executable.propagate(segments)
+        finally:
+            executable.close_runners()
+
+        for segment in segments:
+            assert segment.status == Segment.SEG_STATUS_COMPLETE
+            with open('seg_logs/000002-{:06d}.log'.format(segment.seg_id)) as f:
+                assert f.read() == 'running segment {}\ndone\n'.format(segment.seg_id)
+        assert os.path.exists('work/seg.log')
+
+    def test_threads(self, ref_executable):
+        '''Test that segments propagated from several threads at once each get their own reply.'''
+
+        executable = self.make_propagator()
+        segments = [Segment(n_iter=2, seg_id=seg_id, parent_id=0, weight=0.5) for seg_id in range(12)]
+
+        try:
+            with ThreadPoolExecutor(3) as executor:
+                list(executor.map(lambda segment: executable.propagate([segment]), segments))
+            assert len(executable.runners) == 3
+        finally:
+            executable.close_runners()
+
+        for segment in segments:
+            assert segment.status == Segment.SEG_STATUS_COMPLETE
+            assert np.array_equal(segment.pcoord, [[segment.seg_id], [segment.seg_id + 0.5]])
+
+
+class FakeRunnerProcess:
+    '''Stands in for a runner process, replying to jobs in the order they were sent after a
+    random delay (during which other threads may run).'''
+
+    def __init__(self):
+        self.jobs = []
+        self.stdin = self.stdout = self
+
+    def poll(self):
+        return None
+
+    def write(self, line):
+        self.jobs.append(json.loads(line))
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        time.sleep(random.uniform(0, 0.01))
+        job = self.jobs.pop(0)
+        return json.dumps({'status': 0, 'data': {'seg_id': job['environ']['WEST_CURRENT_SEG_ID']}}) + '\n'
+
+
+def test_runner_threads():
+    '''Test that jobs sent to one runner from several threads receive the replies to their own jobs.'''
+
+    runner = PersistentRunner(['runner'])
+    runner.proc = FakeRunnerProcess()
+    replies = {}
+
+    def run(seg_id):
+        for _i in range(5):
+            replies.setdefault(seg_id, []).append(runner.run({'WEST_CURRENT_SEG_ID': str(seg_id)}, None))
+
+    threads = [threading.Thread(target=run, args=(seg_id,)) for seg_id in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for seg_id in range(8):
+        assert [reply['data']['seg_id'] for reply in replies[seg_id]] == [str(seg_id)] * 5
+
+
+def test_runner_exit():
+    '''Test that a runner exiting without a reply raises RuntimeError.'''
+
+    runner = PersistentRunner([sys.executable, '-c', 'pass'])
+    with pytest.raises(RuntimeError):
+        runner.run({}, None)
+    assert not runner.running
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from westpa.fasthist import histnd, minmax
+
+
+class TestFastHist:
+    def test_histnd_3d(self):
+        rng = np.random.default_rng(12345)
+        values = rng.random((40, 11, 2)).astype(np.float32)
+        weights = rng.random(40)
+        binbounds = [np.linspace(0, 1, 6), np.linspace(0, 1, 4)]
+
+        hist = histnd(values, binbounds, weights)
+
+        expected = np.zeros_like(hist)
+        for ipt in range(values.shape[1]):
+            histnd(values[:, ipt, :], binbounds, weights, out=expected)
+        assert np.allclose(hist, expected)
+        assert np.isclose(hist.sum(), weights.sum() * values.shape[1])
+
+    def test_histnd_3d_weights_length(self):
+        with pytest.raises(TypeError):
+            histnd(np.zeros((4, 3, 1)), [[0, 1]], np.ones(12))
+
+    @pytest.mark.parametrize('dtype', [np.float32, np.float64, np.int32, np.uint8])
+    def test_minmax(self, dtype):
+        rng = np.random.default_rng(12345)
+        values = (rng.random((30, 7, 3)) * 100).astype(dtype)
+
+        minvals, maxvals = minmax(values)
+        assert (minvals == values.min(axis=(0, 1))).all()
+        assert (maxvals == values.max(axis=(0, 1))).all()
+
+        minvals, maxvals = minmax(values[:, 0, 0])
+        assert minvals[0] == values[:, 0, 0].min() and maxvals[0] == values[:, 0, 0].max()
+
+    def test_minmax_empty(self):
+        with pytest.raises(ValueError):
+            minmax(np.zeros((0, 2)))
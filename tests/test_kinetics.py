@@ -1,9 +1,14 @@
 import collections
+import types
 
+import h5py
 import numpy as np
+import pytest
 
+import westpa
+from westpa.core.binning import RectilinearBinMapper
 from westpa.core.kinetics._kinetics import calc_rates, StreamingStats2D, StreamingStats1D
-from westpa.core.kinetics.rate_averaging import tuple2stats
+from westpa.core.kinetics.rate_averaging import RateAverager, SlidingWindowRateAverager, tuple2stats
 
 
 class TestRateAverating:
@@ -238,3 +243,79 @@ class TestStreamingStats1D:
 
         assert np.allclose(rate_stats3.mean, data_masked.mean(axis=0).filled(fill_value=0.0))
         assert np.allclose(rate_stats3.var, data_masked.var(axis=0).filled(fill_value=0.0))
+
+
+class FakeDataManager:
+    iter_prec = 8
+
+    def __init__(self, n_iters, n_segs=20, pcoord_len=3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.iter_groups = {}
+        for n_iter in range(1, n_iters + 1):
+            seg_index = np.zeros((n_segs,), dtype=[('weight', np.float64)])
+            seg_index['weight'] = rng.dirichlet(np.ones(n_segs))
+            # Walkers never reach the last bin, which therefore has zero population
+            pcoord = rng.uniform(0.0, 0.75, size=(n_segs, pcoord_len, 1))
+            self.iter_groups[n_iter] = {'seg_index': seg_index, 'pcoord': pcoord}
+        self.current_iteration = n_iters + 1
+
+    def get_iter_group(self, n_iter):
+        return self.iter_groups[n_iter]
+
+
+class TestSlidingWindowRateAverager:
+    @pytest.fixture(autouse=True)
+    def fake_sim(self, monkeypatch):
+        self.data_manager = FakeDataManager(12)
+        self.system = types.SimpleNamespace(pcoord_len=3)
+        monkeypatch.setattr(westpa.rc, '_data_manager', self.data_manager)
+        monkeypatch.setattr(westpa.rc, '_system', self.system)
+        self.bin_mapper = RectilinearBinMapper([[0.0, 0.25, 0.5, 0.75, 1.0]])
+
+    def check_window(self, averager, iter_start, iter_stop):
+        expected = RateAverager(self.bin_mapper)
+        expected.calculate(iter_start, iter_stop)
+        for name in ('average_flux', 'stderr_flux', 'average_rate', 'stderr_rate', 'average_populations', 'stderr_populations'):
+            assert np.allclose(getattr(averager, name), getattr(expected, name)), name
+
+    @pytest.mark.parametrize('n_blocks', [1, 3])
+    def test_sliding(self, n_blocks):
+        averager = SlidingWindowRateAverager(self.bin_mapper, mapper_hash='abc')
+        for n_iter in range(1, 13):
+            iter_start = max(1, n_iter - 4)
+            averager.calculate(iter_start, n_iter + 1, n_blocks)
+            assert sorted(averager.iter_fluxes) == list(range(iter_start, n_iter + 1))
+            self.check_window(averager, iter_start, n_iter + 1)
+
+    def test_rereads_last_iteration(self):
+        averager = SlidingWindowRateAverager(self.bin_mapper)
+        averager.calculate(1, 6)
+        self.data_manager.iter_groups[5]['seg_index']['weight'][::-1].sort()
+        averager.calculate(1, 6)
+        self.check_window(averager, 1, 6)
+
+    def test_remove_undoes_add(self):
+        averager = SlidingWindowRateAverager(self.bin_mapper)
+        averager.calculate(1, 5)
+        S1, n = averager.flux_stats.S1.toarray(), averager.rate_stats.n.copy()
+        averager.add_iteration(9, *averager.iter_fluxes[2])
+        averager.remove_iteration(9)
+        assert np.allclose(averager.flux_stats.S1.toarray(), S1)
+        assert np.array_equal(averager.rate_stats.n, n)
+
+    def test_save_load(self, tmp_path):
+        averager = SlidingWindowRateAverager(self.bin_mapper, mapper_hash='abc')
+        with h5py.File(str(tmp_path / 'west.h5'), 'w') as h5file:
+            group = h5file.require_group('weed/rate_window')
+            averager.save(group)
+            averager.calculate(3, 9)
+            averager.save(group)
+
+            loaded = SlidingWindowRateAverager.load(group, self.bin_mapper, 'abc')
+            assert sorted(loaded.iter_fluxes) == list(range(3, 9))
+            loaded.calculate(4, 10)
+            self.check_window(loaded, 4, 10)
+
+            assert not SlidingWindowRateAverager.load(group, self.bin_mapper, 'def').iter_fluxes
+            assert not SlidingWindowRateAverager.load(group, self.bin_mapper, None).iter_fluxes
+            assert not SlidingWindowRateAverager.load(None, self.bin_mapper, 'abc').iter_fluxes
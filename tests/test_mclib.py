@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from westpa.core.kinetics import sequence_macro_flux_to_rate
+from westpa.cli.tools.w_direct import _macro_flux_to_rate
+from westpa.mclib import bootstrap_indices, mcbs_ci, mcbs_ci_correl, mcbs_correltime, MCBS_CHUNK_SIZE
+from westpa.mclib._mclib import mcbs_correltime_fullauto, mcbs_correltime_small
+
+
+def scalar_mean(dataset, stride=None):
+    return np.mean(dataset)
+
+
+@pytest.fixture
+def dataset():
+    return np.random.default_rng(1).normal(size=200)
+
+
+@pytest.fixture
+def correlated_dataset():
+    return np.repeat(np.random.default_rng(2).normal(size=25), 8)
+
+
+class TestBootstrapIndices:
+    def test_reproducible(self):
+        assert np.array_equal(bootstrap_indices(50, 1000, seed=7), bootstrap_indices(50, 1000, seed=7))
+        assert not np.array_equal(bootstrap_indices(50, 1000, seed=7), bootstrap_indices(50, 1000, seed=8))
+
+    def test_independent_of_n_sets(self):
+        n_sets = MCBS_CHUNK_SIZE + 10
+        assert np.array_equal(bootstrap_indices(50, n_sets, seed=7), bootstrap_indices(50, 2 * n_sets, seed=7)[:n_sets])
+
+    def test_range(self):
+        indices = bootstrap_indices(50, 1000, seed=7)
+        assert indices.shape == (1000, 50)
+        assert indices.min() >= 0 and indices.max() < 50
+
+
+class TestMCBSCI:
+    def test_batched_matches_scalar(self, dataset):
+        from westpa.mclib import _mean_estimator
+
+        batched = mcbs_ci({'dataset': dataset}, _mean_estimator, 0.05, len(dataset), n_sets=1000, seed=3)
+        scalar = mcbs_ci({'dataset': dataset}, scalar_mean, 0.05, len(dataset), n_sets=1000, seed=3)
+        assert np.allclose(batched, scalar)
+
+    def test_executor_matches_serial(self, dataset):
+        serial = mcbs_ci({'dataset': dataset}, scalar_mean, 0.05, len(dataset), n_sets=1000, seed=3)
+        for max_workers in (1, 4):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parallel = mcbs_ci({'dataset': dataset}, scalar_mean, 0.05, len(dataset), n_sets=1000, seed=3, executor=executor)
+            assert parallel == serial
+
+    def test_ci_contains_estimate(self, dataset):
+        fhat, lb, ub, sterr = mcbs_ci({'a': dataset}, np.mean, 0.05, len(dataset), n_sets=1000, seed=3)
+        assert lb < fhat < ub
+        assert sterr > 0
+
+
+class TestMCBSCorreltime:
+    def test_correlated(self, correlated_dataset):
+        assert mcbs_correltime(correlated_dataset, 0.05, 1000, seed=5) > 0
+
+    def test_reproducible(self, dataset):
+        assert mcbs_correltime(dataset, 0.05, 1000, seed=5) == mcbs_correltime(dataset, 0.05, 1000, seed=5)
+
+    def test_fullauto(self, correlated_dataset):
+        # Both specializations should detect the correlation, although they use different random streams
+        assert mcbs_correltime_fullauto(correlated_dataset, 0.05, 1000, 5) > 0
+        assert mcbs_correltime_small(correlated_dataset, 0.05, 1000, 5) > 0
+
+
+class TestMCBSCICorrel:
+    def test_reproducible(self, correlated_dataset):
+        first = mcbs_ci_correl({'dataset': correlated_dataset}, scalar_mean, 0.05, n_sets=1000, subsample=None, seed=11)
+        second = mcbs_ci_correl({'dataset': correlated_dataset}, scalar_mean, 0.05, n_sets=1000, subsample=None, seed=11)
+        assert first == second
+
+
+def test_macro_flux_to_rate():
+    rng = np.random.default_rng(4)
+    fluxes = rng.random(size=(3, 20))
+    pops = rng.random(size=(3, 20, 3))
+    pops[0, :5] = 0.0
+
+    for pairwise in (True, False):
+        rates = _macro_flux_to_rate(fluxes, pops, 0, 1, pairwise=pairwise)
+        expected = [sequence_macro_flux_to_rate(fluxes[i], pops[i], 0, 1, pairwise) for i in range(3)]
+        assert np.allclose(rates, expected)
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from westpa.core.h5io import WESTIterationFile
+from westpa.core.propagators.executable import restart_loader, restart_writer
+from westpa.core.restarts import RestartFiles, RestartStorage, StoredRestart, link_file
+from westpa.core.segment import Segment
+
+
+@pytest.fixture
+def restart_dir(tmpdir, monkeypatch):
+    '''A directory of restart files, including a symbolic link and a subdirectory.'''
+    monkeypatch.chdir(tmpdir)
+    os.makedirs('seg/sub')
+    with open('seg/seg.rst', 'wb') as f:
+        f.write(os.urandom(100000))
+    with open('seg/sub/seg.log', 'w') as f:
+        f.write('done\n')
+    os.makedirs('return')
+    os.symlink(os.path.abspath('seg/seg.rst'), 'return/seg.rst')
+    os.symlink(os.path.abspath('seg/sub'), 'return/sub')
+    return 'return'
+
+
+def read_files(path):
+    contents = {}
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), 'rb') as f:
+                contents[os.path.relpath(os.path.join(dirpath, filename), path)] = f.read()
+    return contents
+
+
+@pytest.mark.parametrize('codec', ['none', 'zlib', 'blosc:lz4'])
+def test_stream(restart_dir, codec):
+    '''Test that restart files are streamed into the per-iteration file in chunks, and back out unchanged.'''
+
+    storage = RestartStorage(mode='stream', codec=codec, chunk_size=4096, store=os.path.abspath('store'))
+    restart = storage.stage(restart_dir, '1_3_')
+    assert sorted(restart.files) == ['seg.rst', os.path.join('sub', 'seg.log')]
+
+    segment = Segment(n_iter=1, seg_id=3, data={'iterh5/restart': restart})
+    with WESTIterationFile('iter.h5', 'a') as iter_file:
+        iter_file.write_segment(segment, True, storage)
+    assert not os.path.exists(restart.root)
+
+    parent = Segment(n_iter=1, seg_id=3)
+    with WESTIterationFile('iter.h5', 'r') as iter_file:
+        assert iter_file.has_restart(parent)
+        iter_file.read_restart(parent)
+    assert isinstance(parent.data['iterh5/restart'], StoredRestart)
+
+    child = Segment(n_iter=2, seg_id=0, parent_id=3, data=parent.data)
+    restart_writer('child', child)
+    assert read_files('child') == read_files('seg')
+    assert 'iterh5/restart' not in child.data
+
+
+def test_link(restart_dir):
+    '''Test that restart files are only referenced from the per-iteration file in link mode.'''
+
+    storage = RestartStorage(mode='link', link=['hardlink'], store=os.path.abspath('store'))
+    restart = storage.stage(restart_dir, '1_3_')
+
+    # Symbolic links are followed, and the files they point to hard linked into the store
+    assert os.path.samefile(os.path.join(restart.root, 'seg.rst'), 'seg/seg.rst')
+
+    with WESTIterationFile('iter.h5', 'a') as iter_file:
+        iter_file.write_segment(Segment(n_iter=1, seg_id=3, data={'iterh5/restart': restart}), True, storage)
+    assert os.path.exists(restart.root)
+
+    parent = Segment(n_iter=1, seg_id=3)
+    with WESTIterationFile('iter.h5', 'r') as iter_file:
+        iter_file.read_restart(parent)
+    stored = parent.data['iterh5/restart']
+    assert isinstance(stored, RestartFiles)
+    assert stored.root == restart.root
+    assert stored.link_methods == ('hardlink',)
+
+    stored.extract('child')
+    assert read_files('child') == read_files('seg')
+
+
+def test_archive(restart_dir):
+    '''Test that archived restart data is still written out.'''
+
+    segment = Segment(n_iter=1, seg_id=3)
+    restart_loader('restart', 'seg', segment, False)
+    assert isinstance(segment.data['iterh5/restart'], bytes)
+
+    with WESTIterationFile('iter.h5', 'a') as iter_file:
+        iter_file.write_segment(segment, True)
+    parent = Segment(n_iter=1, seg_id=3)
+    with WESTIterationFile('iter.h5', 'r') as iter_file:
+        iter_file.read_restart(parent)
+
+    restart_writer('child', Segment(n_iter=2, seg_id=0, parent_id=3, data=parent.data))
+    assert read_files('child') == read_files('seg')
+
+
+def test_link_file(tmpdir):
+    '''Test that files are copied when they cannot be linked.'''
+
+    src, dst = str(tmpdir / 'src'), str(tmpdir / 'dst')
+    with open(src, 'w') as f:
+        f.write('data')
+
+    assert link_file(src, dst, ['copy', 'hardlink']) == 'copy'
+    assert not os.path.samefile(src, dst)
+    os.unlink(dst)
+
+    assert link_file(src, dst, ['reflink', 'hardlink']) in ('reflink', 'hardlink')
+    with open(dst) as f:
+        assert f.read() == 'data'
+
+
+def test_invalid_options():
+    with pytest.raises(ValueError):
+        RestartStorage(mode='tar')
+    with pytest.raises(ValueError):
+        RestartStorage(mode='link', link=['symlink'])
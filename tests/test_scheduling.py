@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+
+from westpa.core.scheduling import cost_ordered_blocks, get_parent_costs, load_imbalance, predict_segment_costs
+from westpa.core.segment import Segment
+
+
+def make_segments(parent_ids):
+    return [Segment(n_iter=2, seg_id=seg_id, parent_id=parent_id) for seg_id, parent_id in enumerate(parent_ids)]
+
+
+def test_predict_segment_costs():
+    segments = make_segments([0, 1, 1, -1, 5])
+    costs = predict_segment_costs(segments, np.array([2.0, 4.0, 0.0]))
+
+    # unknown costs (initial states, parents out of range) take the mean of the known ones
+    assert np.allclose(costs, [2.0, 4.0, 4.0, 10.0 / 3, 10.0 / 3])
+
+
+def test_predict_segment_costs_without_history():
+    assert np.all(predict_segment_costs(make_segments([0, 1]), None) == 1.0)
+    assert np.all(predict_segment_costs(make_segments([0, 1]), np.zeros(2)) == 1.0)
+
+
+def test_get_parent_costs():
+    seg_index = np.zeros(3, dtype=[('walltime', np.float64), ('cputime', np.float64)])
+    seg_index['walltime'] = [1.0, 0.0, np.nan]
+    seg_index['cputime'] = [5.0, 3.0, 0.0]
+    assert np.all(get_parent_costs(seg_index) == [1.0, 3.0, 0.0])
+
+
+def test_cost_ordered_blocks():
+    segments = make_segments(range(6))
+    costs = [1.0, 8.0, 1.0, 4.0, 1.0, 1.0]
+    blocks = cost_ordered_blocks(segments, costs, n_workers=2, max_block_size=10, blocks_per_worker=1)
+
+    # longest first, cheap segments grouped up to half the total cost each
+    assert [[segment.seg_id for segment in block] for block, _cost in blocks] == [[1], [3, 0, 2, 4, 5]]
+    assert [cost for _block, cost in blocks] == [8.0, 8.0]
+
+
+def test_cost_ordered_blocks_max_size():
+    segments = make_segments(range(5))
+    blocks = cost_ordered_blocks(segments, np.ones(5), n_workers=2, max_block_size=2)
+    assert [len(block) for block, _cost in blocks] == [1, 1, 1, 1, 1]
+
+    blocks = cost_ordered_blocks(segments, np.ones(5), n_workers=1, max_block_size=2, blocks_per_worker=1)
+    assert [len(block) for block, _cost in blocks] == [2, 2, 1]
+    assert cost_ordered_blocks([], [], n_workers=4, max_block_size=1) == []
+
+
+def test_load_imbalance():
+    assert load_imbalance(40.0, 10.0, 4) == 0.0
+    assert load_imbalance(10.0, 10.0, 4) == 0.75
+    assert math.isnan(load_imbalance(0.0, 10.0, 4))
+    assert math.isnan(load_imbalance(10.0, 0.0, 4))
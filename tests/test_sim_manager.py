@@ -1,23 +1,41 @@
 import argparse
 import os
+import time
 from unittest import TestCase
 from unittest.mock import MagicMock
 import tempfile
 import pytest
 
+import h5py
 import numpy as np
 
 import westpa
 from westpa.core.binning.assign import RectilinearBinMapper
+from westpa.core.h5io import load_sparse_matrix
+from westpa.core.propagators import WESTPropagator
 from westpa.core.segment import Segment
 from westpa.core.states import BasisState
-from westpa.core.sim_manager import PropagationError
+from westpa.core.sim_manager import PropagationError, WESimManager
+from westpa.work_managers.threads import ThreadsWorkManager
 
 
 def dummy_callback_one(self):
     pass
 
 
+class StationaryPropagator(WESTPropagator):
+    '''Leaves the progress coordinate of each segment where it starts, taking longer below 1.0'''
+
+    def propagate(self, segments):
+        for segment in segments:
+            if segment.pcoord[0, 0] < 1.0:
+                time.sleep(0.5)
+            segment.pcoord[1:] = segment.pcoord[0]
+            segment.walltime = 0.5 if segment.pcoord[0, 0] < 1.0 else 0.0
+            segment.status = Segment.SEG_STATUS_COMPLETE
+        return segments
+
+
 class TestSimManager(TestCase):
     def setUp(self):
         parser = argparse.ArgumentParser()
@@ -163,9 +181,116 @@ class TestSimManager(TestCase):
         westpa.core.states.pare_basis_initial_states = MagicMock(return_value=([], []))
         self.sim_manager.propagate
 
+    def test_get_propagation_blocks(self):
+        self.sim_manager.propagator_block_size = 3
+        blocks = self.sim_manager.get_propagation_blocks(self.segments)
+        assert [len(block) for block, _cost in blocks] == [3, 3, 2]
+        assert all(cost is None for _block, cost in blocks)
+
+        # Longest first, by the propagation time of the parents
+        for parent_id, segment in enumerate(self.segments):
+            segment.parent_id = parent_id
+        seg_index = np.zeros(8, dtype=[('walltime', np.float64), ('cputime', np.float64)])
+        seg_index['walltime'] = [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 9.0]
+        self.sim_manager.data_manager = MagicMock()
+        self.sim_manager.data_manager.get_seg_index.return_value = seg_index
+        self.sim_manager.work_manager = MagicMock(n_workers=2)
+        self.sim_manager.propagation_scheduling = 'cost'
+        self.sim_manager.n_iter = 2
+        blocks = self.sim_manager.get_propagation_blocks(self.segments)
+        assert blocks[0][0] == [self.segments[7]]
+        assert [cost for _block, cost in blocks] == [9.0, 2.0, 2.0, 2.0, 1.0]
+        assert sorted(id(segment) for block, _cost in blocks for segment in block) == sorted(map(id, self.segments))
+
+    def test_propagate_pipelined(self):
+        if type(self.sim_manager).propagate is not WESimManager.propagate:
+            pytest.skip('propagation is not pipelined by this sim manager')
+
+        # Two slow walkers near 0.5, and six fast ones near 5.0, whose bin can be resampled and their
+        # children propagated while the slow ones are still running
+        segments = []
+        for seg_id, pcoord in enumerate([5.05] * 6 + [0.55] * 2):
+            segment = Segment(
+                n_iter=1,
+                seg_id=seg_id,
+                parent_id=seg_id,
+                weight=0.125,
+                pcoord=self.sim_manager.system.new_pcoord_array(),
+                status=Segment.SEG_STATUS_PREPARED,
+            )
+            segment.pcoord[0] = pcoord
+            segments.append(segment)
+
+        sim_manager = self.sim_manager
+        sim_manager.data_manager = MagicMock()
+        sim_manager.work_manager = ThreadsWorkManager(n_workers=3)
+        sim_manager.pipeline = True
+        sim_manager.pipeline_max_displacement = 0.5
+        sim_manager.propagator_block_size = 1
+        sim_manager.n_iter = 1
+        sim_manager.segments = {segment.seg_id: segment for segment in segments}
+        sim_manager.incomplete_segments = dict(sim_manager.segments)
+        sim_manager.completed_segments = {}
+        sim_manager.current_iter_bstates = []
+        sim_manager.current_iter_istates = {}
+        sim_manager.we_driver.new_iteration(
+            bin_mapper=RectilinearBinMapper([np.arange(0.0, 11.0)]), bin_target_counts=np.full((10,), 10)
+        )
+        westpa.rc._propagator = StationaryPropagator()
+        try:
+            with sim_manager.work_manager:
+                sim_manager.propagate()
+                sim_manager.work_manager.wait_all(list(sim_manager.pipelined_futures))
+        finally:
+            westpa.rc._propagator = None
+
+        # The six fast walkers were split into ten segments of the next iteration, which were propagated
+        # ahead of it, and come first
+        children = sim_manager.pipelined_children
+        assert [segment.seg_id for segment in children] == list(range(10))
+        assert all(segment.pcoord[0, 0] == np.float32(5.05) for segment in children)
+        assert sim_manager.we_driver.resampled_bins == {5}
+        assert len(sim_manager.pipelined_segments) + len(sim_manager.pipelined_futures) == 10
+
+        sim_manager.we_driver.construct_next()
+        sim_manager.prepare_new_iteration()
+        next_segments = sim_manager.data_manager.prepare_iteration.call_args[0][1]
+        assert next_segments[:10] == children
+        assert len(next_segments) == 20
+        assert sum(segment.weight for segment in next_segments) == pytest.approx(1.0)
+
+    def test_find_stragglers(self):
+        self.sim_manager.work_manager = MagicMock(n_workers=3)
+        self.sim_manager.straggler_factor = 2.0
+        block_costs = [10.0, None, None, 5.0]
+        block_starts = [0.0, 0.0, 100.0, None]
+
+        # Nothing is re-dispatched while there is no idle worker
+        assert self.sim_manager.find_stragglers({0, 1, 2, 3}, block_costs, block_starts, [], 100.0) == ([], None)
+
+        # Blocks without a predicted cost are compared with the median of those completed
+        assert self.sim_manager.find_stragglers({0, 1}, block_costs, block_starts, [], 15.0) == ([], 5.0)
+        assert self.sim_manager.find_stragglers({0, 1}, block_costs, block_starts, [4.0, 8.0], 15.0) == ([1], 5.0)
+        assert self.sim_manager.find_stragglers({2}, block_costs, block_starts, [4.0], 107.0) == ([], 1.0)
+
     def test_save_bin_data(self):
         self.sim_manager.save_bin_data()
 
+    def test_save_bin_data_sparse(self):
+        self.sim_manager.save_transition_matrices = True
+        self.sim_manager.save_bin_data()
+        iter_group = self.sim_manager.data_manager.get_iter_group(self.sim_manager.n_iter)
+        assert isinstance(iter_group['bin_fluxes'], h5py.Group)
+        fluxes = load_sparse_matrix(iter_group['bin_fluxes'], dense=True)
+        assert np.allclose(fluxes, self.sim_manager.we_driver.flux_matrix)
+        assert np.array_equal(
+            load_sparse_matrix(iter_group['bin_ntrans'], dense=True), self.sim_manager.we_driver.transition_matrix
+        )
+
+        self.sim_manager.transition_matrix_format = 'dense'
+        self.sim_manager.save_bin_data()
+        assert np.allclose(iter_group['bin_fluxes'][...], fluxes)
+
     def test_check_propagation(self):
         self.assertRaises(PropagationError, self.sim_manager.check_propagation)
 
@@ -193,6 +318,57 @@ class TestSimManager(TestCase):
     def test_post_we(self):
         self.sim_manager.post_we()
 
+    def test_run_write_error(self):
+        # An error writing queued segment data is logged, rather than replacing the error which ended the iteration
+        data_manager = self.sim_manager.data_manager = MagicMock()
+        data_manager.current_iteration = 1
+        data_manager.flush_writes.side_effect = ValueError('write failed')
+        self.sim_manager.max_total_iterations = 1
+        self.sim_manager.prepare_iteration = MagicMock(side_effect=RuntimeError('iteration failed'))
+
+        with pytest.raises(RuntimeError, match='iteration failed'):
+            self.sim_manager.run()
+        data_manager.flush_writes.assert_called_once()
+        data_manager.flush_backing.assert_called_once()
+
+        # Without an error in the iteration, the write error is raised
+        for step in (
+            'prepare_iteration',
+            'pre_propagation',
+            'propagate',
+            'check_propagation',
+            'post_propagation',
+            'pre_we',
+            'run_we',
+            'post_we',
+            'prepare_new_iteration',
+            'finalize_iteration',
+        ):
+            setattr(self.sim_manager, step, MagicMock())
+        self.sim_manager.segments = {}
+        data_manager.get_iter_summary.return_value = {'walltime': 0.0, 'cputime': 0.0}
+        data_manager.get_iter_write_time.return_value = 0.0
+        data_manager.flush_backing.reset_mock()
+        with pytest.raises(ValueError, match='write failed'):
+            self.sim_manager.run()
+        data_manager.flush_backing.assert_called_once()
+
+    def test_assign_initial_points(self):
+        sim_manager = self.sim_manager
+        mapper = RectilinearBinMapper([[0.0, 1.0, 2.0, 3.0]])
+        sim_manager.system.bin_mapper = mapper
+        sim_manager.n_iter = 2
+        final_pcoords = np.array([[0.5], [0.75], [1.5], [2.5]], dtype=np.float32)
+
+        # Cached assignments (deliberately not those of the mapper) are used for the same mapper
+        cache = sim_manager.we_driver.assignment_cache
+        cache.store(mapper.pickle_and_hash()[1], 1, [0, 1], [2, 2])
+        assert list(sim_manager.assign_initial_points(final_pcoords, [0, 1, 2, 3])) == [2, 2, 1, 2]
+
+        # but not once the mapper has been changed in place
+        mapper.boundaries = [[0.0, 0.6, 2.0, 3.0]]
+        assert list(sim_manager.assign_initial_points(final_pcoords, [0, 1, 2, 3])) == [0, 1, 1, 2]
+
 
 class TestMABSimManager(TestSimManager):
     def setUp(self):
@@ -1,7 +1,12 @@
 import shutil
 
+import h5py
+import numpy as np
+import pytest
 from h5diff import H5Diff
 
+from westpa.core import h5io
+
 from westpa.cli.tools import w_assign
 from common import MockArgs
 
@@ -19,6 +24,8 @@ class Test_W_Assign:
             subsample=None,
             config_from_file=True,
             scheme='TEST',
+            append=False,
+            ragged=False,
         )
 
         # This basically some logic that's wrapped up in WESTTool.main() for convenience.
@@ -43,3 +50,83 @@ class Test_W_Assign:
 
         # clean up
         shutil.rmtree('ANALYSIS')
+
+    def run_w_assign(self, append, current_iteration=None, ragged=False):
+        args = MockArgs(
+            verbosity='debug',
+            rcfile=self.cfg_filepath,
+            max_queue_length=None,
+            we_h5filename=self.h5_filepath,
+            construct_dataset=None,
+            dsspecs=None,
+            output='assign.h5',
+            subsample=None,
+            config_from_file=True,
+            scheme='TEST',
+            append=append,
+            ragged=ragged,
+        )
+
+        tool = w_assign.WAssign()
+        tool.wm_env.process_wm_args(args)
+        tool.work_manager = tool.wm_env.make_work_manager()
+        tool.process_all_args(args)
+        if current_iteration is not None:
+            # Pretend the simulation has only run up to current_iteration
+            tool.data_reader.open('r+')
+            tool.data_reader.current_iteration = current_iteration
+            tool.data_reader.close()
+        with tool.work_manager:
+            tool.go()
+
+    def test_append_w_assign(self, ref_50iter):
+        # Assign the first half of the simulation, then append the rest
+        with h5py.File(self.h5_filepath, 'r') as h5file:
+            current_iteration = int(h5file.attrs['west_current_iteration'])
+
+        self.run_w_assign(append=True, current_iteration=26)
+        with h5py.File('./ANALYSIS/TEST/assign.h5', 'r') as assign_file:
+            assert assign_file['assignments'].shape[0] == 25
+
+        self.run_w_assign(append=True, current_iteration=current_iteration)
+
+        with h5py.File('./ANALYSIS/TEST/assign.h5', 'r') as assign_file:
+            assert assign_file['assignments'].attrs['iter_stop'] == current_iteration
+
+        diff = H5Diff('./assign_ref.h5', './ANALYSIS/TEST/assign.h5')
+        diff.check()
+        diff.test_file.close()
+
+        # Appending with different macrostates is refused
+        with h5py.File('./ANALYSIS/TEST/assign.h5', 'r+') as assign_file:
+            assign_file.attrs['statehash'] = 'different'
+        with pytest.raises(ValueError):
+            self.run_w_assign(append=True)
+
+        shutil.rmtree('ANALYSIS')
+
+    def test_ragged_w_assign(self, ref_50iter):
+        # Assign part of the simulation, then append the rest, to check that both work with ragged storage
+        with h5py.File(self.h5_filepath, 'r') as h5file:
+            current_iteration = int(h5file.attrs['west_current_iteration'])
+        self.run_w_assign(append=True, current_iteration=26, ragged=True)
+        self.run_w_assign(append=True, current_iteration=current_iteration)
+
+        with h5py.File('./assign_ref.h5', 'r') as ref_file, h5py.File('./ANALYSIS/TEST/assign.h5', 'r') as test_file:
+            nsegs = test_file['nsegs'][...]
+            npts = test_file['npts'][...]
+            assert test_file['assignments'].attrs['layout'] == 'ragged'
+            assert test_file['assignments'].shape == ((nsegs * npts).sum(),)
+            assert (test_file['iter_offsets'][1:] == np.cumsum(nsegs * npts)).all()
+            assert np.allclose(test_file['labeled_populations'][...], ref_file['labeled_populations'][...])
+
+            for n_iter in range(1, current_iteration):
+                for dsname in 'assignments', 'trajlabels', 'statelabels':
+                    ref_data = h5io.get_iter_assignments(ref_file, dsname, n_iter)
+                    test_data = h5io.get_iter_assignments(test_file, dsname, n_iter)
+                    assert test_data.shape == ref_data.shape
+                    assert (test_data == ref_data).all()
+                    assert (h5io.get_iter_assignments(test_file, dsname, n_iter, 1) == ref_data[1]).all()
+                    assert (h5io.get_iter_assignments(test_file, dsname, n_iter, [0, 2]) == ref_data[[0, 2]]).all()
+
+        shutil.rmtree('ANALYSIS')
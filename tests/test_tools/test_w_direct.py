@@ -55,6 +55,7 @@ class Test_W_Direct_New:
                 alpha=0.05,
                 acalpha=None,
                 nsets=None,
+                seed=None,
                 window_frac=1.0,
                 display_averages=True,
             ),
@@ -4,12 +4,16 @@ from h5diff import H5Diff
 from westpa.cli.tools.w_pdist import entry_point
 import argparse
 
+import pytest
+
 
 class Test_W_PDIST:
     '''Class to test w_pdist works to generate a file and that it is the same as the sample pdist.h5 file.'''
 
-    def test_run_w_pdist(self, ref_50iter):
-        '''Testing if w_pdist runs as expected and the pdist.h5 file looks good.'''
+    @pytest.mark.parametrize('max_cache_size', [512, 0])
+    def test_run_w_pdist(self, ref_50iter, max_cache_size):
+        '''Testing if w_pdist runs as expected and the pdist.h5 file looks good, whether or not data read
+        while scanning for the data range are kept to be histogrammed.'''
 
         with mock.patch(
             target='argparse.ArgumentParser.parse_args',
@@ -30,6 +34,7 @@ class Test_W_PDIST:
                 work_manager=None,
                 n_workers=None,
                 construct_wdataset=None,
+                max_cache_size=max_cache_size,
             ),
         ):
             entry_point()
@@ -0,0 +1,96 @@
+import h5py
+import numpy as np
+import scipy.sparse
+
+from westpa.core.h5io import load_sparse_matrix, save_sparse_matrix
+from westpa.core.kinetics._kinetics import calc_rates, StreamingStats2D
+from westpa.core.transitions import SparseStreamingStats, SparseTransitionCounter, sparse_rate_matrix
+
+
+def random_sparse(rng, nbins, density=0.05):
+    return scipy.sparse.random(nbins, nbins, density=density, format='csr', random_state=rng)
+
+
+class TestSparseTransitionCounter:
+    def test_matrices(self):
+        counter = SparseTransitionCounter(4)
+        counter.add([0, 1, 0], [1, 2, 1], [0.25, 0.5, 0.125])
+        counter.add([3], [3], [0.125])
+
+        expected_fluxes = np.zeros((4, 4))
+        expected_fluxes[0, 1] = 0.375
+        expected_fluxes[1, 2] = 0.5
+        expected_fluxes[3, 3] = 0.125
+        expected_counts = np.zeros((4, 4), np.uint64)
+        expected_counts[0, 1] = 2
+        expected_counts[1, 2] = 1
+        expected_counts[3, 3] = 1
+        assert np.array_equal(counter.flux_matrix.toarray(), expected_fluxes)
+        assert np.array_equal(counter.transition_matrix.toarray(), expected_counts)
+
+    def test_empty(self):
+        counter = SparseTransitionCounter(3)
+        assert counter.flux_matrix.shape == (3, 3)
+        assert counter.flux_matrix.nnz == 0
+
+
+class TestSparseRates:
+    def test_matches_dense(self):
+        rng = np.random.default_rng(1)
+        nbins = 50
+        fluxes = random_sparse(rng, nbins)
+        populations = rng.random(nbins)
+        populations[[0, 2, 5]] = 0.0
+
+        rates, row_mask = sparse_rate_matrix(fluxes, populations)
+
+        dense_rates = np.zeros((nbins, nbins))
+        mask = np.zeros((nbins, nbins), np.uint8)
+        calc_rates(fluxes.toarray(), populations, dense_rates, mask)
+        assert np.allclose(rates.toarray(), dense_rates)
+        assert np.array_equal(row_mask, mask.all(axis=1))
+
+
+class TestSparseStreamingStats:
+    def test_matches_dense(self):
+        rng = np.random.default_rng(2)
+        nbins = 40
+        sparse_stats = SparseStreamingStats((nbins, nbins))
+        dense_stats = StreamingStats2D((nbins, nbins))
+        for _ in range(10):
+            x = random_sparse(rng, nbins)
+            row_mask = rng.random(nbins) < 0.2
+            x = scipy.sparse.diags((~row_mask).astype(float)).dot(x).tocsr()
+            sparse_stats.update(x, row_mask)
+            dense_stats.update(x.toarray(), np.repeat(row_mask[:, np.newaxis], nbins, axis=1).astype(np.uint8))
+
+        assert np.allclose(sparse_stats.mean.toarray(), dense_stats.mean)
+        assert np.allclose(sparse_stats.var.toarray(), dense_stats.var)
+        assert np.allclose(sparse_stats.stderr.toarray(), np.nan_to_num(np.sqrt(dense_stats.var) / dense_stats.n))
+
+    def test_add(self):
+        rng = np.random.default_rng(3)
+        data = [random_sparse(rng, 20) for _ in range(6)]
+        whole = SparseStreamingStats((20, 20))
+        first = SparseStreamingStats((20, 20))
+        second = SparseStreamingStats((20, 20))
+        for i, x in enumerate(data):
+            whole.update(x)
+            (first if i < 4 else second).update(x)
+        combined = first + second
+        assert np.allclose(combined.mean.toarray(), whole.mean.toarray())
+        assert np.allclose(combined.var.toarray(), whole.var.toarray())
+
+
+def test_save_load_sparse_matrix(tmp_path):
+    matrix = random_sparse(np.random.default_rng(4), 30)
+    with h5py.File(tmp_path / 'matrices.h5', 'w') as h5file:
+        save_sparse_matrix(h5file, 'sparse', matrix)
+        save_sparse_matrix(h5file, 'dense', matrix, dense=True)
+        save_sparse_matrix(h5file, 'sparse', matrix * 2)
+
+        assert isinstance(h5file['sparse'], h5py.Group)
+        assert h5file['sparse/data'].shape == (matrix.nnz,)
+        assert isinstance(h5file['dense'], h5py.Dataset)
+        assert np.allclose(load_sparse_matrix(h5file['sparse']).toarray(), 2 * matrix.toarray())
+        assert np.allclose(load_sparse_matrix(h5file['dense'], dense=True), matrix.toarray())
@@ -1,3 +1,5 @@
+import random
+
 import pytest
 from unittest import TestCase
 
@@ -7,11 +9,18 @@ from westpa.core.binning import RectilinearBinMapper
 from westpa.core.segment import Segment
 from westpa.core.states import TargetState, InitialState
 from westpa.core.systems import WESTSystem
-from westpa.core.we_driver import WEDriver
+from westpa.core.we_driver import ConsistencyError, WEDriver
 
 EPS = np.finfo(np.float64).eps
 
 
+def _group_walkers_by_parent(we_driver, ibin, n_groups=2):
+    groups = {}
+    for segment in we_driver.next_iter_binning[ibin]:
+        groups.setdefault(segment.parent_id % n_groups, set()).add(segment)
+    return [groups[key] for key in sorted(groups)]
+
+
 class TestWEDriver(TestCase):
     def setUp(self):
         system = WESTSystem()
@@ -221,6 +230,71 @@ class TestWEDriver(TestCase):
         assert np.allclose([seg.weight for seg in self.we_driver.next_iter_binning[0]], [0.25 for _i in range(4)])
         assert segments[0].endpoint_type == Segment.SEG_ENDPOINT_RECYCLED
 
+    def test_resample_bins(self):
+        segments = [self.segment(0.0, 1.5, weight=0.125) for _i in range(2)] + [
+            self.segment(1.5, 0.5, weight=0.25) for _i in range(3)
+        ]
+        self.we_driver.new_iteration()
+        self.we_driver.assign(segments[:2])
+
+        # Bin 1 is resampled before the walkers ending in bin 0 are assigned, and left alone afterwards
+        early_segments = self.we_driver.resample_bins([1])
+        assert len(early_segments) == 4
+        assert np.allclose([segment.weight for segment in early_segments], 0.0625)
+        assert self.we_driver.resampled_bins == {1}
+
+        self.we_driver.assign(segments[2:])
+        self.we_driver.construct_next()
+        assert set(self.we_driver.next_iter_binning[1]) == set(early_segments)
+        assert len(self.we_driver.next_iter_binning[0]) == 4
+        assert abs(sum(segment.weight for segment in self.we_driver.next_iter_segments) - 1.0) < 8 * EPS
+
+    def test_resample_bins_consistency(self):
+        segments = [self.segment(0.0, 1.5, weight=0.5), self.segment(0.0, 0.5, weight=0.5)]
+        self.we_driver.new_iteration()
+        self.we_driver.assign(segments[:1])
+        self.we_driver.resample_bins([1])
+
+        # Walkers cannot end in a bin already resampled
+        with pytest.raises(ConsistencyError):
+            self.we_driver.assign([self.segment(0.0, 1.5, weight=0.5)])
+
+        # Nor be recycled into one
+        tstate = TargetState('recycle', [1.5], 0)
+        istate = InitialState(0, 0, 0, pcoord=[0.0])
+        self.we_driver.new_iteration(initial_states=[istate], target_states=[tstate])
+        self.we_driver.assign(segments)
+        with pytest.raises(ValueError):
+            self.we_driver.resample_bins([1])
+        self.we_driver.resample_bins([0])
+        with pytest.raises(ConsistencyError):
+            self.we_driver.construct_next()
+
+    def test_assignment_cache(self):
+        segments = [self.segment(0.0, 1.5, weight=0.5), self.segment(0.0, 0.5, weight=0.5)]
+        tstate = TargetState('recycle', [1.5], 0)
+        istate = InitialState(3, 0, 0, pcoord=[0.25])
+
+        self.we_driver.new_iteration(initial_states=[istate], target_states=[tstate])
+        self.we_driver.assign(segments)
+        self.we_driver.construct_next()
+
+        # The initial points of the next iteration are looked up by parent ID, including the recycled walker
+        new_segments = list(self.we_driver.next_iter_segments)
+        assert {segment.parent_id for segment in new_segments} == {1, -4}
+        cache = self.we_driver.assignment_cache
+        assignments, found = cache.lookup(self.we_driver.bin_mapper_hash, 1, [segment.parent_id for segment in new_segments])
+        assert found.all()
+        init_pcoords = np.array([segment.pcoord[0] for segment in new_segments])
+        assert (assignments == self.system.bin_mapper.assign(init_pcoords)).all()
+
+        # Unknown segments, other iterations, and other mappers are not found
+        assert not cache.lookup(self.we_driver.bin_mapper_hash, 1, [2])[1].any()
+        assert not cache.lookup(self.we_driver.bin_mapper_hash, 2, [1])[1].any()
+        self.system.bin_mapper = RectilinearBinMapper([[0.0, 0.75, 2.0]])
+        self.we_driver.new_iteration()
+        assert not cache.lookup(self.we_driver.bin_mapper_hash, 1, [1])[1].any()
+
     def test_multiple_merge(self):
         # This weight and count combination is known to trigger a split to 51
         # followed by a count adjustment to 50 (thanks to Josh Adelman)
@@ -238,6 +312,99 @@ class TestWEDriver(TestCase):
 
         assert len(self.we_driver.next_iter_binning[0]) == 50
 
+    def resample_with_seed(self, segments, seed, array_resampling):
+        for segment in segments:
+            segment.endpoint_type = Segment.SEG_ENDPOINT_UNSET
+        self.we_driver.do_array_resampling = array_resampling
+        self.we_driver.new_iteration()
+        self.we_driver.assign(segments)
+        random.seed(seed)
+        self.we_driver.construct_next()
+        new_segments = sorted(
+            (segment.weight, segment.parent_id, tuple(sorted(segment.wtg_parent_ids)), segment.pcoord[0, 0])
+            for segment in self.we_driver.next_iter_segments
+        )
+        return new_segments, [segment.endpoint_type for segment in segments]
+
+    def test_array_resampling_matches_segments(self):
+        rng = np.random.RandomState(1)
+        for nsegs, target_count in [(40, 10), (5, 12)]:
+            self.system.bin_target_counts = np.array([target_count, target_count])
+            weights = rng.lognormal(sigma=3.0, size=nsegs)
+            weights /= weights.sum()
+            segments = [self.segment(rng.uniform(0.0, 2.0), rng.uniform(0.0, 2.0), weight=weight) for weight in weights]
+
+            for seed in range(10):
+                assert self.resample_with_seed(segments, seed, True) == self.resample_with_seed(segments, seed, False)
+
+            for ibin in range(2):
+                assert len(self.we_driver.next_iter_binning[ibin]) == target_count
+
+    def resample_with_subgroups(self, n_groups, target_count, array_resampling):
+        '''Resample walkers recycled from and continuing in three bins, with walkers grouped into
+        ``n_groups`` subgroups by parent.'''
+        rng = np.random.RandomState(n_groups)
+        self.system.bin_mapper = RectilinearBinMapper([[0.0, 1.0, 2.0, 3.0]])
+        self.system.bin_target_counts = np.array([target_count] * 3)
+        self.we_driver.subgroup_function = _group_walkers_by_parent
+        self.we_driver.subgroup_function_kwargs = {'n_groups': n_groups}
+        self.we_driver.do_array_resampling = array_resampling
+
+        weights = rng.lognormal(sigma=3.0, size=60)
+        weights /= weights.sum()
+        segments = [self.segment(rng.uniform(0.0, 2.0), rng.uniform(0.0, 3.0), weight=weight) for weight in weights]
+        for segment in segments:
+            segment.parent_id = segment.seg_id
+        istates = [InitialState(state_id, 0, 0, pcoord=[0.5]) for state_id in range(len(segments))]
+
+        self.we_driver.new_iteration(initial_states=istates, target_states=[TargetState('recycle', [2.5], 0)])
+        self.we_driver.assign(segments)
+        self.we_driver.construct_next()
+        new_segments = list(self.we_driver.next_iter_segments)
+
+        assert abs(sum(segment.weight for segment in new_segments) - 1.0) < 1e-12
+        assert len(self.we_driver.next_iter_binning[2]) == 0
+
+        # Walkers are recycled from the target bin and otherwise continue or are merged away
+        for segment in segments:
+            if segment.pcoord[-1, 0] >= 2.0:
+                assert segment.endpoint_type == Segment.SEG_ENDPOINT_RECYCLED
+            else:
+                assert segment.endpoint_type in (Segment.SEG_ENDPOINT_CONTINUES, Segment.SEG_ENDPOINT_MERGED)
+        continued = {segment.parent_id for segment in new_segments if segment.parent_id >= 0}
+        assert {segment.seg_id for segment in segments if segment.endpoint_type == Segment.SEG_ENDPOINT_CONTINUES} <= continued
+        assert {segment.seg_id for segment in segments if segment.endpoint_type == Segment.SEG_ENDPOINT_RECYCLED}.isdisjoint(
+            continued
+        )
+
+        # Initial states are in use exactly while a walker starts from them; those merged away are released
+        used = {-(segment.parent_id + 1) for segment in new_segments if segment.parent_id < 0}
+        n_recycled = len(list(self.we_driver.recycling_segments))
+        assert set(self.we_driver.used_initial_states) == used
+        assert set(self.we_driver.avail_initial_states) == set(range(len(istates))) - used
+        return new_segments, n_recycled
+
+    def test_resampling_with_subgroups(self):
+        for n_groups, target_count in [(12, 4), (4, 4), (3, 10)]:
+            for array_resampling in (True, False):
+                new_segments, n_recycled = self.resample_with_subgroups(n_groups, target_count, array_resampling)
+                for ibin in range(2):
+                    assert len(self.we_driver.next_iter_binning[ibin]) == target_count
+                if n_groups > target_count:
+                    # Recycled walkers share a bin, so with more subgroups than walkers most are merged away
+                    assert len(self.we_driver.used_initial_states) < n_recycled
+
+    def test_thresholds_with_subgroups(self):
+        self.we_driver.largest_allowed_weight = 0.05
+        self.we_driver.smallest_allowed_weight = 1e-3
+        for n_groups, target_count in [(12, 4), (3, 10)]:
+            for array_resampling in (True, False):
+                new_segments, _n_recycled = self.resample_with_subgroups(n_groups, target_count, array_resampling)
+                weights = np.array([segment.weight for segment in new_segments])
+                assert (weights <= 0.05 * (1 + 1e-12)).all()
+                # at most one underweight walker remains in each subgroup of the two populated bins
+                assert (weights < 1e-3).sum() <= 2 * n_groups
+
     def check_populate_initial(self, prob, target_counts):
         istate = InitialState(0, 0, 0, pcoord=[0.0])
         self.system.bin_target_counts = np.array([target_counts, target_counts])
@@ -0,0 +1,130 @@
+'''Benchmarks of work manager overheads: CPU time used while idle, and the round-trip latency of
+no-op tasks. These are skipped unless WM_BENCHMARK is set in the environment, as in::
+
+    WM_BENCHMARK=1 pytest -s tests/test_work_managers/test_benchmark.py
+'''
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from westpa.work_managers.processes import ProcessWorkManager
+from .tsupport import will_succeed
+
+pytestmark = pytest.mark.skipif(not os.environ.get('WM_BENCHMARK'), reason='set WM_BENCHMARK to run benchmarks')
+
+IDLE_TIME = 2.0
+N_TASKS = 2000
+MPI_RANKS = 5
+
+
+def process_cputime(pid):
+    '''Return the CPU time (user plus system, in seconds) used so far by the process ``pid``.'''
+    try:
+        with open('/proc/{:d}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        pytest.skip('/proc is not available')
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat, counting from the process name (field 2)
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def measure_latency(work_manager, n_tasks=N_TASKS):
+    '''Return the mean round-trip time of a no-op task submitted one at a time, and the mean time
+    per task when ``n_tasks`` are submitted at once.'''
+    work_manager.submit(will_succeed).get_result()
+
+    start = time.perf_counter()
+    for _i in range(n_tasks // 10):
+        work_manager.submit(will_succeed).get_result()
+    latency = (time.perf_counter() - start) / (n_tasks // 10)
+
+    start = time.perf_counter()
+    futures = work_manager.submit_many([(will_succeed, (), {})] * n_tasks)
+    work_manager.wait_all(futures)
+    throughput = (time.perf_counter() - start) / n_tasks
+
+    return latency, throughput
+
+
+@pytest.mark.parametrize('prefetch', [1, 4])
+def test_processes(prefetch):
+    work_manager = ProcessWorkManager(n_workers=4, prefetch=prefetch)
+    with work_manager:
+        work_manager.wait_all(work_manager.submit_many([(will_succeed, (), {})] * 4))
+
+        pids = [worker.pid for worker in work_manager.workers]
+        workers_start = sum(process_cputime(pid) for pid in pids)
+        master_start = time.process_time()
+        time.sleep(IDLE_TIME)
+        workers_idle = sum(process_cputime(pid) for pid in pids) - workers_start
+        master_idle = time.process_time() - master_start
+
+        latency, throughput = measure_latency(work_manager)
+
+    print(
+        '\nprocesses (prefetch={:d}): idle CPU {:.1%} (workers), {:.1%} (master); '
+        'latency {:.1f} us/task (one at a time), {:.1f} us/task ({:d} at once)'.format(
+            prefetch, workers_idle / IDLE_TIME, master_idle / IDLE_TIME, latency * 1e6, throughput * 1e6, N_TASKS
+        )
+    )
+
+    # Idle workers and the receiver block rather than poll
+    assert workers_idle / IDLE_TIME < 0.05
+    assert master_idle / IDLE_TIME < 0.05
+
+
+def run_mpi_benchmark(prefetch):
+    '''Run on each rank under mpiexec (see test_mpi); the master prints its idle CPU fraction, then the
+    latency and time per task measured by measure_latency().'''
+    from westpa.work_managers.mpi import MPIWorkManager
+
+    work_manager = MPIWorkManager(prefetch=prefetch)
+    with work_manager:
+        if work_manager.is_master:
+            work_manager.wait_all(work_manager.submit_many([(will_succeed, (), {})] * work_manager.size))
+
+            master_start = time.process_time()
+            time.sleep(IDLE_TIME)
+            master_idle = time.process_time() - master_start
+
+            latency, throughput = measure_latency(work_manager)
+            print(master_idle / IDLE_TIME, latency, throughput)
+
+
+@pytest.mark.parametrize('prefetch', [1, 4])
+def test_mpi(prefetch):
+    mpiexec = shutil.which('mpiexec')
+    if mpiexec is None:
+        pytest.skip('mpiexec is not available')
+
+    # Allow Open MPI to run as root and to start more ranks than there are cores; other MPIs ignore these
+    env = dict(os.environ, OMPI_ALLOW_RUN_AS_ROOT='1', OMPI_ALLOW_RUN_AS_ROOT_CONFIRM='1', OMPI_MCA_rmaps_base_oversubscribe='1')
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    output = subprocess.run(
+        [mpiexec, '-n', str(MPI_RANKS), sys.executable, '-m', __name__, str(prefetch)],
+        cwd=root,
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    ).stdout
+    master_idle, latency, throughput = map(float, output.split())
+
+    print(
+        '\nmpi (prefetch={:d}, {:d} ranks): idle CPU {:.1%} (master); '
+        'latency {:.1f} us/task (one at a time), {:.1f} us/task ({:d} at once)'.format(
+            prefetch, MPI_RANKS, master_idle, latency * 1e6, throughput * 1e6, N_TASKS
+        )
+    )
+
+    # The dispatcher and receiver wait on a condition variable rather than polling
+    assert master_idle < 0.05
+
+
+if __name__ == '__main__':
+    run_mpi_benchmark(int(sys.argv[1]))
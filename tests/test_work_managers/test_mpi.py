@@ -1,6 +1,6 @@
 import unittest
 
-from westpa.work_managers.mpi import MPIWorkManager
+from westpa.work_managers.mpi import MPIWorkManager, node_layout
 
 # from .tsupport import CommonWorkManagerTests, CommonParallelTests
 
@@ -16,3 +16,10 @@ class TestMPIWorkManager(unittest.TestCase):
 
     def test_null(self):
         assert 1 == 1
+
+
+def test_node_layout():
+    hosts = ['a', 'a', 'b', 'b', 'b', 'c']
+    assert node_layout(hosts) == {0: [1, 2, 3, 4, 5]}
+    # Ranks on the manager's host and lone ranks are sent tasks directly
+    assert node_layout(hosts, node_leaders=True) == {0: [1, 2, 5], 2: [3, 4]}
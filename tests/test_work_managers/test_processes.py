@@ -1,11 +1,14 @@
 import os
 import signal
 import unittest
+from multiprocessing import shared_memory
+
+import numpy as np
 import pytest
 
-from westpa.work_managers.processes import ProcessWorkManager
+from westpa.work_managers.processes import ProcessWorkManager, dump_result, load_result
 from .tsupport import CommonParallelTests, CommonWorkManagerTests
-from .tsupport import will_busyhang, will_busyhang_uninterruptible, get_process_index
+from .tsupport import will_busyhang, will_busyhang_uninterruptible, get_process_index, will_exit, will_wait, make_array
 
 
 class TestProcessWorkManager(unittest.TestCase, CommonParallelTests, CommonWorkManagerTests):
@@ -17,6 +20,12 @@ class TestProcessWorkManager(unittest.TestCase, CommonParallelTests, CommonWorkM
         self.work_manager.shutdown()
 
 
+class TestProcessWorkManagerPrefetch(TestProcessWorkManager):
+    def setUp(self):
+        self.work_manager = ProcessWorkManager(n_workers=2, prefetch=4, shm_threshold=1024)
+        self.work_manager.startup()
+
+
 class TestProcessWorkManagerAux:
     @pytest.mark.timeout(2)
     def test_shutdown(self):
@@ -73,3 +82,64 @@ class TestProcessWorkManagerAux:
             work_manager.wait_all(futures)
             results = set(future.get_result() for future in futures)
             assert results == set(str(n) for n in range(work_manager.n_workers)), results
+
+    @pytest.mark.timeout(5)
+    def test_per_worker_pipes(self):
+        work_manager = ProcessWorkManager(n_workers=2, prefetch=2)
+        with work_manager:
+            assert len(work_manager.task_pipes) == len(work_manager.result_pipes) == 2
+            futures = work_manager.submit_many([(will_wait, (), {})] * 4)
+
+            # Up to two tasks are sent to each worker at once, so none are left waiting in the master
+            with work_manager.lock:
+                while work_manager.backlog:
+                    work_manager.dispatch_cond.wait(1)
+                assert all(len(assigned) <= 2 for assigned in work_manager.assigned)
+                assert sum(len(assigned) for assigned in work_manager.assigned) + len(futures) - len(work_manager.pending) == 4
+
+            work_manager.wait_all(futures)
+            assert all(future.get_result() for future in futures)
+            assert work_manager.assigned == [set(), set()]
+
+    @pytest.mark.timeout(5)
+    def test_shared_memory_result(self):
+        work_manager = ProcessWorkManager(n_workers=2, shm_threshold=1024)
+        with work_manager:
+            small, large = work_manager.submit(make_array, (10,)), work_manager.submit(make_array, (100000,))
+            assert np.array_equal(small.get_result(), np.arange(10))
+            result = large.get_result()
+            assert np.array_equal(result, np.arange(100000))
+            result[0] = 1  # returned arrays are writable
+
+    @pytest.mark.timeout(5)
+    def test_worker_lost(self):
+        work_manager = ProcessWorkManager(n_workers=2)
+        with work_manager:
+            future = work_manager.submit(will_exit)
+            assert isinstance(future.get_exception(), RuntimeError)
+            assert work_manager.alive.count(False) == 1
+
+            # The remaining worker carries on
+            futures = work_manager.submit_many([(make_array, (5,), {})] * 4)
+            assert all(np.array_equal(future.get_result(), np.arange(5)) for future in futures)
+
+
+def test_dump_result():
+    arrays = {'pcoord': np.random.random((100, 3)), 'small': np.arange(4)}
+    data, shm_name, layout = dump_result(('result', 1, arrays), shm_threshold=1024)
+    assert shm_name is not None
+    assert layout == [(0, arrays['pcoord'].nbytes)]
+    assert len(data) < 1024
+
+    message, task_id, payload = load_result(data, shm_name, layout)
+    assert (message, task_id) == ('result', 1)
+    assert np.array_equal(payload['pcoord'], arrays['pcoord'])
+    assert np.array_equal(payload['small'], arrays['small'])
+
+    # The shared memory segment is removed once read
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shm_name)
+
+    data, shm_name, layout = dump_result(('result', 2, arrays), shm_threshold=None)
+    assert shm_name is None
+    assert np.array_equal(load_result(data, shm_name, layout)[2]['pcoord'], arrays['pcoord'])
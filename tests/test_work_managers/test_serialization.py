@@ -0,0 +1,38 @@
+import numpy as np
+
+from westpa.work_managers import serialization
+
+
+def test_large_buffers_out_of_band():
+    restart = bytes(range(256)) * 400
+    obj = {
+        'pcoord': np.random.random((1000, 3)),
+        'fortran': np.asfortranarray(np.random.random((100, 50))),
+        'small': np.arange(4),
+        'restart': restart,
+        'log': b'short',
+    }
+    data, buffers = serialization.dumps(obj, threshold=1024)
+    assert [buffer.nbytes for buffer in buffers] == [obj['pcoord'].nbytes, obj['fortran'].nbytes, len(restart)]
+    assert len(data) < 1024
+
+    # Arrays are rebuilt around the buffers they are given
+    received = [bytearray(buffer) for buffer in buffers]
+    loaded = serialization.loads(data, received)
+    assert np.array_equal(loaded['pcoord'], obj['pcoord'])
+    assert np.shares_memory(loaded['pcoord'], np.frombuffer(received[0], np.uint8))
+    assert loaded['pcoord'].flags.writeable
+    assert np.array_equal(loaded['fortran'], obj['fortran'])
+    assert loaded['fortran'].flags.f_contiguous
+    assert np.array_equal(loaded['small'], obj['small'])
+    assert type(loaded['restart']) is bytes and loaded['restart'] == restart
+    assert loaded['log'] == b'short'
+
+
+def test_in_band():
+    obj = {'pcoord': np.random.random((1000, 3)), 'restart': bytes(100000)}
+    data, buffers = serialization.dumps(obj, threshold=None)
+    assert buffers == []
+    loaded = serialization.loads(data)
+    assert np.array_equal(loaded['pcoord'], obj['pcoord'])
+    assert loaded['restart'] == obj['restart']
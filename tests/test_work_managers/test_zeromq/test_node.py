@@ -150,3 +150,66 @@ class TestZMQNodeInternal(ZMQTestBase, CommonWorkManagerTests, unittest.TestCase
         self.test_wm.remove_ipc_endpoints()
 
         super().tearDown()
+
+
+class TestZMQNodeBuffered(ZMQTestBase, CommonWorkManagerTests, unittest.TestCase):
+    '''Tests for a node holding tasks for its workers.'''
+
+    n_workers = 2
+
+    def setUp(self):
+        super().setUp()
+
+        self.test_wm = ZMQWorkManager(n_local_workers=0)
+        upstream_ann_endpoint = self.test_core.make_internal_endpoint()
+        upstream_rr_endpoint = self.test_core.make_internal_endpoint()
+        self.test_wm.downstream_rr_endpoint = upstream_rr_endpoint
+        self.test_wm.downstream_ann_endpoint = upstream_ann_endpoint
+
+        self.test_node = ZMQNode(upstream_rr_endpoint, upstream_ann_endpoint, self.n_workers, task_buffer_size=4)
+        self.test_node.downstream_ann_endpoint = self.test_core.make_internal_endpoint()
+        self.test_node.downstream_rr_endpoint = self.test_core.make_internal_endpoint()
+
+        for core_object in itertools.chain([self.test_wm, self.test_node, self.test_core]):
+            core_object.validation_fail_action = 'raise'
+            core_object.master_beacon_period = BEACON_PERIOD
+            core_object.task_beacon_period = BEACON_PERIOD
+
+        for worker in self.test_node.local_workers:
+            worker.master_beacon_period = BEACON_WAIT
+            worker.shutdown_timeout = 0.5
+            worker.prefetch = 2
+
+        self.test_node.startup()
+        self.test_wm.startup()
+
+        self.test_core.master_id = self.test_wm.master_id
+        self.work_manager = self.test_wm
+
+        time.sleep(SETUP_WAIT)
+
+    def tearDown(self):
+        self.test_wm.signal_shutdown()
+        time.sleep(TEARDOWN_WAIT)
+
+        self.test_wm.comm_thread.join()
+
+        self.test_node.signal_shutdown()
+        self.test_node.comm_thread.join()
+
+        self.test_node.remove_ipc_endpoints()
+        self.test_wm.remove_ipc_endpoints()
+
+        super().tearDown()
+
+    def test_tasks_from_buffer(self):
+        rs = [random_int() for _i in range(20)]
+        futures = self.test_wm.submit_many([(identity, (r,), {}) for r in rs])
+        assert [future.get_result() for future in futures] == rs
+
+        # Tasks were handed to the workers by the node, which does not count as a worker itself
+        self.test_node.update_comm_stats()
+        assert self.test_node.comm_stats.counts['tasks_dispatched'] > 0
+        assert self.test_node.comm_stats.levels['tasks_assigned'] == 0
+        assert self.test_wm.worker_information[self.test_node.node_id]['class'] == 'ZMQNode'
+        assert self.test_wm.n_workers == len(self.test_wm.worker_information) - 1
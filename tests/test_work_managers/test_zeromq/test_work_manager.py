@@ -5,7 +5,7 @@ import unittest
 import pytest
 
 from westpa.work_managers.zeromq import ZMQWorkManager, ZMQWorker, ZMQWorkerMissing
-from westpa.work_managers.zeromq.core import Message, Task
+from westpa.work_managers.zeromq.core import Message, Task, CommCounters
 
 from ..tsupport import identity, random_int, CommonWorkManagerTests, ExceptionForTest
 from ..tsupport import will_busyhang, will_busyhang_uninterruptible, will_fail
@@ -170,8 +170,48 @@ class TestZMQWorkManagerBasic(ZMQTestBase, unittest.TestCase):
             self.test_core.send_message(s, Message.RESULT, result)
         assert future.result == r
 
+    def test_task_batch(self):
+        rs = [random_int() for _i in range(3)]
+        futures = self.test_wm.submit_many([(identity, (r,), {}) for r in rs])
+        with self.rr_socket() as s:
+            self.test_core.send_message(s, Message.TASK_REQUEST, 2)
+            msg = self.test_core.recv_message(s)
+            assert msg.message == Message.TASKS
+            assert [task.args for task in msg.payload] == [(rs[0],), (rs[1],)]
+            results = [task.execute() for task in msg.payload]
+
+            # Only as many tasks as remain are sent
+            self.test_core.send_message(s, Message.TASK_REQUEST, 2)
+            msg = self.test_core.recv_message(s)
+            assert msg.message == Message.TASKS
+            assert len(msg.payload) == 1
+            results.extend(task.execute() for task in msg.payload)
+
+            self.test_core.send_message(s, Message.RESULTS, results)
+            msg = self.test_core.recv_message(s)
+            assert msg.message == Message.ACK
+        assert [future.get_result() for future in futures] == rs
+
+        self.test_wm.update_comm_stats()
+        stats = self.test_wm.comm_stats.snapshot()
+        assert stats['tasks_dispatched'] == 3
+        assert stats['results_received'] == 3
+        assert stats['queue_depth'] == 0
+
+
+def test_comm_counters():
+    counters = CommCounters()
+    counters.count('tasks_dispatched', 4)
+    counters.level('queue_depth', 2)
+    counters.update_rates(at=counters._last_time + 2.0)
+    counters.count('tasks_dispatched')
+    stats = counters.snapshot()
+    assert stats == {'tasks_dispatched': 5, 'queue_depth': 2, 'tasks_dispatched_rate': 2.0}
+
 
 class BaseInternal:
+    prefetch = 1
+
     def setUp(self):
         super().setUp()
 
@@ -179,6 +219,7 @@ class BaseInternal:
         for worker in self.test_wm.local_workers:
             worker.validation_fail_action = 'raise'
             worker.shutdown_timeout = 0.5
+            worker.prefetch = self.prefetch
 
         # Set operation parameters
         self.test_wm.validation_fail_action = 'raise'
@@ -295,6 +336,12 @@ class TestZMQWorkManagerInternalMultiple(BaseInternal, ZMQTestBase, CommonWorkMa
     n_workers = 4
 
 
+@flaky_on_macos
+class TestZMQWorkManagerInternalPrefetch(BaseInternal, ZMQTestBase, CommonWorkManagerTests, unittest.TestCase):
+    n_workers = 2
+    prefetch = 4
+
+
 class BaseExternal:
     def setUp(self):
         super().setUp()
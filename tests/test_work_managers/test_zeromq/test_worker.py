@@ -1,6 +1,7 @@
 import time
 import unittest
 
+import numpy as np
 import zmq
 
 from westpa.work_managers.zeromq import ZMQWorker
@@ -108,6 +109,39 @@ class TestZMQWorkerBasic(ZMQTestBase, unittest.TestCase):
         rsl = self.roundtrip_task(task)
         assert rsl.result == r
 
+    def test_worker_processes_large_data(self):
+        # Large arrays and bytes strings travel as separate frames
+        data = {'pcoord': np.random.random((10000, 3)), 'restart': bytes(range(256)) * 1000}
+        rsl = self.roundtrip_task(Task(identity, (data,), {}))
+        assert np.array_equal(rsl.result['pcoord'], data['pcoord'])
+        assert rsl.result['restart'] == data['restart']
+
+    def test_worker_prefetch(self):
+        self.test_worker.prefetch = 3
+        rs = [random_int() for _i in range(3)]
+
+        self.test_core.send_message(self.ann_socket, Message.TASKS_AVAILABLE)
+        msg = self.test_core.recv_message(self.rr_socket)
+        assert msg.message == Message.TASK_REQUEST
+        assert msg.payload == 3
+        self.test_core.send_message(self.rr_socket, Message.TASKS, payload=[Task(identity, (r,), {}) for r in rs])
+
+        results = []
+        while len(results) < 3:
+            msg = self.test_core.recv_message(self.rr_socket)
+            if msg.message == Message.TASK_REQUEST:
+                # the worker asks for more as tasks complete
+                assert msg.payload <= 3 - len(self.test_worker.pending_tasks)
+                self.test_core.send_nak(self.rr_socket, msg)
+                continue
+            self.test_core.send_ack(self.rr_socket, msg)
+            if msg.message == Message.RESULT:
+                results.append(msg.payload)
+            else:
+                assert msg.message == Message.RESULTS
+                results.extend(msg.payload)
+        assert [result.result for result in results] == rs
+
     def test_worker_processes_exception(self):
         task = Task(will_fail, (), {})
         rsl = self.roundtrip_task(task)
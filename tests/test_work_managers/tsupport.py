@@ -111,6 +111,14 @@ class CommonWorkManagerTests:
         output = self.work_manager.wait_any(futures).get_result()
         assert output in test_input
 
+    def test_wait_any_timeout(self):
+        future = self.work_manager.submit(will_wait)
+        # The serial work manager has already run the task
+        if not future.done:
+            assert self.work_manager.wait_any([future], timeout=0.01) is None
+        assert self.work_manager.wait_any([future], timeout=30) is future
+        assert not future._watchers
+
     def test_wait_all(self):
         test_input = set(range(self.MED_TEST_SIZE))
         futures = [self.work_manager.submit(identity, args=(i,)) for i in range(self.MED_TEST_SIZE)]
@@ -145,3 +153,15 @@ class CommonParallelTests:
         result_set = set(result_list)
 
         assert len(result_list) != len(result_set)
+
+
+def will_exit():
+    import os
+
+    os._exit(1)
+
+
+def make_array(n):
+    import numpy as np
+
+    return np.arange(n, dtype=np.float64)